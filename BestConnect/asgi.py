@@ -0,0 +1,8 @@
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'BestConnect.settings')
+
+# Serveur ASGI (ex. gunicorn -k uvicorn.workers.UvicornWorker BestConnect.asgi) : les attentes longues
+# (payments wait-payment-status) ne bloquent aucun worker
+application = get_asgi_application()
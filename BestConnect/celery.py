@@ -12,7 +12,7 @@ app.autodiscover_tasks()
 app.conf.beat_schedule = {
     'update-subscription-status': {
         'task': 'subscriptions.tasks.update_subscription_status',
-        'schedule': crontab(minute='*/5'),  # Toutes les 5 minutes
+        'schedule': 30.0,  # Toutes les 30 secondes
     },
     'generate-daily-statistics': {
         'task': 'subscriptions.tasks.generate_daily_statistics',
@@ -22,4 +22,28 @@ app.conf.beat_schedule = {
         'task': 'subscriptions.tasks.check_connectivity',
         'schedule': crontab(minute='*/1'),  # Toutes les minutes
     },
+    'apply-network-retention': {
+        'task': 'captive_portal.tasks.apply_network_retention',
+        'schedule': crontab(minute=15),  # Toutes les heures
+    },
+    'reconcile-session-registry': {
+        'task': 'captive_portal.tasks.reconcile_session_registry',
+        'schedule': crontab(minute='*/5'),  # Toutes les 5 minutes
+    },
+    'reconcile-enforcement': {
+        'task': 'captive_portal.tasks.reconcile_enforcement',
+        'schedule': crontab(minute='*/1'),  # Toutes les minutes
+    },
+    'reconcile-shaping': {
+        'task': 'captive_portal.tasks.reconcile_shaping',
+        'schedule': crontab(minute='*/1'),  # Toutes les minutes
+    },
+    'resume-fulfillments': {
+        'task': 'payments.tasks.resume_fulfillments',
+        'schedule': crontab(minute='*/1'),  # Toutes les minutes
+    },
+    'resume-report-jobs': {
+        'task': 'payments.tasks.resume_report_jobs',
+        'schedule': crontab(minute='*/1'),  # Toutes les minutes
+    },
 } 
\ No newline at end of file
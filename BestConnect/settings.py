@@ -61,6 +61,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'BestConnect.wsgi.application'
+ASGI_APPLICATION = 'BestConnect.asgi.application'
 
 # Database
 DATABASES = {
@@ -94,6 +95,24 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Hacheurs des mots de passe : le premier est le hacheur par défaut, les autres restent reconnus
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'users.hashers.TicketPBKDF2PasswordHasher',
+]
+
+# Hacheur par classe de compte (users.hashers) : personnel au coût par défaut, tickets WiFi
+# (identifiants aléatoires valables quelques jours, vérifiés à chaque connexion) à coût réduit
+PASSWORD_HASHER_POLICIES = {
+    'staff': 'default',
+    'ticket': 'pbkdf2_ticket',
+}
+TICKET_PASSWORD_ITERATIONS = 20000
+
 # Internationalization
 LANGUAGE_CODE = 'fr-fr'
 TIME_ZONE = 'Indian/Antananarivo'
@@ -118,6 +137,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom user model
 AUTH_USER_MODEL = 'users.User'
 
+# Utilisateur inconnu : hachage factice au coût d'un compte du personnel (users.backends)
+AUTHENTICATION_BACKENDS = ['users.backends.AccountClassModelBackend']
+
 # Celery Configuration
 CELERY_BROKER_URL = 'memory://'
 CELERY_RESULT_BACKEND = 'rpc://'
@@ -126,6 +148,130 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Cache (droits d'accès du portail captif, etc.)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bestconnect',
+    }
+}
+
+# Durée de vie (secondes) du cache des droits d'accès à la connexion. L'invalidation à l'enregistrement
+# d'un abonnement ne touche que le cache du processus : en production (plusieurs processus), configurer
+# un cache partagé (Redis, Memcached) ; avec LocMemCache, droits périmés possibles jusqu'à cette durée
+ENTITLEMENT_CACHE_TIMEOUT = 30
+
+# Registre des sessions actives (verrou par appareil à la connexion)
+# 'local' : mémoire du processus ; 'cache' : cache Django partagé (Redis, Memcached) entre processus
+SESSION_REGISTRY_BACKEND = 'local'
+SESSION_REGISTRY_MAX_AGE = 30  # Secondes avant rechargement du registre local depuis la base
+SESSION_REGISTRY_CACHE_TIMEOUT = 3600  # Secondes de vie d'une génération du registre partagé
+
+# Pont vers le pare-feu de la passerelle (captive_portal.enforcement) : clients autorisés des sessions actives
+# 'nftables', 'ipset', 'file' (simulation : scripts écrits dans ENFORCEMENT_DRY_RUN_FILE) ; None : désactivé
+ENFORCEMENT_BACKEND = None
+ENFORCEMENT_NFT_TABLE = 'bestconnect'
+ENFORCEMENT_IPSET_NAME = 'bestconnect_authorized'
+ENFORCEMENT_DRY_RUN_FILE = os.path.join(BASE_DIR, 'enforcement.nft')
+ENFORCEMENT_FLUSH_DELAY = 0.05   # Secondes de regroupement des connexions avant envoi d'un lot
+ENFORCEMENT_BATCH_SIZE = 1000    # Éléments par instruction nftables
+
+# Limitation de débit des sessions selon le forfait (captive_portal.shaping, classes HTB de tc)
+# 'tc', 'file' (simulation : commandes écrites dans SHAPING_COMMAND_FILE) ; None : désactivée
+SHAPING_BACKEND = None
+SHAPING_INTERFACE = 'br-lan'           # Interface côté clients (débit descendant)
+SHAPING_UPLOAD_INTERFACE = None        # Interface ifb du trafic montant redirigé ; None : montant non limité
+SHAPING_COMMAND_FILE = os.path.join(BASE_DIR, 'shaping.tc')
+SHAPING_FLUSH_DELAY = 0.05             # Secondes de regroupement avant envoi d'un lot
+SHAPING_LIMIT_EVENT_INTERVAL = 300     # Secondes minimum entre deux activités BANDWIDTH_LIMIT d'une session
+SHAPING_LIMIT_POLL_INTERVAL = 60       # Secondes entre deux relevés des compteurs (commande record_bandwidth_limits)
+
+# Forfaits au volume : comptage des octets par client (captive_portal.accounting, commande collect_usage)
+ACCOUNTING_SOURCE = 'conntrack'        # 'conntrack', 'nftables' (ensembles à compteurs), 'iptables'
+ACCOUNTING_CONNTRACK_FILE = '/proc/net/nf_conntrack'
+ACCOUNTING_NFT_TABLE = 'bestconnect'
+ACCOUNTING_IPTABLES_CHAIN = 'BESTCONNECT_ACCT'
+ACCOUNTING_INTERVAL = 30               # Secondes entre deux relevés
+ACCOUNTING_BATCH_SIZE = 1000           # Sessions ou abonnements par requête UPDATE
+
+# Serveur RADIUS des NAS et points d'accès (captive_portal.radius, commande run_radius)
+RADIUS_CLIENTS = {}                    # {adresse IP du NAS: secret partagé} ; paquets des autres adresses ignorés
+RADIUS_AUTH_PORT = 1812
+RADIUS_ACCT_PORT = 1813
+RADIUS_AUTH_WORKERS = 4                # Threads de vérification des mots de passe
+RADIUS_FLUSH_INTERVAL = 0.2            # Secondes d'attente maximum d'un paquet de comptabilité avant écriture
+RADIUS_BATCH_SIZE = 1000               # Paquets de comptabilité par lot d'écriture
+RADIUS_REQUIRE_MESSAGE_AUTHENTICATOR = False  # Refuser les Access-Request sans Message-Authenticator
+
+# Adresses MAC des clients résolues par la passerelle (captive_portal.neighbors) : [(type, chemin)]
+# Types 'dnsmasq', 'isc' (dhcpd.leases), 'arp' ; par priorité croissante, fichiers absents ignorés
+NEIGHBOR_SOURCES = [
+    ('dnsmasq', '/var/lib/misc/dnsmasq.leases'),
+    ('arp', '/proc/net/arp'),
+]
+NEIGHBOR_REFRESH_INTERVAL = 2          # Secondes minimum entre deux vérifications des fichiers
+NEIGHBOR_TRUST_CLIENT_MAC = False      # MAC introuvable côté passerelle : accepter celle envoyée par le client (falsifiable)
+
+# Rétention de l'historique réseau (NetworkActivity / BandwidthUsage)
+NETWORK_RAW_RETENTION_DAYS = 7        # Mesures brutes, puis agrégats horaires
+NETWORK_HOURLY_RETENTION_DAYS = 90    # Agrégats horaires, puis agrégats journaliers
+NETWORK_DAILY_RETENTION_DAYS = None   # Agrégats journaliers conservés indéfiniment
+NETWORK_RETENTION_BATCH_SIZE = 5000
+NETWORK_RETENTION_MAX_BATCHES = 20    # Lots maximum par étape et par exécution
+
+# Rapprochement des paiements Mobile Money avec les transactions SMS en attente :
+# trop-perçu (Ar) toléré en dernier recours (frais de l'opérateur, arrondis) ; un paiement inférieur
+# au montant attendu n'est jamais rapproché
+SMS_MATCH_AMOUNT_TOLERANCE = 50
+
+# Suivi du statut d'une transaction SMS par le client, en secondes
+PAYMENT_STATUS_LONG_POLL_TIMEOUT = 50         # Attente longue maximum, sous le délai de lecture des proxys (60 s)
+PAYMENT_STATUS_DB_CHECK_INTERVAL = 1          # Relecture du statut en base pendant une attente longue
+PAYMENT_STATUS_POLL_INTERVAL = 3              # Polling simple : intervalle conseillé en attente du paiement,
+PAYMENT_STATUS_POLL_BACKOFF_AFTER = 60        # doublé toutes les 60 s d'attente
+PAYMENT_STATUS_MAX_POLL_INTERVAL = 15         # jusqu'à 15 s
+PAYMENT_STATUS_PROCESSING_POLL_INTERVAL = 1   # Paiement reçu, identifiants WiFi en préparation
+
+# Traitement des paiements confirmés (identifiants WiFi, QR code, envoi au client)
+FULFILLMENT_BACKEND = 'local'   # Pool de threads du processus ; 'celery' avec un broker partagé
+FULFILLMENT_WORKERS = 4
+FULFILLMENT_STAGE_RETRIES = 3
+FULFILLMENT_RETRY_DELAY = 2     # Secondes, doublé à chaque nouvelle tentative
+FULFILLMENT_STALL_TIMEOUT = 120      # Secondes avant de relancer un paiement confirmé resté inachevé
+FULFILLMENT_RESUME_MAX_AGE = 86400   # Secondes : paiements plus anciens non relancés automatiquement
+CREDENTIALS_SMS_SENDER = None        # Chemin d'une fonction send(numéro, message) ; None : pas d'envoi SMS
+
+# Expiration des abonnements (balayage toutes les 30 s, voir BestConnect/celery.py)
+SUBSCRIPTION_EXPIRY_BATCH_SIZE = 1000
+SUBSCRIPTION_EXPIRY_MAX_BATCHES = 50   # Lots maximum par exécution
+
+# Passerelle du portail captif : vérification de la connectivité des abonnés (subscriptions.connectivity)
+CAPTIVE_PORTAL_API_URL = 'http://127.0.0.1:8080'
+CONNECTIVITY_CHECK_CONCURRENCY = 20   # Requêtes simultanées au plus (vérification par utilisateur)
+CONNECTIVITY_CHECK_TIMEOUT = 5        # Secondes
+
+# Exports de l'admin (payments.exports) : lignes lues par requête, plafond de l'export PDF (au-delà : CSV/XLSX)
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_PDF_MAX_ROWS = 20000
+
+# Rapports lourds produits en arrière-plan (payments.reports), documents sous MEDIA_ROOT/reports/
+REPORT_JOB_BACKEND = 'local'   # Pool de threads du processus ; 'celery' avec un broker partagé
+REPORT_JOB_WORKERS = 2
+REPORT_JOB_TIMEOUT = 900       # Secondes : au-delà, un job interrompu n'est plus relancé mais marqué en échec
+REPORT_JOB_STALL_TIMEOUT = 300 # Secondes sans progression : job considéré comme interrompu (processus arrêté)
+
+# Tickets WiFi prépayés générés en masse (users.vouchers)
+VOUCHER_WORKERS = None            # Processus de hachage et de rendu des QR codes (None : un par cœur)
+VOUCHER_PASSWORD_LENGTH = 8
+VOUCHER_BATCH_SIZE = 1000         # Lignes par requête d'insertion
+VOUCHER_ADMIN_MAX_COUNT = 500     # Action de l'admin (requête HTTP) ; au-delà, commande generate_vouchers
+
+# Statistiques des paiements : durée de vie maximale (secondes) du résultat en cache
+STATISTICS_CACHE_TIMEOUT = 300
+
+# QR codes : nombre d'images PNG gardées en mémoire (portal.qr)
+QR_CACHE_SIZE = 512
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -0,0 +1,244 @@
+"""Comptage des octets par client depuis les compteurs du noyau (forfaits au volume).
+
+Un collecteur relève périodiquement des compteurs cumulés et n'en retient que
+la progression depuis le relevé précédent (un compteur qui recule a été remis
+à zéro : sa valeur entière est comptée). La progression est ventilée par
+adresse IP sur les sessions actives puis écrite par lots (UPDATE ... CASE, une
+requête par lot de sessions ou d'abonnements, jamais une écriture par ligne) :
+
+- octets des sessions (UserSession.metered_bytes_*) ;
+- volume consommé de l'abonnement en cours s'il est au volume
+  (Subscription.data_used, quota Plan.data_quota_mb).
+
+L'abonnement dont le quota est atteint est désactivé au relevé même qui l'épuise
+et les sessions de l'utilisateur (sans autre abonnement en cours) sont
+terminées comme à l'expiration (activité LOGOUT, motif quota_exhausted,
+retrait du pare-feu et de la limitation de débit).
+
+Sources (ACCOUNTING_SOURCE) :
+
+- 'nftables' : ensembles dynamiques à compteurs de la table
+  ACCOUNTING_NFT_TABLE, alimentés par la passerelle, par exemple
+  « add @account_up4 { ip saddr counter } » et
+  « add @account_down4 { ip daddr counter } » dans la chaîne forward ;
+- 'iptables' : règles de la chaîne ACCOUNTING_IPTABLES_CHAIN (une règle -s et
+  une règle -d par client), lues par « iptables-save -c » ;
+- 'conntrack' : table des connexions avec comptage (nf_conntrack_acct=1),
+  fichier ACCOUNTING_CONNTRACK_FILE ou sortie de « conntrack -L » ; chaque
+  connexion est suivie séparément, les octets qu'elle a échangés depuis le
+  dernier relevé sont perdus si elle se ferme avant le suivant.
+
+Les relevés précédents sont gardés en mémoire : la collecte tourne dans un
+seul processus (commande collect_usage), le premier relevé sert de référence.
+"""
+import json
+import logging
+import re
+import subprocess
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ACCOUNTING_SOURCE = getattr(settings, 'ACCOUNTING_SOURCE', 'conntrack')
+ACCOUNTING_CONNTRACK_FILE = getattr(settings, 'ACCOUNTING_CONNTRACK_FILE', '/proc/net/nf_conntrack')
+ACCOUNTING_NFT_TABLE = getattr(settings, 'ACCOUNTING_NFT_TABLE', 'bestconnect')
+ACCOUNTING_IPTABLES_CHAIN = getattr(settings, 'ACCOUNTING_IPTABLES_CHAIN', 'BESTCONNECT_ACCT')
+ACCOUNTING_INTERVAL = getattr(settings, 'ACCOUNTING_INTERVAL', 30)
+ACCOUNTING_BATCH_SIZE = getattr(settings, 'ACCOUNTING_BATCH_SIZE', 1000)
+
+# Sens d'origine puis sens de réponse : protocole, adresses, ports (ou type/code ICMP) et octets
+_CONNTRACK_PATTERN = re.compile(
+    r'^(?:\S+\s+\d+\s+)?(\S+)\s+\d+\s.*?src=(\S+) dst=(\S+) (.*?)packets=\d+ bytes=(\d+) .*?bytes=(\d+)',
+    re.MULTILINE
+)
+_IPTABLES_PATTERN = re.compile(r'^\[\d+:(\d+)\] -A (\S+) .*?-([sd]) (\S+?)(?:/(?:32|128))?(?:\s|$)', re.MULTILINE)
+
+
+class ConntrackCounters:
+    """Compteurs par connexion de la table conntrack"""
+    name = 'conntrack'
+
+    def __init__(self, path=ACCOUNTING_CONNTRACK_FILE):
+        self.path = path
+
+    def read(self, clients):
+        """{clé de connexion: (ip du client, octets envoyés, octets reçus)} des connexions des clients"""
+        with open(self.path, encoding='ascii', errors='replace') as handle:
+            content = handle.read()
+        counters = {}
+        for protocol, source, destination, ports, original, reply in _CONNTRACK_PATTERN.findall(content):
+            if source in clients:
+                counters[(protocol, source, destination, ports)] = (source, int(original), int(reply))
+            elif destination in clients:
+                # Connexion entrante vers le client (redirection de port)
+                counters[(protocol, source, destination, ports)] = (destination, int(reply), int(original))
+        return counters
+
+
+class NftablesCounters:
+    """Compteurs par élément des ensembles dynamiques nftables"""
+    name = 'nftables'
+    SETS = {'account_up4': 0, 'account_up6': 0, 'account_down4': 1, 'account_down6': 1}
+
+    def __init__(self, table=ACCOUNTING_NFT_TABLE, family='inet'):
+        self.table = table
+        self.family = family
+
+    def read(self, clients):
+        totals = defaultdict(lambda: [0, 0])
+        for name, direction in self.SETS.items():
+            result = subprocess.run(['nft', '-j', 'list', 'set', self.family, self.table, name],
+                                    text=True, capture_output=True)
+            if result.returncode:
+                continue
+            for item in json.loads(result.stdout).get('nftables', []):
+                for element in item.get('set', {}).get('elem', []):
+                    element = element.get('elem', {}) if isinstance(element, dict) else {}
+                    ip_address = element.get('val')
+                    if ip_address in clients:
+                        totals[ip_address][direction] += element.get('counter', {}).get('bytes', 0)
+        return {ip_address: (ip_address, up, down) for ip_address, (up, down) in totals.items()}
+
+
+class IptablesCounters:
+    """Compteurs des règles par client d'une chaîne iptables"""
+    name = 'iptables'
+
+    def __init__(self, chain=ACCOUNTING_IPTABLES_CHAIN, command=('iptables-save', '-c')):
+        self.chain = chain
+        self.command = command
+
+    def read(self, clients):
+        output = subprocess.run(list(self.command), text=True, capture_output=True, check=True).stdout
+        totals = defaultdict(lambda: [0, 0])
+        for count, chain, direction, ip_address in _IPTABLES_PATTERN.findall(output):
+            if chain == self.chain and ip_address in clients:
+                totals[ip_address][0 if direction == 's' else 1] += int(count)
+        return {ip_address: (ip_address, up, down) for ip_address, (up, down) in totals.items()}
+
+
+SOURCES = {
+    'conntrack': ConntrackCounters,
+    'nftables': NftablesCounters,
+    'iptables': IptablesCounters,
+}
+
+
+def active_clients():
+    """Sessions actives par adresse IP : {ip: (session_id, user_id)}"""
+    from .models import UserSession
+
+    rows = UserSession.objects.filter(is_active=True).order_by('id').values_list('ip_address', 'id', 'user_id')
+    return {ip_address: (session_id, user_id) for ip_address, session_id, user_id in rows.iterator(chunk_size=5000)}
+
+
+class UsageCollector:
+    """Relève les compteurs d'une source et reporte leur progression sur les sessions et les quotas"""
+
+    def __init__(self, source, batch_size=ACCOUNTING_BATCH_SIZE):
+        self.source = source
+        self.batch_size = batch_size
+        self._previous = None  # {clé: (envoyés, reçus)} du relevé précédent
+
+    def deltas(self, counters):
+        """Progression par client depuis le relevé précédent : {ip: [envoyés, reçus]}"""
+        previous, self._previous = self._previous, {key: (up, down) for key, (_, up, down) in counters.items()}
+        if previous is None:
+            return {}  # Premier relevé : référence
+        deltas = defaultdict(lambda: [0, 0])
+        for key, (ip_address, up, down) in counters.items():
+            before = previous.get(key)
+            if before is not None and up >= before[0] and down >= before[1]:
+                up, down = up - before[0], down - before[1]
+            # Sinon : nouveau compteur ou compteur remis à zéro, valeur entière
+            if up or down:
+                delta = deltas[ip_address]
+                delta[0] += up
+                delta[1] += down
+        return deltas
+
+    def poll(self, timings=None):
+        """Un relevé complet ; retourne un résumé (clients, compteurs, octets, quotas épuisés)"""
+        timings = {} if timings is None else timings
+        started = time.perf_counter()
+        clients = active_clients()
+        counters = self.source.read(clients)
+        timings['lecture'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        deltas = self.deltas(counters)
+        sessions = {}
+        users = defaultdict(int)
+        for ip_address, (up, down) in deltas.items():
+            session_id, user_id = clients[ip_address]
+            sessions[session_id] = (up, down)
+            users[user_id] += up + down
+        timings['calcul'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        exhausted = self._record(sessions, users) if sessions else 0
+        timings['base'] = time.perf_counter() - started
+        return {
+            'clients': len(clients),
+            'counters': len(counters),
+            'sessions': len(sessions),
+            'bytes': sum(users.values()),
+            'exhausted': exhausted,
+        }
+
+    def _record(self, sessions, users):
+        """Écrit la progression ; coupe les abonnements dont le quota est atteint"""
+        from captive_portal.entitlements import invalidate_entitlement
+        from captive_portal.models import UserSession
+        from payments.statistics import invalidate_statistics
+        from subscriptions.expiry import end_user_sessions
+        from subscriptions.models import Subscription
+
+        now = timezone.now()
+        with transaction.atomic():
+            UserSession.add_metered_usage(sessions, batch_size=self.batch_size)
+
+            # Abonnement en cours de chaque utilisateur (le premier, comme à la connexion)
+            current = {}
+            user_ids = list(users)
+            for start in range(0, len(user_ids), self.batch_size):
+                rows = Subscription.objects.filter(
+                    user_id__in=user_ids[start:start + self.batch_size], is_active=True, end_date__gt=now
+                ).order_by('-pk').values_list('id', 'user_id', 'data_used', 'plan__data_quota_mb')
+                for subscription_id, user_id, data_used, quota_mb in rows:
+                    current[user_id] = (subscription_id, data_used, quota_mb)
+
+            usage = {}
+            exhausted = {}
+            for user_id, (subscription_id, data_used, quota_mb) in current.items():
+                if quota_mb is None:
+                    continue
+                usage[subscription_id] = users[user_id]
+                if data_used + users[user_id] >= quota_mb * 1024 * 1024:
+                    exhausted[subscription_id] = user_id
+            Subscription.add_data_usage(usage, batch_size=self.batch_size)
+            if not exhausted:
+                return 0
+
+            Subscription.objects.filter(id__in=list(exhausted), is_active=True).update(is_active=False, updated_at=now)
+            cut_off = set(exhausted.values())
+            # Un utilisateur qui a encore un autre abonnement en cours garde ses sessions
+            entitled = set(Subscription.entitled(now).filter(
+                user_id__in=cut_off
+            ).values_list('user_id', flat=True))
+            ended = end_user_sessions(cut_off - entitled, now, reason='quota_exhausted')
+            transaction.on_commit(invalidate_statistics)
+            for user_id in cut_off:
+                transaction.on_commit(lambda user_id=user_id: invalidate_entitlement(user_id))
+
+        logger.info(f"{len(exhausted)} quota(s) épuisé(s), {ended} session(s) terminée(s)")
+        return len(exhausted)
+
+
+def get_collector(source=None, **options):
+    return UsageCollector(SOURCES[source or ACCOUNTING_SOURCE](**options))
@@ -1,7 +1,10 @@
 from django.contrib import admin
+from django.db.models import F
 from django.utils.html import format_html
-from django.db.models import Sum, Avg
-from .models import UserSession, NetworkActivity, DeviceFingerprint, BandwidthUsage
+from .models import (
+    UserSession, NetworkActivity, DeviceFingerprint, BandwidthUsage,
+    NetworkActivityRollup, BandwidthUsageRollup
+)
 
 @admin.register(UserSession)
 class UserSessionAdmin(admin.ModelAdmin):
@@ -12,7 +15,10 @@ class UserSessionAdmin(admin.ModelAdmin):
     date_hierarchy = 'start_time'
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user').prefetch_related('activities')
+        # Total montant + descendant calculé en SQL pour permettre le tri sur la colonne
+        return super().get_queryset(request).select_related('user').annotate(
+            data_transfer_total=F('bytes_uploaded') + F('bytes_downloaded')
+        )
     
     def duration(self, obj):
         if obj.end_time:
@@ -22,18 +28,16 @@ class UserSessionAdmin(admin.ModelAdmin):
     duration.short_description = 'Durée'
     
     def data_usage(self, obj):
-        total = obj.activities.aggregate(
-            total_up=Sum('bytes_uploaded'),
-            total_down=Sum('bytes_downloaded')
-        )
-        if total['total_up'] or total['total_down']:
-            total_mb = ((total['total_up'] or 0) + (total['total_down'] or 0)) / (1024 * 1024)
+        # Compteurs pré-agrégés : aucune requête supplémentaire par ligne
+        if obj.total_data_transfer:
+            total_mb = obj.total_data_transfer / (1024 * 1024)
             return f"{total_mb:.2f} MB"
         return "0 MB"
     data_usage.short_description = 'Données utilisées'
+    data_usage.admin_order_field = 'data_transfer_total'
     
     def total_activities(self, obj):
-        return obj.activities.count()
+        return obj.activity_count
     total_activities.short_description = 'Nombre d\'activités'
     
     def total_data_transfer(self, obj):
@@ -92,4 +96,24 @@ class BandwidthUsageAdmin(admin.ModelAdmin):
     def total_data(self, obj):
         total_mb = (obj.total_uploaded + obj.total_downloaded) / (1024 * 1024)
         return f"{total_mb:.2f} MB"
-    total_data.short_description = 'Données totales'
\ No newline at end of file
+    total_data.short_description = 'Données totales'
+
+@admin.register(NetworkActivityRollup)
+class NetworkActivityRollupAdmin(admin.ModelAdmin):
+    list_display = ['session', 'granularity', 'bucket_start', 'activity_count', 'data_transfer_display']
+    list_filter = ['granularity', 'bucket_start']
+    search_fields = ['session__user__username']
+    date_hierarchy = 'bucket_start'
+    list_select_related = ['session__user']
+    
+    def data_transfer_display(self, obj):
+        return f"{obj.total_data_transfer / (1024 * 1024):.2f} MB"
+    data_transfer_display.short_description = 'Transfert de données'
+
+@admin.register(BandwidthUsageRollup)
+class BandwidthUsageRollupAdmin(admin.ModelAdmin):
+    list_display = ['session', 'granularity', 'bucket_start', 'sample_count', 'average_download_speed', 'average_upload_speed']
+    list_filter = ['granularity', 'bucket_start']
+    search_fields = ['session__user__username']
+    date_hierarchy = 'bucket_start'
+    list_select_related = ['session__user']
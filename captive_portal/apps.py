@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class CaptivePortalConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'captive_portal'
+
+    def ready(self):
+        # Brancher les signaux (invalidation du cache des droits d'accès)
+        from . import signals  # noqa: F401
@@ -0,0 +1,87 @@
+"""Mises à jour regroupées de l'état réseau de la passerelle (pare-feu, limitation de débit).
+
+Les changements demandés par les connexions et déconnexions sont accumulés
+par clé (dernier état demandé) puis appliqués en un seul appel par un thread
+dédié, après une courte fenêtre de regroupement. Un lot refusé ou le premier
+démarrage du thread déclenchent une resynchronisation complète depuis la base.
+"""
+import logging
+import threading
+import time
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class BatchedUpdater:
+    """Accumule des changements {clé: état} et les applique par lots depuis un thread dédié.
+
+    Les sous-classes fournissent _apply(pending) et _reconcile(**options).
+    """
+    thread_name = 'batched-updates'
+
+    def __init__(self, flush_delay, reconcile_on_start=True):
+        self.flush_delay = flush_delay
+        self._reconciled = not reconcile_on_start
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _queue(self, key, value):
+        with self._lock:
+            self._pending[key] = value
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # Fenêtre de regroupement : les changements qui arrivent entre-temps partent dans le même lot
+            time.sleep(self.flush_delay)
+            self._wakeup.clear()
+            try:
+                if not self._reconciled:
+                    self.reconcile()
+                self.flush()
+            except Exception:
+                logger.exception(f"Échec de la mise à jour ({self.thread_name})")
+            finally:
+                close_old_connections()
+
+    def _discard_pending(self):
+        """Oublie les changements en attente (déjà validés en base, repris par une resynchronisation)"""
+        with self._lock:
+            self._pending.clear()
+
+    def flush(self):
+        """Applique les changements en attente ; retourne leur nombre"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            try:
+                self._apply(pending)
+            except Exception:
+                logger.exception(f"Lot de {len(pending)} changement(s) refusé ({self.thread_name})")
+                # Resynchronisation complète depuis la base, qui reflète déjà ces changements
+                self._reconcile()
+            return len(pending)
+
+    def reconcile(self, **options):
+        with self._flush_lock:
+            result = self._reconcile(**options)
+            if not options.get('dry_run'):
+                self._reconciled = True
+            return result
+
+    def _apply(self, pending):
+        raise NotImplementedError
+
+    def _reconcile(self, **options):
+        raise NotImplementedError
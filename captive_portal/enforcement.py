@@ -0,0 +1,292 @@
+"""Pont vers le pare-feu de la passerelle : clients autorisés (MAC + IP) des sessions actives.
+
+Chaque session active du portail captif autorise un couple (adresse MAC,
+adresse IP) au niveau paquet. Les ouvertures et fins de session (signaux de
+UserSession, balayage des abonnements échus) ne sont pas appliquées une à
+une : elles sont accumulées puis envoyées par lots au pare-feu, chaque lot ne
+contenant que le dernier état de chaque client (un client connecté puis
+déconnecté dans la même fenêtre n'y figure qu'une fois). Un lot est appliqué
+en une seule invocation de l'outil, de façon atomique.
+
+Backends (ENFORCEMENT_BACKEND) :
+
+- 'nftables' : ensembles ether_addr . ipv4_addr / ether_addr . ipv6_addr de la
+  table ENFORCEMENT_NFT_TABLE, script passé à « nft -f - » ;
+- 'ipset' : ensemble hash:ip,mac (IPv4), script passé à « ipset restore » ;
+- 'file' : simulation, les scripts nftables sont ajoutés à
+  ENFORCEMENT_DRY_RUN_FILE au lieu d'être exécutés ;
+- None : pont désactivé.
+
+Le jeu de règles de la passerelle reste maître du filtrage et ne fait que
+consulter ces ensembles, par exemple :
+« ether saddr . ip saddr @authorized4 accept ».
+
+reconcile() compare l'ensemble appliqué à la table des sessions et n'envoie que
+la différence : au démarrage du pont dans chaque processus, toutes les minutes
+(Celery beat), au démarrage de la passerelle (commande sync_enforcement) et
+après un lot refusé par le pare-feu. Une session sans MAC prend celle que la
+passerelle connaît pour son IP (captive_portal.neighbors) ; les sessions dont
+la MAC reste inconnue ne peuvent pas être autorisées au niveau paquet et sont
+ignorées.
+"""
+import ipaddress
+import json
+import logging
+import re
+import subprocess
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import neighbors
+from .batching import BatchedUpdater
+
+logger = logging.getLogger(__name__)
+
+ENFORCEMENT_BACKEND = getattr(settings, 'ENFORCEMENT_BACKEND', None)
+ENFORCEMENT_NFT_TABLE = getattr(settings, 'ENFORCEMENT_NFT_TABLE', 'bestconnect')
+ENFORCEMENT_IPSET_NAME = getattr(settings, 'ENFORCEMENT_IPSET_NAME', 'bestconnect_authorized')
+ENFORCEMENT_DRY_RUN_FILE = getattr(settings, 'ENFORCEMENT_DRY_RUN_FILE', 'enforcement.nft')
+ENFORCEMENT_FLUSH_DELAY = getattr(settings, 'ENFORCEMENT_FLUSH_DELAY', 0.05)
+ENFORCEMENT_BATCH_SIZE = getattr(settings, 'ENFORCEMENT_BATCH_SIZE', 1000)
+
+_MAC_PATTERN = re.compile(r'^[0-9a-f]{2}(:[0-9a-f]{2}){5}$')
+
+_bridge = None
+_bridge_lock = threading.Lock()
+
+
+def client_entry(mac_address, ip_address):
+    """Couple (mac, ip) normalisé, ou None si la session ne peut pas être autorisée au niveau paquet"""
+    if not mac_address or not ip_address:
+        return None
+    mac_address = mac_address.strip().lower().replace('-', ':')
+    if not _MAC_PATTERN.match(mac_address):
+        return None
+    try:
+        ip_address = str(ipaddress.ip_address(ip_address.strip()))
+    except ValueError:
+        return None
+    return mac_address, ip_address
+
+
+def active_clients():
+    """Clients des sessions actives de la table"""
+    from .models import UserSession
+
+    rows = UserSession.objects.filter(is_active=True).values_list('mac_address', 'ip_address')
+    entries = (
+        client_entry(mac_address or neighbors.resolve(ip_address), ip_address)
+        for mac_address, ip_address in rows.iterator(chunk_size=5000)
+    )
+    return {entry for entry in entries if entry}
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class NftablesBackend:
+    """Ensembles nftables, un par famille d'adresses"""
+    name = 'nftables'
+    SETS = {4: ('authorized4', 'ether_addr . ipv4_addr'), 6: ('authorized6', 'ether_addr . ipv6_addr')}
+
+    def __init__(self, table=ENFORCEMENT_NFT_TABLE, family='inet', batch_size=ENFORCEMENT_BATCH_SIZE):
+        self.table = table
+        self.family = family
+        self.batch_size = batch_size
+
+    def _by_set(self, entries):
+        sets = {}
+        for mac_address, ip_address in entries:
+            name = self.SETS[ipaddress.ip_address(ip_address).version][0]
+            sets.setdefault(name, []).append(f'{mac_address} . {ip_address}')
+        return sets
+
+    def script(self, add=(), remove=()):
+        """Script « nft -f » : table et ensembles (créés s'ils manquent), ajouts puis retraits"""
+        prefix = f'{self.family} {self.table}'
+        lines = [f'add table {prefix}']
+        lines += [f'add set {prefix} {name} {{ type {kind}; }}' for name, kind in self.SETS.values()]
+        for name, elements in self._by_set(add).items():
+            for chunk in _chunks(elements, self.batch_size):
+                lines.append(f'add element {prefix} {name} {{ {", ".join(chunk)} }}')
+        for name, elements in self._by_set(remove).items():
+            for chunk in _chunks(elements, self.batch_size):
+                # Ajout avant retrait : un élément déjà absent ne fait pas échouer le lot
+                lines.append(f'add element {prefix} {name} {{ {", ".join(chunk)} }}')
+                lines.append(f'delete element {prefix} {name} {{ {", ".join(chunk)} }}')
+        return '\n'.join(lines) + '\n'
+
+    def _run(self, script):
+        subprocess.run(['nft', '-f', '-'], input=script, text=True, capture_output=True, check=True)
+
+    def apply(self, add=(), remove=()):
+        self._run(self.script(add, remove))
+
+    def entries(self):
+        """Clients présents dans les ensembles du pare-feu"""
+        entries = set()
+        for name, _ in self.SETS.values():
+            result = subprocess.run(
+                ['nft', '-j', 'list', 'set', self.family, self.table, name],
+                text=True, capture_output=True
+            )
+            if result.returncode:
+                continue  # Ensemble pas encore créé
+            for item in json.loads(result.stdout).get('nftables', []):
+                for element in item.get('set', {}).get('elem', []):
+                    # Élément simple ({"concat": [...]}) ou avec options ({"elem": {"val": {"concat": [...]}}})
+                    value = element.get('elem', {}).get('val', element) if isinstance(element, dict) else {}
+                    entry = client_entry(*value.get('concat', (None, None)))
+                    if entry:
+                        entries.add(entry)
+        return entries
+
+
+class IpsetBackend:
+    """Ensemble ipset hash:ip,mac (IPv4 uniquement)"""
+    name = 'ipset'
+
+    def __init__(self, set_name=ENFORCEMENT_IPSET_NAME):
+        self.set_name = set_name
+
+    def _elements(self, entries):
+        for mac_address, ip_address in entries:
+            if ipaddress.ip_address(ip_address).version == 4:
+                yield f'{ip_address},{mac_address}'
+            else:
+                logger.debug(f"Client IPv6 ignoré par ipset : {mac_address} {ip_address}")
+
+    def script(self, add=(), remove=()):
+        lines = [f'create {self.set_name} hash:ip,mac -exist']
+        lines += [f'add {self.set_name} {element} -exist' for element in self._elements(add)]
+        lines += [f'del {self.set_name} {element} -exist' for element in self._elements(remove)]
+        return '\n'.join(lines) + '\n'
+
+    def apply(self, add=(), remove=()):
+        subprocess.run(['ipset', 'restore'], input=self.script(add, remove), text=True,
+                       capture_output=True, check=True)
+
+    def entries(self):
+        result = subprocess.run(['ipset', 'save', self.set_name], text=True, capture_output=True)
+        if result.returncode:
+            return set()
+        entries = set()
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            if len(parts) >= 3 and parts[0] == 'add':
+                ip_address, _, mac_address = parts[2].partition(',')
+                entry = client_entry(mac_address, ip_address)
+                if entry:
+                    entries.add(entry)
+        return entries
+
+
+class FileBackend(NftablesBackend):
+    """Simulation : scripts nftables ajoutés à un fichier, ensemble tenu en mémoire"""
+    name = 'file'
+
+    def __init__(self, path=ENFORCEMENT_DRY_RUN_FILE, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._entries = set()
+
+    def _run(self, script):
+        with open(self.path, 'a', encoding='utf-8') as handle:
+            handle.write(f'# {timezone.now().isoformat()}\n{script}')
+
+    def apply(self, add=(), remove=()):
+        super().apply(add, remove)
+        self._entries.update(add)
+        self._entries.difference_update(remove)
+
+    def entries(self):
+        return set(self._entries)
+
+
+BACKENDS = {
+    'nftables': NftablesBackend,
+    'ipset': IpsetBackend,
+    'file': FileBackend,
+}
+
+
+class EnforcementBridge(BatchedUpdater):
+    """Accumule les autorisations et retraits et les applique par lots depuis un thread dédié"""
+    thread_name = 'enforcement'
+
+    def __init__(self, backend, flush_delay=ENFORCEMENT_FLUSH_DELAY, reconcile_on_start=True):
+        super().__init__(flush_delay, reconcile_on_start)
+        self.backend = backend
+
+    def grant(self, mac_address, ip_address):
+        entry = client_entry(mac_address or neighbors.resolve(ip_address), ip_address)
+        if entry:
+            self._queue(entry, True)
+
+    def revoke(self, mac_address, ip_address):
+        entry = client_entry(mac_address or neighbors.resolve(ip_address), ip_address)
+        if entry:
+            self._queue(entry, False)
+
+    def _apply(self, pending):
+        # pending : {(mac, ip): autorisé}, dernier état demandé de chaque client
+        self.backend.apply(
+            [entry for entry, allowed in pending.items() if allowed],
+            [entry for entry, allowed in pending.items() if not allowed]
+        )
+
+    def _reconcile(self, desired=None, dry_run=False):
+        """Aligne le pare-feu sur les sessions actives (ou sur desired) ; retourne les écarts trouvés"""
+        if desired is None:
+            if not dry_run:
+                self._discard_pending()
+            # Pare-feu lu avant la base : un client autorisé entre les deux lectures figure dans les
+            # sessions actives et n'est donc pas retiré (au pire ajouté une seconde fois, sans effet)
+            current = self.backend.entries()
+            desired = active_clients()
+        else:
+            current = self.backend.entries()
+            desired = set(desired)
+        add, remove = desired - current, current - desired
+        if not dry_run and (add or remove):
+            self.backend.apply(add, remove)
+        result = {'clients': len(desired), 'added': len(add), 'removed': len(remove)}
+        if add or remove:
+            logger.info(f"Pare-feu resynchronisé : {result}")
+        return result
+
+
+def get_bridge():
+    """Pont du processus, ou None si ENFORCEMENT_BACKEND n'est pas configuré"""
+    global _bridge
+    if ENFORCEMENT_BACKEND is None:
+        return None
+    if _bridge is None:
+        with _bridge_lock:
+            if _bridge is None:
+                _bridge = EnforcementBridge(BACKENDS[ENFORCEMENT_BACKEND]())
+    return _bridge
+
+
+def grant(mac_address, ip_address):
+    bridge = get_bridge()
+    if bridge:
+        bridge.grant(mac_address, ip_address)
+
+
+def revoke(mac_address, ip_address):
+    bridge = get_bridge()
+    if bridge:
+        bridge.revoke(mac_address, ip_address)
+
+
+def reconcile(dry_run=False):
+    bridge = get_bridge()
+    if bridge is None:
+        return None
+    return bridge.reconcile(dry_run=dry_run)
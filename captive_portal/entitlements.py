@@ -0,0 +1,152 @@
+"""Résolution des droits d'accès au portail captif.
+
+Regroupe en une seule requête ce que la vue de connexion faisait en quatre ou
+cinq allers-retours : l'abonnement actif et son forfait (dont la limite de
+débit appliquée à la session, voir shaping), mis en cache quelques
+secondes par utilisateur et invalidés dès qu'un abonnement de l'utilisateur
+est enregistré. Seuls les droits effectifs sont mis en cache : l'absence
+d'abonnement est relue en base à chaque appel, pour qu'un paiement ouvre
+l'accès immédiatement. L'état des sessions actives pour l'adresse MAC
+présentée (verrou par appareil) est lu dans le registre des sessions, sans
+requête.
+
+Avant d'ouvrir une session, confirm_entitlement() relit en une seule requête
+l'abonnement, le forfait et les sessions actives de l'utilisateur : le cache
+et le registre d'un processus peuvent ignorer un quota épuisé ou une session
+ouverte ailleurs. Le cache et le registre sont corrigés au passage.
+
+L'invalidation par version n'atteint que le cache du processus qui enregistre
+l'abonnement : avec plusieurs processus (workers web, lecteur de modem,
+Celery), elle suppose un cache partagé (Redis, Memcached, base de données).
+Avec LocMemCache, un autre processus peut servir des droits périmés jusqu'à
+ENTITLEMENT_CACHE_TIMEOUT secondes.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import FilteredRelation, Q
+from django.utils import timezone
+
+from . import registry
+
+# Durée de vie (en secondes) d'une entrée du cache des droits d'accès
+ENTITLEMENT_CACHE_TIMEOUT = getattr(settings, 'ENTITLEMENT_CACHE_TIMEOUT', 30)
+
+
+def _version_key(user_id):
+    return f'entitlement:version:{user_id}'
+
+
+def _get_version(user_id):
+    """Version courante des entrées de l'utilisateur (créée à la demande)"""
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex[:8], None)
+        version = cache.get(key)
+    return version
+
+
+def _cache_key(user_id):
+    return f'entitlement:{user_id}:{_get_version(user_id)}'
+
+
+def invalidate_entitlement(user_id):
+    """Invalide les entrées en cache de l'utilisateur"""
+    # Supprimer la version rend inaccessibles toutes les clés construites avec elle
+    cache.delete(_version_key(user_id))
+
+
+def _entitlement(user_id, subscription_id=None, plan_name=None, end_date=None, rate_kbps=None, burst_kbytes=None):
+    return {
+        'user_id': user_id,
+        'subscription_id': subscription_id,
+        'plan_name': plan_name,
+        'end_date': end_date,
+        'rate_kbps': rate_kbps,
+        'burst_kbytes': burst_kbytes,
+    }
+
+
+def _query_entitlement(user_id):
+    """Abonnement actif + forfait, en une seule requête"""
+    from subscriptions.models import Subscription
+
+    # Un abonnement au volume dont le quota est atteint n'ouvre plus l'accès, même s'il est encore actif
+    subscription = Subscription.entitled().select_related('plan').filter(
+        user_id=user_id
+    ).order_by('pk').first()
+    if subscription is None:
+        return _entitlement(user_id)
+
+    return _entitlement(
+        user_id, subscription.pk, subscription.plan.name, subscription.end_date,
+        subscription.plan.rate_kbps, subscription.plan.burst_kbytes,
+    )
+
+
+def get_entitlement(user_id):
+    """Abonnement actif et forfait de l'utilisateur (cache, sinon une requête)"""
+    key = _cache_key(user_id)
+    entitlement = cache.get(key)
+
+    # Une entrée en cache ne doit jamais prolonger un abonnement expiré entre-temps
+    if entitlement is not None and entitlement['end_date'] is not None \
+            and entitlement['end_date'] <= timezone.now():
+        entitlement = None
+
+    if entitlement is None:
+        entitlement = _query_entitlement(user_id)
+        # Pas d'abonnement : non mis en cache (un abonnement créé dans un autre processus serait ignoré)
+        if entitlement['subscription_id'] is not None:
+            cache.set(key, entitlement, ENTITLEMENT_CACHE_TIMEOUT)
+    return entitlement
+
+
+def resolve_entitlement(user, mac_address=None):
+    """Retourne les droits d'accès de l'utilisateur pour cette adresse MAC.
+
+    Le dictionnaire retourné contient l'identifiant de l'abonnement actif
+    (None s'il n'y en a pas), le nom du forfait, la date de fin, la limite de
+    débit du forfait, un booléen indiquant une session active sur un autre
+    appareil et l'identifiant de la session active existante pour cette MAC.
+    """
+    return {
+        **get_entitlement(user.pk),
+        'other_device': registry.other_device(user.pk, mac_address),
+        'session_id': registry.device_session(user.pk, mac_address),
+    }
+
+
+def confirm_entitlement(user, mac_address=None):
+    """Comme resolve_entitlement, lu en base en une seule requête (abonnement, forfait, sessions actives).
+
+    Une ligne par session active de l'utilisateur (jointure externe), aucune
+    sans abonnement ouvrant l'accès. Le cache des droits et le registre des
+    sessions sont corrigés au passage.
+    """
+    from subscriptions.models import Subscription
+
+    rows = list(Subscription.entitled().filter(user_id=user.pk).annotate(
+        active_session=FilteredRelation('user__usersession', condition=Q(user__usersession__is_active=True))
+    ).order_by('pk', 'active_session__id').values_list(
+        'pk', 'plan__name', 'end_date', 'plan__rate_kbps', 'plan__burst_kbytes',
+        'active_session__id', 'active_session__mac_address'
+    ))
+    if not rows:
+        invalidate_entitlement(user.pk)
+        return {**_entitlement(user.pk), 'other_device': False, 'session_id': None}
+
+    entitlement = _entitlement(user.pk, *rows[0][:5])
+    cache.set(_cache_key(user.pk), entitlement, ENTITLEMENT_CACHE_TIMEOUT)
+    # Sessions de l'abonnement retenu (le premier) : les autres lignes les répètent
+    sessions = {session_id: mac for pk, *_, session_id, mac in rows if pk == rows[0][0] and session_id is not None}
+    registry.confirm_user_sessions(user.pk, sessions)
+
+    same_device = [session_id for session_id, mac in sessions.items() if mac_address and mac == mac_address]
+    return {
+        **entitlement,
+        'other_device': bool(mac_address) and any(mac != mac_address for mac in sessions.values()),
+        'session_id': min(same_device) if same_device else None,
+    }
@@ -0,0 +1,90 @@
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from captive_portal import accounting
+from captive_portal.models import UserSession
+from subscriptions.models import Plan, Subscription
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Mesure un relevé des compteurs conntrack pour des dizaines de milliers de clients (forfaits au volume)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=20000, help='Nombre de clients connectés')
+        parser.add_argument('--flows', type=int, default=8, help='Connexions suivies par client')
+        parser.add_argument('--polls', type=int, default=3, help='Relevés mesurés après le relevé de référence')
+
+    def handle(self, *args, **options):
+        count, flows = options['clients'], options['flows']
+        prefix = f"acct_{uuid.uuid4().hex[:6]}_"
+
+        self.stdout.write(f"Préparation de {count} clients ({count * flows} connexions)...")
+        plan = Plan.objects.create(
+            name='Forfait benchmark 20 Mo', description='Benchmark volume', duration=1, duration_unit='DAYS',
+            price=1000, data_quota_mb=20
+        )
+        User.objects.bulk_create([User(username=f"{prefix}{i}", password='!') for i in range(count)], batch_size=2000)
+        users = list(User.objects.filter(username__startswith=prefix).order_by('id'))
+        now = timezone.now()
+        Subscription.objects.bulk_create([
+            Subscription(user=user, plan=plan, start_date=now, end_date=now + timedelta(days=1)) for user in users
+        ], batch_size=2000)
+        ips = [f"10.{20 + i // 65536}.{i // 256 % 256}.{i % 256}" for i in range(count)]
+        UserSession.objects.bulk_create([
+            UserSession(user=user, ip_address=ip, user_agent='bench-accounting', mac_address=None)
+            for user, ip in zip(users, ips)
+        ], batch_size=2000)
+
+        directory = tempfile.mkdtemp(prefix='bench_accounting_')
+        path = os.path.join(directory, 'nf_conntrack')
+        # Octets cumulés par connexion (envoyés, reçus)
+        counters = [[0, 0] for _ in range(count * flows)]
+        collector = accounting.get_collector('conntrack', path=path)
+
+        try:
+            self._write(path, ips, flows, counters)
+            collector.poll()  # Référence
+            for poll in range(options['polls']):
+                for counter in counters:
+                    counter[0] += random.randint(0, 200_000)
+                    counter[1] += random.randint(0, 2_000_000)
+                self._write(path, ips, flows, counters)
+                timings = {}
+                started = time.perf_counter()
+                result = collector.poll(timings)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"Relevé {poll + 1} : {result['counters']} connexions, {result['sessions']} sessions, "
+                    f"{result['bytes'] / 1e9:.2f} Go, {result['exhausted']} quota(s) épuisé(s) - "
+                    f"{elapsed * 1000:.0f} ms ("
+                    + ', '.join(f"{stage} {seconds * 1000:.0f} ms" for stage, seconds in timings.items()) + ')'
+                )
+        finally:
+            User.objects.filter(username__startswith=prefix).delete()
+            plan.delete()
+            os.remove(path)
+            os.rmdir(directory)
+
+    @staticmethod
+    def _write(path, ips, flows, counters):
+        """Table conntrack simulée (format /proc/net/nf_conntrack avec nf_conntrack_acct=1)"""
+        lines = []
+        for index, (up, down) in enumerate(counters):
+            ip, port = ips[index // flows], 40000 + index % flows
+            lines.append(
+                f"ipv4     2 tcp      6 431999 ESTABLISHED src={ip} dst=93.184.216.34 sport={port} dport=443 "
+                f"packets={up // 1400 + 1} bytes={up} src=93.184.216.34 dst={ip} sport=443 dport={port} "
+                f"packets={down // 1400 + 1} bytes={down} [ASSURED] mark=0 zone=0 use=2\n"
+            )
+        with open(path, 'w') as handle:
+            handle.writelines(lines)
@@ -0,0 +1,129 @@
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from captive_portal import enforcement
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class _TimedBackend:
+    """Enregistre l'instant où chaque client est effectivement appliqué"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.applied = {}
+        self.batches = []
+
+    def apply(self, add=(), remove=()):
+        self.backend.apply(add, remove)
+        done = time.perf_counter()
+        self.batches.append(len(add) + len(remove))
+        for entry in list(add) + list(remove):
+            self.applied[entry] = done
+
+    def entries(self):
+        return self.backend.entries()
+
+
+class Command(BaseCommand):
+    help = 'Mesure la latence de mise à jour du pare-feu pour des connexions et déconnexions simultanées'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=5000, help='Nombre de clients connectés')
+        parser.add_argument('--duration', type=float, default=5.0,
+                            help='Durée (secondes) sur laquelle les connexions arrivent')
+        parser.add_argument('--backend', choices=sorted(enforcement.BACKENDS), default='file',
+                            help='nftables et ipset nécessitent les droits root ; file ne mesure que le regroupement par le pont')
+        parser.add_argument('--table', default='bestconnect_bench',
+                            help='Table nftables / ensemble ipset de test (jamais celui de production)')
+        parser.add_argument('--single-sample', type=int, default=200,
+                            help='Connexions mesurées pour la référence « une règle par connexion »')
+
+    def handle(self, *args, **options):
+        count = options['clients']
+        clients = [
+            (f"02:00:00:{i // 65536 % 256:02x}:{i // 256 % 256:02x}:{i % 256:02x}",
+             f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}")
+            for i in range(count)
+        ]
+        directory = tempfile.mkdtemp(prefix='bench_enforcement_')
+        backend = self._backend(options, directory)
+
+        try:
+            # Référence : une invocation du pare-feu par connexion
+            sample = clients[:options['single_sample']]
+            started = time.perf_counter()
+            for entry in sample:
+                backend.apply([entry], [])
+            per_rule = (time.perf_counter() - started) / max(len(sample), 1)
+            backend.apply([], sample)
+            self.stdout.write(
+                f"Une règle par connexion : {per_rule * 1000:.2f} ms par client, "
+                f"soit {per_rule * count:.2f} s pour {count} clients"
+            )
+
+            timed = _TimedBackend(backend)
+            bridge = enforcement.EnforcementBridge(timed, reconcile_on_start=False)
+            self._wave(bridge, timed, clients, options['duration'], 'Connexions', bridge.grant)
+
+            # Dérive : 5 % des clients retirés hors du pont, 5 % de clients inconnus ajoutés
+            drift = max(count // 20, 1)
+            backend.apply([(mac, f"172.16.{i // 256 % 256}.{i % 256}") for i, (mac, _) in enumerate(clients[:drift])],
+                          clients[-drift:])
+            started = time.perf_counter()
+            result = bridge.reconcile(desired=clients)
+            self.stdout.write(
+                f"Resynchronisation ({count} clients, {result['added']} ajout(s), {result['removed']} retrait(s)) : "
+                f"{(time.perf_counter() - started) * 1000:.1f} ms"
+            )
+
+            self._wave(bridge, timed, clients, options['duration'], 'Déconnexions', bridge.revoke)
+        finally:
+            backend.apply([], backend.entries())
+            if options['backend'] == 'file':
+                self.stdout.write(f"Scripts simulés : {backend.path} ({os.path.getsize(backend.path) // 1024} Ko)")
+
+    def _backend(self, options, directory):
+        if options['backend'] == 'file':
+            return enforcement.FileBackend(path=os.path.join(directory, 'enforcement.nft'),
+                                           table=options['table'])
+        if options['backend'] == 'ipset':
+            return enforcement.IpsetBackend(set_name=options['table'])
+        return enforcement.NftablesBackend(table=options['table'])
+
+    def _wave(self, bridge, timed, clients, duration, label, action):
+        """Connexions (ou déconnexions) réparties sur duration secondes, appliquées par le pont"""
+        timed.applied.clear()
+        timed.batches.clear()
+        interval = duration / len(clients)
+        queued = {}
+        started = time.perf_counter()
+        for i, entry in enumerate(clients):
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            queued[entry] = time.perf_counter()
+            action(*entry)
+
+        deadline = time.perf_counter() + 30
+        while len(timed.applied) < len(clients) and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        latencies = [(timed.applied[entry] - queued[entry]) * 1000 for entry in clients if entry in timed.applied]
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f"{label} : aucun client appliqué"))
+            return
+        self.stdout.write(
+            f"{label} ({len(latencies)}/{len(clients)} sur {duration:.0f} s, {threading.active_count()} threads) : "
+            f"{len(timed.batches)} lots de {statistics.mean(timed.batches):.0f} clients en moyenne - "
+            f"p50={_percentile(latencies, 50):.1f} ms p95={_percentile(latencies, 95):.1f} ms "
+            f"p99={_percentile(latencies, 99):.1f} ms"
+        )
@@ -0,0 +1,126 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import RequestFactory
+from django.utils import timezone
+
+from captive_portal.entitlements import resolve_entitlement
+from captive_portal.models import UserSession
+from captive_portal.views import login
+from subscriptions.models import Plan, Subscription
+
+User = get_user_model()
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _legacy_lookup(user, mac_address):
+    """Séquence de requêtes de l'ancienne vue de connexion (référence « avant »)"""
+    subscription = user.subscription_set.filter(
+        is_active=True,
+        end_date__gt=timezone.now()
+    ).first()
+    if not subscription:
+        return None
+    subscription.plan.name
+    active = UserSession.objects.filter(user=user, is_active=True)
+    if active.exclude(mac_address=mac_address).exists():
+        return None
+    if active.filter(mac_address=mac_address).exists():
+        active.filter(mac_address=mac_address).first()
+    return subscription
+
+
+class Command(BaseCommand):
+    help = 'Mesure la latence (p50/p95/p99) des connexions simultanées au portail captif'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help='Nombre de connexions simultanées')
+        parser.add_argument('--rounds', type=int, default=2, help='Nombre de vagues de connexions')
+        parser.add_argument('--full', action='store_true',
+                            help='Mesurer aussi la vue complète (authenticate + PBKDF2 inclus)')
+
+    def handle(self, *args, **options):
+        count = options['users']
+        prefix = f"bench_{uuid.uuid4().hex[:6]}_"
+        password = 'bench-password'
+
+        self.stdout.write(f"Préparation de {count} utilisateurs de test...")
+        plan = Plan.objects.create(
+            name='Forfait benchmark', description='Benchmark connexion',
+            duration=1, duration_unit='DAYS', price=1000
+        )
+        # Un seul hachage PBKDF2 partagé : la préparation ne doit pas dominer le test
+        encoded = make_password(password)
+        users = User.objects.bulk_create([
+            User(username=f"{prefix}{i}", password=encoded, phone_number='0340000000')
+            for i in range(count)
+        ])
+        users = list(User.objects.filter(username__startswith=prefix))
+        now = timezone.now()
+        Subscription.objects.bulk_create([
+            Subscription(user=user, plan=plan, start_date=now, end_date=now + timedelta(days=1))
+            for user in users
+        ])
+        macs = {user.pk: f"02:00:00:{i // 65536 % 256:02X}:{i // 256 % 256:02X}:{i % 256:02X}"
+                for i, user in enumerate(users)}
+
+        try:
+            self._run('Avant (requêtes séquentielles)', users, options['rounds'],
+                      lambda user: _legacy_lookup(user, macs[user.pk]))
+            cache.clear()
+            self._run('Après (requête jointe + cache + registre des sessions)', users, options['rounds'],
+                      lambda user: resolve_entitlement(user, macs[user.pk]))
+
+            if options['full']:
+                factory = RequestFactory()
+
+                def full_login(user):
+                    request = factory.post(
+                        '/api/captive-portal/login/',
+                        {'username': user.username, 'password': password, 'mac_address': macs[user.pk]},
+                        content_type='application/json',
+                        HTTP_USER_AGENT='bench-login'
+                    )
+                    login(request)
+
+                cache.clear()
+                self._run('Vue complète (après)', users, options['rounds'], full_login)
+        finally:
+            User.objects.filter(username__startswith=prefix).delete()
+            plan.delete()
+
+    def _run(self, label, users, rounds, func):
+        def timed(user):
+            started = time.perf_counter()
+            try:
+                func(user)
+                return (time.perf_counter() - started) * 1000
+            finally:
+                # Comme une requête Django (CONN_MAX_AGE=0) : une connexion par appel
+                connections.close_all()
+
+        samples = []
+        with ThreadPoolExecutor(max_workers=len(users)) as pool:
+            for _ in range(rounds):
+                samples.extend(pool.map(timed, users))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}: {len(samples)} connexions - "
+            f"p50={statistics.median(samples):.1f} ms "
+            f"p95={_percentile(samples, 95):.1f} ms "
+            f"p99={_percentile(samples, 99):.1f} ms"
+        ))
+        connection.close()
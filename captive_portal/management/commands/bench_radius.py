@@ -0,0 +1,219 @@
+import asyncio
+import os
+import socket
+import statistics
+import time
+import uuid
+from collections import Counter, deque
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from captive_portal import radius
+from captive_portal.models import BandwidthUsage, NetworkActivity, UserSession
+from subscriptions.models import Plan, Subscription
+
+User = get_user_model()
+
+
+class _Client(asyncio.DatagramProtocol):
+    """Socket NAS simulée : 256 identifiants de paquet disponibles"""
+
+    def __init__(self):
+        self.transport = None
+        self.free = deque(range(256))
+        self.pending = {}  # {identifiant: (envoi, phase)}
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, radius.RECEIVE_BUFFER)
+
+    def datagram_received(self, data, addr):
+        entry = self.pending.pop(data[1], None)
+        if entry is None:
+            return  # Réponse tardive ou retransmise
+        sent, phase = entry
+        phase['latencies'].append(time.perf_counter() - sent)
+        phase['codes'][data[0]] += 1
+        self.free.append(data[1])
+
+
+class Command(BaseCommand):
+    help = 'Charge le serveur RADIUS (lancé dans le processus) avec des milliers de paquets de comptabilité par seconde'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=2000, help='Sessions simulées (un Start et un Stop chacune)')
+        parser.add_argument('--rate', type=int, default=5000, help='Paquets envoyés par seconde')
+        parser.add_argument('--duration', type=float, default=10, help='Secondes d\'Interim-Update')
+        parser.add_argument('--auth', type=int, default=50, help='Access-Request envoyées avant la comptabilité')
+        parser.add_argument('--sockets', type=int, default=16, help='Sockets clientes (256 paquets en vol chacune)')
+        parser.add_argument('--timeout', type=float, default=5, help='Secondes avant de compter un paquet perdu')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.prefix = f"radius_{uuid.uuid4().hex[:6]}_"
+        self.secret = uuid.uuid4().hex.encode()
+        self.password = uuid.uuid4().hex
+        count = options['sessions']
+
+        self.stdout.write(f"Préparation de {count} utilisateurs...")
+        plan = Plan.objects.create(
+            name='Forfait benchmark RADIUS', description='Benchmark RADIUS', duration=1, duration_unit='DAYS',
+            price=1000, rate_kbps=4000
+        )
+        template = User(username=f"{self.prefix}template")
+        template.set_password(self.password)
+        User.objects.bulk_create([
+            User(username=f"{self.prefix}{i}", password=template.password) for i in range(count)
+        ], batch_size=2000)
+        now = timezone.now()
+        Subscription.objects.bulk_create([
+            Subscription(user=user, plan=plan, start_date=now, end_date=now + timedelta(days=1))
+            for user in User.objects.filter(username__startswith=self.prefix)
+        ], batch_size=2000)
+
+        try:
+            asyncio.run(self._bench())
+            sessions = UserSession.objects.filter(user__username__startswith=self.prefix)
+            self.stdout.write(
+                f"Base : {sessions.count()} session(s) ouvertes dont {sessions.filter(is_active=True).count()} "
+                f"encore active(s), {BandwidthUsage.objects.filter(session__in=sessions).count()} mesure(s), "
+                f"{NetworkActivity.objects.filter(session__in=sessions, activity_type='LOGOUT').count()} LOGOUT"
+            )
+        finally:
+            User.objects.filter(username__startswith=self.prefix).delete()
+            plan.delete()
+
+    async def _bench(self):
+        options = self.options
+        loop = asyncio.get_running_loop()
+        server = radius.RadiusServer(clients={'127.0.0.1': self.secret.decode()})
+        auth_port, acct_port = await server.start('127.0.0.1', 0, 0)
+        self.clients = []
+        for _ in range(options['sockets']):
+            _, client = await loop.create_datagram_endpoint(_Client, remote_addr=('127.0.0.1', acct_port))
+            self.clients.append(client)
+        auth_clients = []
+        for _ in range(max(options['sockets'] // 4, 1)):
+            _, client = await loop.create_datagram_endpoint(_Client, remote_addr=('127.0.0.1', auth_port))
+            auth_clients.append(client)
+
+        count = options['sessions']
+        octets = [[0, 0] for _ in range(count)]
+        try:
+            await self._phase('Access-Request', auth_clients, (
+                self._access(i % count) for i in range(options['auth'])
+            ), options['rate'])
+            await self._phase('Accounting Start', self.clients, (
+                self._accounting(i, radius.STATUS_START, octets[i], 0) for i in range(count)
+            ), options['rate'])
+
+            interims = int(options['rate'] * options['duration'])
+
+            def interim(n):
+                i = n % count
+                octets[i][0] += 50_000
+                octets[i][1] += 500_000
+                return self._accounting(i, radius.STATUS_INTERIM_UPDATE, octets[i], 60 * (n // count + 1))
+
+            await self._phase('Accounting Interim', self.clients, (interim(n) for n in range(interims)),
+                              options['rate'])
+            await self._phase('Accounting Stop', self.clients, (
+                self._accounting(i, radius.STATUS_STOP, octets[i], 60 * (interims // count + 1)) for i in range(count)
+            ), options['rate'])
+            self.stdout.write(f"Serveur : {server.stats}, {server.writer.batches} lot(s) écrit(s)")
+        finally:
+            for client in self.clients + auth_clients:
+                client.transport.close()
+            server.close()
+
+    def _access(self, i):
+        authenticator = os.urandom(16)
+        attributes = [
+            (radius.USER_NAME, f"{self.prefix}{i}".encode()),
+            (radius.USER_PASSWORD, radius.encrypt_password(self.password, self.secret, authenticator)),
+            (radius.CALLING_STATION_ID, self._mac(i).encode()),
+        ]
+        return radius.ACCESS_REQUEST, attributes, authenticator
+
+    def _accounting(self, i, status, octets, session_time):
+        attributes = [
+            radius.integer_attribute(radius.ACCT_STATUS_TYPE, status),
+            (radius.ACCT_SESSION_ID, f"{self.prefix}{i}".encode()),
+            (radius.USER_NAME, f"{self.prefix}{i}".encode()),
+            (radius.NAS_IDENTIFIER, b'bench'),
+            (radius.CALLING_STATION_ID, self._mac(i).encode()),
+            (radius.FRAMED_IP_ADDRESS, bytes([10, 30 + i // 65536, i // 256 % 256, i % 256])),
+            radius.integer_attribute(radius.ACCT_SESSION_TIME, session_time),
+        ]
+        if status != radius.STATUS_START:
+            attributes += [
+                radius.integer_attribute(radius.ACCT_INPUT_OCTETS, octets[0] & 0xFFFFFFFF),
+                radius.integer_attribute(radius.ACCT_INPUT_GIGAWORDS, octets[0] >> 32),
+                radius.integer_attribute(radius.ACCT_OUTPUT_OCTETS, octets[1] & 0xFFFFFFFF),
+                radius.integer_attribute(radius.ACCT_OUTPUT_GIGAWORDS, octets[1] >> 32),
+            ]
+        return radius.ACCOUNTING_REQUEST, attributes, None
+
+    @staticmethod
+    def _mac(i):
+        return '02-BC-' + '-'.join(f'{byte:02X}' for byte in i.to_bytes(4, 'big'))
+
+    async def _phase(self, label, clients, packets, rate):
+        """Envoie les paquets au débit demandé puis attend les réponses"""
+        phase = {'latencies': [], 'codes': Counter()}
+        started = time.perf_counter()
+        sent = waits = 0
+        index = 0
+        for code, attributes, authenticator in packets:
+            # Socket avec un identifiant libre (sinon : trop de paquets en vol, on attend)
+            client = None
+            while client is None:
+                for _ in range(len(clients)):
+                    index = (index + 1) % len(clients)
+                    if clients[index].free:
+                        client = clients[index]
+                        break
+                else:
+                    waits += 1
+                    await asyncio.sleep(0.001)
+            ahead = started + sent / rate - time.perf_counter()
+            if ahead > 0.002:
+                await asyncio.sleep(ahead)
+            identifier = client.free.popleft()
+            packet = radius.encode_request(code, identifier, attributes, self.secret, authenticator)
+            client.pending[identifier] = (time.perf_counter(), phase)
+            client.transport.sendto(packet)
+            sent += 1
+        sending = time.perf_counter() - started
+
+        deadline = time.perf_counter() + self.options['timeout']
+        while time.perf_counter() < deadline and any(
+            entry[1] is phase for client in clients for entry in client.pending.values()
+        ):
+            await asyncio.sleep(0.01)
+        lost = 0
+        for client in clients:
+            for identifier, entry in list(client.pending.items()):
+                if entry[1] is phase:
+                    del client.pending[identifier]
+                    client.free.append(identifier)
+                    lost += 1
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(phase['latencies'])
+        received = len(latencies)
+        line = (f"{label} : {sent} envoyé(s) en {sending:.2f} s ({sent / max(sending, 1e-9):.0f}/s), "
+                f"{received} réponse(s) en {elapsed:.2f} s ({received / elapsed:.0f}/s), {lost} perdu(s)")
+        if latencies:
+            quantiles = statistics.quantiles(latencies, n=100) if received > 1 else latencies * 99
+            line += (f" - latence p50 {quantiles[49] * 1000:.1f} ms, p95 {quantiles[94] * 1000:.1f} ms, "
+                     f"p99 {quantiles[98] * 1000:.1f} ms")
+        if waits:
+            line += f" - {waits} attente(s) d'identifiant libre"
+        codes = {radius.ACCESS_ACCEPT: 'Accept', radius.ACCESS_REJECT: 'Reject'}
+        if any(code in codes for code in phase['codes']):
+            line += ' - ' + ', '.join(f"{phase['codes'][code]} {name}" for code, name in codes.items())
+        self.stdout.write(line)
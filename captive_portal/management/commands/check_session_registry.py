@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from captive_portal import registry
+
+
+class Command(BaseCommand):
+    help = 'Compare le registre des sessions actives à la base (et le reconstruit avec --fix)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Reconstruire le registre depuis la base')
+
+    def handle(self, *args, **options):
+        result = registry.reconcile(fix=options['fix'])
+        self.stdout.write(
+            f"{result['sessions']} session(s) active(s), {result['missing']} absente(s) du registre, "
+            f"{result['stale']} périmée(s)"
+        )
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS('Registre reconstruit'))
+        elif result['missing'] or result['stale']:
+            self.stdout.write(self.style.WARNING('Registre désynchronisé : relancer avec --fix'))
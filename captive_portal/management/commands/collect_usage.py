@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from captive_portal import accounting
+
+
+class Command(BaseCommand):
+    help = 'Relève les compteurs d\'octets par client et décompte les forfaits au volume (processus unique)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=sorted(accounting.SOURCES), default=None,
+                            help='Source des compteurs (défaut : ACCOUNTING_SOURCE)')
+        parser.add_argument('--file', default=None, help='Fichier conntrack à lire (source conntrack)')
+        parser.add_argument('--interval', type=float, default=accounting.ACCOUNTING_INTERVAL,
+                            help='Secondes entre deux relevés')
+        parser.add_argument('--polls', type=int, default=None,
+                            help='Nombre de relevés avant de s\'arrêter (défaut : sans fin)')
+
+    def handle(self, *args, **options):
+        source = options['source'] or accounting.ACCOUNTING_SOURCE
+        collector = accounting.get_collector(source, **({'path': options['file']} if options['file'] else {}))
+        self.stdout.write(f"Relevé des compteurs ({source}) toutes les {options['interval']:g} s")
+
+        polls = 0
+        while options['polls'] is None or polls < options['polls']:
+            started = time.monotonic()
+            try:
+                result = collector.poll()
+                self.stdout.write(
+                    f"{result['clients']} client(s), {result['sessions']} session(s) mises à jour, "
+                    f"{result['bytes']} octet(s), {result['exhausted']} quota(s) épuisé(s)"
+                )
+            except Exception as exc:
+                self.stderr.write(f"Relevé en échec : {exc}")
+            finally:
+                close_old_connections()
+            polls += 1
+            if options['polls'] is None or polls < options['polls']:
+                time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from captive_portal.models import UserSession, NetworkActivity, NetworkActivityRollup
+
+
+class Command(BaseCommand):
+    help = 'Recalcule les compteurs agrégés des sessions à partir de l\'historique des activités réseau'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session', type=int, action='append', dest='sessions',
+                            help='Limiter le recalcul à cette session (option répétable)')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        sessions = UserSession.objects.all()
+        activities = NetworkActivity.objects.all()
+        # Les activités purgées par la rétention ne subsistent que dans les agrégats horaires/journaliers
+        rollups = NetworkActivityRollup.objects.all()
+        if options['sessions']:
+            sessions = sessions.filter(id__in=options['sessions'])
+            activities = activities.filter(session_id__in=options['sessions'])
+            rollups = rollups.filter(session_id__in=options['sessions'])
+
+        raw_aggregates = activities.order_by().values('session').annotate(
+            count=Count('id'),
+            uploaded=Sum('bytes_uploaded'),
+            downloaded=Sum('bytes_downloaded'),
+            bandwidth=Sum('bandwidth_usage')
+        )
+        rollup_aggregates = rollups.order_by().values('session').annotate(
+            count=Sum('activity_count'),
+            uploaded=Sum('bytes_uploaded'),
+            downloaded=Sum('bytes_downloaded'),
+            bandwidth=Sum('bandwidth_usage_total')
+        )
+
+        rebuilt = 0
+        with transaction.atomic():
+            # Remise à zéro puis réaccumulation : les sessions sans activité repartent de 0
+            sessions.update(activity_count=0, bytes_uploaded=0, bytes_downloaded=0, bandwidth_usage_total=0)
+
+            for aggregates in (raw_aggregates, rollup_aggregates):
+                totals = {}
+                for row in aggregates.iterator(chunk_size=options['batch_size']):
+                    totals[row['session']] = (
+                        row['count'] or 0, row['uploaded'] or 0, row['downloaded'] or 0, row['bandwidth'] or 0.0
+                    )
+                    if len(totals) >= options['batch_size']:
+                        UserSession.add_usage(totals, batch_size=options['batch_size'])
+                        rebuilt += len(totals)
+                        totals = {}
+                if totals:
+                    UserSession.add_usage(totals, batch_size=options['batch_size'])
+                    rebuilt += len(totals)
+
+        self.stdout.write(self.style.SUCCESS(f'Compteurs recalculés ({rebuilt} mise(s) à jour de sessions)'))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from captive_portal import shaping
+
+
+class Command(BaseCommand):
+    help = 'Relève les compteurs des classes de limitation de débit et trace les sessions limitées (processus unique)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=shaping.SHAPING_LIMIT_POLL_INTERVAL,
+                            help='Secondes entre deux relevés')
+        parser.add_argument('--polls', type=int, default=None,
+                            help='Nombre de relevés avant de s\'arrêter (défaut : sans fin)')
+
+    def handle(self, *args, **options):
+        engine = shaping.get_engine()
+        if engine is None:
+            raise CommandError('SHAPING_BACKEND n\'est pas configuré')
+        recorder = shaping.LimitHitRecorder(engine.backend)
+        self.stdout.write(f"Relevé des classes ({shaping.SHAPING_BACKEND}) toutes les {options['interval']:g} s")
+
+        polls = 0
+        while options['polls'] is None or polls < options['polls']:
+            started = time.monotonic()
+            try:
+                created = recorder.poll()
+                if created:
+                    self.stdout.write(f"{created} session(s) limitée(s) par leur forfait")
+            except Exception as exc:
+                self.stderr.write(f"Relevé en échec : {exc}")
+            finally:
+                close_old_connections()
+            polls += 1
+            if options['polls'] is None or polls < options['polls']:
+                time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
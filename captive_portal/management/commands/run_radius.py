@@ -0,0 +1,36 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from captive_portal import radius
+
+
+class Command(BaseCommand):
+    help = 'Serveur RADIUS (authentification et comptabilité) des NAS déclarés dans RADIUS_CLIENTS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='0.0.0.0', help='Adresse d\'écoute')
+        parser.add_argument('--auth-port', type=int, default=radius.RADIUS_AUTH_PORT)
+        parser.add_argument('--acct-port', type=int, default=radius.RADIUS_ACCT_PORT)
+
+    def handle(self, *args, **options):
+        if not radius.RADIUS_CLIENTS:
+            raise CommandError('Aucun NAS déclaré dans RADIUS_CLIENTS')
+        try:
+            asyncio.run(self._serve(options))
+        except KeyboardInterrupt:
+            pass
+
+    async def _serve(self, options):
+        server = radius.RadiusServer()
+        auth_port, acct_port = await server.start(options['host'], options['auth_port'], options['acct_port'])
+        self.stdout.write(
+            f"Serveur RADIUS sur {options['host']} (authentification {auth_port}, comptabilité {acct_port}), "
+            f"{len(server.clients)} NAS"
+        )
+        try:
+            while True:
+                await asyncio.sleep(300)
+                self.stdout.write(f"Statistiques : {server.stats}, {server.writer.batches} lot(s) écrit(s)")
+        finally:
+            server.close()
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from captive_portal import enforcement
+
+
+class Command(BaseCommand):
+    help = 'Aligne les ensembles du pare-feu sur les sessions actives (à lancer au démarrage de la passerelle)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Afficher les écarts sans modifier le pare-feu')
+
+    def handle(self, *args, **options):
+        if enforcement.get_bridge() is None:
+            raise CommandError('ENFORCEMENT_BACKEND n\'est pas configuré')
+        result = enforcement.reconcile(dry_run=options['dry_run'])
+        self.stdout.write(
+            f"{result['clients']} client(s) autorisé(s) : {result['added']} à ajouter, {result['removed']} à retirer"
+        )
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Pare-feu ({enforcement.ENFORCEMENT_BACKEND}) synchronisé'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from captive_portal import shaping
+
+
+class Command(BaseCommand):
+    help = 'Aligne les classes de limitation de débit sur les sessions actives (à lancer au démarrage de la passerelle)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Afficher les écarts sans modifier les classes')
+
+    def handle(self, *args, **options):
+        if shaping.get_engine() is None:
+            raise CommandError('SHAPING_BACKEND n\'est pas configuré')
+        result = shaping.reconcile(dry_run=options['dry_run'])
+        self.stdout.write(
+            f"{result['clients']} client(s) limité(s) : {result['updated']} classe(s) à créer ou modifier, "
+            f"{result['removed']} à retirer"
+        )
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Limitation de débit ({shaping.SHAPING_BACKEND}) synchronisée'))
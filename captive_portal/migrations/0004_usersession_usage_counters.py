@@ -0,0 +1,33 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('captive_portal', '0003_bandwidthusage_devicefingerprint_networkactivity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersession',
+            name='activity_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='usersession',
+            name='bandwidth_usage_total',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='usersession',
+            name='bytes_downloaded',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='usersession',
+            name='bytes_uploaded',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
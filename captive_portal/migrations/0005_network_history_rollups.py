@@ -0,0 +1,93 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('captive_portal', '0004_usersession_usage_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BandwidthUsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('HOUR', 'Heure'), ('DAY', 'Jour')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+                ('upload_speed_total', models.FloatField(default=0.0)),
+                ('download_speed_total', models.FloatField(default=0.0)),
+                ('ping_latency_total', models.FloatField(default=0.0)),
+                ('ping_count', models.PositiveIntegerField(default=0)),
+                ('total_uploaded', models.BigIntegerField(default=0)),
+                ('total_downloaded', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Bande passante agrégée',
+                'verbose_name_plural': 'Bandes passantes agrégées',
+                'ordering': ['-bucket_start'],
+            },
+        ),
+        migrations.CreateModel(
+            name='NetworkActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('HOUR', 'Heure'), ('DAY', 'Jour')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('activity_count', models.PositiveIntegerField(default=0)),
+                ('bytes_uploaded', models.BigIntegerField(default=0)),
+                ('bytes_downloaded', models.BigIntegerField(default=0)),
+                ('bandwidth_usage_total', models.FloatField(default=0.0)),
+            ],
+            options={
+                'verbose_name': 'Activité réseau agrégée',
+                'verbose_name_plural': 'Activités réseau agrégées',
+                'ordering': ['-bucket_start'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bandwidthusage',
+            index=models.Index(fields=['session', 'timestamp'], name='bandwidth_session_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bandwidthusage',
+            index=models.Index(fields=['timestamp'], name='bandwidth_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='networkactivity',
+            index=models.Index(fields=['session', 'timestamp'], name='activity_session_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='networkactivity',
+            index=models.Index(fields=['timestamp'], name='activity_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='bandwidthusagerollup',
+            name='session',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bandwidth_rollups', to='captive_portal.usersession'),
+        ),
+        migrations.AddField(
+            model_name='networkactivityrollup',
+            name='session',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_rollups', to='captive_portal.usersession'),
+        ),
+        migrations.AddIndex(
+            model_name='bandwidthusagerollup',
+            index=models.Index(fields=['granularity', 'bucket_start'], name='bandwidth_rollup_bucket_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='bandwidthusagerollup',
+            unique_together={('session', 'granularity', 'bucket_start')},
+        ),
+        migrations.AddIndex(
+            model_name='networkactivityrollup',
+            index=models.Index(fields=['granularity', 'bucket_start'], name='activity_rollup_bucket_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='networkactivityrollup',
+            unique_together={('session', 'granularity', 'bucket_start')},
+        ),
+    ]
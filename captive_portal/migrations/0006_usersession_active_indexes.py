@@ -0,0 +1,23 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('captive_portal', '0005_network_history_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usersession',
+            index=models.Index(fields=['user', 'is_active'], name='session_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersession',
+            index=models.Index(fields=['is_active', 'mac_address'], name='session_active_mac_idx'),
+        ),
+    ]
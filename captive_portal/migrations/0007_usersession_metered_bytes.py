@@ -0,0 +1,23 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('captive_portal', '0006_usersession_active_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersession',
+            name='metered_bytes_downloaded',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='usersession',
+            name='metered_bytes_uploaded',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
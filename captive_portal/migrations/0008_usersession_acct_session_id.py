@@ -0,0 +1,24 @@
+# Generated by Django 5.0.2 on 2026-10-18 17:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('captive_portal', '0007_usersession_metered_bytes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersession',
+            name='acct_session_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='usersession',
+            index=models.Index(fields=['acct_session_id', 'is_active'], name='session_acct_idx'),
+        ),
+    ]
@@ -3,6 +3,8 @@ from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 
+from portal import counters
+
 class UserSession(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     ip_address = models.GenericIPAddressField()
@@ -11,83 +13,103 @@ class UserSession(models.Model):
     start_time = models.DateTimeField(auto_now_add=True)
     end_time = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
+    # Compteurs agrégés, tenus à jour à l'ingestion des activités réseau
+    activity_count = models.PositiveIntegerField(default=0)
+    bytes_uploaded = models.BigIntegerField(default=0)
+    bytes_downloaded = models.BigIntegerField(default=0)
+    bandwidth_usage_total = models.FloatField(default=0.0)  # Somme des Mbps relevés
+    # Octets relevés sur les compteurs du noyau (captive_portal.accounting), hors activités déclarées
+    metered_bytes_uploaded = models.BigIntegerField(default=0)
+    metered_bytes_downloaded = models.BigIntegerField(default=0)
+    # Sessions ouvertes par un NAS RADIUS : "<adresse du NAS>/<Acct-Session-Id>"
+    acct_session_id = models.CharField(max_length=100, null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Sessions actives d'un utilisateur (fin des sessions à l'expiration), chargement du registre
+            models.Index(fields=['user', 'is_active'], name='session_user_active_idx'),
+            models.Index(fields=['is_active', 'mac_address'], name='session_active_mac_idx'),
+            models.Index(fields=['acct_session_id', 'is_active'], name='session_acct_idx'),
+        ]
     
     def __str__(self):
         return f"Session de {self.user.username} ({self.start_time})"
     
+    @property
+    def total_data_transfer(self):
+        return self.bytes_uploaded + self.bytes_downloaded
+    
+    @property
+    def average_bandwidth(self):
+        if not self.activity_count:
+            return 0
+        return self.bandwidth_usage_total / self.activity_count
+    
+    @classmethod
+    def add_usage(cls, totals, batch_size=500):
+        """Incrémente les compteurs agrégés de plusieurs sessions.
+        
+        totals : {session_id: (nombre d'activités, octets envoyés, octets reçus, Mbps cumulés)}
+        Une seule requête UPDATE par lot de sessions, quelle que soit la taille du lot.
+        """
+        counters.increment(
+            cls, totals, ['activity_count', 'bytes_uploaded', 'bytes_downloaded', 'bandwidth_usage_total'], batch_size
+        )
+    
+    @classmethod
+    def add_metered_usage(cls, totals, batch_size=1000):
+        """Incrémente les octets relevés sur les compteurs du noyau : totals = {session_id: (envoyés, reçus)}"""
+        counters.increment(cls, totals, ['metered_bytes_uploaded', 'metered_bytes_downloaded'], batch_size)
+    
     def end_session(self):
         self.end_time = timezone.now()
         self.is_active = False
         self.save()
     
     def get_remaining_time(self):
+        """Temps restant (minutes) de l'abonnement en cours de l'utilisateur ; sans effet sur la session.
+
+        Les sessions des abonnements échus sont terminées par subscriptions.expiry.
+        """
         if not self.is_active:
             return 0
         
         # Importer ici pour éviter les imports circulaires
         from subscriptions.models import Subscription
         
-        # Récupérer l'abonnement actif de l'utilisateur
-        subscription = Subscription.objects.filter(
-            user=self.user,
+        now = timezone.now()
+        end_date = Subscription.objects.filter(
+            user_id=self.user_id,
             is_active=True,
-            start_date__lte=timezone.now(),
-            end_date__gte=timezone.now()
-        ).first()
+            start_date__lte=now,
+            end_date__gte=now
+        ).order_by('pk').values_list('end_date', flat=True).first()
         
-        if not subscription:
-            # Pas d'abonnement actif, terminer la session
-            self.end_session()
+        if end_date is None:
             return 0
         
-        # Calculer le temps restant basé sur la date d'expiration de l'abonnement
-        remaining = subscription.end_date - timezone.now()
-        
-        if remaining.total_seconds() <= 0:
-            # L'abonnement a expiré, terminer la session
-            self.end_session()
-            # Marquer l'abonnement comme inactif
-            subscription.is_active = False
-            subscription.save()
-            return 0
-        
-        return int(remaining.total_seconds() / 60)  # Retourne le temps restant en minutes
+        return int((end_date - now).total_seconds() / 60)  # Retourne le temps restant en minutes
     
     @classmethod
     def check_mac_address_usage(cls, user, mac_address):
-        """Vérifie si l'adresse MAC est déjà utilisée par cet utilisateur"""
-        if not mac_address:
-            return False
-        
-        existing_session = cls.objects.filter(
-            user=user,
-            mac_address=mac_address,
-            is_active=True
-        ).first()
-        
-        return existing_session is not None
+        """Vérifie si l'adresse MAC est déjà utilisée par cet utilisateur (registre des sessions, sans requête)"""
+        from . import registry
+        return registry.device_session(user.pk, mac_address) is not None
     
     @classmethod
     def get_active_session_by_mac(cls, user, mac_address):
         """Récupère la session active pour cette adresse MAC"""
-        return cls.objects.filter(
-            user=user,
-            mac_address=mac_address,
-            is_active=True
-        ).first()
+        from . import registry
+        session_id = registry.device_session(user.pk, mac_address)
+        if session_id is None:
+            return None
+        return cls.objects.filter(pk=session_id, is_active=True).first()
     
     @classmethod
     def has_active_session_on_different_device(cls, user, current_mac_address):
-        """Vérifie si l'utilisateur a déjà une session active sur un autre appareil"""
-        if not current_mac_address:
-            return False
-        
-        existing_session = cls.objects.filter(
-            user=user,
-            is_active=True
-        ).exclude(mac_address=current_mac_address).first()
-        
-        return existing_session is not None
+        """Vérifie si l'utilisateur a déjà une session active sur un autre appareil (registre des sessions)"""
+        from . import registry
+        return registry.other_device(user.pk, current_mac_address)
 
 
 class NetworkActivity(models.Model):
@@ -116,6 +138,10 @@ class NetworkActivity(models.Model):
         verbose_name = 'Activité Réseau'
         verbose_name_plural = 'Activités Réseau'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['session', 'timestamp'], name='activity_session_time_idx'),
+            models.Index(fields=['timestamp'], name='activity_time_idx'),
+        ]
     
     def __str__(self):
         return f"{self.session.user.username} - {self.get_activity_type_display()} - {self.timestamp}"
@@ -127,6 +153,20 @@ class NetworkActivity(models.Model):
     @property
     def data_transfer_mb(self):
         return self.total_data_transfer / (1024 * 1024)
+    
+    @staticmethod
+    def usage_by_session(activities):
+        """Regroupe des activités par session au format attendu par UserSession.add_usage"""
+        totals = {}
+        for activity in activities:
+            count, uploaded, downloaded, bandwidth = totals.get(activity.session_id, (0, 0, 0, 0.0))
+            totals[activity.session_id] = (
+                count + 1,
+                uploaded + activity.bytes_uploaded,
+                downloaded + activity.bytes_downloaded,
+                bandwidth + activity.bandwidth_usage,
+            )
+        return totals
 
 class DeviceFingerprint(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -161,4 +201,77 @@ class BandwidthUsage(models.Model):
     class Meta:
         verbose_name = 'Utilisation de la bande passante'
         verbose_name_plural = 'Utilisations de la bande passante'
-        ordering = ['-timestamp']
\ No newline at end of file
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['session', 'timestamp'], name='bandwidth_session_time_idx'),
+            models.Index(fields=['timestamp'], name='bandwidth_time_idx'),
+        ]
+
+
+ROLLUP_GRANULARITIES = [
+    ('HOUR', 'Heure'),
+    ('DAY', 'Jour'),
+]
+
+class NetworkActivityRollup(models.Model):
+    """Activités réseau agrégées par session et par heure/jour (données sous-échantillonnées)"""
+    session = models.ForeignKey(UserSession, on_delete=models.CASCADE, related_name='activity_rollups')
+    granularity = models.CharField(max_length=4, choices=ROLLUP_GRANULARITIES)
+    bucket_start = models.DateTimeField()
+    activity_count = models.PositiveIntegerField(default=0)
+    bytes_uploaded = models.BigIntegerField(default=0)
+    bytes_downloaded = models.BigIntegerField(default=0)
+    bandwidth_usage_total = models.FloatField(default=0.0)  # Somme des Mbps relevés
+    
+    class Meta:
+        verbose_name = 'Activité réseau agrégée'
+        verbose_name_plural = 'Activités réseau agrégées'
+        ordering = ['-bucket_start']
+        unique_together = [('session', 'granularity', 'bucket_start')]
+        indexes = [
+            models.Index(fields=['granularity', 'bucket_start'], name='activity_rollup_bucket_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Session {self.session_id} - {self.get_granularity_display()} {self.bucket_start}"
+    
+    @property
+    def total_data_transfer(self):
+        return self.bytes_uploaded + self.bytes_downloaded
+
+class BandwidthUsageRollup(models.Model):
+    """Mesures de bande passante agrégées par session et par heure/jour"""
+    session = models.ForeignKey(UserSession, on_delete=models.CASCADE, related_name='bandwidth_rollups')
+    granularity = models.CharField(max_length=4, choices=ROLLUP_GRANULARITIES)
+    bucket_start = models.DateTimeField()
+    sample_count = models.PositiveIntegerField(default=0)
+    upload_speed_total = models.FloatField(default=0.0)  # Mbps cumulés (moyenne = total / échantillons)
+    download_speed_total = models.FloatField(default=0.0)
+    ping_latency_total = models.FloatField(default=0.0)  # ms cumulées
+    ping_count = models.PositiveIntegerField(default=0)
+    total_uploaded = models.BigIntegerField(default=0)  # Dernière valeur (maximum) des compteurs
+    total_downloaded = models.BigIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Bande passante agrégée'
+        verbose_name_plural = 'Bandes passantes agrégées'
+        ordering = ['-bucket_start']
+        unique_together = [('session', 'granularity', 'bucket_start')]
+        indexes = [
+            models.Index(fields=['granularity', 'bucket_start'], name='bandwidth_rollup_bucket_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Session {self.session_id} - {self.get_granularity_display()} {self.bucket_start}"
+    
+    @property
+    def average_upload_speed(self):
+        return self.upload_speed_total / self.sample_count if self.sample_count else 0
+    
+    @property
+    def average_download_speed(self):
+        return self.download_speed_total / self.sample_count if self.sample_count else 0
+    
+    @property
+    def average_ping_latency(self):
+        return self.ping_latency_total / self.ping_count if self.ping_count else None
\ No newline at end of file
@@ -0,0 +1,272 @@
+"""Résolution adresse IP -> adresse MAC des clients, côté serveur (baux DHCP, table ARP).
+
+Un navigateur ne peut pas lire l'adresse MAC de l'appareil : celle envoyée à
+la connexion n'est qu'une déclaration du client. La passerelle, elle, la
+connaît par ses baux DHCP et sa table de voisins. Ce module en tient un index
+en mémoire {ip: mac} consulté par la connexion (MAC de la session et des
+empreintes d'appareil) et par le pont vers le pare-feu (sessions sans MAC).
+
+Sources (NEIGHBOR_SOURCES, par ordre de priorité croissante, les fichiers
+absents sont ignorés) :
+
+- 'dnsmasq' : fichier de baux de dnsmasq, réécrit en entier à chaque
+  changement ; baux expirés ignorés ;
+- 'isc' : dhcpd.leases de l'ISC DHCP, fichier en ajout seul : seuls les
+  blocs ajoutés depuis la lecture précédente sont analysés (relecture
+  complète après réécriture du fichier par dhcpd) ;
+- 'arp' : /proc/net/arp, voisins IPv4 effectivement joignables (entrées
+  incomplètes ignorées). Dernière source : elle fait foi sur les baux.
+
+Une consultation est une lecture de dictionnaire. Au plus toutes les
+NEIGHBOR_REFRESH_INTERVAL secondes, la consultation qui suit vérifie la date
+de modification et la taille des fichiers (os.stat, sans processus externe)
+et ne relit que ceux qui ont changé ; l'index n'est reconstruit que si une
+source a effectivement changé. Un seul thread rafraîchit à la fois, les
+autres consultent l'index courant sans attendre.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+NEIGHBOR_SOURCES = getattr(settings, 'NEIGHBOR_SOURCES', [('arp', '/proc/net/arp')])
+NEIGHBOR_REFRESH_INTERVAL = getattr(settings, 'NEIGHBOR_REFRESH_INTERVAL', 2)
+NEIGHBOR_TRUST_CLIENT_MAC = getattr(settings, 'NEIGHBOR_TRUST_CLIENT_MAC', False)
+
+_MAC_PATTERN = re.compile(r'^[0-9a-f]{2}(:[0-9a-f]{2}){5}$', re.IGNORECASE)
+_ISC_LEASE_PATTERN = re.compile(r'lease\s+(\S+)\s*\{(.*?)\}', re.DOTALL)
+_ISC_HARDWARE_PATTERN = re.compile(r'hardware\s+ethernet\s+([0-9a-fA-F:]+);')
+_ISC_STATE_PATTERN = re.compile(r'(?<!next )(?<!rewind )binding\s+state\s+(\w+);')
+_ISC_ENDS_PATTERN = re.compile(r'ends\s+(?:\d\s+(\S+\s+\S+)|never);')
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def normalize_mac(mac_address):
+    """MAC au format du portail (AA:BB:CC:DD:EE:FF), ou None si ce n'est pas une adresse Ethernet valide"""
+    if not mac_address or not _MAC_PATTERN.match(mac_address):
+        return None
+    mac_address = mac_address.upper()
+    return None if mac_address == '00:00:00:00:00:00' else mac_address
+
+
+def normalize_ip(ip_address):
+    """Adresse IPv4 transmise en IPv6 (::ffff:a.b.c.d) ramenée à sa forme IPv4"""
+    if ip_address and ip_address.lower().startswith('::ffff:') and '.' in ip_address:
+        return ip_address[7:]
+    return ip_address
+
+
+class FileSource:
+    """Fichier relu en entier lorsque sa date de modification, sa taille ou son inode changent"""
+    name = None
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._stamp = None
+
+    def poll(self):
+        """Relit le fichier s'il a changé ; retourne True si les entrées ont changé"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            if self._stamp is not None:
+                logger.warning(f"Source de voisins {self.name} indisponible : {self.path}")
+            self._stamp = None
+            return self._replace({})
+        stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        return self._load()
+
+    def _load(self):
+        with open(self.path, 'rb') as handle:
+            return self._replace(self.parse(handle.read().decode('ascii', errors='replace')))
+
+    def _replace(self, entries):
+        if entries == self.entries:
+            return False
+        self.entries = entries
+        return True
+
+    def parse(self, content):
+        raise NotImplementedError
+
+
+class DnsmasqLeases(FileSource):
+    """Baux dnsmasq : « expiration mac ip nom client-id » (expiration 0 : bail permanent)"""
+    name = 'dnsmasq'
+
+    def parse(self, content):
+        now = time.time()
+        entries = {}
+        for line in content.splitlines():
+            parts = line.split()
+            # Les lignes DHCPv6 (duid, IAID à la place de la MAC) sont écartées par normalize_mac
+            if len(parts) < 3 or not parts[0].isdigit():
+                continue
+            mac_address = normalize_mac(parts[1])
+            if mac_address and (parts[0] == '0' or int(parts[0]) > now):
+                entries[parts[2]] = mac_address
+        return entries
+
+
+class IscLeases(FileSource):
+    """Baux ISC DHCP : journal en ajout seul, le dernier bloc d'une adresse fait foi"""
+    name = 'isc'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._offset = 0
+
+    def poll(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self._offset = 0
+            return super().poll()
+        previous = self._stamp
+        if previous and previous[0] == stat.st_ino and stat.st_size >= self._offset and stat.st_size != previous[2]:
+            # Même fichier, agrandi : seuls les blocs ajoutés sont lus
+            self._stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            return self._tail()
+        return super().poll()
+
+    def _load(self):
+        # Fichier nouveau ou réécrit par dhcpd : relecture complète
+        self._offset = 0
+        previous, self.entries = self.entries, {}
+        self._tail()
+        return self.entries != previous
+
+    def _tail(self):
+        with open(self.path, 'rb') as handle:
+            handle.seek(self._offset)
+            data = handle.read()
+        end = data.rfind(b'}') + 1  # Dernier bloc complet ; un bloc en cours d'écriture sera relu
+        if not end:
+            return False
+        self._offset += end
+        entries = dict(self.entries)
+        self._apply(entries, data[:end].decode('ascii', errors='replace'))
+        return self._replace(entries)
+
+    @staticmethod
+    def _apply(entries, content):
+        now = datetime.now(dt_timezone.utc)
+        for ip_address, body in _ISC_LEASE_PATTERN.findall(content):
+            hardware = _ISC_HARDWARE_PATTERN.search(body)
+            state = _ISC_STATE_PATTERN.search(body)
+            ends = _ISC_ENDS_PATTERN.search(body)
+            active = state is None or state.group(1) == 'active'
+            if active and ends and ends.group(1):
+                try:
+                    active = datetime.strptime(ends.group(1), '%Y/%m/%d %H:%M:%S').replace(tzinfo=dt_timezone.utc) > now
+                except ValueError:
+                    pass
+            mac_address = normalize_mac(hardware.group(1)) if hardware else None
+            if active and mac_address:
+                entries[ip_address] = mac_address
+            else:
+                entries.pop(ip_address, None)
+
+
+class ArpTable(FileSource):
+    """Table des voisins IPv4 du noyau (/proc/net/arp)"""
+    name = 'arp'
+    COMPLETE = 0x2
+
+    def poll(self):
+        # Fichier procfs : ni date de modification ni taille, relu à chaque rafraîchissement
+        try:
+            return self._load()
+        except OSError:
+            return super().poll()
+
+    def parse(self, content):
+        entries = {}
+        for line in content.splitlines()[1:]:
+            parts = line.split()
+            if len(parts) < 4:
+                continue
+            try:
+                complete = int(parts[2], 16) & self.COMPLETE
+            except ValueError:
+                continue
+            mac_address = normalize_mac(parts[3])
+            if complete and mac_address:
+                entries[parts[0]] = mac_address
+        return entries
+
+
+SOURCES = {
+    'dnsmasq': DnsmasqLeases,
+    'isc': IscLeases,
+    'arp': ArpTable,
+}
+
+
+class NeighborTable:
+    """Index {ip: mac} fusionné des sources, rafraîchi à la demande au plus toutes les refresh_interval secondes"""
+
+    def __init__(self, sources, refresh_interval=NEIGHBOR_REFRESH_INTERVAL):
+        self.sources = list(sources)
+        self.refresh_interval = refresh_interval
+        self._index = {}
+        self._next_refresh = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, ip_address):
+        if time.monotonic() >= self._next_refresh:
+            self.refresh(wait=False)
+        return self._index.get(normalize_ip(ip_address))
+
+    def refresh(self, wait=True):
+        """Relit les sources modifiées ; retourne True si l'index a été reconstruit"""
+        if not self._lock.acquire(blocking=wait):
+            return False  # Rafraîchissement en cours dans un autre thread
+        try:
+            changed = False
+            for source in self.sources:
+                try:
+                    changed = source.poll() or changed
+                except Exception:
+                    logger.exception(f"Lecture de la source de voisins {source.name} impossible : {source.path}")
+            if changed:
+                index = {}
+                for source in self.sources:
+                    index.update(source.entries)
+                self._index = index
+            self._next_refresh = time.monotonic() + self.refresh_interval
+            return changed
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._index)
+
+
+def get_table():
+    """Index du processus, construit depuis NEIGHBOR_SOURCES"""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = NeighborTable(SOURCES[name](path) for name, path in NEIGHBOR_SOURCES)
+    return _table
+
+
+def resolve(ip_address):
+    """Adresse MAC du client d'adresse ip_address, ou None si la passerelle ne le connaît pas"""
+    if not ip_address:
+        return None
+    return get_table().lookup(ip_address)
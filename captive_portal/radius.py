@@ -0,0 +1,591 @@
+"""Serveur RADIUS du portail captif, pour les points d'accès et NAS qui ne passent pas par l'API REST.
+
+Un processus asyncio écoute en UDP (RFC 2865/2866) :
+
+- Access-Request (PAP) : identifiants vérifiés comme à la connexion au portail
+  (utilisateur actif, mot de passe, abonnement en cours, verrou par appareil
+  sur Calling-Station-Id). La réponse Access-Accept porte la durée restante de
+  l'abonnement (Session-Timeout) et la limite de débit du forfait
+  (WISPr-Bandwidth-Max-Up/Down). Le hachage des mots de passe tourne dans un
+  pool de threads, hors de la boucle d'événements ;
+- Accounting-Request : Start ouvre une session UserSession (identifiée par
+  « <NAS>/<Acct-Session-Id> »), Interim-Update ajoute une mesure
+  BandwidthUsage (débits calculés depuis la mesure précédente), Stop termine
+  la session et trace une activité LOGOUT portant les octets échangés ;
+  Accounting-On/Off termine les sessions du NAS qui redémarre. Un Interim ou
+  un Stop d'une session inconnue (Start perdu) ouvre la session.
+
+Les paquets de comptabilité sont écrits par lots (bulk_create, UPDATE
+groupés) par un seul thread base de données : un lot part dès que le
+précédent est écrit, ou après RADIUS_FLUSH_INTERVAL. La réponse
+Accounting-Response n'est envoyée qu'une fois le lot validé, comme l'exige la
+RFC 2866 ; un NAS sans réponse retransmet, et les retransmissions d'un paquet
+déjà traité reçoivent la même réponse sans nouvelle écriture.
+
+Les NAS autorisés et leur secret partagé sont déclarés dans RADIUS_CLIENTS ;
+les paquets des autres adresses sont ignorés. Commande : run_radius.
+"""
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import logging
+import re
+import socket
+import struct
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import registry
+from .entitlements import get_entitlement
+
+logger = logging.getLogger(__name__)
+
+RADIUS_CLIENTS = getattr(settings, 'RADIUS_CLIENTS', {})
+RADIUS_AUTH_PORT = getattr(settings, 'RADIUS_AUTH_PORT', 1812)
+RADIUS_ACCT_PORT = getattr(settings, 'RADIUS_ACCT_PORT', 1813)
+RADIUS_AUTH_WORKERS = getattr(settings, 'RADIUS_AUTH_WORKERS', 4)
+RADIUS_FLUSH_INTERVAL = getattr(settings, 'RADIUS_FLUSH_INTERVAL', 0.2)
+RADIUS_BATCH_SIZE = getattr(settings, 'RADIUS_BATCH_SIZE', 1000)
+RADIUS_REQUIRE_MESSAGE_AUTHENTICATOR = getattr(settings, 'RADIUS_REQUIRE_MESSAGE_AUTHENTICATOR', False)
+
+# Codes des paquets
+ACCESS_REQUEST = 1
+ACCESS_ACCEPT = 2
+ACCESS_REJECT = 3
+ACCOUNTING_REQUEST = 4
+ACCOUNTING_RESPONSE = 5
+
+# Attributs
+USER_NAME = 1
+USER_PASSWORD = 2
+NAS_IP_ADDRESS = 4
+FRAMED_IP_ADDRESS = 8
+REPLY_MESSAGE = 18
+VENDOR_SPECIFIC = 26
+SESSION_TIMEOUT = 27
+CALLING_STATION_ID = 31
+NAS_IDENTIFIER = 32
+ACCT_STATUS_TYPE = 40
+ACCT_INPUT_OCTETS = 42
+ACCT_OUTPUT_OCTETS = 43
+ACCT_SESSION_ID = 44
+ACCT_SESSION_TIME = 46
+ACCT_INPUT_GIGAWORDS = 52
+ACCT_OUTPUT_GIGAWORDS = 53
+MESSAGE_AUTHENTICATOR = 80
+
+WISPR_VENDOR_ID = 14122
+WISPR_BANDWIDTH_MAX_UP = 7
+WISPR_BANDWIDTH_MAX_DOWN = 8
+
+# Acct-Status-Type
+STATUS_START = 1
+STATUS_STOP = 2
+STATUS_INTERIM_UPDATE = 3
+STATUS_ACCOUNTING_ON = 7
+STATUS_ACCOUNTING_OFF = 8
+
+RECENT_RESPONSES = 8192  # Réponses gardées pour les retransmissions
+RECEIVE_BUFFER = 4 * 1024 * 1024  # Tampon de réception UDP (limité par net.core.rmem_max) : absorbe les rafales
+_MAC_PATTERN = re.compile(r'^([0-9A-F]{2})[:\-.]?([0-9A-F]{2})[:\-.]?([0-9A-F]{2})[:\-.]?'
+                          r'([0-9A-F]{2})[:\-.]?([0-9A-F]{2})[:\-.]?([0-9A-F]{2})$')
+
+
+class RadiusError(Exception):
+    """Paquet RADIUS mal formé"""
+
+
+class Packet:
+    def __init__(self, code, identifier, authenticator, attributes=None):
+        self.code = code
+        self.identifier = identifier
+        self.authenticator = authenticator
+        self.attributes = attributes or []  # [(type, valeur brute)]
+
+    @classmethod
+    def decode(cls, data):
+        """Retourne (paquet, octets du paquet sans le bourrage éventuel)"""
+        if len(data) < 20:
+            raise RadiusError('Paquet trop court')
+        code, identifier, length = struct.unpack('!BBH', data[:4])
+        if length < 20 or length > len(data) or length > 4096:
+            raise RadiusError('Longueur invalide')
+        attributes = []
+        position = 20
+        while position < length:
+            if position + 2 > length:
+                raise RadiusError('Attribut tronqué')
+            kind, size = data[position], data[position + 1]
+            if size < 2 or position + size > length:
+                raise RadiusError('Longueur d\'attribut invalide')
+            attributes.append((kind, data[position + 2:position + size]))
+            position += size
+        return cls(code, identifier, data[4:20], attributes), data[:length]
+
+    def get(self, kind, default=None):
+        for attribute, value in self.attributes:
+            if attribute == kind:
+                return value
+        return default
+
+    def text(self, kind):
+        value = self.get(kind)
+        return value.decode('utf-8', errors='replace') if value is not None else None
+
+    def integer(self, kind, default=0):
+        value = self.get(kind)
+        return struct.unpack('!I', value)[0] if value is not None and len(value) == 4 else default
+
+    def address(self, kind):
+        value = self.get(kind)
+        return str(ipaddress.IPv4Address(value)) if value is not None and len(value) == 4 else None
+
+
+def encode_attributes(attributes):
+    return b''.join(struct.pack('!BB', kind, len(value) + 2) + value for kind, value in attributes)
+
+
+def integer_attribute(kind, value):
+    return kind, struct.pack('!I', value)
+
+
+def vendor_attribute(vendor_id, kind, value):
+    return VENDOR_SPECIFIC, struct.pack('!IBB', vendor_id, kind, len(value) + 2) + value
+
+
+def encode_request(code, identifier, attributes, secret, authenticator=None):
+    """Paquet de requête (client NAS, banc de charge) ; authenticator aléatoire pour Access-Request"""
+    body = encode_attributes(attributes)
+    header = struct.pack('!BBH', code, identifier, 20 + len(body))
+    if code == ACCOUNTING_REQUEST:
+        authenticator = hashlib.md5(header + bytes(16) + body + secret).digest()
+    return header + authenticator + body
+
+
+def encode_response(request, code, attributes, secret, message_authenticator=False):
+    """Réponse à request, signée par le Response Authenticator (et Message-Authenticator si demandé)"""
+    attributes = list(attributes)
+    if message_authenticator:
+        attributes.append((MESSAGE_AUTHENTICATOR, bytes(16)))
+    body = encode_attributes(attributes)
+    header = struct.pack('!BBH', code, request.identifier, 20 + len(body))
+    if message_authenticator:
+        # Dernier attribut : HMAC-MD5 du paquet calculé avec l'authenticator de la requête
+        signature = hmac.new(secret, header + request.authenticator + body, hashlib.md5).digest()
+        body = body[:-16] + signature
+    authenticator = hashlib.md5(header + request.authenticator + body + secret).digest()
+    return header + authenticator + body
+
+
+def verify_accounting_request(raw, secret):
+    expected = hashlib.md5(raw[:4] + bytes(16) + raw[20:] + secret).digest()
+    return hmac.compare_digest(expected, raw[4:20])
+
+
+def verify_message_authenticator(raw, secret):
+    """Vérifie l'attribut Message-Authenticator (RFC 3579) d'une Access-Request"""
+    position = 20
+    while position + 2 <= len(raw):
+        kind, size = raw[position], raw[position + 1]
+        if kind == MESSAGE_AUTHENTICATOR and size == 18:
+            received = raw[position + 2:position + 18]
+            zeroed = raw[:position + 2] + bytes(16) + raw[position + 18:]
+            return hmac.compare_digest(hmac.new(secret, zeroed, hashlib.md5).digest(), received)
+        position += max(size, 2)
+    return False
+
+
+def encrypt_password(password, secret, authenticator):
+    """Chiffrement de User-Password (RFC 2865, 5.2)"""
+    value = password.encode('utf-8')
+    value = value + bytes(-len(value) % 16) if value else bytes(16)
+    result, previous = b'', authenticator
+    for start in range(0, len(value), 16):
+        key = hashlib.md5(secret + previous).digest()
+        previous = bytes(a ^ b for a, b in zip(value[start:start + 16], key))
+        result += previous
+    return result
+
+
+def decrypt_password(value, secret, authenticator):
+    if not value or len(value) % 16 or len(value) > 128:
+        raise RadiusError('User-Password invalide')
+    result, previous = b'', authenticator
+    for start in range(0, len(value), 16):
+        block = value[start:start + 16]
+        key = hashlib.md5(secret + previous).digest()
+        result += bytes(a ^ b for a, b in zip(block, key))
+        previous = block
+    return result.rstrip(b'\0').decode('utf-8', errors='replace')
+
+
+def normalize_mac(value):
+    """Calling-Station-Id (AA-BB-CC-DD-EE-FF, aabb.ccdd.eeff...) au format du portail AA:BB:CC:DD:EE:FF"""
+    match = _MAC_PATTERN.match((value or '').strip().upper().replace('.', ''))
+    return ':'.join(match.groups()) if match else None
+
+
+def authorize(username, password, mac_address=None):
+    """Vérifie les identifiants et l'abonnement ; retourne (accepté, message, droits)"""
+    from django.contrib.auth import authenticate
+
+    try:
+        user = authenticate(username=username, password=password)
+        if user is None:
+            return False, 'Identifiants invalides', None
+        if not user.is_active:
+            return False, 'Compte désactivé', None
+        entitlement = get_entitlement(user.pk)
+        if not entitlement['subscription_id']:
+            return False, 'Aucun abonnement actif', None
+        if mac_address and registry.other_device(user.pk, mac_address):
+            return False, 'DEVICE_ALREADY_USED', None
+        return True, None, entitlement
+    finally:
+        close_old_connections()
+
+
+class AccountingWriter:
+    """Écrit les paquets de comptabilité par lots depuis un unique thread base de données"""
+
+    def __init__(self, flush_interval=RADIUS_FLUSH_INTERVAL, batch_size=RADIUS_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.batches = 0
+        self._queue = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='radius-db')
+        self._timer = None
+        self._busy = False
+        self._sessions = {}  # {clé de session RADIUS: UserSession.id}
+        self._samples = {}   # {clé: (Acct-Session-Time, octets envoyés, octets reçus)} de la dernière mesure
+
+    def submit(self, record):
+        """Met le paquet en file ; le futur est résolu quand son lot est validé en base"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((record, future))
+        if not self._busy:
+            if len(self._queue) >= self.batch_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.flush_interval, self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._busy or not self._queue:
+            return
+        batch, self._queue = self._queue[:self.batch_size], self._queue[self.batch_size:]
+        self._busy = True
+        loop = asyncio.get_running_loop()
+        task = loop.run_in_executor(self._executor, self.write, [record for record, _ in batch])
+        task.add_done_callback(lambda done: self._written(done, batch))
+
+    def _written(self, done, batch):
+        self._busy = False
+        self.batches += 1
+        error = done.exception()
+        for _, future in batch:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(True)
+            else:
+                future.set_exception(error)
+        # Paquets arrivés pendant l'écriture : lot suivant sans attendre
+        if self._queue:
+            self._flush()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def write(self, records):
+        """Écrit un lot de paquets de comptabilité (thread base de données)"""
+        try:
+            with transaction.atomic():
+                self._write(records, timezone.now())
+        except Exception:
+            logger.exception(f"Échec de l'écriture d'un lot de {len(records)} paquet(s) de comptabilité RADIUS")
+            # La base fait foi : les correspondances en mémoire sont relues au lot suivant
+            self._sessions.clear()
+            self._samples.clear()
+            raise
+        finally:
+            close_old_connections()
+
+    def _write(self, records, now):
+        from users.models import User
+        from .models import BandwidthUsage, NetworkActivity, UserSession
+        from .signals import session_ended, session_started
+
+        for nas in {record['nas'] for record in records if record['status'] in (STATUS_ACCOUNTING_ON, STATUS_ACCOUNTING_OFF)}:
+            self._end_nas_sessions(nas, now)
+        records = [record for record in records
+                   if record['key'] and record['status'] in (STATUS_START, STATUS_STOP, STATUS_INTERIM_UPDATE)]
+        if not records:
+            return
+
+        missing = list({record['key'] for record in records} - set(self._sessions))
+        for start in range(0, len(missing), self.batch_size):
+            self._sessions.update(UserSession.objects.filter(
+                acct_session_id__in=missing[start:start + self.batch_size], is_active=True
+            ).values_list('acct_session_id', 'id'))
+
+        # Sessions à ouvrir : Start, ou Interim / Stop d'une session inconnue
+        to_create = {}
+        for record in records:
+            if record['key'] not in self._sessions and record['key'] not in to_create and record['username']:
+                to_create[record['key']] = record
+        created = []
+        if to_create:
+            users = dict(User.objects.filter(
+                username__in={record['username'] for record in to_create.values()}
+            ).values_list('username', 'id'))
+            sessions = [
+                UserSession(
+                    user_id=users[record['username']], ip_address=record['ip'] or record['nas'],
+                    mac_address=record['mac'], user_agent=f"RADIUS {record['nas_identifier'] or record['nas']}",
+                    acct_session_id=key
+                )
+                for key, record in to_create.items() if record['username'] in users
+            ]
+            UserSession.objects.bulk_create(sessions, batch_size=self.batch_size)
+            # Clés primaires relues : bulk_create ne les renvoie pas sous MySQL
+            keys = [session.acct_session_id for session in sessions]
+            for start in range(0, len(keys), self.batch_size):
+                created.extend(UserSession.objects.filter(
+                    acct_session_id__in=keys[start:start + self.batch_size], is_active=True
+                ))
+            self._sessions.update({session.acct_session_id: session.id for session in created})
+
+        samples = []
+        stops = {}
+        for record in records:
+            session_id = self._sessions.get(record['key'])
+            if session_id is None:
+                continue  # Utilisateur inconnu
+            if record['status'] == STATUS_INTERIM_UPDATE:
+                samples.append(self._sample(session_id, record))
+            elif record['status'] == STATUS_STOP:
+                stops[record['key']] = (session_id, record)
+        BandwidthUsage.objects.bulk_create(samples, batch_size=self.batch_size)
+
+        ended = []
+        if stops:
+            totals = {session_id: record for session_id, record in stops.values()}
+            ended = list(UserSession.objects.filter(id__in=list(totals), is_active=True).values(
+                'id', 'user_id', 'ip_address', 'mac_address', 'user_agent'
+            ))
+            UserSession.objects.filter(id__in=[row['id'] for row in ended]).update(is_active=False, end_time=now)
+            activities = NetworkActivity.objects.bulk_create([
+                NetworkActivity(
+                    session_id=row['id'], activity_type='LOGOUT', ip_address=row['ip_address'],
+                    mac_address=row['mac_address'], user_agent=row['user_agent'] or '',
+                    bytes_uploaded=totals[row['id']]['input'], bytes_downloaded=totals[row['id']]['output'],
+                    additional_data={'reason': 'radius_stop', 'acct_session_time': totals[row['id']]['session_time']},
+                )
+                for row in ended
+            ], batch_size=self.batch_size)
+            UserSession.add_usage(NetworkActivity.usage_by_session(activities))
+            for key in stops:
+                self._sessions.pop(key, None)
+                self._samples.pop(key, None)
+
+        # Mises à jour groupées sans signaux : registre, pare-feu et limitation de débit après validation
+        for session in created:
+            transaction.on_commit(lambda session=session: session_started(session))
+        for row in ended:
+            transaction.on_commit(lambda row=row: session_ended(UserSession(**row)))
+
+    def _sample(self, session_id, record):
+        from .models import BandwidthUsage
+
+        previous = self._samples.get(record['key'])
+        self._samples[record['key']] = (record['session_time'], record['input'], record['output'])
+        if previous and record['session_time'] > previous[0]:
+            elapsed = record['session_time'] - previous[0]
+            uploaded, downloaded = record['input'] - previous[1], record['output'] - previous[2]
+        else:
+            elapsed = record['session_time']
+            uploaded, downloaded = record['input'], record['output']
+        return BandwidthUsage(
+            session_id=session_id,
+            upload_speed=max(uploaded, 0) * 8 / elapsed / 1e6 if elapsed > 0 else 0.0,
+            download_speed=max(downloaded, 0) * 8 / elapsed / 1e6 if elapsed > 0 else 0.0,
+            total_uploaded=record['input'],
+            total_downloaded=record['output'],
+        )
+
+    def _end_nas_sessions(self, nas, now):
+        """Accounting-On/Off : le NAS a redémarré, ses sessions sont terminées"""
+        from .models import NetworkActivity, UserSession
+        from .signals import session_ended
+
+        rows = list(UserSession.objects.filter(acct_session_id__startswith=f'{nas}/', is_active=True).values(
+            'id', 'user_id', 'ip_address', 'mac_address', 'user_agent', 'acct_session_id'
+        ))
+        UserSession.objects.filter(id__in=[row['id'] for row in rows]).update(is_active=False, end_time=now)
+        activities = NetworkActivity.objects.bulk_create([
+            NetworkActivity(
+                session_id=row['id'], activity_type='LOGOUT', ip_address=row['ip_address'],
+                mac_address=row['mac_address'], user_agent=row['user_agent'] or '',
+                additional_data={'reason': 'nas_restarted'},
+            )
+            for row in rows
+        ], batch_size=self.batch_size)
+        UserSession.add_usage(NetworkActivity.usage_by_session(activities))
+        for row in rows:
+            self._sessions.pop(row['acct_session_id'], None)
+            self._samples.pop(row['acct_session_id'], None)
+            transaction.on_commit(lambda row=row: session_ended(UserSession(**row)))
+        if rows:
+            logger.info(f"NAS {nas} redémarré : {len(rows)} session(s) terminée(s)")
+
+
+class _Protocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.server.dispatch(data, addr, self.transport)
+
+
+class RadiusServer:
+    def __init__(self, clients=None, auth_workers=RADIUS_AUTH_WORKERS, **writer_options):
+        self.clients = {address: secret.encode('utf-8') for address, secret in (clients or RADIUS_CLIENTS).items()}
+        self.writer = AccountingWriter(**writer_options)
+        self.stats = {'access_accept': 0, 'access_reject': 0, 'accounting': 0, 'retransmissions': 0, 'dropped': 0}
+        self._auth_pool = ThreadPoolExecutor(max_workers=auth_workers, thread_name_prefix='radius-auth')
+        self._recent = OrderedDict()  # {(adresse du NAS, identifiant, authenticator): réponse, ou None en cours}
+        self._tasks = set()
+        self._transports = []
+
+    async def start(self, host='0.0.0.0', auth_port=RADIUS_AUTH_PORT, acct_port=RADIUS_ACCT_PORT):
+        """Ouvre les ports d'authentification et de comptabilité ; retourne les ports effectifs"""
+        loop = asyncio.get_running_loop()
+        ports = []
+        for port in (auth_port, acct_port):
+            transport, _ = await loop.create_datagram_endpoint(lambda: _Protocol(self), local_addr=(host, port))
+            transport.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+            self._transports.append(transport)
+            ports.append(transport.get_extra_info('sockname')[1])
+        return ports
+
+    def close(self):
+        for transport in self._transports:
+            transport.close()
+        self._auth_pool.shutdown(wait=False)
+        self.writer.close()
+
+    def dispatch(self, data, addr, transport):
+        task = asyncio.ensure_future(self.handle(data, addr, transport))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _drop(self, reason, addr):
+        self.stats['dropped'] += 1
+        logger.debug(f"Paquet RADIUS de {addr[0]} ignoré : {reason}")
+
+    async def handle(self, data, addr, transport):
+        secret = self.clients.get(addr[0])
+        if secret is None:
+            return self._drop('client inconnu', addr)
+        try:
+            packet, raw = Packet.decode(data)
+        except RadiusError as exc:
+            return self._drop(str(exc), addr)
+
+        key = (addr[0], packet.identifier, packet.authenticator)
+        if key in self._recent:
+            self.stats['retransmissions'] += 1
+            if self._recent[key] is not None:
+                transport.sendto(self._recent[key], addr)
+            return
+        self._recent[key] = None
+
+        try:
+            if packet.code == ACCESS_REQUEST:
+                response = await self._access(packet, raw, secret)
+            elif packet.code == ACCOUNTING_REQUEST:
+                response = await self._accounting(packet, raw, secret, addr)
+            else:
+                response = None
+        except Exception:
+            logger.exception(f"Échec du traitement d'un paquet RADIUS de {addr[0]}")
+            response = None
+
+        if response is None:
+            # Pas de réponse : le NAS retransmettra
+            self._recent.pop(key, None)
+            return
+        self._recent[key] = response
+        while len(self._recent) > RECENT_RESPONSES:
+            self._recent.popitem(last=False)
+        transport.sendto(response, addr)
+
+    async def _access(self, packet, raw, secret):
+        if packet.get(MESSAGE_AUTHENTICATOR) is not None:
+            if not verify_message_authenticator(raw, secret):
+                return self._drop('Message-Authenticator invalide', ('?',))
+        elif RADIUS_REQUIRE_MESSAGE_AUTHENTICATOR:
+            return self._drop('Message-Authenticator absent', ('?',))
+
+        username, password = packet.text(USER_NAME), packet.get(USER_PASSWORD)
+        if not username or password is None:
+            self.stats['access_reject'] += 1
+            return encode_response(packet, ACCESS_REJECT, [
+                (REPLY_MESSAGE, 'Méthode d\'authentification non prise en charge'.encode('utf-8'))
+            ], secret, message_authenticator=True)
+
+        password = decrypt_password(password, secret, packet.authenticator)
+        mac_address = normalize_mac(packet.text(CALLING_STATION_ID))
+        loop = asyncio.get_running_loop()
+        accepted, message, entitlement = await loop.run_in_executor(
+            self._auth_pool, authorize, username, password, mac_address
+        )
+        if not accepted:
+            self.stats['access_reject'] += 1
+            return encode_response(packet, ACCESS_REJECT, [(REPLY_MESSAGE, message.encode('utf-8'))],
+                                   secret, message_authenticator=True)
+
+        self.stats['access_accept'] += 1
+        remaining = int((entitlement['end_date'] - timezone.now()).total_seconds())
+        attributes = [integer_attribute(SESSION_TIMEOUT, max(remaining, 1))]
+        if entitlement.get('rate_kbps'):
+            rate = struct.pack('!I', entitlement['rate_kbps'] * 1000)
+            attributes += [vendor_attribute(WISPR_VENDOR_ID, WISPR_BANDWIDTH_MAX_UP, rate),
+                           vendor_attribute(WISPR_VENDOR_ID, WISPR_BANDWIDTH_MAX_DOWN, rate)]
+        return encode_response(packet, ACCESS_ACCEPT, attributes, secret, message_authenticator=True)
+
+    async def _accounting(self, packet, raw, secret, addr):
+        if not verify_accounting_request(raw, secret):
+            return self._drop('Request Authenticator invalide', addr)
+        nas = packet.address(NAS_IP_ADDRESS) or addr[0]
+        acct_session_id = packet.text(ACCT_SESSION_ID)
+        record = {
+            'status': packet.integer(ACCT_STATUS_TYPE),
+            'nas': nas,
+            'nas_identifier': packet.text(NAS_IDENTIFIER),
+            'key': f'{nas}/{acct_session_id}' if acct_session_id else None,
+            'username': packet.text(USER_NAME),
+            'mac': normalize_mac(packet.text(CALLING_STATION_ID)),
+            'ip': packet.address(FRAMED_IP_ADDRESS),
+            # Input : octets reçus du client (envoyés par lui), Output : octets envoyés au client
+            'input': (packet.integer(ACCT_INPUT_GIGAWORDS) << 32) + packet.integer(ACCT_INPUT_OCTETS),
+            'output': (packet.integer(ACCT_OUTPUT_GIGAWORDS) << 32) + packet.integer(ACCT_OUTPUT_OCTETS),
+            'session_time': packet.integer(ACCT_SESSION_TIME),
+        }
+        await self.writer.submit(record)
+        self.stats['accounting'] += 1
+        return encode_response(packet, ACCOUNTING_RESPONSE, [], secret)
@@ -0,0 +1,300 @@
+"""Registre des sessions actives du portail captif (verrou par appareil).
+
+Associe chaque utilisateur à ses sessions actives et à leur adresse MAC, et
+chaque MAC à sa session : les contrôles faits à la connexion (session sur un
+autre appareil, session existante pour cette MAC) sont des lectures en
+mémoire, sans aller-retour vers la base.
+
+Deux implémentations :
+
+- 'local' : dictionnaires du processus, chargés au premier usage puis
+  rechargés depuis la table toutes les SESSION_REGISTRY_MAX_AGE secondes
+  (les sessions ouvertes par un autre processus y apparaissent au plus tard
+  à ce moment) ;
+- 'cache' : entrées dans le cache Django, partagées par tous les processus
+  lorsque le cache l'est (Redis, Memcached). Un rechargement écrit une
+  nouvelle génération de clés, l'ancienne devient inaccessible et expire
+  (SESSION_REGISTRY_CACHE_TIMEOUT) ; la génération courante est reconstruite
+  depuis la base à l'expiration de sa clé.
+
+Le registre est un instantané : avec le registre local, une session ouverte
+par un autre processus n'y figure qu'au rechargement suivant. Les lectures
+(vérifications à la connexion) s'en contentent, mais avant d'ouvrir une
+session la connexion confirme le verrou en base, dans la même requête que
+l'abonnement (entitlements.confirm_entitlement) : confirm_user_sessions().
+
+Le registre est tenu à jour par les signaux de UserSession (après validation
+de la transaction) et par le balayage des abonnements échus, qui termine les
+sessions par UPDATE groupé. reconcile() le compare à la table et le
+reconstruit (tâche périodique, commande check_session_registry).
+"""
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+SESSION_REGISTRY_BACKEND = getattr(settings, 'SESSION_REGISTRY_BACKEND', 'local')
+SESSION_REGISTRY_MAX_AGE = getattr(settings, 'SESSION_REGISTRY_MAX_AGE', 30)
+SESSION_REGISTRY_CACHE_TIMEOUT = getattr(settings, 'SESSION_REGISTRY_CACHE_TIMEOUT', 3600)
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def active_sessions():
+    """Sessions actives de la table : {user_id: {session_id: mac}}"""
+    from .models import UserSession
+
+    users = {}
+    rows = UserSession.objects.filter(is_active=True).values_list('id', 'user_id', 'mac_address')
+    for session_id, user_id, mac_address in rows.iterator(chunk_size=5000):
+        users.setdefault(user_id, {})[session_id] = mac_address
+    return users
+
+
+class LocalRegistry:
+    """Registre en mémoire du processus"""
+
+    def __init__(self, max_age=SESSION_REGISTRY_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._users = {}     # {user_id: {session_id: mac}}
+        self._sessions = {}  # {session_id: user_id}
+        self._macs = {}      # {mac: session_id}
+        self._loaded_at = None
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or (self.max_age and time.monotonic() - self._loaded_at > self.max_age):
+            self.replace(active_sessions())
+
+    def replace(self, users):
+        sessions = {session_id: user_id for user_id, entries in users.items() for session_id in entries}
+        macs = {mac: session_id for entries in users.values() for session_id, mac in entries.items() if mac}
+        with self._lock:
+            self._users, self._sessions, self._macs = users, sessions, macs
+            self._loaded_at = time.monotonic()
+
+    def user_sessions(self, user_id):
+        self._ensure_loaded()
+        with self._lock:
+            return dict(self._users.get(user_id, {}))
+
+    def get_many(self, user_ids):
+        self._ensure_loaded()
+        with self._lock:
+            return {user_id: dict(self._users[user_id]) for user_id in user_ids if user_id in self._users}
+
+    def mac_session(self, mac_address):
+        self._ensure_loaded()
+        return self._macs.get(mac_address)
+
+    def add(self, session_id, user_id, mac_address):
+        self._ensure_loaded()
+        with self._lock:
+            self._discard(session_id)
+            self._users.setdefault(user_id, {})[session_id] = mac_address
+            self._sessions[session_id] = user_id
+            if mac_address:
+                self._macs[mac_address] = session_id
+
+    def remove(self, session_ids):
+        self._ensure_loaded()
+        with self._lock:
+            for session_id in session_ids:
+                self._discard(session_id)
+
+    def _discard(self, session_id):
+        user_id = self._sessions.pop(session_id, None)
+        if user_id is None:
+            return
+        entries = self._users.get(user_id, {})
+        mac_address = entries.pop(session_id, None)
+        if not entries:
+            self._users.pop(user_id, None)
+        if mac_address and self._macs.get(mac_address) == session_id:
+            del self._macs[mac_address]
+
+    def user_ids(self):
+        """Utilisateurs présents dans le registre (None si le registre ne peut pas être parcouru)"""
+        self._ensure_loaded()
+        with self._lock:
+            return set(self._users)
+
+
+class CacheRegistry:
+    """Registre partagé par les processus via le cache Django"""
+    GENERATION_KEY = 'session_registry:generation'
+    SET_MANY_BATCH = 1000
+    # Les entrées survivent un peu à la clé de génération : une génération publiée est toujours complète
+    ENTRY_TIMEOUT_MARGIN = 300
+
+    def __init__(self, timeout=SESSION_REGISTRY_CACHE_TIMEOUT):
+        self.timeout = timeout
+        self.entry_timeout = timeout + self.ENTRY_TIMEOUT_MARGIN
+
+    def _generation(self):
+        generation = cache.get(self.GENERATION_KEY)
+        if generation is None:
+            generation = self.replace(active_sessions())
+        return generation
+
+    @staticmethod
+    def _key(generation, kind, value):
+        return f'session_registry:{generation}:{kind}:{value}'
+
+    def replace(self, users):
+        generation = uuid.uuid4().hex[:8]
+        values = {}
+        for user_id, entries in users.items():
+            values[self._key(generation, 'user', user_id)] = entries
+            for session_id, mac_address in entries.items():
+                values[self._key(generation, 'session', session_id)] = user_id
+                if mac_address:
+                    values[self._key(generation, 'mac', mac_address)] = session_id
+        items = list(values.items())
+        for start in range(0, len(items), self.SET_MANY_BATCH):
+            cache.set_many(dict(items[start:start + self.SET_MANY_BATCH]), self.entry_timeout)
+        # Génération publiée une fois toutes ses entrées écrites
+        cache.set(self.GENERATION_KEY, generation, self.timeout)
+        return generation
+
+    def user_sessions(self, user_id):
+        return cache.get(self._key(self._generation(), 'user', user_id)) or {}
+
+    def get_many(self, user_ids):
+        generation = self._generation()
+        keys = {self._key(generation, 'user', user_id): user_id for user_id in user_ids}
+        return {keys[key]: entries for key, entries in cache.get_many(list(keys)).items() if entries}
+
+    def mac_session(self, mac_address):
+        return cache.get(self._key(self._generation(), 'mac', mac_address))
+
+    def add(self, session_id, user_id, mac_address):
+        generation = self._generation()
+        self._discard(generation, session_id)
+        user_key = self._key(generation, 'user', user_id)
+        entries = cache.get(user_key) or {}
+        entries[session_id] = mac_address
+        cache.set_many({user_key: entries, self._key(generation, 'session', session_id): user_id}, self.entry_timeout)
+        if mac_address:
+            cache.set(self._key(generation, 'mac', mac_address), session_id, self.entry_timeout)
+
+    def remove(self, session_ids):
+        generation = self._generation()
+        for session_id in session_ids:
+            self._discard(generation, session_id)
+
+    def _discard(self, generation, session_id):
+        session_key = self._key(generation, 'session', session_id)
+        user_id = cache.get(session_key)
+        if user_id is None:
+            return
+        cache.delete(session_key)
+        user_key = self._key(generation, 'user', user_id)
+        entries = cache.get(user_key) or {}
+        mac_address = entries.pop(session_id, None)
+        if entries:
+            cache.set(user_key, entries, self.entry_timeout)
+        else:
+            cache.delete(user_key)
+        if mac_address:
+            mac_key = self._key(generation, 'mac', mac_address)
+            if cache.get(mac_key) == session_id:
+                cache.delete(mac_key)
+
+    def user_ids(self):
+        return None
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = CacheRegistry() if SESSION_REGISTRY_BACKEND == 'cache' else LocalRegistry()
+    return _registry
+
+
+def other_device(user_id, mac_address):
+    """Session active de l'utilisateur sur un autre appareil (ou sans MAC connue)"""
+    if not mac_address:
+        return False
+    return any(mac != mac_address for mac in get_registry().user_sessions(user_id).values())
+
+
+def device_session(user_id, mac_address):
+    """Identifiant de la session active de l'utilisateur pour cette MAC, ou None"""
+    if not mac_address:
+        return None
+    session_ids = [session_id for session_id, mac in get_registry().user_sessions(user_id).items()
+                   if mac == mac_address]
+    return min(session_ids) if session_ids else None
+
+
+def session_for_mac(mac_address):
+    """Session active associée à une MAC, tous utilisateurs confondus"""
+    return get_registry().mac_session(mac_address) if mac_address else None
+
+
+def confirm_user_sessions(user_id, sessions=None):
+    """Sessions actives de l'utilisateur lues en base ({session_id: mac}) ; le registre est corrigé au passage.
+
+    sessions : sessions actives déjà lues en base par l'appelant (aucune requête).
+    """
+    from .models import UserSession
+
+    if sessions is None:
+        sessions = dict(UserSession.objects.filter(user_id=user_id, is_active=True).values_list('id', 'mac_address'))
+    registry = get_registry()
+    known = registry.user_sessions(user_id)
+    for session_id, mac_address in sessions.items():
+        if known.get(session_id, False) != mac_address:
+            registry.add(session_id, user_id, mac_address)
+    stale = [session_id for session_id in known if session_id not in sessions]
+    if stale:
+        registry.remove(stale)
+    return sessions
+
+
+def register(session_id, user_id, mac_address):
+    get_registry().add(session_id, user_id, mac_address)
+
+
+def unregister(session_ids):
+    get_registry().remove(session_ids)
+
+
+def reconcile(fix=True):
+    """Compare le registre à la table des sessions et le reconstruit (fix=True).
+
+    Retourne le nombre de sessions actives, de sessions absentes du registre (ou
+    avec une autre MAC) et de sessions du registre qui ne sont plus actives. Le
+    registre partagé ne peut pas être parcouru : seules les entrées des
+    utilisateurs ayant une session active y sont comparées.
+    """
+    registry = get_registry()
+    expected = active_sessions()
+    known = registry.user_ids()
+    current = registry.get_many(set(expected) | (known or set()))
+
+    missing = stale = 0
+    for user_id in set(expected) | set(current):
+        wanted, found = expected.get(user_id, {}), current.get(user_id, {})
+        missing += sum(1 for session_id, mac in wanted.items() if found.get(session_id, False) != mac)
+        stale += sum(1 for session_id in found if session_id not in wanted)
+
+    if fix:
+        registry.replace(expected)
+    result = {
+        'sessions': sum(len(entries) for entries in expected.values()),
+        'missing': missing,
+        'stale': stale,
+    }
+    if missing or stale:
+        logger.warning(f"Registre des sessions désynchronisé : {result}")
+    return result
@@ -0,0 +1,187 @@
+"""Rétention de l'historique réseau (NetworkActivity et BandwidthUsage).
+
+Les mesures brutes plus anciennes que NETWORK_RAW_RETENTION_DAYS sont
+regroupées par session et par heure dans des tables d'agrégats, puis
+supprimées. Les agrégats horaires plus anciens que
+NETWORK_HOURLY_RETENTION_DAYS sont à leur tour regroupés par jour. Chaque
+étape travaille par lots bornés pour ne jamais verrouiller longtemps les
+tables pendant les heures d'affluence.
+
+Deux exécutions peuvent se chevaucher (tâche périodique et commande
+manuelle) : chaque lot réclame ses lignes avec
+select_for_update(skip_locked=True), et un agrégat créé entre-temps par
+l'autre exécution est relu puis complété au lieu d'être créé deux fois.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum, Max
+from django.db.models.functions import TruncHour, TruncDay
+from django.utils import timezone
+
+from .models import NetworkActivity, BandwidthUsage, NetworkActivityRollup, BandwidthUsageRollup
+
+logger = logging.getLogger(__name__)
+
+NETWORK_RAW_RETENTION_DAYS = getattr(settings, 'NETWORK_RAW_RETENTION_DAYS', 7)
+NETWORK_HOURLY_RETENTION_DAYS = getattr(settings, 'NETWORK_HOURLY_RETENTION_DAYS', 90)
+# None : les agrégats journaliers sont conservés indéfiniment
+NETWORK_DAILY_RETENTION_DAYS = getattr(settings, 'NETWORK_DAILY_RETENTION_DAYS', None)
+NETWORK_RETENTION_BATCH_SIZE = getattr(settings, 'NETWORK_RETENTION_BATCH_SIZE', 5000)
+NETWORK_RETENTION_MAX_BATCHES = getattr(settings, 'NETWORK_RETENTION_MAX_BATCHES', 20)
+
+ACTIVITY_SUM_FIELDS = ['activity_count', 'bytes_uploaded', 'bytes_downloaded', 'bandwidth_usage_total']
+ACTIVITY_MAX_FIELDS = []
+BANDWIDTH_SUM_FIELDS = ['sample_count', 'upload_speed_total', 'download_speed_total', 'ping_latency_total', 'ping_count']
+BANDWIDTH_MAX_FIELDS = ['total_uploaded', 'total_downloaded']
+
+# Agrégation des mesures brutes vers les champs des tables d'agrégats
+RAW_ACTIVITY_AGGREGATES = {
+    'activity_count': Count('id'),
+    'bytes_uploaded': Sum('bytes_uploaded'),
+    'bytes_downloaded': Sum('bytes_downloaded'),
+    'bandwidth_usage_total': Sum('bandwidth_usage'),
+}
+RAW_BANDWIDTH_AGGREGATES = {
+    'sample_count': Count('id'),
+    'upload_speed_total': Sum('upload_speed'),
+    'download_speed_total': Sum('download_speed'),
+    'ping_latency_total': Sum('ping_latency'),
+    'ping_count': Count('ping_latency'),
+    'total_uploaded': Max('total_uploaded'),
+    'total_downloaded': Max('total_downloaded'),
+}
+
+
+def _rollup_aggregates(sum_fields, max_fields):
+    """Agrégation d'agrégats horaires vers des agrégats journaliers"""
+    aggregates = {field: Sum(field) for field in sum_fields}
+    aggregates.update({field: Max(field) for field in max_fields})
+    return aggregates
+
+
+def _merge_rollups(model, granularity, rows, sum_fields, max_fields):
+    """Additionne des lignes agrégées (session, bucket) dans la table d'agrégats"""
+    rows = list(rows)
+    if not rows:
+        return
+
+    try:
+        with transaction.atomic():
+            _apply_rollups(model, granularity, rows, sum_fields, max_fields)
+    except IntegrityError:
+        # Agrégat créé par une exécution concurrente depuis la lecture : relu (verrouillé) puis complété
+        _apply_rollups(model, granularity, rows, sum_fields, max_fields)
+
+
+def _apply_rollups(model, granularity, rows, sum_fields, max_fields):
+    existing = {
+        (rollup.session_id, rollup.bucket_start): rollup
+        for rollup in model.objects.select_for_update().filter(
+            granularity=granularity,
+            session_id__in={row['session'] for row in rows},
+            bucket_start__in={row['bucket'] for row in rows}
+        )
+    }
+    to_create = []
+    to_update = {}
+    for row in rows:
+        key = (row['session'], row['bucket'])
+        rollup = existing.get(key)
+        if rollup is None:
+            rollup = model(session_id=row['session'], granularity=granularity, bucket_start=row['bucket'])
+            existing[key] = rollup
+            to_create.append(rollup)
+        elif rollup.pk is not None:
+            to_update[rollup.pk] = rollup
+        for field in sum_fields:
+            setattr(rollup, field, getattr(rollup, field) + (row[field] or 0))
+        for field in max_fields:
+            setattr(rollup, field, max(getattr(rollup, field), row[field] or 0))
+
+    model.objects.bulk_create(to_create)
+    if to_update:
+        model.objects.bulk_update(list(to_update.values()), sum_fields + max_fields)
+
+
+def _downsample_batch(queryset, time_field, trunc, aggregates, rollup_model, granularity,
+                      sum_fields, max_fields, batch_size):
+    """Regroupe puis supprime un lot des lignes les plus anciennes du queryset"""
+    with transaction.atomic():
+        # Lignes réclamées : une exécution concurrente passe au lot suivant au lieu de les compter deux fois
+        pks = list(queryset.select_for_update(skip_locked=True).order_by(time_field).values_list(
+            'pk', flat=True
+        )[:batch_size])
+        if not pks:
+            return 0
+
+        rows = queryset.model.objects.filter(pk__in=pks).annotate(
+            bucket=trunc(time_field)
+        ).values('session', 'bucket').annotate(**aggregates).order_by()
+        _merge_rollups(rollup_model, granularity, rows, sum_fields, max_fields)
+        queryset.model.objects.filter(pk__in=pks).delete()
+    return len(pks)
+
+
+def _delete_batch(queryset, batch_size):
+    pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+    if pks:
+        queryset.model.objects.filter(pk__in=pks).delete()
+    return len(pks)
+
+
+def _run_batches(step, max_batches):
+    """Exécute une étape par lots jusqu'à épuisement ou jusqu'au nombre maximal de lots"""
+    processed = 0
+    for _ in range(max_batches):
+        count = step()
+        processed += count
+        if not count:
+            break
+    return processed
+
+
+def apply_retention(now=None, batch_size=None, max_batches=None):
+    """Sous-échantillonne et purge l'historique réseau. Retourne le nombre de lignes traitées par étape."""
+    now = now or timezone.now()
+    batch_size = batch_size or NETWORK_RETENTION_BATCH_SIZE
+    max_batches = max_batches or NETWORK_RETENTION_MAX_BATCHES
+    raw_cutoff = now - timedelta(days=NETWORK_RAW_RETENTION_DAYS)
+    hourly_cutoff = now - timedelta(days=NETWORK_HOURLY_RETENTION_DAYS)
+
+    summary = {
+        'activities_downsampled': _run_batches(lambda: _downsample_batch(
+            NetworkActivity.objects.filter(timestamp__lt=raw_cutoff), 'timestamp', TruncHour,
+            RAW_ACTIVITY_AGGREGATES, NetworkActivityRollup, 'HOUR',
+            ACTIVITY_SUM_FIELDS, ACTIVITY_MAX_FIELDS, batch_size
+        ), max_batches),
+        'bandwidth_downsampled': _run_batches(lambda: _downsample_batch(
+            BandwidthUsage.objects.filter(timestamp__lt=raw_cutoff), 'timestamp', TruncHour,
+            RAW_BANDWIDTH_AGGREGATES, BandwidthUsageRollup, 'HOUR',
+            BANDWIDTH_SUM_FIELDS, BANDWIDTH_MAX_FIELDS, batch_size
+        ), max_batches),
+        'activity_hours_compacted': _run_batches(lambda: _downsample_batch(
+            NetworkActivityRollup.objects.filter(granularity='HOUR', bucket_start__lt=hourly_cutoff),
+            'bucket_start', TruncDay, _rollup_aggregates(ACTIVITY_SUM_FIELDS, ACTIVITY_MAX_FIELDS),
+            NetworkActivityRollup, 'DAY', ACTIVITY_SUM_FIELDS, ACTIVITY_MAX_FIELDS, batch_size
+        ), max_batches),
+        'bandwidth_hours_compacted': _run_batches(lambda: _downsample_batch(
+            BandwidthUsageRollup.objects.filter(granularity='HOUR', bucket_start__lt=hourly_cutoff),
+            'bucket_start', TruncDay, _rollup_aggregates(BANDWIDTH_SUM_FIELDS, BANDWIDTH_MAX_FIELDS),
+            BandwidthUsageRollup, 'DAY', BANDWIDTH_SUM_FIELDS, BANDWIDTH_MAX_FIELDS, batch_size
+        ), max_batches),
+    }
+
+    if NETWORK_DAILY_RETENTION_DAYS is not None:
+        daily_cutoff = now - timedelta(days=NETWORK_DAILY_RETENTION_DAYS)
+        summary['daily_rollups_pruned'] = sum(
+            _run_batches(lambda model=model: _delete_batch(
+                model.objects.filter(granularity='DAY', bucket_start__lt=daily_cutoff), batch_size
+            ), max_batches)
+            for model in (NetworkActivityRollup, BandwidthUsageRollup)
+        )
+
+    logger.info(f"Rétention de l'historique réseau : {summary}")
+    return summary
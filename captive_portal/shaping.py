@@ -0,0 +1,346 @@
+"""Limitation de débit des sessions selon le forfait (classes HTB de tc).
+
+Chaque session active dont le forfait a un débit maximal (Plan.rate_kbps,
+rafale Plan.burst_kbytes) reçoit une classe HTB à son ouverture, avec une file
+fq_codel, et la perd à sa fin. Le trafic qui ne correspond à aucune classe
+(forfaits illimités) n'est pas limité.
+
+- Débit descendant : classes de SHAPING_INTERFACE (interface côté clients),
+  filtrées sur l'adresse de destination ;
+- débit montant (facultatif) : mêmes classes sur SHAPING_UPLOAD_INTERFACE (ifb
+  recevant le trafic entrant redirigé), filtrées sur l'adresse source.
+
+La classe d'un client est dérivée de son adresse IPv4 (16 bits de poids
+faible : 10.0.3.7 -> 1:307), sans table d'allocation partagée entre processus ;
+le réseau des clients ne doit donc pas dépasser un /16. Les clients IPv6 ne
+sont pas limités.
+
+Comme pour le pare-feu (enforcement), les changements sont regroupés et
+appliqués en un seul appel « tc -batch » ; reconcile() aligne les classes sur
+les sessions actives et n'envoie que les écarts. Backends (SHAPING_BACKEND) :
+'tc', 'file' (simulation : commandes ajoutées à SHAPING_COMMAND_FILE), None
+(désactivé).
+
+LimitHitRecorder relève les compteurs des classes : un client dont la classe
+a retardé ou rejeté du trafic depuis le relevé précédent est tracé par une
+activité BANDWIDTH_LIMIT (au plus une par session toutes les
+SHAPING_LIMIT_EVENT_INTERVAL secondes, d'après la dernière activité en base).
+Le relevé précédent est gardé en mémoire : le relevé tourne dans un seul
+processus de longue durée (commande record_bandwidth_limits), comme
+collect_usage.
+"""
+import ipaddress
+import json
+import logging
+import subprocess
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .batching import BatchedUpdater
+from .entitlements import get_entitlement
+
+logger = logging.getLogger(__name__)
+
+SHAPING_BACKEND = getattr(settings, 'SHAPING_BACKEND', None)
+SHAPING_INTERFACE = getattr(settings, 'SHAPING_INTERFACE', 'br-lan')
+SHAPING_UPLOAD_INTERFACE = getattr(settings, 'SHAPING_UPLOAD_INTERFACE', None)
+SHAPING_COMMAND_FILE = getattr(settings, 'SHAPING_COMMAND_FILE', 'shaping.tc')
+SHAPING_FLUSH_DELAY = getattr(settings, 'SHAPING_FLUSH_DELAY', 0.05)
+SHAPING_LIMIT_EVENT_INTERVAL = getattr(settings, 'SHAPING_LIMIT_EVENT_INTERVAL', 300)
+SHAPING_LIMIT_POLL_INTERVAL = getattr(settings, 'SHAPING_LIMIT_POLL_INTERVAL', 60)
+
+FILTER_PRIORITY = 10
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def class_minor(ip_address):
+    """Numéro de classe HTB du client (16 bits de poids faible de l'IPv4), ou None"""
+    try:
+        address = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return None
+    if address.version != 4:
+        return None
+    minor = int(address) & 0xffff
+    # 0 : adresse de réseau, 0xffff : diffusion
+    return minor if 0 < minor < 0xffff else None
+
+
+def plan_profile(rate_kbps, burst_kbytes=None):
+    """Profil (débit, rafale) d'un forfait, ou None s'il n'est pas limité"""
+    return (rate_kbps, burst_kbytes) if rate_kbps else None
+
+
+def desired_profiles():
+    """Profils des sessions actives : {minor: (ip, profil)}"""
+    from subscriptions.models import Subscription
+    from .models import UserSession
+
+    sessions = list(UserSession.objects.filter(is_active=True).values_list('ip_address', 'user_id'))
+    # Premier abonnement en cours de chaque utilisateur, comme à la connexion
+    plans = {}
+    rows = Subscription.objects.filter(
+        user_id__in={user_id for _, user_id in sessions}, is_active=True, end_date__gt=timezone.now()
+    ).order_by('-pk').values_list('user_id', 'plan__rate_kbps', 'plan__burst_kbytes')
+    for user_id, rate_kbps, burst_kbytes in rows:
+        plans[user_id] = plan_profile(rate_kbps, burst_kbytes)
+
+    desired = {}
+    for ip_address, user_id in sessions:
+        minor = class_minor(ip_address)
+        if minor is not None and plans.get(user_id):
+            desired[minor] = (ip_address, plans[user_id])
+    return desired
+
+
+class TcBackend:
+    """Classes HTB et filtres flower, appliqués par « tc -force -batch - »"""
+    name = 'tc'
+
+    def __init__(self, interface=SHAPING_INTERFACE, upload_interface=SHAPING_UPLOAD_INTERFACE):
+        # (interface, champ du filtre) : destination pour le débit descendant, source pour le montant
+        self.directions = [(interface, 'dst_ip')]
+        if upload_interface:
+            self.directions.append((upload_interface, 'src_ip'))
+
+    def script(self, changes, setup=False):
+        """Commandes tc pour changes = {minor: (ip, (débit, rafale)) ou None pour retirer la classe}"""
+        lines = []
+        for device, match in self.directions:
+            if setup:
+                # Sans effet sur les classes si la racine HTB existe déjà ; trafic non classé non limité
+                lines.append(f'qdisc replace dev {device} root handle 1: htb default 0')
+            for minor, change in changes.items():
+                filter_spec = f'dev {device} parent 1: protocol ip prio {FILTER_PRIORITY} handle 0x{minor:x} flower'
+                if change is None:
+                    lines.append(f'filter del {filter_spec}')
+                    lines.append(f'class del dev {device} classid 1:{minor:x}')
+                    continue
+                ip_address, (rate_kbps, burst_kbytes) = change
+                burst = f' burst {burst_kbytes}k cburst {burst_kbytes}k' if burst_kbytes else ''
+                lines.append(
+                    f'class replace dev {device} parent 1: classid 1:{minor:x} '
+                    f'htb rate {rate_kbps}kbit ceil {rate_kbps}kbit{burst}'
+                )
+                lines.append(f'qdisc replace dev {device} parent 1:{minor:x} fq_codel')
+                lines.append(f'filter replace {filter_spec} {match} {ip_address} classid 1:{minor:x}')
+        return '\n'.join(lines) + '\n'
+
+    def _run(self, script):
+        # -force : une commande en échec (classe déjà absente...) n'interrompt pas le lot
+        subprocess.run(['tc', '-force', '-batch', '-'], input=script, text=True, capture_output=True, check=True)
+
+    def apply(self, changes, setup=False):
+        self._run(self.script(changes, setup))
+
+    def _classes(self, statistics=False):
+        device = self.directions[0][0]
+        command = ['tc', '-j'] + (['-s'] if statistics else []) + ['class', 'show', 'dev', device]
+        result = subprocess.run(command, text=True, capture_output=True)
+        if result.returncode or not result.stdout.strip():
+            return []
+        return [item for item in json.loads(result.stdout) if item.get('class') == 'htb']
+
+    @staticmethod
+    def _minor(item):
+        major, _, minor = item.get('handle', '').partition(':')
+        return int(minor, 16) if major == '1' and minor else None
+
+    def classes(self):
+        """Classes en place (débit descendant) : {minor: débit en kbit/s}"""
+        # tc -j exprime les débits en octets par seconde
+        return {self._minor(item): int(item.get('rate', 0)) * 8 // 1000 for item in self._classes()
+                if self._minor(item) is not None}
+
+    def counters(self):
+        """Compteurs des classes : {minor: {'dropped': paquets rejetés, 'overlimits': dépassements}}"""
+        return {
+            self._minor(item): {
+                'dropped': item.get('stats', {}).get('drops', 0),
+                'overlimits': item.get('stats', {}).get('overlimits', 0),
+            }
+            for item in self._classes(statistics=True) if self._minor(item) is not None
+        }
+
+
+class CommandFileBackend(TcBackend):
+    """Simulation : commandes tc ajoutées à un fichier, classes tenues en mémoire"""
+    name = 'file'
+
+    def __init__(self, path=SHAPING_COMMAND_FILE, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._classes_state = {}
+        self.counter_values = {}  # Compteurs simulés, renseignés par les tests ou le benchmark
+
+    def _run(self, script):
+        with open(self.path, 'a', encoding='utf-8') as handle:
+            handle.write(f'# {timezone.now().isoformat()}\n{script}')
+
+    def apply(self, changes, setup=False):
+        super().apply(changes, setup)
+        for minor, change in changes.items():
+            if change is None:
+                self._classes_state.pop(minor, None)
+            else:
+                self._classes_state[minor] = change[1][0]
+
+    def classes(self):
+        return dict(self._classes_state)
+
+    def counters(self):
+        return {minor: dict(values) for minor, values in self.counter_values.items() if minor in self._classes_state}
+
+
+BACKENDS = {
+    'tc': TcBackend,
+    'file': CommandFileBackend,
+}
+
+
+class ShapingEngine(BatchedUpdater):
+    """Accumule les ouvertures et fins de classes et les applique par lots"""
+    thread_name = 'shaping'
+
+    def __init__(self, backend, flush_delay=SHAPING_FLUSH_DELAY, reconcile_on_start=True):
+        super().__init__(flush_delay, reconcile_on_start)
+        self.backend = backend
+
+    def shape(self, ip_address, profile):
+        """Applique le profil au client (None : retire sa limite)"""
+        minor = class_minor(ip_address)
+        if minor is not None:
+            self._queue(minor, (ip_address, profile) if profile else None)
+
+    def unshape(self, ip_address):
+        self.shape(ip_address, None)
+
+    def _apply(self, pending):
+        self.backend.apply(pending)
+
+    def _reconcile(self, desired=None, dry_run=False):
+        """Aligne les classes sur les sessions actives (ou sur desired) ; retourne les écarts trouvés"""
+        if desired is None:
+            if not dry_run:
+                self._discard_pending()
+            desired = desired_profiles()
+        current = self.backend.classes()
+        changes = {minor: change for minor, change in desired.items() if current.get(minor) != change[1][0]}
+        changes.update({minor: None for minor in current if minor not in desired})
+        if not dry_run:
+            self.backend.apply(changes, setup=True)
+        added = sum(1 for change in changes.values() if change is not None)
+        result = {'clients': len(desired), 'updated': added, 'removed': len(changes) - added}
+        if changes:
+            logger.info(f"Limitation de débit resynchronisée : {result}")
+        return result
+
+
+def get_engine():
+    """Moteur du processus, ou None si SHAPING_BACKEND n'est pas configuré"""
+    global _engine
+    if SHAPING_BACKEND is None:
+        return None
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = ShapingEngine(BACKENDS[SHAPING_BACKEND]())
+    return _engine
+
+
+def session_started(user_id, ip_address):
+    """Limite le client selon le forfait de l'abonnement en cours (droits en cache après la connexion)"""
+    engine = get_engine()
+    if engine:
+        entitlement = get_entitlement(user_id)
+        engine.shape(ip_address, plan_profile(entitlement.get('rate_kbps'), entitlement.get('burst_kbytes')))
+
+
+def session_ended(ip_address):
+    engine = get_engine()
+    if engine:
+        engine.unshape(ip_address)
+
+
+def reconcile(dry_run=False):
+    engine = get_engine()
+    if engine is None:
+        return None
+    return engine.reconcile(dry_run=dry_run)
+
+
+class LimitHitRecorder:
+    """Relevés successifs des compteurs des classes (un seul processus : le relevé précédent est en mémoire)"""
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.previous = None
+
+    def poll(self, counters=None):
+        """Trace les sessions limitées depuis le relevé précédent ; retourne le nombre d'activités créées"""
+        if counters is None:
+            if self.backend is None:
+                return 0
+            counters = self.backend.counters()
+        previous, self.previous = self.previous, counters
+        if previous is None:
+            return 0  # Premier relevé : référence
+
+        limited = {}
+        for minor, values in counters.items():
+            before = previous.get(minor, {'dropped': 0, 'overlimits': 0})
+            if values['dropped'] < before['dropped'] or values['overlimits'] < before['overlimits']:
+                continue  # Classe recréée : compteurs remis à zéro, nouvelle référence
+            delta = {key: values[key] - before[key] for key in ('dropped', 'overlimits')}
+            if delta['dropped'] or delta['overlimits']:
+                limited[minor] = delta
+        if not limited:
+            return 0
+        return record_limit_hits(limited)
+
+
+def record_limit_hits(limited):
+    """Crée les activités BANDWIDTH_LIMIT des sessions des classes limitées ({classe: écarts des compteurs})"""
+    from .models import NetworkActivity, UserSession
+
+    sessions = [
+        session for session in UserSession.objects.filter(is_active=True).values(
+            'id', 'user_id', 'ip_address', 'mac_address', 'user_agent'
+        )
+        if class_minor(session['ip_address']) in limited
+    ]
+    if not sessions:
+        return 0
+    # Au plus une activité par session et par intervalle (index session/horodatage)
+    recent = set(NetworkActivity.objects.filter(
+        session_id__in=[session['id'] for session in sessions],
+        activity_type='BANDWIDTH_LIMIT',
+        timestamp__gte=timezone.now() - timedelta(seconds=SHAPING_LIMIT_EVENT_INTERVAL),
+    ).values_list('session_id', flat=True))
+    sessions = [session for session in sessions if session['id'] not in recent]
+    if not sessions:
+        return 0
+
+    activities = []
+    for session in sessions:
+        rate_kbps = get_entitlement(session['user_id']).get('rate_kbps') or 0
+        activities.append(NetworkActivity(
+            session_id=session['id'],
+            activity_type='BANDWIDTH_LIMIT',
+            ip_address=session['ip_address'],
+            mac_address=session['mac_address'],
+            user_agent=session['user_agent'] or '',
+            bandwidth_usage=rate_kbps / 1000,
+            additional_data={'rate_kbps': rate_kbps, **limited[class_minor(session['ip_address'])]},
+        ))
+    with transaction.atomic():
+        activities = NetworkActivity.objects.bulk_create(activities)
+        UserSession.add_usage(NetworkActivity.usage_by_session(activities))
+    logger.info(f"{len(activities)} session(s) limitée(s) par leur forfait")
+    return len(activities)
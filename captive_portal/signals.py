@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import enforcement, registry, shaping
+from .entitlements import invalidate_entitlement
+
+
+@receiver(post_save, sender='subscriptions.Subscription')
+@receiver(post_delete, sender='subscriptions.Subscription')
+def invalidate_user_entitlement(sender, instance, **kwargs):
+    """Un abonnement modifié invalide les droits en cache"""
+    invalidate_entitlement(instance.user_id)
+
+
+def session_started(session):
+    """Session ouverte (validée en base) : registre, pare-feu, limitation de débit"""
+    registry.register(session.pk, session.user_id, session.mac_address)
+    enforcement.grant(session.mac_address, session.ip_address)
+    shaping.session_started(session.user_id, session.ip_address)
+
+
+def session_ended(session):
+    """Session terminée ou supprimée (validée en base)"""
+    registry.unregister([session.pk])
+    enforcement.revoke(session.mac_address, session.ip_address)
+    shaping.session_ended(session.ip_address)
+
+
+@receiver(post_save, sender='captive_portal.UserSession')
+def track_user_session(sender, instance, **kwargs):
+    """Registre des sessions actives, pare-feu et limitation de débit mis à jour après validation de l'écriture"""
+    if instance.is_active:
+        transaction.on_commit(lambda: session_started(instance))
+    else:
+        transaction.on_commit(lambda: session_ended(instance))
+
+
+@receiver(post_delete, sender='captive_portal.UserSession')
+def untrack_user_session(sender, instance, **kwargs):
+    transaction.on_commit(lambda: session_ended(instance))
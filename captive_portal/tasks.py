@@ -0,0 +1,33 @@
+from celery import shared_task
+
+from . import enforcement, registry, shaping
+from .retention import apply_retention
+
+
+@shared_task
+def apply_network_retention():
+    """Sous-échantillonne et purge l'historique réseau (lots bornés)"""
+    return apply_retention()
+
+
+@shared_task
+def reconcile_session_registry():
+    """Reconstruit le registre partagé (backend 'cache') depuis la base.
+
+    Le registre local est propre à chaque processus et se recharge seul
+    (SESSION_REGISTRY_MAX_AGE) : la tâche ne fait alors que mesurer l'écart.
+    """
+    return registry.reconcile(fix=registry.SESSION_REGISTRY_BACKEND == 'cache')
+
+
+@shared_task
+def reconcile_enforcement():
+    """Aligne les ensembles du pare-feu sur les sessions actives"""
+    return enforcement.reconcile()
+
+
+@shared_task
+def reconcile_shaping():
+    """Aligne les classes de limitation de débit sur les sessions actives"""
+    return shaping.reconcile()
+
@@ -7,4 +7,6 @@ urlpatterns = [
     path('login/', views.login, name='login'),
     path('logout/', views.logout, name='logout'),
     path('check-status/', views.check_status, name='check_status'),
+    path('activities/', views.log_network_activity, name='log_network_activity'),
+    path('activities/batch/', views.log_network_activity_batch, name='log_network_activity_batch'),
 ] 
\ No newline at end of file
@@ -6,10 +6,19 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 import json
+import logging
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import UserSession
+from .models import UserSession, NetworkActivity, DeviceFingerprint
+from .entitlements import confirm_entitlement, resolve_entitlement
+from . import neighbors, registry
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Sum, Avg
+from django.db import transaction, DatabaseError
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_ipv46_address
+
+logger = logging.getLogger(__name__)
 
 @csrf_exempt
 @api_view(['POST'])
@@ -73,16 +82,55 @@ def captive_portal_login(request):
             'message': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def _subscription_payload(entitlement):
+    """Résumé de l'abonnement renvoyé au client après connexion"""
+    return {
+        'plan': entitlement['plan_name'],
+        'end_date': entitlement['end_date'].strftime('%Y-%m-%d'),
+        'remaining_days': (entitlement['end_date'] - timezone.now()).days
+    }
+
+def _device_conflict():
+    return Response(
+        {'error': 'DEVICE_ALREADY_USED', 'message': 'Ce ticket est déjà utilisé par un autre appareil. Impossible de se connecter sur le même ticket depuis plusieurs appareils. Je vous conseille d\'acheter un autre ticket, mon ami, pas cher le ticket !'},
+        status=status.HTTP_409_CONFLICT
+    )
+
+def _existing_session(user, session_id, entitlement):
+    """Réponse à la reconnexion d'un appareil qui a déjà une session active"""
+    return Response({
+        'access_token': str(RefreshToken.for_user(user).access_token),
+        'session_id': session_id,
+        'message': 'Session existante récupérée',
+        'user': {
+            'username': user.username,
+            'email': user.email,
+            'subscription': _subscription_payload(entitlement)
+        }
+    })
+
+DEVICE_FIELDS = ('device_name', 'device_type', 'operating_system', 'browser', 'screen_resolution', 'timezone', 'language')
+
+def _record_device(user, mac_address, data):
+    """Empreinte de l'appareil, uniquement pour une MAC résolue par la passerelle (jamais celle déclarée par le client)"""
+    defaults = {field: str(data[field])[:DeviceFingerprint._meta.get_field(field).max_length]
+                for field in DEVICE_FIELDS if data.get(field)}
+    DeviceFingerprint.objects.update_or_create(mac_address=mac_address, defaults={'user': user, **defaults})
+
 @api_view(['POST'])
 def login(request):
     try:
         data = request.data
         username = data.get('username')
         password = data.get('password')
-        mac_address = data.get('mac_address')  # Nouvelle ligne
+        ip_address = request.META.get('REMOTE_ADDR')
+        # MAC connue de la passerelle (baux DHCP, table ARP) ; à défaut, celle déclarée par le client si autorisé
+        resolved_mac = neighbors.resolve(ip_address)
+        mac_address = resolved_mac or (
+            neighbors.normalize_mac(data.get('mac_address')) if neighbors.NEIGHBOR_TRUST_CLIENT_MAC else None
+        )
         
-        print(f"Tentative de connexion pour l'utilisateur: {username}")  # Debug log
-        print(f"Données reçues: {data}")  # Debug log
+        logger.debug(f"Tentative de connexion pour l'utilisateur: {username}")
         
         if not username or not password:
             return Response(
@@ -93,73 +141,61 @@ def login(request):
         user = authenticate(username=username, password=password)
         
         if user is None:
-            print(f"Échec de l'authentification pour l'utilisateur: {username}")  # Debug log
+            logger.info(f"Échec de l'authentification pour l'utilisateur: {username}")
             return Response(
                 {'error': 'Identifiants invalides'},
                 status=status.HTTP_401_UNAUTHORIZED
             )
         
         if not user.is_active:
-            print(f"Compte désactivé pour l'utilisateur: {username}")  # Debug log
+            logger.info(f"Compte désactivé pour l'utilisateur: {username}")
             return Response(
                 {'error': 'Compte désactivé'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Vérifier si l'utilisateur a un abonnement actif
-        subscription = user.subscription_set.filter(
-            is_active=True,
-            end_date__gt=timezone.now()
-        ).first()
+        # Reconnexion d'un appareil qui a déjà une session : droits et session lus dans le cache et le registre
+        if registry.device_session(user.pk, mac_address):
+            entitlement = resolve_entitlement(user, mac_address)
+            if entitlement['subscription_id'] and entitlement['session_id']:
+                if resolved_mac:
+                    _record_device(user, resolved_mac, data)
+                return _existing_session(user, entitlement['session_id'], entitlement)
         
-        if not subscription:
-            print(f"Aucun abonnement actif pour l'utilisateur: {username}")  # Debug log
+        # Sinon droits et verrou par appareil confirmés en base, en une seule requête : le cache et le registre
+        # d'un processus peuvent ignorer un quota épuisé (collect_usage) ou une session ouverte ailleurs
+        entitlement = confirm_entitlement(user, mac_address)
+        
+        if not entitlement['subscription_id']:
+            logger.info(f"Aucun abonnement actif pour l'utilisateur: {username}")
             return Response(
                 {'error': 'Aucun abonnement actif trouvé. Veuillez contacter l\'administrateur.'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # NOUVELLE LOGIQUE : Vérifier si l'utilisateur a déjà une session active sur un autre appareil
-        if mac_address and UserSession.has_active_session_on_different_device(user, mac_address):
-            return Response(
-                {'error': 'DEVICE_ALREADY_USED', 'message': 'Ce ticket est déjà utilisé par un autre appareil. Impossible de se connecter sur le même ticket depuis plusieurs appareils. Je vous conseille d\'acheter un autre ticket, mon ami, pas cher le ticket !'},
-                status=status.HTTP_409_CONFLICT
-            )
+        # Vérifier si l'utilisateur a déjà une session active sur un autre appareil
+        if mac_address and entitlement['other_device']:
+            return _device_conflict()
+        
+        if resolved_mac:
+            _record_device(user, resolved_mac, data)
         
         # Vérifier si c'est le même appareil qui se reconnecte
-        if mac_address:
-            existing_session = UserSession.check_mac_address_usage(user, mac_address)
-            if existing_session:
-                # Récupérer la session existante
-                session = UserSession.get_active_session_by_mac(user, mac_address)
-                if session:
-                    return Response({
-                        'access_token': str(RefreshToken.for_user(user).access_token),
-                        'session_id': session.id,
-                        'message': 'Session existante récupérée',
-                        'user': {
-                            'username': user.username,
-                            'email': user.email,
-                            'subscription': {
-                                'plan': subscription.plan.name,
-                                'end_date': subscription.end_date.strftime('%Y-%m-%d'),
-                                'remaining_days': (subscription.end_date - timezone.now()).days
-                            }
-                        }
-                    })
+        if mac_address and entitlement['session_id']:
+            return _existing_session(user, entitlement['session_id'], entitlement)
         
         # Créer une nouvelle session avec l'adresse MAC
         session = UserSession.objects.create(
             user=user,
-            ip_address=request.META.get('REMOTE_ADDR'),
+            ip_address=ip_address,
             user_agent=request.META.get('HTTP_USER_AGENT'),
-            mac_address=mac_address  # Nouvelle ligne
+            mac_address=mac_address
         )
         
         # Générer les tokens JWT
         refresh = RefreshToken.for_user(user)
         
-        print(f"Connexion réussie pour l'utilisateur: {username}")  # Debug log
+        logger.info(f"Connexion réussie pour l'utilisateur: {username}")
         
         return Response({
             'access_token': str(refresh.access_token),
@@ -168,16 +204,12 @@ def login(request):
             'user': {
                 'username': user.username,
                 'email': user.email,
-                'subscription': {
-                    'plan': subscription.plan.name,
-                    'end_date': subscription.end_date.strftime('%Y-%m-%d'),
-                    'remaining_days': (subscription.end_date - timezone.now()).days
-                }
+                'subscription': _subscription_payload(entitlement)
             }
         })
         
     except Exception as e:
-        print(f"Erreur lors de la connexion: {str(e)}")  # Debug log
+        logger.exception(f"Erreur lors de la connexion: {str(e)}")
         return Response(
             {'error': f'Une erreur est survenue: {str(e)}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -244,31 +276,143 @@ def check_status(request):
         status=status.HTTP_400_BAD_REQUEST
     )
 
+ACTIVITY_TYPES = {choice for choice, _ in NetworkActivity.ACTIVITY_TYPES}
+
+# Taille des lots d'insertion et nombre maximal d'enregistrements par requête
+NETWORK_ACTIVITY_BATCH_SIZE = getattr(settings, 'NETWORK_ACTIVITY_BATCH_SIZE', 500)
+NETWORK_ACTIVITY_MAX_RECORDS = getattr(settings, 'NETWORK_ACTIVITY_MAX_RECORDS', 5000)
+
+def _as_counter(value):
+    """Convertit un compteur (octets) reçu en entier positif"""
+    value = int(value or 0)
+    if value < 0:
+        raise ValueError('Compteur négatif')
+    return value
+
+def _build_activity(data, session, user_agent):
+    """Construit une activité réseau (non enregistrée) à partir des données reçues"""
+    activity_type = data.get('activity_type')
+    if activity_type not in ACTIVITY_TYPES:
+        raise ValueError(f"Type d'activité inconnu: {activity_type}")
+    
+    ip_address = data.get('ip_address') or session.ip_address
+    try:
+        validate_ipv46_address(ip_address)
+    except ValidationError:
+        raise ValueError(f"Adresse IP invalide: {ip_address}")
+    
+    return NetworkActivity(
+        session=session,
+        activity_type=activity_type,
+        ip_address=ip_address,
+        mac_address=data.get('mac_address', session.mac_address),
+        bytes_uploaded=_as_counter(data.get('bytes_uploaded')),
+        bytes_downloaded=_as_counter(data.get('bytes_downloaded')),
+        bandwidth_usage=float(data.get('bandwidth_usage') or 0),
+        user_agent=data.get('user_agent') or user_agent,
+        additional_data=data.get('additional_data', {})
+    )
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def log_network_activity(request):
     """Enregistre une activité réseau"""
     session_id = request.data.get('session_id')
-    activity_type = request.data.get('activity_type')
     
     try:
         session = UserSession.objects.get(id=session_id, user=request.user)
-        
-        activity = NetworkActivity.objects.create(
-            session=session,
-            activity_type=activity_type,
-            ip_address=request.data.get('ip_address', session.ip_address),
-            mac_address=request.data.get('mac_address', session.mac_address),
-            bytes_uploaded=request.data.get('bytes_uploaded', 0),
-            bytes_downloaded=request.data.get('bytes_downloaded', 0),
-            bandwidth_usage=request.data.get('bandwidth_usage', 0),
-            user_agent=request.META.get('HTTP_USER_AGENT', ''),
-            additional_data=request.data.get('additional_data', {})
-        )
+        activity = _build_activity(request.data, session, request.META.get('HTTP_USER_AGENT', ''))
+        with transaction.atomic():
+            activity.save()
+            UserSession.add_usage(NetworkActivity.usage_by_session([activity]))
         
         return Response({'status': 'success', 'activity_id': activity.id})
     except UserSession.DoesNotExist:
         return Response({'error': 'Session non trouvée'}, status=404)
+    except (TypeError, ValueError) as e:
+        return Response({'error': f'Données invalides: {e}'}, status=400)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def log_network_activity_batch(request):
+    """Enregistre un lot d'activités réseau, éventuellement de plusieurs sessions.
+    
+    Les sessions sont validées en une seule requête et les activités insérées
+    par paquets avec bulk_create. Les enregistrements rejetés sont signalés
+    individuellement (index dans le lot + motif) sans bloquer les autres.
+    """
+    records = request.data.get('activities') if isinstance(request.data, dict) else request.data
+    if not isinstance(records, list) or not records:
+        return Response({'error': 'Liste d\'activités requise'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(records) > NETWORK_ACTIVITY_MAX_RECORDS:
+        return Response(
+            {'error': f'Lot trop volumineux (maximum {NETWORK_ACTIVITY_MAX_RECORDS} activités)'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    # Valider toutes les sessions référencées en une seule requête
+    session_ids = set()
+    for record in records:
+        if isinstance(record, dict):
+            try:
+                session_ids.add(int(record.get('session_id')))
+            except (TypeError, ValueError):
+                pass
+    sessions = UserSession.objects.filter(id__in=session_ids)
+    if not request.user.is_staff:
+        # Un client ne peut alimenter que ses propres sessions (la passerelle, elle, est staff)
+        sessions = sessions.filter(user=request.user)
+    sessions = sessions.in_bulk()
+    
+    user_agent = request.META.get('HTTP_USER_AGENT', '')
+    activities = []
+    indexes = []
+    errors = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors.append({'index': index, 'error': 'Enregistrement invalide'})
+            continue
+        try:
+            session = sessions.get(int(record.get('session_id')))
+        except (TypeError, ValueError):
+            session = None
+        if session is None:
+            errors.append({'index': index, 'error': 'Session non trouvée'})
+            continue
+        try:
+            activities.append(_build_activity(record, session, user_agent))
+            indexes.append(index)
+        except (TypeError, ValueError) as e:
+            errors.append({'index': index, 'error': f'Données invalides: {e}'})
+    
+    created = 0
+    for start in range(0, len(activities), NETWORK_ACTIVITY_BATCH_SIZE):
+        chunk = activities[start:start + NETWORK_ACTIVITY_BATCH_SIZE]
+        try:
+            with transaction.atomic():
+                NetworkActivity.objects.bulk_create(chunk)
+                # Compteurs agrégés des sessions mis à jour dans la même transaction
+                UserSession.add_usage(NetworkActivity.usage_by_session(chunk))
+            created += len(chunk)
+        except DatabaseError as e:
+            errors.extend(
+                {'index': index, 'error': f'Erreur d\'enregistrement: {e}'}
+                for index in indexes[start:start + NETWORK_ACTIVITY_BATCH_SIZE]
+            )
+    
+    if not errors:
+        response_status = status.HTTP_201_CREATED
+    elif created:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_400_BAD_REQUEST
+    
+    return Response({
+        'status': 'success' if not errors else 'partial' if created else 'failed',
+        'created': created,
+        'failed': len(errors),
+        'errors': sorted(errors, key=lambda error: error['index'])
+    }, status=response_status)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -284,14 +428,18 @@ def get_user_analytics(request):
         session__user=user
     ).order_by('-timestamp')[:20]
     
-    # Statistiques
-    total_data = NetworkActivity.objects.filter(
-        session__user=user
+    # Statistiques (compteurs pré-agrégés par session)
+    total_data = UserSession.objects.filter(
+        user=user
     ).aggregate(
         total_up=Sum('bytes_uploaded'),
         total_down=Sum('bytes_downloaded'),
-        avg_bandwidth=Avg('bandwidth_usage')
+        total_bandwidth=Sum('bandwidth_usage_total'),
+        total_activities=Sum('activity_count')
     )
+    average_bandwidth = 0
+    if total_data['total_activities']:
+        average_bandwidth = total_data['total_bandwidth'] / total_data['total_activities']
     
     # Appareils utilisés
     devices = DeviceFingerprint.objects.filter(user=user)
@@ -314,7 +462,7 @@ def get_user_analytics(request):
         'statistics': {
             'total_uploaded_mb': (total_data['total_up'] or 0) / (1024 * 1024),
             'total_downloaded_mb': (total_data['total_down'] or 0) / (1024 * 1024),
-            'average_bandwidth': total_data['avg_bandwidth'] or 0
+            'average_bandwidth': average_bandwidth
         },
         'devices': [{
             'name': d.device_name,
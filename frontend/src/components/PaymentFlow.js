@@ -8,27 +8,42 @@ const PaymentFlow = ({ selectedPlan, onSuccess }) => {
     const [credentials, setCredentials] = useState(null);
     const [timeLeft, setTimeLeft] = useState(600); // 10 minutes
 
-    // Polling pour vérifier le statut du paiement
+    // Attente du statut du paiement : le serveur répond dès le changement de statut (long-poll)
     useEffect(() => {
         if (transaction && step === 'waiting') {
-            const interval = setInterval(async () => {
-                try {
-                    const status = await paymentService.checkPaymentStatus(transaction.transaction_id);
-                    
-                    if (status.status === 'CONFIRMED') {
-                        setCredentials(status.wifi_credentials);
-                        setStep('success');
-                        clearInterval(interval);
-                    } else if (status.status === 'EXPIRED' || status.status === 'FAILED') {
-                        setStep('phone');
-                        clearInterval(interval);
+            const controller = new AbortController();
+
+            const waitForPayment = async () => {
+                let knownStatus = 'PENDING';
+                while (!controller.signal.aborted) {
+                    try {
+                        const status = await paymentService.waitPaymentStatus(
+                            transaction.transaction_id, knownStatus, { signal: controller.signal }
+                        );
+                        // PROCESSING : paiement reçu, identifiants en cours de préparation
+                        knownStatus = status.status;
+
+                        if (status.status === 'CONFIRMED') {
+                            setCredentials(status.wifi_credentials);
+                            setStep('success');
+                            return;
+                        } else if (status.status === 'EXPIRED' || status.status === 'FAILED') {
+                            setStep('phone');
+                            return;
+                        }
+                    } catch (error) {
+                        if (controller.signal.aborted) {
+                            return;
+                        }
+                        console.error('Erreur vérification statut:', error);
+                        // Réseau indisponible : nouvelle tentative après une courte pause
+                        await new Promise((resolve) => setTimeout(resolve, 3000));
                     }
-                } catch (error) {
-                    console.error('Erreur vérification statut:', error);
                 }
-            }, 3000); // Vérifier toutes les 3 secondes
+            };
 
-            return () => clearInterval(interval);
+            waitForPayment();
+            return () => controller.abort();
         }
     }, [transaction, step]);
 
@@ -11,6 +11,7 @@ export const API_ENDPOINTS = {
   
   // Payments
   PAYMENTS: `${API_BASE_URL}/payments/`,
+  SMS_PAYMENTS: `${API_BASE_URL.replace(/\/api\/?$/, '')}/payments/api/`,
   
   // User
   USER_PROFILE: `${API_BASE_URL}/users/profile/`,
@@ -101,6 +101,44 @@ class PaymentService {
     }
   }
 
+  async initiateSMSPayment(data) {
+    try {
+      const response = await axios.post(`${API_ENDPOINTS.SMS_PAYMENTS}initiate-sms-payment/`, data);
+      return response.data;
+    } catch (error) {
+      throw this.handleError(error);
+    }
+  }
+
+  async checkPaymentStatus(transactionId) {
+    try {
+      const response = await axios.get(`${API_ENDPOINTS.SMS_PAYMENTS}check-payment-status/${transactionId}/`);
+      return response.data;
+    } catch (error) {
+      throw this.handleError(error);
+    }
+  }
+
+  // Long-poll : le serveur ne répond qu'au changement de statut (ou après `timeout` secondes)
+  async waitPaymentStatus(transactionId, knownStatus = 'PENDING', { timeout = 50, signal } = {}) {
+    try {
+      const response = await axios.get(
+        `${API_ENDPOINTS.SMS_PAYMENTS}wait-payment-status/${transactionId}/`,
+        {
+          params: { status: knownStatus, timeout },
+          timeout: (timeout + 10) * 1000,
+          signal,
+        }
+      );
+      return response.data;
+    } catch (error) {
+      if (axios.isCancel(error)) {
+        throw error;
+      }
+      throw this.handleError(error);
+    }
+  }
+
   handleError(error) {
     if (error.response) {
       return {
@@ -121,4 +159,6 @@ class PaymentService {
   }
 }
 
-export default new PaymentService();
\ No newline at end of file
+export const paymentService = new PaymentService();
+
+export default paymentService;
\ No newline at end of file
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Passerelle de portail captif simulée, pour tester subscriptions.connectivity sans équipement.
+
+Sert en local les deux appels utilisés par le vérificateur de connectivité :
+
+    GET /check_connection?username=...  ->  {"username": ..., "is_connected": true|false}
+    GET /connected_users                ->  {"usernames": [...]}
+
+    gateway = GatewaySimulator(connected={'alice'}, latency=0.05)
+    gateway.start()
+    check_connectivity(base_url=gateway.url)
+    gateway.stop()
+
+bulk=False fait répondre 404 à /connected_users (ancienne passerelle), failing
+liste les utilisateurs pour lesquels /check_connection répond 500. Lancé
+directement, il sert la liste des utilisateurs passés en argument.
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # File d'attente des connexions à la mesure des clients simultanés (5 par défaut)
+    request_queue_size = 256
+
+
+class GatewaySimulator:
+    def __init__(self, connected=(), latency=0.0, bulk=True, failing=(), host='127.0.0.1', port=0):
+        self.connected = set(connected)
+        self.latency = latency
+        self.bulk = bulk
+        self.failing = set(failing)
+        self.requests = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _enter(self):
+        with self._lock:
+            self.requests += 1
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+
+    def _leave(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _handler(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # En-têtes et corps sont écrits séparément : sans TCP_NODELAY, chaque réponse attend l'ACK différé
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                gateway._enter()
+                try:
+                    if gateway.latency:
+                        time.sleep(gateway.latency)
+                    url = urlparse(self.path)
+                    if url.path == '/connected_users' and gateway.bulk:
+                        self._reply(200, {'usernames': sorted(gateway.connected)})
+                    elif url.path == '/check_connection':
+                        username = parse_qs(url.query).get('username', [''])[0]
+                        if username in gateway.failing:
+                            self._reply(500, {'error': 'gateway error'})
+                        else:
+                            self._reply(200, {'username': username, 'is_connected': username in gateway.connected})
+                    else:
+                        self._reply(404, {'error': 'not found'})
+                finally:
+                    gateway._leave()
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    gateway = GatewaySimulator(connected=sys.argv[1:], port=8080)
+    print(f"Passerelle simulée sur {gateway.url} ({len(gateway.connected)} utilisateur(s) connecté(s))")
+    try:
+        gateway._server.serve_forever()
+    except KeyboardInterrupt:
+        gateway.stop()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Simulateur de modem GSM sur pseudo-terminal, pour tester sms_modem sans matériel.
+
+Répond aux commandes AT utilisées par GSMModem (CMGF, CNMI, CPMS, CMGR,
+CMGL, CMGD) et émet une notification +CMTI (ou +CMT en mode direct) à
+chaque SMS livré :
+
+    simulator = ModemSimulator()
+    simulator.start()
+    modem = GSMModem(simulator.port)
+    modem.open()
+    simulator.deliver('+261341234567', 'Vous avez reçu 1000 Ar de 0341234567 ...')
+
+Lancé directement, il affiche le port à utiliser puis livre chaque ligne
+« expéditeur|texte » lue sur l'entrée standard.
+"""
+import os
+import pty
+import sys
+import threading
+import tty
+from datetime import datetime
+
+
+class ModemSimulator:
+    def __init__(self, direct=False, duplicate_notifications=False):
+        self.direct = direct
+        # Émet chaque +CMTI deux fois, comme certains modems après une reconnexion réseau
+        self.duplicate_notifications = duplicate_notifications
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.storage = {}
+        self.commands = []
+        self.deleted = []
+        self._next_index = 1
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        os.close(self.master)
+        os.close(self.slave)
+
+    def _write(self, text):
+        with self._lock:
+            os.write(self.master, text.replace('\n', '\r\n').encode())
+
+    def _serve(self):
+        buffer = b''
+        while self._running:
+            try:
+                data = os.read(self.master, 1024)
+            except OSError:
+                return
+            buffer += data
+            *commands, buffer = buffer.split(b'\r')
+            for command in commands:
+                command = command.decode(errors='replace').strip()
+                if command:
+                    self._write(self._respond(command))
+
+    def _respond(self, command):
+        self.commands.append(command)
+        upper = command.upper()
+        if upper.startswith('AT+CMGR='):
+            index = int(command.split('=')[1])
+            with self._lock:
+                stored = self.storage.get(index)
+            if stored is None:
+                return '\nOK\n'
+            sender, timestamp, text = stored
+            return f'\n+CMGR: "REC UNREAD","{sender}",,"{timestamp}"\n{text}\n\nOK\n'
+        if upper.startswith('AT+CMGL'):
+            with self._lock:
+                stored = sorted(self.storage.items())
+            listing = ''.join(
+                f'\n+CMGL: {index},"REC UNREAD","{sender}",,"{timestamp}"\n{text}'
+                for index, (sender, timestamp, text) in stored
+            )
+            return f'{listing}\n\nOK\n'
+        if upper.startswith('AT+CMGD='):
+            index = int(command.split('=')[1])
+            with self._lock:
+                self.storage.pop(index, None)
+                self.deleted.append(index)
+            return '\nOK\n'
+        if upper.startswith('AT'):
+            return '\nOK\n'
+        return '\nERROR\n'
+
+    def store(self, sender, text):
+        """Place un SMS en mémoire sans notification (SMS reçus avant le démarrage du lecteur)"""
+        timestamp = datetime.now().strftime('%y/%m/%d,%H:%M:%S+12')
+        with self._lock:
+            index = self._next_index
+            self._next_index += 1
+            self.storage[index] = (sender, timestamp, text)
+        return index
+
+    def deliver(self, sender, text):
+        """Livre un SMS et émet la notification correspondante"""
+        if self.direct:
+            timestamp = datetime.now().strftime('%y/%m/%d,%H:%M:%S+12')
+            self._write(f'\n+CMT: "{sender}",,"{timestamp}"\n{text}\n')
+            return None
+        index = self.store(sender, text)
+        notification = f'\n+CMTI: "SM",{index}\n'
+        self._write(notification * (2 if self.duplicate_notifications else 1))
+        return index
+
+
+if __name__ == '__main__':
+    simulator = ModemSimulator().start()
+    print(f"Modem simulé sur {simulator.port} (saisir « expéditeur|texte »)")
+    for line in sys.stdin:
+        sender, _, text = line.rstrip('\n').partition('|')
+        if text:
+            print(f"SMS livré (index {simulator.deliver(sender, text)})")
@@ -1,17 +1,15 @@
 from django.contrib import admin
+from django.shortcuts import redirect
+from django.utils.html import format_html
 from django.urls import path
 from . import views
-from .models import Payment
-from django.db import connection
+from . import exports
+from . import receipts
+from .models import Payment, ReportJob
+from .reports import request_report
 from django.db import models
-from django.http import HttpResponse
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from django.utils import timezone
 from django.urls import reverse
+from subscriptions.daily_statistics import lifetime_totals
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
@@ -19,7 +17,7 @@ class PaymentAdmin(admin.ModelAdmin):
     list_filter = ('status', 'payment_method')
     search_fields = ('receipt_number', 'user__username', 'user__email')
     ordering = ('-created_at',)
-    actions = ['export_as_pdf']
+    actions = ['print_receipts', 'export_as_pdf', 'export_list_as_pdf', 'export_as_csv', 'export_as_xlsx']
 
     def get_urls(self):
         urls = super().get_urls()
@@ -30,19 +28,8 @@ class PaymentAdmin(admin.ModelAdmin):
 
     # Dans la méthode changelist_view, ajoutez les données pour les graphiques
     def changelist_view(self, request, extra_context=None):
-        # Récupérer les statistiques avec des requêtes SQL directes
-        with connection.cursor() as cursor:
-            # Nombre total de paiements
-            cursor.execute("SELECT COUNT(*) FROM payments_payment")
-            total_payments = cursor.fetchone()[0]
-
-            # Montant total des paiements réussis
-            cursor.execute("""
-                SELECT COALESCE(SUM(amount), 0) 
-                FROM payments_payment 
-                WHERE status = 'SUCCESS'
-            """)
-            total_amount = cursor.fetchone()[0]
+        # Totaux depuis l'origine : table de faits journalière, complétée par les paiements du jour
+        total_payments, total_amount = lifetime_totals()
 
         # Récupérer les statistiques complètes
         stats = Payment.get_statistics()
@@ -72,169 +59,45 @@ class PaymentAdmin(admin.ModelAdmin):
         payment = Payment.objects.get(id=payment_id)
         return payment.generate_receipt_pdf()
 
+    def print_receipts(self, request, queryset):
+        # Un seul document, une page par reçu : le décor du reçu n'est dessiné qu'une fois
+        payments = queryset.select_related('user', 'plan').order_by('created_at')
+        return receipts.receipt_response(receipts.PAYMENT_RECEIPT, receipts.payment_receipts(payments), "recus.pdf")
+    print_receipts.short_description = "Imprimer les reçus sélectionnés"
+
     def export_as_pdf(self, request, queryset):
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="payment_statistics.pdf"'
-        
-        # Créer le document PDF
-        doc = SimpleDocTemplate(response, pagesize=A4)
-        styles = getSampleStyleSheet()
-        elements = []
-        
-        # Style personnalisé pour les titres
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            spaceAfter=30,
-            alignment=1
-        )
-        
-        # En-tête
-        elements.append(Paragraph("Statistiques des Paiements", title_style))
-        elements.append(Spacer(1, 20))
-        
-        # Statistiques globales
-        stats = Payment.get_statistics()
-        
-        # Tableau des statistiques globales
-        global_data = [
-            ['Statistique', 'Valeur'],
-            ['Nombre total de paiements', f"{stats['total_payments']:,}"],
-            ['Montant total', f"{stats['total_amount']:,} Ar"],
-            ['Nombre d\'abonnements', f"{stats['total_subscriptions']:,}"],
-            ['Montant des abonnements', f"{stats['total_subscription_amount']:,} Ar"]
-        ]
-        
-        global_table = Table(global_data, colWidths=[3*inch, 2*inch])
-        global_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-        
-        elements.append(global_table)
-        elements.append(Spacer(1, 30))
-        
-        # Tableau des forfaits
-        plan_data = [['Forfait', 'Prix', 'Effectif', 'Montant Total']]
-        for stat in stats['subscription_stats']:
-            plan_data.append([
-                stat['name'],
-                f"{stat['price']:,} Ar",
-                f"{stat['count']:,}",
-                f"{stat['total_amount']:,} Ar"
-            ])
-        
-        plan_table = Table(plan_data, colWidths=[2*inch, 1.5*inch, 1.5*inch, 1.5*inch])
-        plan_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-        
-        elements.append(Paragraph("Statistiques par Forfait", styles['Heading2']))
-        elements.append(Spacer(1, 10))
-        elements.append(plan_table)
-        elements.append(Spacer(1, 30))
-        
-        # Tableau des statistiques journalières
-        daily_data = [['Date', 'Nombre de Paiements', 'Montant Total']]
-        for stat in stats['daily_stats']:
-            daily_data.append([
-                stat['day'].strftime('%d/%m/%Y'),
-                f"{stat['count']:,}",
-                f"{stat['total_amount']:,} Ar"
-            ])
-        
-        daily_table = Table(daily_data, colWidths=[2*inch, 2*inch, 2*inch])
-        daily_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-        
-        elements.append(Paragraph("Statistiques Journalières", styles['Heading2']))
-        elements.append(Spacer(1, 10))
-        elements.append(daily_table)
-        
-        # Ajoutez ces imports
-        import matplotlib.pyplot as plt
-        import io
-        from reportlab.lib.utils import ImageReader
-        
-        # Dans la méthode export_as_pdf, ajoutez après les tableaux
-        # Créer un graphique avec matplotlib
-        buffer = io.BytesIO()
-        plt.figure(figsize=(8, 4))
-        
-        # Données pour le graphique
-        dates = [stat['day'].strftime('%d/%m/%Y') for stat in stats['daily_stats']]
-        amounts = [float(stat['total_amount']) for stat in stats['daily_stats']]
-        
-        # Créer le graphique à barres
-        plt.bar(dates, amounts, color='skyblue')
-        plt.title('Montant total par jour')
-        plt.xlabel('Date')
-        plt.ylabel('Montant (Ar)')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        # Sauvegarder le graphique dans le buffer
-        plt.savefig(buffer, format='png')
-        buffer.seek(0)
-        plt.close()
-        
-        # Ajouter le graphique au PDF
-        elements.append(Paragraph("Graphique des montants journaliers", styles['Heading2']))
-        elements.append(Spacer(1, 10))
-        elements.append(Image(ImageReader(buffer), width=6*inch, height=3*inch))
-        elements.append(Spacer(1, 20))
-        
-        # Pied de page
-        elements.append(Spacer(1, 30))
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=10,
-            alignment=1,
-            spaceBefore=20
-        )
-        elements.append(Paragraph(f"Rapport généré le {timezone.now().strftime('%d/%m/%Y à %H:%M')}", footer_style))
-        elements.append(Paragraph("BestConnect - Votre connexion internet de confiance", footer_style))
-        elements.append(Paragraph("Contact: 0347249715", footer_style))
-        
-        # Générer le PDF
-        doc.build(elements)
-        return response
-    export_as_pdf.short_description = "Exporter les statistiques en PDF"
\ No newline at end of file
+        job, _ = request_report('PAYMENT_STATISTICS', {}, request.user)
+        return redirect('payments:report_job', job_id=job.id)
+    export_as_pdf.short_description = "Exporter les statistiques en PDF"
+
+    def export_list_as_pdf(self, request, queryset):
+        return exports.export_response(self, request, queryset, exports.PAYMENTS, 'pdf')
+    export_list_as_pdf.short_description = "Exporter les paiements sélectionnés en PDF"
+
+    def export_as_csv(self, request, queryset):
+        return exports.export_response(self, request, queryset, exports.PAYMENTS, 'csv')
+    export_as_csv.short_description = "Exporter les paiements sélectionnés en CSV"
+
+    def export_as_xlsx(self, request, queryset):
+        return exports.export_response(self, request, queryset, exports.PAYMENTS, 'xlsx')
+    export_as_xlsx.short_description = "Exporter les paiements sélectionnés en XLSX (Excel)"
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'params', 'status', 'progress', 'requested_by', 'created_at', 'finished_at', 'document')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('kind', 'params', 'key', 'status', 'progress', 'message', 'file', 'content_hash',
+                       'filename', 'requested_by', 'created_at', 'started_at', 'finished_at')
+
+    def document(self, obj):
+        if obj.status == 'SUCCESS':
+            return format_html('<a href="{}">Télécharger</a>', reverse('payments:report_job_download', args=[obj.id]))
+        return format_html('<a href="{}">Suivre</a>', reverse('payments:report_job', args=[obj.id]))
+    document.short_description = "Document"
+
+    # Jobs créés par les demandes de rapport (export des statistiques, reçus du jour)
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,214 @@
+"""Exports des listes de l'admin (abonnements, paiements) en PDF, CSV et XLSX.
+
+Les lignes sont lues par tranches de clé primaire (EXPORT_CHUNK_SIZE) avec
+leurs relations jointes : la mémoire ne dépend pas du nombre de lignes
+exportées, y compris sur MySQL dont le pilote charge un résultat entier en
+mémoire. Le CSV est envoyé au fil de la lecture (StreamingHttpResponse). Le PDF
+est dessiné page par page et le XLSX écrit en mode write_only, tous deux dans
+un fichier temporaire servi une fois terminé.
+
+Au-delà de EXPORT_PDF_MAX_ROWS lignes, l'export PDF est refusé au profit du
+CSV ou du XLSX.
+"""
+import csv
+import tempfile
+
+from django.conf import settings
+from django.contrib import messages
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.units import mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+EXPORT_PDF_MAX_ROWS = getattr(settings, 'EXPORT_PDF_MAX_ROWS', 20000)
+
+ROW_HEIGHT = 7 * mm
+MARGIN = 15 * mm
+
+
+def _date(value):
+    return timezone.localtime(value).strftime('%d/%m/%Y %H:%M') if value else ''
+
+
+class ExportSpec:
+    """Colonnes d'un export : (en-tête, valeur de la ligne, largeur en mm dans le PDF)"""
+
+    def __init__(self, name, title, columns, related=(), pagesize=A4):
+        self.name = name
+        self.title = title
+        self.columns = columns
+        self.related = related
+        self.pagesize = pagesize
+
+    @property
+    def headers(self):
+        return [header for header, _, _ in self.columns]
+
+    def values(self, obj):
+        return [value(obj) for _, value, _ in self.columns]
+
+
+SUBSCRIPTIONS = ExportSpec('subscriptions', 'Liste des abonnements', [
+    ('Utilisateur', lambda s: s.user.username, 45),
+    ('Forfait', lambda s: s.plan.name, 45),
+    ('Date de début', lambda s: _date(s.start_date), 32),
+    ('Date de fin', lambda s: _date(s.end_date), 32),
+    ('Statut', lambda s: 'Actif' if s.is_active else 'Expiré', 26),
+], related=('user', 'plan'))
+
+PAYMENTS = ExportSpec('payments', 'Liste des paiements', [
+    ('Reçu', lambda p: p.receipt_number or '', 40),
+    ('Utilisateur', lambda p: p.user.username, 40),
+    ('Téléphone', lambda p: p.phone_number or '', 30),
+    ('Forfait', lambda p: p.plan.name, 40),
+    ('Montant (Ar)', lambda p: p.amount, 25),
+    ('Mode', lambda p: p.get_payment_method_display(), 30),
+    ('Statut', lambda p: p.get_status_display(), 25),
+    ('Date', lambda p: _date(p.created_at), 32),
+], related=('user', 'plan'), pagesize=landscape(A4))
+
+
+def iterate(queryset, chunk_size=None):
+    """Parcourt le queryset par tranches de clé primaire croissante, relations jointes"""
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        chunk = queryset if last is None else queryset.filter(pk__gt=last)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last = chunk[-1].pk
+
+
+def _rows(queryset, spec, chunk_size=None):
+    for obj in iterate(queryset.select_related(*spec.related), chunk_size):
+        yield spec.values(obj)
+
+
+def _filename(spec, extension):
+    return f"{spec.name}_{timezone.localtime().strftime('%Y%m%d_%H%M')}.{extension}"
+
+
+class _Echo:
+    """Pseudo-fichier : csv.writer retourne la ligne écrite au lieu de la conserver"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(queryset, spec, chunk_size=None):
+    writer = csv.writer(_Echo())
+
+    def lines():
+        # BOM : accents lus correctement par Excel
+        yield '\ufeff' + writer.writerow(spec.headers)
+        for row in _rows(queryset, spec, chunk_size):
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{_filename(spec, "csv")}"'
+    return response
+
+
+def write_xlsx(queryset, spec, output, chunk_size=None):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(spec.title[:31])
+    sheet.append(spec.headers)
+    for row in _rows(queryset, spec, chunk_size):
+        sheet.append(row)
+    workbook.save(output)
+
+
+def _fit(text, font, size, width):
+    """Tronque le texte à la largeur de la colonne"""
+    text = str(text)
+    if stringWidth(text, font, size) <= width:
+        return text
+    while text and stringWidth(text + '…', font, size) > width:
+        text = text[:-1]
+    return text + '…'
+
+
+def write_pdf(queryset, spec, output, chunk_size=None):
+    """Tableau paginé : en-tête de colonnes répété sur chaque page, numéro de page en pied"""
+    width, height = spec.pagesize
+    p = canvas.Canvas(output, pagesize=spec.pagesize, pageCompression=1)
+    p.setTitle(spec.title)
+    widths = [column_width * mm for _, _, column_width in spec.columns]
+    generated = timezone.localtime().strftime('%d/%m/%Y à %H:%M')
+    state = {'page': 0, 'y': 0}
+
+    def draw_row(values, font, size):
+        p.setFont(font, size)
+        x = MARGIN
+        for value, column_width in zip(values, widths):
+            p.drawString(x + 1 * mm, state['y'], _fit(value, font, size, column_width - 2 * mm))
+            x += column_width
+        state['y'] -= ROW_HEIGHT
+
+    def new_page():
+        if state['page']:
+            p.showPage()
+        state['page'] += 1
+        state['y'] = height - MARGIN
+        if state['page'] == 1:
+            p.setFont('Helvetica-Bold', 18)
+            p.drawString(MARGIN, state['y'] - 6 * mm, spec.title)
+            state['y'] -= 16 * mm
+        p.setFont('Helvetica', 8)
+        p.drawString(MARGIN, MARGIN / 2, f"BestConnect - généré le {generated}")
+        p.drawRightString(width - MARGIN, MARGIN / 2, f"Page {state['page']}")
+        draw_row(spec.headers, 'Helvetica-Bold', 10)
+        p.line(MARGIN, state['y'] + ROW_HEIGHT - 2 * mm, MARGIN + sum(widths), state['y'] + ROW_HEIGHT - 2 * mm)
+
+    new_page()
+    for row in _rows(queryset, spec, chunk_size):
+        if state['y'] < MARGIN + ROW_HEIGHT:
+            new_page()
+        draw_row(row, 'Helvetica', 9)
+    p.showPage()
+    p.save()
+    return state['page']
+
+
+def _file_response(write, queryset, spec, extension, content_type):
+    output = tempfile.TemporaryFile()
+    write(queryset, spec, output)
+    output.seek(0)
+    # FileResponse envoie le fichier par blocs puis le ferme (le fichier temporaire est alors supprimé)
+    return FileResponse(output, as_attachment=True, filename=_filename(spec, extension), content_type=content_type)
+
+
+def pdf_response(queryset, spec):
+    return _file_response(write_pdf, queryset, spec, 'pdf', 'application/pdf')
+
+
+def xlsx_response(queryset, spec):
+    return _file_response(
+        write_xlsx, queryset, spec, 'xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+
+def export_response(modeladmin, request, queryset, spec, fmt):
+    """Réponse d'une action d'export de l'admin ; None (retour à la liste) si le PDF serait trop volumineux"""
+    if fmt == 'csv':
+        return stream_csv(queryset, spec)
+    if fmt == 'xlsx':
+        return xlsx_response(queryset, spec)
+    count = queryset.count()
+    if count > EXPORT_PDF_MAX_ROWS:
+        modeladmin.message_user(
+            request,
+            f"{count} lignes sélectionnées : l'export PDF est limité à {EXPORT_PDF_MAX_ROWS} lignes, "
+            f"utilisez l'export CSV ou XLSX.",
+            messages.WARNING
+        )
+        return None
+    return pdf_response(queryset, spec)
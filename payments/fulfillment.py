@@ -0,0 +1,224 @@
+"""Traitement des paiements confirmés, hors du thread de la requête ou du modem.
+
+Une fois le paiement validé en base, trois étapes s'enchaînent : création des
+identifiants WiFi, génération du QR code, envoi des identifiants au client.
+Chaque étape est idempotente (elle vérifie ce qui est déjà fait) et peut donc
+être rejouée sans risque ; elle est retentée avec un délai croissant en cas
+d'erreur. Les durées et échecs de chaque étape sont cumulés en base
+(FulfillmentStageMetric), lisibles depuis n'importe quel processus.
+
+L'envoi des identifiants passe par CREDENTIALS_SMS_SENDER (chemin d'une
+fonction send(numéro, message)) ; sans expéditeur configuré, rien n'est
+envoyé et delivered_at reste vide. Les identifiants restent affichés sur la
+page de statut du paiement.
+
+Un paiement confirmé dont le traitement n'a pas abouti (pool arrêté avec le
+processus, tentatives épuisées) est relancé par resume_stalled_fulfillments
+(Celery beat, toutes les minutes) : étapes idempotentes, rejouées sans risque.
+
+Par défaut les traitements tournent dans un pool de threads local au processus
+(le broker Celery configuré est en mémoire) ; FULFILLMENT_BACKEND = 'celery'
+les confie à la tâche payments.tasks.fulfill_payment.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from portal.models import WiFiCredentials
+from .models import FulfillmentStageMetric, Payment, SMSTransaction
+
+logger = logging.getLogger(__name__)
+
+FULFILLMENT_BACKEND = getattr(settings, 'FULFILLMENT_BACKEND', 'local')
+FULFILLMENT_WORKERS = getattr(settings, 'FULFILLMENT_WORKERS', 4)
+FULFILLMENT_STAGE_RETRIES = getattr(settings, 'FULFILLMENT_STAGE_RETRIES', 3)
+FULFILLMENT_RETRY_DELAY = getattr(settings, 'FULFILLMENT_RETRY_DELAY', 2)
+FULFILLMENT_STALL_TIMEOUT = getattr(settings, 'FULFILLMENT_STALL_TIMEOUT', 120)
+FULFILLMENT_RESUME_MAX_AGE = getattr(settings, 'FULFILLMENT_RESUME_MAX_AGE', 86400)
+CREDENTIALS_SMS_SENDER = getattr(settings, 'CREDENTIALS_SMS_SENDER', None)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def issue_credentials(payment):
+    """Crée les identifiants WiFi du paiement (sans QR code) s'ils n'existent pas encore"""
+    credentials = WiFiCredentials.objects.filter(payment=payment).first()
+    if credentials:
+        return credentials
+    credentials = WiFiCredentials(
+        payment=payment,
+        expires_at=timezone.now() + timedelta(days=payment.plan.get_duration_in_days())
+    )
+    try:
+        with transaction.atomic():
+            credentials.save(with_qr=False)
+    except IntegrityError:
+        # Étape rejouée en parallèle : les identifiants existent déjà
+        return WiFiCredentials.objects.get(payment=payment)
+    return credentials
+
+
+def render_qr_code(payment):
+    credentials = WiFiCredentials.objects.get(payment=payment)
+    if not credentials.qr_code:
+        credentials.generate_qr_code()
+    return credentials
+
+
+def deliver_credentials(payment):
+    """Envoie les identifiants au client, une seule fois (delivered_at posé seulement si l'envoi réussit)"""
+    credentials = WiFiCredentials.objects.get(payment=payment)
+    if CREDENTIALS_SMS_SENDER is None:
+        logger.info(f"Paiement {payment.pk} : envoi SMS non configuré, identifiants {credentials.username} non envoyés")
+        return credentials
+    claimed = WiFiCredentials.objects.filter(
+        pk=credentials.pk, delivered_at__isnull=True
+    ).update(delivered_at=timezone.now())
+    if not claimed:
+        return credentials
+    try:
+        message = (
+            f"Vos identifiants BestConnect : {credentials.username} / {credentials.password} "
+            f"- valables jusqu'au {credentials.expires_at.strftime('%d/%m/%Y')}"
+        )
+        import_string(CREDENTIALS_SMS_SENDER)(payment.phone_number, message)
+        logger.info(f"Paiement {payment.pk} : identifiants {credentials.username} envoyés au {payment.phone_number}")
+    except Exception:
+        # Envoi à refaire à la prochaine tentative
+        WiFiCredentials.objects.filter(pk=credentials.pk).update(delivered_at=None)
+        raise
+    return credentials
+
+
+STAGES = [
+    ('issue_credentials', issue_credentials),
+    ('render_qr_code', render_qr_code),
+    ('deliver_credentials', deliver_credentials),
+]
+
+
+def _record(stage, duration_ms, failed=False):
+    """Cumule la durée d'une exécution d'étape (UPDATE atomique en base)"""
+    duration_ms = int(duration_ms)
+    changes = {
+        'count': F('count') + 1,
+        'failures': F('failures') + int(failed),
+        'total_ms': F('total_ms') + duration_ms,
+        'max_ms': Greatest(F('max_ms'), Value(duration_ms)),
+        'updated_at': timezone.now(),
+    }
+    if FulfillmentStageMetric.objects.filter(stage=stage).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            FulfillmentStageMetric.objects.create(
+                stage=stage, count=1, failures=int(failed), total_ms=duration_ms, max_ms=duration_ms
+            )
+    except IntegrityError:
+        # Ligne créée en parallèle par un autre processus
+        FulfillmentStageMetric.objects.filter(stage=stage).update(**changes)
+
+
+def get_metrics():
+    """Nombre d'exécutions, durées moyenne et maximale, échecs de chaque étape"""
+    rows = {row.stage: row for row in FulfillmentStageMetric.objects.all()}
+    metrics = {}
+    for stage, _ in STAGES:
+        row = rows.get(stage)
+        count = row.count if row else 0
+        metrics[stage] = {
+            'count': count,
+            'failures': row.failures if row else 0,
+            'avg_ms': round(row.total_ms / count, 1) if count else None,
+            'max_ms': row.max_ms if row else None,
+        }
+    return metrics
+
+
+def run_fulfillment(payment_id, retries=None, retry_delay=None):
+    """Exécute toutes les étapes pour un paiement ; lève l'erreur si une étape échoue malgré les tentatives"""
+    retries = FULFILLMENT_STAGE_RETRIES if retries is None else retries
+    retry_delay = FULFILLMENT_RETRY_DELAY if retry_delay is None else retry_delay
+    payment = Payment.objects.select_related('plan').get(pk=payment_id)
+
+    for stage, func in STAGES:
+        for attempt in range(retries + 1):
+            started = time.perf_counter()
+            try:
+                func(payment)
+            except Exception as e:
+                _record(stage, (time.perf_counter() - started) * 1000, failed=True)
+                if attempt >= retries:
+                    logger.error(f"Paiement {payment_id} : échec de l'étape {stage} ({e})")
+                    raise
+                logger.warning(f"Paiement {payment_id} : étape {stage} en échec ({e}), nouvelle tentative")
+                time.sleep(retry_delay * 2 ** attempt)
+            else:
+                _record(stage, (time.perf_counter() - started) * 1000)
+                break
+
+
+def _run_in_pool(payment_id):
+    try:
+        run_fulfillment(payment_id)
+    except Exception:
+        logger.exception(f"Traitement du paiement {payment_id} abandonné")
+    finally:
+        connections.close_all()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=FULFILLMENT_WORKERS, thread_name_prefix='fulfillment')
+        return _pool
+
+
+def dispatch_fulfillment(payment_id):
+    if FULFILLMENT_BACKEND == 'celery':
+        from .tasks import fulfill_payment
+        fulfill_payment.delay(payment_id)
+    else:
+        _get_pool().submit(_run_in_pool, payment_id)
+
+
+def schedule_fulfillment(payment_id):
+    """Lance le traitement après validation de la transaction base de données en cours"""
+    transaction.on_commit(lambda: dispatch_fulfillment(payment_id))
+
+
+def stalled_payments(now=None):
+    """Paiements confirmés depuis plus de FULFILLMENT_STALL_TIMEOUT secondes dont le traitement n'a pas abouti"""
+    now = now or timezone.now()
+    unfinished = Q(wificredentials__isnull=True) | Q(wificredentials__qr_code='') | Q(wificredentials__qr_code__isnull=True)
+    if CREDENTIALS_SMS_SENDER is not None:
+        unfinished |= Q(wificredentials__delivered_at__isnull=True)
+    # Transaction confirmée lue en sous-requête (pk__in) : aucune jointure ne peut répéter un paiement dans
+    # le OU ci-dessus (identifiants WiFi : relation un-à-un)
+    return Payment.objects.filter(
+        unfinished,
+        pk__in=SMSTransaction.objects.filter(status='CONFIRMED', payment__isnull=False).values('payment_id'),
+        created_at__lt=now - timedelta(seconds=FULFILLMENT_STALL_TIMEOUT),
+        created_at__gte=now - timedelta(seconds=FULFILLMENT_RESUME_MAX_AGE),
+    )
+
+
+def resume_stalled_fulfillments():
+    """Relance le traitement des paiements confirmés restés inachevés ; retourne leur nombre"""
+    payment_ids = list(stalled_payments().values_list('pk', flat=True))
+    for payment_id in payment_ids:
+        dispatch_fulfillment(payment_id)
+    if payment_ids:
+        logger.warning(f"Traitement relancé pour {len(payment_ids)} paiement(s) : {payment_ids}")
+    return len(payment_ids)
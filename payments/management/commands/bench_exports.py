@@ -0,0 +1,125 @@
+import time
+import tracemalloc
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from payments import exports
+from subscriptions.models import Plan, Subscription
+
+User = get_user_model()
+
+
+def legacy_subscriptions_pdf(queryset, output):
+    """Ancien export des abonnements : relations lues à chaque ligne, document complet en mémoire"""
+    p = canvas.Canvas(output, pagesize=letter)
+    width, height = letter
+    p.setFont("Helvetica-Bold", 24)
+    p.drawString(50, height - 50, "Liste des abonnements")
+    y = height - 100
+    p.setFont("Helvetica", 12)
+    for subscription in queryset:
+        p.drawString(50, y, f"Utilisateur: {subscription.user.username}")
+        p.drawString(50, y - 20, f"Forfait: {subscription.plan.name}")
+        p.drawString(50, y - 40, f"Date de début: {subscription.start_date.strftime('%d/%m/%Y')}")
+        p.drawString(50, y - 60, f"Date de fin: {subscription.end_date.strftime('%d/%m/%Y')}")
+        p.drawString(50, y - 80, f"Statut: {'Actif' if subscription.is_active else 'Expiré'}")
+        y -= 120
+        if y < 100:
+            p.showPage()
+            y = height - 50
+            p.setFont("Helvetica", 12)
+    p.showPage()
+    p.save()
+
+
+class _Sink:
+    """Sortie qui compte les octets sans les conserver"""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+    def tell(self):
+        return self.size
+
+    def flush(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = ('Compare l\'ancien export PDF des abonnements aux exports par tranches '
+            '(PDF, CSV, XLSX) : durée, requêtes et pic mémoire')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscriptions', type=int, default=5000)
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--skip-legacy', action='store_true')
+
+    def handle(self, *args, **options):
+        count = options['subscriptions']
+        prefix = f"exp{uuid.uuid4().hex[:6]}"
+        plan = Plan.objects.create(
+            name='Forfait bench export', description='Bench', duration=1, duration_unit='DAYS', price=1000
+        )
+        try:
+            User.objects.bulk_create([
+                User(username=f"{prefix}_{i:06d}", phone_number='0340000000') for i in range(count)
+            ], batch_size=5000)
+            now = timezone.now()
+            Subscription.objects.bulk_create([
+                Subscription(user=user, plan=plan, start_date=now, end_date=now + timedelta(days=1))
+                for user in User.objects.filter(username__startswith=f"{prefix}_")
+            ], batch_size=5000)
+            queryset = Subscription.objects.filter(plan=plan)
+
+            chunk_size = options['chunk_size']
+            spec = exports.SUBSCRIPTIONS
+            runs = [
+                ('PDF par tranches', lambda out: exports.write_pdf(queryset, spec, out, chunk_size)),
+                ('XLSX write_only', lambda out: exports.write_xlsx(queryset, spec, out, chunk_size)),
+                ('CSV en flux', lambda out: self._csv(queryset, spec, out)),
+            ]
+            if not options['skip_legacy']:
+                runs.insert(0, ('Ancien PDF', lambda out: legacy_subscriptions_pdf(queryset.order_by('pk'), out)))
+            for label, run in runs:
+                self._measure(label, run, count)
+        finally:
+            User.objects.filter(username__startswith=f"{prefix}_").delete()
+            plan.delete()
+
+    def _csv(self, queryset, spec, output):
+        for chunk in exports.stream_csv(queryset, spec).streaming_content:
+            output.write(chunk)
+
+    def _measure(self, label, run, count):
+        queries = []
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        # Le PDF/XLSX est écrit dans un fichier temporaire, le CSV envoyé au client : seule la taille compte ici
+        output = _Sink()
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_queries):
+            run(output)
+        elapsed = time.perf_counter() - started
+
+        # Second passage pour le pic mémoire : tracemalloc ralentit fortement l'exécution
+        tracemalloc.start()
+        run(_Sink())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{label}: {elapsed:.2f} s ({count / elapsed:,.0f} lignes/s), {len(queries)} requêtes, "
+            f"pic mémoire {peak / 1024 / 1024:.1f} Mo, {output.size / 1024:.0f} Ko"
+        )
@@ -0,0 +1,176 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from payments.models import Payment
+from payments.statistics import compute_statistics, get_statistics, invalidate_statistics
+from subscriptions.daily_statistics import first_activity_day, materialize_range
+from subscriptions.models import Plan, Subscription
+
+User = get_user_model()
+
+
+def legacy_plan_statistics():
+    """Ancien calcul par forfait : trois requêtes par forfait (référence de comparaison)"""
+    subscription_stats = []
+    for plan in Plan.objects.all():
+        last_payment = Payment.objects.filter(plan=plan, status='SUCCESS').order_by('-created_at').first()
+        subscription_stats.append({
+            'id': plan.id,
+            'count': Subscription.objects.filter(plan=plan, is_active=True).count(),
+            'total_amount': Payment.objects.filter(
+                plan=plan, status='SUCCESS'
+            ).aggregate(total=Sum('amount'))['total'] or 0,
+            'payment_id': last_payment.id if last_payment else None,
+        })
+    return subscription_stats
+
+
+def legacy_statistics():
+    """Ancien calcul complet : forfaits puis série journalière groupée par TruncDate"""
+    end_date = timezone.now()
+    subscription_stats = legacy_plan_statistics()
+    daily_stats = list(Payment.objects.filter(
+        created_at__range=(end_date - timedelta(days=6), end_date), status='SUCCESS'
+    ).annotate(day=TruncDate('created_at')).values('day').annotate(
+        count=Count('id'), total_amount=Sum('amount')
+    ).order_by('day'))
+    return subscription_stats, daily_stats
+
+
+class Command(BaseCommand):
+    help = ('Mesure le calcul des statistiques des paiements (ancien calcul par forfait, '
+            'requêtes groupées, cache) sur un jeu de paiements généré')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plans', type=int, default=50)
+        parser.add_argument('--payments', type=int, default=1_000_000)
+        parser.add_argument('--days', type=int, default=30, help='Période couverte par les paiements générés')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--keep', action='store_true', help='Conserver les données générées')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not User.objects.filter(pk=1).exists():
+            raise CommandError("Les paiements générés sont rattachés à l'utilisateur système (id=1), introuvable")
+
+        plans = self._populate(options)
+        try:
+            # Jours écoulés matérialisés comme par la tâche nocturne
+            started = time.perf_counter()
+            materialize_range(first_activity_day(), timezone.localdate() - timedelta(days=1))
+            self.stdout.write(f"Statistiques journalières matérialisées en {time.perf_counter() - started:.1f} s")
+
+            legacy = self._measure('Ancien calcul', legacy_statistics, options['repeat'])
+            grouped = self._measure('Requêtes groupées', compute_statistics, options['repeat'])
+
+            invalidate_statistics()
+            get_statistics()
+            self._measure('Cache', get_statistics, options['repeat'])
+
+            self._check(plans)
+            self.stdout.write(self.style.SUCCESS(
+                f"Requêtes : {legacy[0]} -> {grouped[0]}, durée médiane : "
+                f"x{legacy[1] / grouped[1]:.1f} plus rapide"
+            ))
+        finally:
+            if not options['keep']:
+                self._cleanup(plans)
+                materialize_range(first_activity_day() or timezone.localdate(), timezone.localdate() - timedelta(days=1))
+            invalidate_statistics()
+
+    def _populate(self, options):
+        rng = random.Random(options['seed'])
+        user = User.objects.get(pk=1)
+        prefix = f"Forfait bench {int(time.time())}"
+        Plan.objects.bulk_create([
+            Plan(name=f"{prefix} {i:02d}", description='Bench statistiques', duration=1,
+                 duration_unit='DAYS', price=1000 * (1 + i % 10))
+            for i in range(options['plans'])
+        ])
+        plans = list(Plan.objects.filter(name__startswith=prefix).order_by('id'))
+
+        now = timezone.now()
+        Subscription.objects.bulk_create([
+            Subscription(user=user, plan=plan, start_date=now, end_date=now + timedelta(days=1),
+                         is_active=rng.random() < 0.7)
+            for plan in plans
+            for _ in range(rng.randint(0, 20))
+        ])
+
+        started = time.perf_counter()
+        total = options['payments']
+        for offset in range(0, total, options['batch_size']):
+            batch = []
+            for _ in range(min(options['batch_size'], total - offset)):
+                plan = rng.choice(plans)
+                batch.append(Payment(
+                    user=user, plan=plan, amount=Decimal(plan.price), phone_number='0340000000',
+                    status='SUCCESS' if rng.random() < 0.9 else 'FAILED'
+                ))
+            Payment.objects.bulk_create(batch)
+        # created_at est fixé à l'insertion : répartition sur la période par plages d'identifiants
+        ids = Payment.objects.filter(plan__in=plans).order_by('id').values_list('id', flat=True)
+        first, last = ids.first(), ids.last()
+        span = max(1, (last - first + 1) // options['days'] + 1)
+        for day in range(options['days']):
+            Payment.objects.filter(
+                plan__in=plans, id__gte=first + day * span, id__lt=first + (day + 1) * span
+            ).update(created_at=now - timedelta(days=options['days'] - 1 - day, hours=rng.randint(0, 12)))
+        self.stdout.write(
+            f"{len(plans)} forfaits, {total} paiements générés en {time.perf_counter() - started:.1f} s"
+        )
+        return plans
+
+    def _measure(self, label, func, repeat):
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        durations = []
+        for _ in range(repeat):
+            queries.clear()
+            with connection.execute_wrapper(count_query):
+                started = time.perf_counter()
+                func()
+                durations.append(time.perf_counter() - started)
+        median = statistics.median(durations)
+        self.stdout.write(f"{label}: {len(queries)} requêtes, médiane {median * 1000:.1f} ms, "
+                          f"max {max(durations) * 1000:.1f} ms")
+        return len(queries), median
+
+    def _check(self, plans):
+        """Les deux calculs donnent les mêmes résultats pour les forfaits générés"""
+        ids = {plan.id for plan in plans}
+        expected = {stat['id']: stat for stat in legacy_plan_statistics() if stat['id'] in ids}
+        stats = [stat for stat in compute_statistics()['subscription_stats'] if stat['id'] in ids]
+        # Les paiements générés partagent leurs dates : comparer la date du dernier paiement, pas son identifiant
+        payment_dates = dict(Payment.objects.filter(
+            pk__in=[stat['payment_id'] for stat in stats] + [stat['payment_id'] for stat in expected.values()]
+        ).values_list('pk', 'created_at'))
+        for stat in stats:
+            reference = expected[stat['id']]
+            if (stat['count'], stat['total_amount'], payment_dates.get(stat['payment_id'])) != (
+                    reference['count'], reference['total_amount'], payment_dates.get(reference['payment_id'])):
+                raise CommandError(f"Résultats différents pour le forfait {stat['id']}: {stat} / {reference}")
+
+    def _cleanup(self, plans):
+        plan_ids = [plan.id for plan in plans]
+        placeholders = ', '.join(['%s'] * len(plan_ids))
+        # Suppression directe : le collecteur de l'ORM chargerait chaque paiement
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {Payment._meta.db_table} WHERE plan_id IN ({placeholders})", plan_ids)
+        Subscription.objects.filter(plan_id__in=plan_ids).delete()
+        Plan.objects.filter(pk__in=plan_ids).delete()
@@ -0,0 +1,89 @@
+import io
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments import receipts
+from portal import qr
+
+
+def _payment_data(i):
+    return {
+        'receipt_number': f"RCP-{i:08X}",
+        'date': '01/01/2025 10:00',
+        'username': f"client_{i:06d}",
+        'email': f"client_{i:06d}@example.com",
+        'phone_number': '0340000000',
+        'plan_name': 'Forfait journalier',
+        'plan_description': 'Accès illimité 24 h',
+        'duration': '1 Jours',
+        'price': '1,000 Ar',
+        'active_subscriptions': '120 abonnés',
+        'plan_total': '1,250,000 Ar',
+        'amount': '1,000.00 Ar',
+        'payment_method': 'Mobile Money',
+        'status': 'Réussi',
+    }
+
+
+def _ticket_data(i):
+    return {
+        'username': f"client_{i:06d}",
+        'password': 'Xy7!kP2q9Lm#',
+        'email': 'Non renseigné',
+        'phone_number': '0340000000',
+        'address': 'Non renseignée',
+        'plan_name': 'Forfait journalier',
+        'price': '1,000 Ar',
+        'start_date': '01/01/2025',
+        'end_date': '02/01/2025',
+        'payment_method': 'Mobile Money',
+        'payment_phone_number': '0340000000',
+        'payment_date': '01/01/2025 10:00',
+        'generated_at': '01/01/2025 à 10:00',
+        'qr_code': qr.get_buffer(f"client_{i:06d}:Xy7!kP2q9Lm#", fill_color="green").getvalue(),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Mesure le débit de génération des reçus PDF (reçus/s) : décor redessiné à chaque reçu, '
+            'décor en cache (un document par reçu) et impression par lot (un document pour tous)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--receipts', type=int, default=500)
+        parser.add_argument('--layout', choices=['payment', 'ticket'], default='payment')
+
+    def handle(self, *args, **options):
+        count = options['receipts']
+        if options['layout'] == 'payment':
+            layout, items = receipts.PAYMENT_RECEIPT, [_payment_data(i) for i in range(count)]
+        else:
+            layout, items = receipts.REGISTRATION_TICKET, [_ticket_data(i) for i in range(count)]
+
+        # Décor capturé avant les mesures, comme dans un processus déjà démarré
+        receipts.render(layout, items[:1], io.BytesIO())
+
+        runs = [
+            ('Décor redessiné, un document par reçu',
+             lambda: sum(self._single(layout, item, cached=False) for item in items)),
+            ('Décor en cache, un document par reçu',
+             lambda: sum(self._single(layout, item, cached=True) for item in items)),
+            ('Lot, un seul document', lambda: self._batch(layout, items)),
+        ]
+        for label, run in runs:
+            started = time.perf_counter()
+            size = run()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{label}: {elapsed:.2f} s, {count / elapsed:,.0f} reçus/s, {size / count / 1024:.1f} Ko par reçu"
+            )
+
+    def _single(self, layout, item, cached):
+        output = io.BytesIO()
+        receipts.render(layout, [item], output, cached=cached)
+        return output.tell()
+
+    def _batch(self, layout, items):
+        output = io.BytesIO()
+        receipts.render(layout, items, output)
+        return output.tell()
@@ -0,0 +1,160 @@
+import random
+import re
+import string
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.sms_parsing import SMSParserRegistry, DEFAULT_TEMPLATES_PATH
+
+# Expressions de l'ancien SMSHandler.process_payment_sms (référence « avant »)
+LEGACY_PATTERNS = {
+    'AIRTEL': r'Vous avez reçu (\d+(?:\.\d+)?) Ar de (\d+).*Ref[érence]*:?\s*([A-Z0-9]+)',
+    'TELMA': r'Transfert reçu.*Montant[:\s]*(\d+(?:\.\d+)?).*De[:\s]*(\d+).*Référence[:\s]*([A-Z0-9]+)',
+    'ORANGE': r'Vous avez reçu (\d+(?:\.\d+)?) Ar.*de (\d+).*Transaction[:\s]*([A-Z0-9]+)'
+}
+
+# Formats de messages réels, par opérateur
+MESSAGE_FORMATS = {
+    'AIRTEL': [
+        'Vous avez reçu {amount} Ar de {phone}. Ref: {reference}. Nouveau solde: {balance} Ar.',
+        'Vous avez recu {amount} Ar de {phone} le {date}. Reference: {reference}. Solde: {balance} Ar',
+    ],
+    'TELMA': [
+        'Transfert reçu. Montant: {amount} Ar. De: {phone}. Référence: {reference}. Solde: {balance} Ar',
+        'MVola: Transfert reçu le {date}\nMontant: {amount}\nDe: {phone}\nRéférence: {reference}',
+    ],
+    'ORANGE': [
+        'Vous avez reçu {amount} Ar de {phone}. Transaction: {reference}. Solde: {balance} Ar.',
+        'Vous avez reçu {amount} Ar de la part de {phone} le {date}. Transaction: {reference}',
+    ],
+}
+
+SENDERS = {
+    'AIRTEL': ['AirtelMoney', 'Airtel Money', None],
+    'TELMA': ['MVola', 'TELMA', None],
+    'ORANGE': ['OrangeMoney', 'ORANGE', '1515', None],
+}
+
+PREFIXES = {'AIRTEL': ['33'], 'TELMA': ['34', '38'], 'ORANGE': ['32', '37']}
+
+
+def _format_amount(rng, amount):
+    plain = str(amount)
+    grouped = f"{amount:,}"
+    return rng.choice([
+        plain,
+        grouped.replace(',', ' '),
+        grouped.replace(',', '.') if amount >= 1000 else plain,
+        f"{plain}.00",
+        f"{grouped.replace(',', ' ')},00",
+    ])
+
+
+def _format_phone(rng, national):
+    body = national[1:]
+    return rng.choice([
+        national,
+        f"+261{body}",
+        f"261{body}",
+        f"{national[:3]} {national[3:5]} {national[5:8]} {national[8:]}",
+        f"+261 {body[:2]} {body[2:4]} {body[4:7]} {body[7:]}",
+    ])
+
+
+def _reference(rng, operator):
+    if operator == 'TELMA':
+        return f"PP{rng.randint(100000, 999999)}.{rng.randint(1000, 9999)}.A{rng.randint(10000, 99999)}"
+    return ''.join(rng.choices(string.ascii_uppercase + string.digits, k=rng.randint(8, 12)))
+
+
+def build_corpus(size, seed=0):
+    """Corpus de SMS au format des opérateurs avec les valeurs normalisées attendues"""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(size):
+        operator = ('AIRTEL', 'TELMA', 'ORANGE')[i % 3]
+        amount = rng.choice([rng.randint(1, 500) * 100, rng.randint(100, 2000000)])
+        national = '0' + rng.choice(PREFIXES[operator]) + ''.join(rng.choices(string.digits, k=7))
+        reference = _reference(rng, operator)
+        message = rng.choice(MESSAGE_FORMATS[operator]).format(
+            amount=_format_amount(rng, amount),
+            phone=_format_phone(rng, national),
+            reference=reference,
+            balance=_format_amount(rng, rng.randint(0, 5000000)),
+            date=f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025 {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}"
+        )
+        corpus.append((rng.choice(SENDERS[operator]), message, {
+            'operator': operator,
+            'amount': Decimal(amount),
+            'phone': national,
+            'reference': reference,
+        }))
+    return corpus
+
+
+def _legacy_parse(message):
+    for operator, pattern in LEGACY_PATTERNS.items():
+        match = re.search(pattern, message, re.IGNORECASE)
+        if match:
+            return {
+                'amount': float(match.group(1)),
+                'phone': match.group(2),
+                'reference': match.group(3),
+                'operator': operator,
+                'message': message
+            }
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Vérifie et mesure l\'analyse des SMS de paiement sur un corpus de messages au format des opérateurs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=6000, help='Taille du corpus')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--rounds', type=int, default=3, help='Passes sur le corpus pour la mesure de débit')
+        parser.add_argument('--templates', default=DEFAULT_TEMPLATES_PATH, help='Fichier de modèles d\'opérateurs')
+
+    def handle(self, *args, **options):
+        corpus = build_corpus(options['messages'], options['seed'])
+        registry = SMSParserRegistry.from_file(options['templates'])
+
+        # Exactitude : opérateur, montant, numéro et référence normalisés
+        failures = []
+        legacy_correct = 0
+        for sender, message, expected in corpus:
+            parsed = registry.parse(message, sender)
+            result = {key: parsed[key] for key in expected} if parsed else None
+            if result != expected:
+                failures.append((sender, message, expected, result))
+
+            legacy = _legacy_parse(message)
+            if legacy and legacy['operator'] == expected['operator'] and legacy['reference'] == expected['reference'] \
+                    and Decimal(str(legacy['amount'])) == expected['amount'] and legacy['phone'] == expected['phone']:
+                legacy_correct += 1
+
+        total = len(corpus)
+        self.stdout.write(f"Ancien analyseur : {legacy_correct}/{total} messages correctement analysés")
+        self.stdout.write(f"Registre : {total - len(failures)}/{total} messages correctement analysés")
+
+        self._throughput('Avant (expressions séquentielles)', corpus, options['rounds'],
+                         lambda sender, message: _legacy_parse(message))
+        self._throughput('Après (registre compilé)', corpus, options['rounds'],
+                         lambda sender, message: registry.parse(message, sender))
+
+        if failures:
+            for sender, message, expected, result in failures[:10]:
+                self.stderr.write(f"[{sender}] {message!r}\n  attendu: {expected}\n  obtenu:  {result}")
+            raise CommandError(f"{len(failures)} message(s) mal analysé(s)")
+        self.stdout.write(self.style.SUCCESS('Tous les messages du corpus sont correctement analysés'))
+
+    def _throughput(self, label, corpus, rounds, parse):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for sender, message, _ in corpus:
+                parse(sender, message)
+        elapsed = time.perf_counter() - started
+        rate = len(corpus) * rounds / elapsed if elapsed else 0
+        self.stdout.write(f"{label}: {rate:,.0f} messages/s ({elapsed * 1000:.0f} ms pour {len(corpus) * rounds} messages)")
@@ -0,0 +1,162 @@
+import asyncio
+import random
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory
+from django.utils import timezone
+
+from payments.matching import confirm_payment
+from payments.models import Payment, SMSTransaction
+from payments.notifications import wait_for_status
+from payments.views import check_payment_status
+from subscriptions.models import Plan
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Compare le nombre de requêtes de suivi de paiement entre le polling périodique '
+            'et l\'attente longue (long-poll) pour des clients simultanés')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100, help='Téléphones en attente de confirmation')
+        parser.add_argument('--max-wait', type=float, default=120,
+                            help='Délai maximum (secondes) avant réception du SMS de paiement')
+        parser.add_argument('--poll-interval', type=float, default=3, help='Intervalle du polling (ancien PaymentFlow)')
+        parser.add_argument('--timeout', type=float, default=50, help='Délai d\'une requête de long-poll')
+        parser.add_argument('--check-interval', type=float, default=1,
+                            help='Relecture du statut en base pendant un long-poll')
+        parser.add_argument('--time-scale', type=float, default=0.1,
+                            help='Facteur d\'accélération appliqué à tous les délais (1 = temps réel)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not User.objects.filter(pk=1).exists():
+            raise CommandError("Les paiements confirmés sont rattachés à l'utilisateur système (id=1), introuvable")
+
+        scale = options['time_scale']
+        rng = random.Random(options['seed'])
+        # Instants d'arrivée des SMS de paiement, identiques pour les deux scénarios
+        arrivals = [rng.uniform(0, options['max_wait']) * scale for _ in range(options['clients'])]
+        plan = Plan.objects.create(
+            name='Forfait charge statut', description='Test de charge',
+            duration=1, duration_unit='DAYS', price=1000
+        )
+        factory = RequestFactory()
+
+        def poll_clients(transaction_ids, requests, detected_at, failed):
+            # Un thread par client, une requête toutes les poll_interval secondes
+            def client(index):
+                try:
+                    while index not in failed:
+                        requests[index] += 1
+                        response = check_payment_status(
+                            factory.get(f'/payments/api/check-payment-status/{transaction_ids[index]}/'),
+                            transaction_id=transaction_ids[index]
+                        )
+                        if response.data['status'] != 'PENDING':
+                            detected_at[index] = time.monotonic()
+                            return
+                        time.sleep(options['poll_interval'] * scale)
+                finally:
+                    connections.close_all()
+
+            with ThreadPoolExecutor(max_workers=len(transaction_ids)) as pool:
+                for future in [pool.submit(client, i) for i in range(len(transaction_ids))]:
+                    future.result()
+
+        def long_poll_clients(transaction_ids, requests, detected_at, failed):
+            # Tous les clients dans une seule boucle asyncio, comme sous ASGI
+            async def client(index):
+                while index not in failed:
+                    requests[index] += 1
+                    payload = await wait_for_status(
+                        transaction_ids[index], 'PENDING', options['timeout'] * scale,
+                        interval=options['check_interval'] * scale
+                    )
+                    if payload['status'] != 'PENDING':
+                        detected_at[index] = time.monotonic()
+                        return
+
+            async def clients():
+                await asyncio.gather(*(client(i) for i in range(len(transaction_ids))))
+
+            asyncio.run(clients())
+            connections.close_all()
+
+        try:
+            polling = self._run(plan, arrivals, poll_clients, '033')
+            long_polling = self._run(plan, arrivals, long_poll_clients, '034')
+        finally:
+            payment_ids = list(SMSTransaction.objects.filter(
+                plan=plan, payment__isnull=False
+            ).values_list('payment_id', flat=True))
+            SMSTransaction.objects.filter(plan=plan).delete()
+            Payment.objects.filter(pk__in=payment_ids).delete()
+            plan.delete()
+
+        for label, (requests, delays) in (('Polling périodique', polling), ('Long-poll', long_polling)):
+            self.stdout.write(
+                f"{label}: {requests} requêtes ({requests / len(arrivals):.1f} par client), "
+                f"délai de détection p50={statistics.median(delays) / scale:.2f} s "
+                f"max={max(delays) / scale:.2f} s (temps réel)"
+            )
+        reduction = polling[0] / long_polling[0]
+        style = self.style.SUCCESS if reduction >= 10 else self.style.WARNING
+        self.stdout.write(style(f"Réduction du nombre de requêtes : x{reduction:.1f}"))
+
+    def _run(self, plan, arrivals, run_clients, operator):
+        """Clients simultanés jusqu'à la confirmation de leur paiement ; retourne (requêtes, délais de détection)"""
+        prefix = f"LOAD{uuid.uuid4().hex[:6].upper()}"
+        # Numéros propres au scénario : un SMS non rapproché du scénario précédent ne peut pas être réclamé
+        phones = [f"{operator}{i:07d}" for i in range(len(arrivals))]
+        SMSTransaction.objects.bulk_create([
+            SMSTransaction(
+                reference=f"{prefix}{i:05d}", phone_number=phone, amount=plan.price, plan=plan,
+                operator_message='En attente de paiement', status='PENDING',
+                expires_at=timezone.now() + timedelta(minutes=10)
+            )
+            for i, phone in enumerate(phones)
+        ])
+        transaction_ids = list(SMSTransaction.objects.filter(
+            reference__startswith=prefix
+        ).order_by('reference').values_list('pk', flat=True))
+
+        requests = [0] * len(arrivals)
+        confirmed_at = {}
+        detected_at = {}
+        failed = set()  # SMS non rapprochés : le client correspondant abandonne
+        started = time.monotonic()
+
+        def sms_arrival(index):
+            time.sleep(max(0, started + arrivals[index] - time.monotonic()))
+            try:
+                if confirm_payment(phones[index], plan.price) is None:
+                    raise CommandError(f"SMS du {phones[index]} non rapproché")
+                confirmed_at[index] = time.monotonic()
+            except Exception as exc:
+                self.stderr.write(f"Confirmation {index} en échec : {exc}")
+                failed.add(index)
+            finally:
+                connections.close_all()
+
+        # Le lecteur de modem confirme les paiements dans un autre processus : threads séparés des clients
+        arrival_pool = ThreadPoolExecutor(max_workers=len(arrivals))
+        arrival_futures = [arrival_pool.submit(sms_arrival, i) for i in range(len(arrivals))]
+        client_thread = threading.Thread(target=run_clients, args=(transaction_ids, requests, detected_at, failed))
+        client_thread.start()
+        client_thread.join()
+        for future in arrival_futures:
+            future.result()
+        arrival_pool.shutdown()
+
+        delays = [detected_at[i] - confirmed_at[i] for i in range(len(arrivals)) if i in detected_at]
+        return sum(requests), [max(delay, 0) for delay in delays]
@@ -0,0 +1,128 @@
+import random
+import statistics
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from payments.matching import confirm_payment
+from payments.models import Payment, SMSTransaction
+from subscriptions.models import Plan
+
+User = get_user_model()
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Lance des confirmations de paiement simultanées et vérifie que chaque transaction SMS n\'est confirmée qu\'une fois'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phones', type=int, default=50, help='Nombre de clients')
+        parser.add_argument('--retries', type=int, default=3,
+                            help='Transactions en attente par client (tentatives répétées)')
+        parser.add_argument('--confirmations', type=int, default=4,
+                            help='SMS de confirmation reçus par client')
+        parser.add_argument('--workers', type=int, default=32)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not User.objects.filter(pk=1).exists():
+            raise CommandError("Les paiements confirmés sont rattachés à l'utilisateur système (id=1), introuvable")
+
+        rng = random.Random(options['seed'])
+        plan = Plan.objects.create(
+            name='Forfait stress SMS', description='Test de rapprochement',
+            duration=1, duration_unit='DAYS', price=1000
+        )
+        phones = [f"034{i:07d}" for i in range(options['phones'])]
+        prefix = f"STRESS{uuid.uuid4().hex[:6].upper()}"
+        expires_at = timezone.now() + timedelta(minutes=10)
+
+        self.stdout.write(f"Préparation de {len(phones) * options['retries']} transactions en attente...")
+        created = SMSTransaction.objects.bulk_create([
+            SMSTransaction(
+                reference=f"{prefix}{i:03d}{n}", phone_number=phone, amount=plan.price,
+                operator_message='En attente de paiement', plan=plan, status='PENDING', expires_at=expires_at
+            )
+            for i, phone in enumerate(phones)
+            for n in range(options['retries'])
+        ])
+        transaction_ids = [sms_transaction.pk for sms_transaction in created] or list(
+            SMSTransaction.objects.filter(reference__startswith=prefix).values_list('pk', flat=True)
+        )
+
+        # Chaque client envoie plusieurs confirmations, sous des écritures de numéro différentes
+        jobs = []
+        for phone in phones:
+            for _ in range(options['confirmations']):
+                jobs.append(rng.choice([phone, f"+261{phone[1:]}", f"{phone[:3]} {phone[3:5]} {phone[5:8]} {phone[8:]}"]))
+        rng.shuffle(jobs)
+
+        def confirm(phone):
+            started = time.perf_counter()
+            try:
+                result = confirm_payment(phone, '1000', operator_message=f"Vous avez reçu 1000 Ar de {phone}")
+                return result.pk if result else None, (time.perf_counter() - started) * 1000
+            finally:
+                connections.close_all()
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                results = list(pool.map(confirm, jobs))
+            elapsed = time.perf_counter() - started
+            self._verify(phones, options, results, transaction_ids)
+
+            latencies = [latency for _, latency in results]
+            self.stdout.write(self.style.SUCCESS(
+                f"{len(jobs)} confirmations en {elapsed:.2f} s ({len(jobs) / elapsed:.0f}/s) - "
+                f"p50={statistics.median(latencies):.1f} ms p95={_percentile(latencies, 95):.1f} ms"
+            ))
+        finally:
+            payment_ids = list(SMSTransaction.objects.filter(
+                pk__in=transaction_ids, payment__isnull=False
+            ).values_list('payment_id', flat=True))
+            SMSTransaction.objects.filter(pk__in=transaction_ids).delete()
+            Payment.objects.filter(pk__in=payment_ids).delete()
+            plan.delete()
+
+    def _verify(self, phones, options, results, transaction_ids):
+        claimed = [pk for pk, _ in results if pk is not None]
+        duplicates = [pk for pk, count in Counter(claimed).items() if count > 1]
+        if duplicates:
+            raise CommandError(f"Transactions confirmées plusieurs fois : {duplicates[:10]}")
+
+        expected_per_phone = min(options['retries'], options['confirmations'])
+        rows = SMSTransaction.objects.filter(pk__in=transaction_ids).order_by('created_at', 'id')
+        by_phone = defaultdict(list)
+        for row in rows:
+            by_phone[row.phone_number].append(row)
+
+        errors = []
+        for phone in phones:
+            transactions = by_phone[phone]
+            confirmed = [row for row in transactions if row.status == 'CONFIRMED']
+            if len(confirmed) != expected_per_phone:
+                errors.append(f"{phone}: {len(confirmed)} confirmée(s) au lieu de {expected_per_phone}")
+            elif confirmed != transactions[:expected_per_phone]:
+                errors.append(f"{phone}: les transactions les plus anciennes n'ont pas été retenues")
+            if any(row.payment_id is None for row in confirmed):
+                errors.append(f"{phone}: transaction confirmée sans paiement")
+
+        if len(claimed) != len(phones) * expected_per_phone:
+            errors.append(f"{len(claimed)} confirmations réussies au lieu de {len(phones) * expected_per_phone}")
+        if errors:
+            raise CommandError('\n'.join(errors[:20]))
+        self.stdout.write(f"{len(claimed)} transactions confirmées une seule fois, "
+                          f"{len(results) - len(claimed)} confirmation(s) sans transaction en attente")
@@ -0,0 +1,108 @@
+"""Rapprochement des paiements Mobile Money reçus avec les transactions SMS en attente.
+
+Les candidats sont cherchés par étapes, du plus sûr au plus approximatif :
+la référence de la transaction avec le numéro (sous toutes ses écritures),
+puis le numéro et le montant exact, puis le numéro et un montant reçu
+légèrement supérieur au montant attendu (un paiement incomplet n'est jamais
+rapproché). À chaque
+étape, la transaction en attente non expirée la plus ancienne est retenue,
+verrouillée avec select_for_update(skip_locked=True) pour que deux
+confirmations simultanées ne se disputent jamais la même ligne, puis réclamée
+par une mise à jour conditionnelle sur son statut. L'étape retenue est
+enregistrée sur la transaction (match_step).
+"""
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .fulfillment import schedule_fulfillment
+from .models import Payment, SMSTransaction
+from .sms_parsing import normalize_phone, COUNTRY_CODE
+
+logger = logging.getLogger(__name__)
+
+# Trop-perçu (Ar) accepté par la dernière étape de rapprochement
+SMS_MATCH_AMOUNT_TOLERANCE = Decimal(str(getattr(settings, 'SMS_MATCH_AMOUNT_TOLERANCE', 0)))
+
+
+def phone_variants(phone):
+    """Écritures possibles d'un même numéro : 0341234567, +261341234567, 261341234567, 341234567"""
+    national = normalize_phone(phone or '')
+    if len(national) != 10:
+        return [phone] if phone else []
+    subscriber = national[1:]
+    return list(dict.fromkeys([phone, national, f'+{COUNTRY_CODE}{subscriber}', f'{COUNTRY_CODE}{subscriber}', subscriber]))
+
+
+def _candidate_filters(phone, amount, reference, tolerance):
+    """Filtres des étapes de rapprochement, dans l'ordre"""
+    phones = phone_variants(phone)
+    # Seul un trop-perçu est toléré : montant attendu entre le montant reçu moins la tolérance et le montant reçu
+    window = {'amount__gte': amount - tolerance, 'amount__lte': amount}
+    if not phones:
+        return
+    # Référence toujours accompagnée du numéro : une référence recopiée depuis un autre téléphone ne suffit pas
+    if reference:
+        yield 'reference', {'reference': reference, 'phone_number__in': phones, **window}
+    yield 'exact', {'phone_number__in': phones, 'amount': amount}
+    if tolerance:
+        yield 'tolerance', {'phone_number__in': phones, **window}
+
+
+def claim_pending_transaction(phone, amount, reference=None, tolerance=None):
+    """Verrouille et réclame la transaction en attente correspondante (à appeler dans un atomic)"""
+    try:
+        amount = Decimal(str(amount))
+    except InvalidOperation:
+        return None, None
+    tolerance = SMS_MATCH_AMOUNT_TOLERANCE if tolerance is None else Decimal(str(tolerance))
+    pending = SMSTransaction.objects.select_for_update(skip_locked=True).filter(
+        status='PENDING', expires_at__gt=timezone.now()
+    ).order_by('created_at', 'id')
+
+    for step, filters in _candidate_filters(phone, amount, reference, tolerance):
+        for candidate in pending.filter(**filters)[:5]:
+            # Garde sur le statut : sans verrou de ligne (SQLite), une seule confirmation gagne
+            if SMSTransaction.objects.filter(pk=candidate.pk, status='PENDING').update(status='CONFIRMED'):
+                candidate.status = 'CONFIRMED'
+                return candidate, step
+    return None, None
+
+
+def confirm_payment(phone, amount, reference=None, operator_message=''):
+    """Confirme la transaction SMS correspondant à un paiement reçu ; None si aucune ne correspond"""
+    with transaction.atomic():
+        sms_transaction, step = claim_pending_transaction(phone, amount, reference)
+        if sms_transaction is None:
+            if reference and SMSTransaction.objects.filter(reference=reference, status='PENDING').exists():
+                # Référence d'une transaction en attente payée depuis un autre numéro : vérification manuelle
+                logger.warning(
+                    f"Paiement de {phone} ({amount} Ar) portant la référence {reference} d'une transaction "
+                    f"d'un autre numéro : non rapproché, à vérifier manuellement"
+                )
+            else:
+                logger.info(f"Aucune transaction en attente pour {phone} ({amount} Ar, référence {reference})")
+            return None
+
+        payment = Payment.objects.create(
+            user_id=1,  # Utilisateur système
+            plan=sms_transaction.plan,
+            amount=sms_transaction.amount,
+            payment_method='MOBILE_MONEY',
+            phone_number=sms_transaction.phone_number,
+            status='SUCCESS'
+        )
+        sms_transaction.payment = payment
+        sms_transaction.match_step = step
+        if operator_message:
+            sms_transaction.operator_message = operator_message
+        sms_transaction.save(update_fields=['payment', 'match_step', 'operator_message', 'status'])
+
+        # Identifiants WiFi, QR code et envoi : traités hors de cet appel, après validation
+        schedule_fulfillment(payment.pk)
+
+    logger.info(f"Transaction {sms_transaction.reference} confirmée ({step}) pour {phone}: {amount} Ar")
+    return sms_transaction
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0008_smstransaction'),
+        ('subscriptions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='smstransaction',
+            index=models.Index(fields=['phone_number', 'status'], name='smstx_phone_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='smstransaction',
+            index=models.Index(fields=['status', 'expires_at'], name='smstx_status_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0009_smstransaction_matching_indexes'),
+        ('subscriptions', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'plan', 'created_at', 'amount'], name='payment_status_plan_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'created_at', 'amount'], name='payment_status_created_idx'),
+        ),
+    ]
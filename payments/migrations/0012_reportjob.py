@@ -0,0 +1,41 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0011_payment_created_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('DAILY_RECEIPTS', 'Reçus du jour'), ('PAYMENT_STATISTICS', 'Statistiques des paiements')], max_length=30)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('key', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('PENDING', 'En attente'), ('RUNNING', 'En cours'), ('SUCCESS', 'Terminé'), ('FAILED', 'Échoué')], default='PENDING', max_length=20)),
+                ('progress', models.PositiveSmallIntegerField(default=0)),
+                ('message', models.CharField(blank=True, max_length=255)),
+                ('file', models.FileField(blank=True, upload_to='reports/')),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('filename', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Rapport',
+                'verbose_name_plural': 'Rapports',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['key', 'status'], name='reportjob_key_status_idx')],
+            },
+        ),
+    ]
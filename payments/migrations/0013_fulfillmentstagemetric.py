@@ -0,0 +1,29 @@
+# Generated by Django 5.0.2 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0012_reportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FulfillmentStageMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(max_length=50, unique=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('total_ms', models.BigIntegerField(default=0)),
+                ('max_ms', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Mesure du traitement des paiements',
+                'verbose_name_plural': 'Mesures du traitement des paiements',
+            },
+        ),
+    ]
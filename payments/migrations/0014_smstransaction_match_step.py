@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 18:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0013_fulfillmentstagemetric'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='smstransaction',
+            name='match_step',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+    ]
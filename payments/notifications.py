@@ -0,0 +1,119 @@
+"""Suivi du statut des transactions SMS par les clients (long-poll et polling).
+
+Le paiement est confirmé par le lecteur de modem, dans un autre processus que
+les workers web : aucune attente en mémoire ne peut en être réveillée, et la
+base de production (MySQL) n'offre pas de LISTEN/NOTIFY. L'attente longue
+(wait_for_status) relit donc la transaction en base toutes les
+PAYMENT_STATUS_DB_CHECK_INTERVAL secondes, par une lecture sur la clé
+primaire, jusqu'au changement de statut ou à la fin du délai (borné par
+PAYMENT_STATUS_LONG_POLL_TIMEOUT). Elle est asynchrone : servie par ASGI
+(BestConnect/asgi.py), une requête en attente n'occupe aucun worker.
+
+Chaque lecture tient en une seule requête : statut, échéance et identifiants
+WiFi (jointure vide tant que le paiement n'est pas confirmé). Le polling
+simple (check-payment-status) reste disponible ; l'intervalle conseillé
+(poll_interval) s'allonge avec l'âge d'une transaction en attente.
+"""
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from portal.models import WiFiCredentials
+from .models import SMSTransaction
+
+# Délai maximum (secondes) pendant lequel une requête de long-poll reste ouverte
+PAYMENT_STATUS_LONG_POLL_TIMEOUT = getattr(settings, 'PAYMENT_STATUS_LONG_POLL_TIMEOUT', 50)
+# Relecture du statut en base pendant un long-poll
+PAYMENT_STATUS_DB_CHECK_INTERVAL = getattr(settings, 'PAYMENT_STATUS_DB_CHECK_INTERVAL', 1)
+# Intervalle (secondes) conseillé au client qui interroge check-payment-status pendant l'attente du paiement,
+# doublé toutes les PAYMENT_STATUS_POLL_BACKOFF_AFTER secondes jusqu'à PAYMENT_STATUS_MAX_POLL_INTERVAL
+PAYMENT_STATUS_POLL_INTERVAL = getattr(settings, 'PAYMENT_STATUS_POLL_INTERVAL', 3)
+PAYMENT_STATUS_POLL_BACKOFF_AFTER = getattr(settings, 'PAYMENT_STATUS_POLL_BACKOFF_AFTER', 60)
+PAYMENT_STATUS_MAX_POLL_INTERVAL = getattr(settings, 'PAYMENT_STATUS_MAX_POLL_INTERVAL', 15)
+# Intervalle conseillé une fois le paiement reçu (identifiants en préparation)
+PAYMENT_STATUS_PROCESSING_POLL_INTERVAL = getattr(settings, 'PAYMENT_STATUS_PROCESSING_POLL_INTERVAL', 1)
+
+FINAL_STATUSES = ('CONFIRMED', 'EXPIRED', 'FAILED')
+
+_FIELDS = (
+    'status', 'reference', 'created_at', 'expires_at',
+    'payment__wificredentials__username', 'payment__wificredentials__password',
+    'payment__wificredentials__qr_code', 'payment__wificredentials__expires_at',
+)
+
+
+def poll_interval(status, created_at=None):
+    """Délai avant la prochaine lecture du statut, None pour un statut final"""
+    if status in FINAL_STATUSES:
+        return None
+    if status == 'PROCESSING':
+        return PAYMENT_STATUS_PROCESSING_POLL_INTERVAL
+    age = (timezone.now() - created_at).total_seconds() if created_at else 0
+    steps = int(max(age, 0) // PAYMENT_STATUS_POLL_BACKOFF_AFTER)
+    return min(PAYMENT_STATUS_POLL_INTERVAL * 2 ** min(steps, 8), PAYMENT_STATUS_MAX_POLL_INTERVAL)
+
+
+def _read(transaction_id):
+    return SMSTransaction.objects.filter(pk=transaction_id).values(*_FIELDS).first()
+
+
+def _status(transaction_id, row):
+    """Statut rapporté au client ; passe la transaction à EXPIRED une seule fois.
+
+    Un paiement confirmé dont les identifiants WiFi ne sont pas encore prêts
+    est rapporté comme PROCESSING.
+    """
+    status = row['status']
+    if status == 'CONFIRMED' and not row['payment__wificredentials__qr_code']:
+        return 'PROCESSING'
+    if status == 'PENDING' and row['expires_at'] <= timezone.now():
+        if SMSTransaction.objects.filter(pk=transaction_id, status='PENDING').update(status='EXPIRED'):
+            return 'EXPIRED'
+        return SMSTransaction.objects.filter(pk=transaction_id).values_list('status', flat=True).first()
+    return status
+
+
+def _payload(row, status):
+    """Réponse de statut ; les identifiants WiFi ne sont renvoyés qu'une fois le paiement confirmé"""
+    payload = {
+        'status': status,
+        'reference': row['reference'],
+        'poll_interval': poll_interval(status, row['created_at']),  # Secondes (None : statut final)
+    }
+    if status == 'CONFIRMED':
+        credentials = WiFiCredentials(
+            username=row['payment__wificredentials__username'],
+            password=row['payment__wificredentials__password'],
+            qr_code=row['payment__wificredentials__qr_code'],
+        )
+        payload['wifi_credentials'] = {
+            'username': credentials.username,
+            'password': credentials.password,
+            'qr_code': credentials.get_qr_code_base64(),
+            'expires_at': row['payment__wificredentials__expires_at'].isoformat(),
+        }
+    return payload
+
+
+def status_payload(transaction_id):
+    """(statut, réponse) en une lecture ; (None, None) si la transaction n'existe pas"""
+    row = _read(transaction_id)
+    if row is None:
+        return None, None
+    status = _status(transaction_id, row)
+    return status, _payload(row, status)
+
+
+async def wait_for_status(transaction_id, known_status, timeout, interval=None):
+    """Attend que le statut diffère de known_status (ou la fin du délai) ; retourne la réponse, None si introuvable"""
+    interval = PAYMENT_STATUS_DB_CHECK_INTERVAL if interval is None else interval
+    deadline = time.monotonic() + timeout
+    while True:
+        status, payload = await sync_to_async(status_payload)(transaction_id)
+        remaining = deadline - time.monotonic()
+        if status != known_status or remaining <= 0:
+            return payload
+        await asyncio.sleep(min(interval, remaining))
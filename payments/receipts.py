@@ -0,0 +1,480 @@
+"""Rendu des reçus PDF (reçu de paiement A4, tickets d'inscription 80 mm).
+
+Chaque modèle de reçu sépare le décor statique (en-tête, filigrane, titres de
+section et libellés, toujours aux mêmes positions) des valeurs propres au
+client. Le décor est dessiné une seule fois par processus dans un formulaire
+PDF (XObject) dont le flux d'opérations est gardé en mémoire ; chaque document
+déclare ce formulaire une fois et le référence sur chacune de ses pages, puis
+seules les valeurs sont dessinées par-dessus. Plusieurs reçus peuvent ainsi
+être imprimés dans un même document (une page par reçu) sans répéter le décor.
+
+ReportLab ne permet pas de partager un formulaire entre documents : le flux
+capturé est réinjecté dans le canvas de chaque nouveau document, avec les
+polices déclarées dans le même ordre que lors de la capture (mêmes noms
+internes /F1, /F2...).
+"""
+import io
+import logging
+import threading
+from collections import defaultdict
+from functools import cached_property
+
+from django.db.models import Count
+from django.http import HttpResponse
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+logger = logging.getLogger(__name__)
+
+_backgrounds = {}
+_backgrounds_lock = threading.Lock()
+
+
+def _local(value, format):
+    return timezone.localtime(value).strftime(format) if value else ''
+
+
+class ReceiptLayout:
+    """Modèle de reçu : lignes ('title', texte), ('field', libellé, clé) ou ('gap', hauteur)"""
+    name = ''
+    pagesize = A4
+    lines = ()
+    start_y = 0
+    title_before = 0
+    title_after = 0
+    line_step = 0
+
+    @property
+    def width(self):
+        return self.pagesize[0]
+
+    @property
+    def height(self):
+        return self.pagesize[1]
+
+    @cached_property
+    def rows(self):
+        """Position de chaque titre et champ, fixe d'un reçu à l'autre ; retourne (lignes, ordonnée finale)"""
+        rows, y = [], self.start_y
+        for line in self.lines:
+            if line[0] == 'title':
+                y -= self.title_before
+                rows.append((line, y))
+                y -= self.title_after
+            elif line[0] == 'field':
+                rows.append((line, y))
+                y -= self.line_step
+            else:
+                y -= line[1]
+        return rows, y
+
+    def fields(self):
+        return [(line, y) for line, y in self.rows[0] if line[0] == 'field']
+
+    def draw_background(self, p):
+        raise NotImplementedError
+
+    def draw_fields(self, p, data):
+        raise NotImplementedError
+
+
+class PaymentReceipt(ReceiptLayout):
+    """Reçu de paiement A4 (Payment.generate_receipt_pdf)"""
+    name = 'payment_receipt'
+    primary_color = (0.26, 0.46, 0.56)  # Bleu BestConnect
+    secondary_color = (0.2, 0.2, 0.2)   # Gris foncé
+    margin_left = 20 * mm
+    header_height = 30 * mm
+    start_y = A4[1] - 30 * mm - 10 * mm
+    title_before = 4 * mm
+    title_after = 6 * mm
+    line_step = 6 * mm
+    lines = (
+        ('title', "Informations du Reçu"),
+        ('field', "Numéro de reçu", 'receipt_number'),
+        ('field', "Date", 'date'),
+        ('title', "Informations Client"),
+        ('field', "Nom d'utilisateur", 'username'),
+        ('field', "Email", 'email'),
+        ('field', "Téléphone", 'phone_number'),
+        ('title', "Détails du Forfait"),
+        ('field', "Nom du forfait", 'plan_name'),
+        ('field', "Description", 'plan_description'),
+        ('field', "Durée", 'duration'),
+        ('field', "Prix unitaire", 'price'),
+        ('title', "Statistiques du Forfait"),
+        ('field', "Effectif actuel", 'active_subscriptions'),
+        ('field', "Montant total", 'plan_total'),
+        ('title', "Détails du Paiement"),
+        ('field', "Montant payé", 'amount'),
+        ('field', "Méthode de paiement", 'payment_method'),
+        ('field', "Statut", 'status'),
+    )
+
+    def draw_background(self, p):
+        width, height = self.pagesize
+
+        # Filigrane
+        p.saveState()
+        p.setFillColorRGB(0.9, 0.9, 0.9)
+        p.setFont("Helvetica-Bold", 60)
+        p.rotate(45)
+        p.drawCentredString(width/2, -height/2, "BEST CONNECT")
+        p.restoreState()
+
+        # En-tête avec titre
+        p.setFillColorRGB(*self.primary_color)
+        p.rect(0, height - self.header_height, width, self.header_height, fill=True)
+        p.setFillColorRGB(1, 1, 1)
+        p.setFont("Helvetica-Bold", 24)
+        p.drawCentredString(width/2, height - 15*mm, "BEST CONNECT")
+        p.setFont("Helvetica", 14)
+        p.drawCentredString(width/2, height - 25*mm, "Reçu de Paiement")
+
+        # Titres de section et libellés
+        for line, y in self.rows[0]:
+            if line[0] == 'title':
+                p.setFillColorRGB(*self.primary_color)
+                p.setFont("Helvetica-Bold", 12)
+                p.drawString(self.margin_left, y, line[1])
+            else:
+                p.setFillColorRGB(*self.secondary_color)
+                p.setFont("Helvetica-Bold", 10)
+                p.drawString(self.margin_left, y, f"{line[1]}:")
+
+        # Pied de page
+        footer_y = 20 * mm
+        p.setFillColorRGB(*self.primary_color)
+        p.setFont("Helvetica-Bold", 10)
+        p.drawCentredString(width/2, footer_y + 15*mm, "Merci de votre confiance !")
+        p.setFont("Helvetica", 8)
+        p.drawCentredString(width/2, footer_y + 10*mm, "BestConnect - Votre connexion internet de confiance")
+        p.drawCentredString(width/2, footer_y + 5*mm, "Contact: 034 72 497 15")
+
+    def draw_fields(self, p, data):
+        p.setFillColorRGB(*self.secondary_color)
+        p.setFont("Helvetica", 10)
+        for (_, _, key), y in self.fields():
+            p.drawString(self.margin_left + 40*mm, y, str(data.get(key, '')))
+
+
+class RegistrationTicket(ReceiptLayout):
+    """Ticket d'inscription 80 mm avec identifiants et QR code (admin des utilisateurs)"""
+    name = 'registration_ticket'
+    pagesize = (80 * mm, 300 * mm)
+    text_color = (0, 0, 0)
+    title_color = (0, 0, 0.5)
+    header_bg_color = (0.8, 0.9, 1.0)
+    header_text_color = (0, 0, 0.5)
+    margin = 2 * mm
+    margin_top = 5 * mm
+    margin_bottom = 5 * mm
+    header_height = 15 * mm
+    line_height = 4 * mm
+    small_line_height = 3 * mm
+    start_y = 300 * mm - 5 * mm - 15 * mm - 3 * mm - 4 * mm
+    title_before = 3 * mm
+    title_after = 4 * mm
+    line_step = 3 * mm
+    # Valeurs en gras
+    bold = {'username', 'password', 'plan_name', 'price'}
+    lines = (
+        ('title', "INFORMATIONS UTILISATEUR"),
+        ('field', "Nom d'utilisateur", 'username'),
+        ('field', "Mot de passe", 'password'),
+        ('field', "Email", 'email'),
+        ('field', "Téléphone", 'phone_number'),
+        ('field', "Adresse", 'address'),
+        ('gap', 3 * mm),
+        ('title', "DÉTAILS DE L'ABONNEMENT"),
+        ('field', "Forfait", 'plan_name'),
+        ('field', "Prix", 'price'),
+        ('field', "Date d'inscription", 'start_date'),
+        ('field', "Date d'expiration", 'end_date'),
+        ('gap', 3 * mm),
+        ('title', "INFORMATIONS DE PAIEMENT"),
+        ('field', "Méthode de paiement", 'payment_method'),
+        ('field', "Numéro de téléphone", 'payment_phone_number'),
+        ('field', "Date de paiement", 'payment_date'),
+        ('field', "Document généré le", 'generated_at'),
+        ('gap', 4 * mm),
+    )
+
+    def draw_background(self, p):
+        width, height = self.pagesize
+
+        # Filigrane en diagonale sur toute la page
+        p.saveState()
+        p.translate(width/2, height/2)
+        p.rotate(45)
+        watermark_text = "BestConnect by Franco Fanazava"
+        spacing = stringWidth(watermark_text, "Helvetica", 16) * 2
+        p.setFillColorRGB(0.95, 0.95, 0.95)
+        p.setFont("Helvetica", 16)
+        for y in range(int(-height * 0.8), int(height*1.6), int(spacing)):
+            for x in range(int(-width * 0.8), int(width*1.6), int(spacing)):
+                p.drawString(x, y, watermark_text)
+        p.restoreState()
+
+        # En-tête avec fond bleu
+        header_y_start = height - self.margin_top
+        header_y_end = header_y_start - self.header_height
+        p.setFillColorRGB(*self.header_bg_color)
+        p.rect(self.margin, header_y_end, width - 2 * self.margin, self.header_height, fill=1)
+        p.setFillColorRGB(*self.header_text_color)
+        p.setFont("Helvetica-Bold", 14)
+        p.drawCentredString(width/2, header_y_start - 5*mm, "BestConnect")
+        p.setFont("Helvetica-Bold", 12)
+        p.drawCentredString(width/2, header_y_start - 10*mm, "Reçu d'inscription")
+
+        # Ligne de séparation après l'en-tête
+        p.setStrokeColorRGB(*self.header_text_color)
+        p.line(self.margin, header_y_end - 3*mm, width - self.margin, header_y_end - 3*mm)
+
+        # Titres de section et libellés
+        for line, y in self.rows[0]:
+            if line[0] == 'title':
+                p.setFillColorRGB(*self.title_color)
+                p.setFont("Helvetica-Bold", 8)
+                p.drawCentredString(width/2, y, line[1])
+            else:
+                p.setFillColorRGB(*self.text_color)
+                p.setFont("Helvetica", 7)
+                p.drawString(self.margin, y, f"{line[1]}:")
+
+    def draw_fields(self, p, data):
+        width = self.width
+        p.setFillColorRGB(*self.text_color)
+        for (_, label, key), y in self.fields():
+            font = "Helvetica-Bold" if key in self.bold else "Helvetica"
+            p.setFont(font, 7)
+            p.drawString(self.margin + stringWidth(label + ":", "Helvetica", 7) + 1*mm, y, str(data.get(key, '')))
+
+        # QR code centré
+        y_position = self.rows[1]
+        footer_height = self.small_line_height * 2 + self.line_height
+        if data.get('qr_code'):
+            qr_size = 50*mm
+            qr_y = max(self.margin_bottom + footer_height + 2*mm, y_position - qr_size)
+            p.drawImage(ImageReader(io.BytesIO(data['qr_code'])), (width - qr_size) / 2, qr_y,
+                        width=qr_size, height=qr_size)
+            y_position = qr_y - 2*mm
+        else:
+            p.setFillColorRGB(1, 0, 0)
+            p.setFont("Helvetica-Bold", 7)
+            p.drawCentredString(width/2, y_position - 10*mm, "QR Code manquant")
+            y_position -= 15*mm
+
+        # Pied de page avec fond bleu clair, sous le QR code
+        footer_y = max(self.margin_bottom + 5*mm, y_position - footer_height)
+        p.setFillColorRGB(*self.header_bg_color)
+        p.rect(self.margin, footer_y - 6*mm, width - 2 * self.margin, 6*mm, fill=1)
+        p.setFillColorRGB(*self.header_text_color)
+        p.setFont("Helvetica-Bold", 8)
+        p.drawCentredString(width/2, footer_y + self.small_line_height, "Merci de votre confiance")
+        p.setFont("Helvetica", 7)
+        p.drawCentredString(width/2, footer_y + self.small_line_height*0.5, "BestConnect - Votre partenaire de confiance")
+        p.drawCentredString(width/2, footer_y, "Pour toute assistance: 034 72 497 15")
+
+
+class SubscriptionTicket(ReceiptLayout):
+    """Ticket d'inscription 80 mm (admin des abonnements)"""
+    name = 'subscription_ticket'
+    pagesize = (80 * mm, 297 * mm)
+    primary_color = (0.26, 0.46, 0.56)  # Bleu BestConnect
+    secondary_color = (0.2, 0.2, 0.2)   # Gris foncé
+    margin = 3 * mm
+    header_height = 15 * mm
+    start_y = 297 * mm - 15 * mm - 5 * mm
+    title_before = 2 * mm
+    title_after = 4 * mm
+    line_step = 4 * mm
+    lines = (
+        ('title', "Informations utilisateur"),
+        ('field', "Nom d'utilisateur", 'username'),
+        ('field', "Mot de passe", 'password'),
+        ('field', "Email", 'email'),
+        ('field', "Téléphone", 'phone_number'),
+        ('field', "Adresse", 'address'),
+        ('title', "Détails de l'abonnement"),
+        ('field', "Forfait", 'plan_name'),
+        ('field', "Prix", 'price'),
+        ('field', "Date d'inscription", 'start_date'),
+        ('field', "Date d'expiration", 'end_date'),
+        ('title', "Informations de paiement"),
+        ('field', "Méthode de paiement", 'payment_method'),
+        ('field', "Numéro de téléphone", 'payment_phone_number'),
+        ('field', "Date de paiement", 'payment_date'),
+        ('gap', 2 * mm),
+    )
+
+    def draw_background(self, p):
+        width, height = self.pagesize
+
+        # En-tête avec titre
+        p.setFillColorRGB(*self.primary_color)
+        p.rect(0, height - self.header_height, width, self.header_height, fill=True)
+        header_center = height - (self.header_height / 2)
+        p.setFillColorRGB(1, 1, 1)
+        p.setFont("Helvetica-Bold", 12)
+        p.drawCentredString(width/2, header_center + 2*mm, "BestConnect")
+        p.setFont("Helvetica-Bold", 9)
+        p.drawCentredString(width/2, header_center - 2*mm, "Reçu d'inscription")
+
+        # Titres de section et libellés
+        for line, y in self.rows[0]:
+            if line[0] == 'title':
+                p.setFillColorRGB(*self.primary_color)
+                p.setFont("Helvetica-Bold", 8)
+                p.drawCentredString(width/2, y, line[1])
+            else:
+                p.setFillColorRGB(*self.secondary_color)
+                p.setFont("Helvetica-Bold", 7)
+                p.drawString(self.margin, y, f"{line[1]}:")
+
+    def draw_fields(self, p, data):
+        width = self.width
+        content_width = width - 2 * self.margin
+        p.setFillColorRGB(*self.secondary_color)
+        p.setFont("Helvetica", 7)
+        for (_, label, key), y in self.fields():
+            label_width = stringWidth(label + ":", "Helvetica-Bold", 7)
+            max_value_width = content_width - (label_width + 4*mm)
+            value = str(data.get(key, ''))
+            while stringWidth(value, "Helvetica", 7) > max_value_width and value:
+                value = value[:-1]
+            p.drawString(self.margin + label_width + 2*mm, y, value)
+
+        # QR code centré en bas, suivi du message de remerciement
+        if data.get('qr_code'):
+            qr_size = min(content_width, 45*mm)
+            qr_y = self.rows[1] - qr_size
+            p.drawImage(ImageReader(io.BytesIO(data['qr_code'])), (width - qr_size) / 2, qr_y,
+                        width=qr_size, height=qr_size)
+            p.setFillColorRGB(*self.primary_color)
+            p.setFont("Helvetica-Bold", 7)
+            p.drawCentredString(width/2, qr_y - 8*mm, "Merci de votre confiance")
+            p.setFont("Helvetica", 6)
+            p.drawCentredString(width/2, qr_y - 11*mm, "BestConnect - Votre partenaire de confiance")
+            p.drawCentredString(width/2, qr_y - 14*mm, "Pour toute assistance: 034 72 497 15")
+
+
+PAYMENT_RECEIPT = PaymentReceipt()
+REGISTRATION_TICKET = RegistrationTicket()
+SUBSCRIPTION_TICKET = SubscriptionTicket()
+
+
+def _background(layout):
+    """Flux d'opérations du décor et polices à déclarer, capturés une fois par processus"""
+    background = _backgrounds.get(layout.name)
+    if background is None:
+        with _backgrounds_lock:
+            background = _backgrounds.get(layout.name)
+            if background is None:
+                p = canvas.Canvas(io.BytesIO(), pagesize=layout.pagesize)
+                p.beginForm(layout.name)
+                layout.draw_background(p)
+                background = (tuple(p._doc.fontMapping.items()), list(p._code))
+                p.endForm()
+                _backgrounds[layout.name] = background
+    return background
+
+
+def render(layout, items, output, cached=True):
+    """Un reçu par page dans un même document ; retourne le nombre de pages.
+
+    cached=False redessine le décor sur chaque page (référence des mesures).
+    """
+    p = canvas.Canvas(output, pagesize=layout.pagesize)
+    if cached:
+        fonts, ops = _background(layout)
+        # Polices déclarées dans l'ordre de la capture : mêmes noms internes que dans le flux réinjecté
+        cached = all(p._doc.getInternalFontName(font) == name for font, name in fonts)
+        if cached:
+            p.beginForm(layout.name)
+            p._code.extend(ops)
+            p.endForm()
+        else:
+            logger.warning(f"Décor du reçu {layout.name} redessiné : polices déclarées dans un autre ordre")
+
+    pages = 0
+    for data in items:
+        if cached:
+            p.doForm(layout.name)
+        else:
+            layout.draw_background(p)
+        layout.draw_fields(p, data)
+        p.showPage()
+        pages += 1
+    p.save()
+    return pages
+
+
+def receipt_response(layout, items, filename):
+    response = HttpResponse(content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    render(layout, items, response)
+    return response
+
+
+def _plan_statistics(plan_ids):
+    """Abonnés actifs et chiffre d'affaires de chaque forfait, en deux requêtes pour tout le lot"""
+    from subscriptions.daily_statistics import plan_revenue_totals
+    from subscriptions.models import Subscription
+
+    active = dict(Subscription.objects.filter(plan__in=plan_ids, is_active=True).values('plan').annotate(
+        count=Count('id')
+    ).order_by().values_list('plan', 'count'))
+    totals = plan_revenue_totals()
+    return defaultdict(lambda: (0, 0), {
+        plan_id: (active.get(plan_id, 0), totals.get(plan_id, 0)) for plan_id in plan_ids
+    })
+
+
+def payment_receipts(payments):
+    """Données des reçus de paiement (utilisateur et forfait déjà joints de préférence)"""
+    payments = list(payments)
+    statistics = _plan_statistics({payment.plan_id for payment in payments})
+    for payment in payments:
+        plan = payment.plan
+        active_subscriptions, plan_total = statistics[plan.id]
+        yield {
+            'receipt_number': payment.receipt_number,
+            'date': _local(payment.created_at, '%d/%m/%Y %H:%M'),
+            'username': payment.user.username,
+            'email': payment.user.email,
+            'phone_number': payment.phone_number or "Non renseigné",
+            'plan_name': plan.name,
+            'plan_description': plan.description,
+            'duration': f"{plan.duration} {plan.get_duration_unit_display()}",
+            'price': f"{plan.price:,} Ar",
+            'active_subscriptions': f"{active_subscriptions} abonnés",
+            'plan_total': f"{plan_total:,} Ar",
+            'amount': f"{payment.amount:,} Ar",
+            'payment_method': payment.get_payment_method_display(),
+            'status': payment.get_status_display(),
+        }
+
+
+def registration_receipt(user, subscription, payment, plain_password, qr_code=None):
+    """Données d'un ticket d'inscription ; qr_code : image PNG (octets)"""
+    return {
+        'username': user.username,
+        'password': plain_password,
+        'email': user.email or "Non renseigné",
+        'phone_number': user.phone_number,
+        'address': user.address or "Non renseignée",
+        'plan_name': subscription.plan.name,
+        'price': f"{subscription.plan.price:,} Ar",
+        'start_date': _local(subscription.start_date, '%d/%m/%Y'),
+        'end_date': _local(subscription.end_date, '%d/%m/%Y'),
+        'payment_method': payment.get_payment_method_display(),
+        'payment_phone_number': payment.phone_number,
+        'payment_date': _local(payment.created_at, '%d/%m/%Y %H:%M'),
+        'generated_at': _local(timezone.now(), '%d/%m/%Y à %H:%M'),
+        'qr_code': qr_code,
+    }
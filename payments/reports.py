@@ -0,0 +1,410 @@
+"""Rapports lourds (PDF) produits en arrière-plan, hors des workers web.
+
+Une demande de rapport crée un ReportJob, exécuté par un pool de threads du
+processus ou par la tâche Celery payments.tasks.run_report_job
+(REPORT_JOB_BACKEND, comme le traitement des paiements). Le job avance sa
+progression en base ; la page de suivi l'interroge puis propose le
+téléchargement.
+
+Chaque demande porte une empreinte : type, paramètres et état des données
+concernées (paiements du jour ; nombre et dernière modification des
+paiements, abonnements et forfaits pour les statistiques). Une demande
+identique à un job en cours ou terminé le réutilise au lieu d'en lancer un
+nouveau ; dès que les données changent, l'empreinte change. Le document est
+stocké sous MEDIA_ROOT/reports/ au nom du hachage de son contenu : deux jobs
+qui produisent le même document partagent le même fichier.
+
+Un job signale qu'il est en vie (heartbeat_at) à sa mise en file, à son
+démarrage et à chaque progression. Seul un job en cours avec un signe de vie
+récent est réutilisé ; la tâche périodique resume_report_jobs relance ceux
+dont le worker s'est arrêté (REPORT_JOB_STALL_TIMEOUT) et marque en échec
+ceux demandés depuis plus de REPORT_JOB_TIMEOUT.
+"""
+import hashlib
+import io
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import Count, Max
+from django.template.loader import render_to_string
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+
+from subscriptions.daily_statistics import daily_rows, day_bounds
+from subscriptions.models import Plan, Subscription
+from .models import Payment, ReportJob
+from .statistics import get_statistics
+
+logger = logging.getLogger(__name__)
+
+REPORT_JOB_BACKEND = getattr(settings, 'REPORT_JOB_BACKEND', 'local')
+REPORT_JOB_WORKERS = getattr(settings, 'REPORT_JOB_WORKERS', 2)
+REPORT_JOB_TIMEOUT = getattr(settings, 'REPORT_JOB_TIMEOUT', 900)
+REPORT_JOB_STALL_TIMEOUT = getattr(settings, 'REPORT_JOB_STALL_TIMEOUT', 300)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _parse_day(params):
+    return datetime.strptime(params['date'], '%Y-%m-%d').date()
+
+
+def _day_payments(day):
+    start, end = day_bounds(day)
+    return Payment.objects.filter(created_at__gte=start, created_at__lt=end, status='SUCCESS')
+
+
+def render_daily_receipts(params, output, progress):
+    """Reçus des paiements réussis d'un jour (WeasyPrint)"""
+    from weasyprint import HTML
+
+    target_date = _parse_day(params)
+    payments = _day_payments(target_date).select_related('user', 'plan').order_by('created_at')
+
+    # Totaux du jour : table de faits journalière si le jour est matérialisé, sinon calcul
+    day_rows = daily_rows([target_date], ('TOTAL', 'METHOD'))[target_date]
+    total = [row for row in day_rows if row.dimension == 'TOTAL']
+    payment_method_counts = [
+        {'payment_method': row.key, 'count': row.payments_count}
+        for row in day_rows if row.dimension == 'METHOD' and row.payments_count
+    ]
+    progress(10)
+
+    html_string = render_to_string('payments/daily_receipts_pdf.html', {
+        'date': target_date,
+        'payments': payments,
+        'total_amount': total[0].revenue if total else 0,
+        'total_payments_count': total[0].payments_count if total else 0,
+        'payment_method_counts': payment_method_counts,
+        'generation_datetime': timezone.now()
+    })
+    progress(40)
+    HTML(string=html_string).write_pdf(output)
+
+
+def render_payment_statistics(params, output, progress):
+    """Statistiques des paiements : totaux, forfaits, série des 7 derniers jours et graphique"""
+    from matplotlib.figure import Figure
+
+    # Créer le document PDF
+    doc = SimpleDocTemplate(output, pagesize=A4)
+    styles = getSampleStyleSheet()
+    elements = []
+
+    # Style personnalisé pour les titres
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        spaceAfter=30,
+        alignment=1
+    )
+
+    # En-tête
+    elements.append(Paragraph("Statistiques des Paiements", title_style))
+    elements.append(Spacer(1, 20))
+
+    # Statistiques globales
+    stats = get_statistics()
+    progress(30)
+
+    # Tableau des statistiques globales
+    global_data = [
+        ['Statistique', 'Valeur'],
+        ['Nombre total de paiements', f"{stats['total_payments']:,}"],
+        ['Montant total', f"{stats['total_amount']:,} Ar"],
+        ['Nombre d\'abonnements', f"{stats['total_subscriptions']:,}"],
+        ['Montant des abonnements', f"{stats['total_subscription_amount']:,} Ar"]
+    ]
+
+    global_table = Table(global_data, colWidths=[3*inch, 2*inch])
+    global_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 14),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]))
+
+    elements.append(global_table)
+    elements.append(Spacer(1, 30))
+
+    # Tableau des forfaits
+    plan_data = [['Forfait', 'Prix', 'Effectif', 'Montant Total']]
+    for stat in stats['subscription_stats']:
+        plan_data.append([
+            stat['name'],
+            f"{stat['price']:,} Ar",
+            f"{stat['count']:,}",
+            f"{stat['total_amount']:,} Ar"
+        ])
+
+    plan_table = Table(plan_data, colWidths=[2*inch, 1.5*inch, 1.5*inch, 1.5*inch])
+    plan_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 14),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]))
+
+    elements.append(Paragraph("Statistiques par Forfait", styles['Heading2']))
+    elements.append(Spacer(1, 10))
+    elements.append(plan_table)
+    elements.append(Spacer(1, 30))
+
+    # Tableau des statistiques journalières
+    daily_data = [['Date', 'Nombre de Paiements', 'Montant Total']]
+    for stat in stats['daily_stats']:
+        daily_data.append([
+            stat['day'].strftime('%d/%m/%Y'),
+            f"{stat['count']:,}",
+            f"{stat['total_amount']:,} Ar"
+        ])
+
+    daily_table = Table(daily_data, colWidths=[2*inch, 2*inch, 2*inch])
+    daily_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 14),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]))
+
+    elements.append(Paragraph("Statistiques Journalières", styles['Heading2']))
+    elements.append(Spacer(1, 10))
+    elements.append(daily_table)
+
+    # Graphique des montants journaliers (API objet de matplotlib : pas d'état global, utilisable hors du thread principal)
+    buffer = io.BytesIO()
+    figure = Figure(figsize=(8, 4))
+    axes = figure.subplots()
+
+    # Données pour le graphique
+    dates = [stat['day'].strftime('%d/%m/%Y') for stat in stats['daily_stats']]
+    amounts = [float(stat['total_amount']) for stat in stats['daily_stats']]
+
+    # Créer le graphique à barres
+    axes.bar(dates, amounts, color='skyblue')
+    axes.set_title('Montant total par jour')
+    axes.set_xlabel('Date')
+    axes.set_ylabel('Montant (Ar)')
+    axes.tick_params(axis='x', labelrotation=45)
+    figure.tight_layout()
+
+    # Sauvegarder le graphique dans le buffer
+    figure.savefig(buffer, format='png')
+    buffer.seek(0)
+    progress(70)
+
+    # Ajouter le graphique au PDF
+    elements.append(Paragraph("Graphique des montants journaliers", styles['Heading2']))
+    elements.append(Spacer(1, 10))
+    elements.append(Image(buffer, width=6*inch, height=3*inch))
+    elements.append(Spacer(1, 20))
+
+    # Pied de page
+    elements.append(Spacer(1, 30))
+    footer_style = ParagraphStyle(
+        'Footer',
+        parent=styles['Normal'],
+        fontSize=10,
+        alignment=1,
+        spaceBefore=20
+    )
+    elements.append(Paragraph(f"Rapport généré le {timezone.now().strftime('%d/%m/%Y à %H:%M')}", footer_style))
+    elements.append(Paragraph("BestConnect - Votre connexion internet de confiance", footer_style))
+    elements.append(Paragraph("Contact: 0347249715", footer_style))
+
+    # Générer le PDF
+    doc.build(elements)
+
+
+def _daily_receipts_fingerprint(params):
+    # Paiements réussis du jour : nombre et dernière modification (index created_at)
+    state = _day_payments(_parse_day(params)).aggregate(count=Count('id'), updated=Max('updated_at'))
+    return [state['count'], state['updated'].isoformat() if state['updated'] else None]
+
+
+def _statistics_fingerprint(params):
+    # Nombre et dernière modification des paiements, abonnements et forfaits lus en base (partagé entre
+    # processus, contrairement à la version en cache ; index updated_at) et jour courant (fenêtre des 7 jours)
+    fingerprint = []
+    for model in (Payment, Subscription, Plan):
+        state = model.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+        fingerprint += [state['count'], state['updated'].isoformat() if state['updated'] else None]
+    return fingerprint + [timezone.localdate().isoformat()]
+
+
+# Type de rapport : (rendu, empreinte des données, nom du fichier téléchargé)
+REPORTS = {
+    'DAILY_RECEIPTS': (
+        render_daily_receipts, _daily_receipts_fingerprint,
+        lambda params: f"reçus_paiement_{params['date']}.pdf",
+    ),
+    'PAYMENT_STATISTICS': (
+        render_payment_statistics, _statistics_fingerprint,
+        lambda params: f"statistiques_paiements_{timezone.localdate():%Y-%m-%d}.pdf",
+    ),
+}
+
+
+def report_key(kind, params):
+    _, fingerprint, _ = REPORTS[kind]
+    payload = json.dumps([kind, params, fingerprint(params)], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def find_report(kind, params):
+    """Job réutilisable pour cette demande : terminé (fichier présent) ou en cours avec un signe de vie récent"""
+    key = report_key(kind, params)
+    stale = timezone.now() - timedelta(seconds=REPORT_JOB_STALL_TIMEOUT)
+    for job in ReportJob.objects.filter(key=key, status__in=('PENDING', 'RUNNING', 'SUCCESS')).order_by('-created_at'):
+        if job.status == 'SUCCESS':
+            if job.file and default_storage.exists(job.file.name):
+                return key, job
+        elif job.heartbeat_at >= stale:
+            return key, job
+    return key, None
+
+
+def request_report(kind, params, user=None):
+    """Job du rapport demandé, existant ou nouvellement mis en file ; retourne (job, créé)"""
+    key, job = find_report(kind, params)
+    if job:
+        return job, False
+    job = ReportJob.objects.create(
+        kind=kind, params=params, key=key, filename=REPORTS[kind][2](params),
+        requested_by=user if user and user.is_authenticated else None
+    )
+    transaction.on_commit(lambda: dispatch_report(job.id))
+    logger.info(f"Rapport {job.id} ({kind} {params}) mis en file")
+    return job, True
+
+
+def _store(data):
+    """Enregistre le document sous le hachage de son contenu ; retourne (chemin, hachage)"""
+    content_hash = hashlib.sha256(data).hexdigest()
+    name = f"reports/{content_hash[:2]}/{content_hash}.pdf"
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    return name, content_hash
+
+
+def run_report(job_id):
+    """Produit le document d'un job en attente (sans effet si un autre worker l'a déjà pris)"""
+    now = timezone.now()
+    if not ReportJob.objects.filter(id=job_id, status='PENDING').update(
+        status='RUNNING', started_at=now, heartbeat_at=now, progress=0
+    ):
+        return
+    job = ReportJob.objects.get(id=job_id)
+    render, _, _ = REPORTS[job.kind]
+
+    def progress(percent):
+        ReportJob.objects.filter(id=job_id).update(progress=percent, heartbeat_at=timezone.now())
+
+    try:
+        output = io.BytesIO()
+        render(job.params, output, progress)
+        name, content_hash = _store(output.getvalue())
+    except Exception as e:
+        logger.exception(f"Rapport {job_id} ({job.kind}) en échec")
+        ReportJob.objects.filter(id=job_id).update(
+            status='FAILED', message=str(e)[:255], finished_at=timezone.now()
+        )
+        return
+    ReportJob.objects.filter(id=job_id).update(
+        status='SUCCESS', progress=100, file=name, content_hash=content_hash, finished_at=timezone.now()
+    )
+    logger.info(f"Rapport {job_id} ({job.kind}) terminé en {(timezone.now() - now).total_seconds():.1f} s")
+
+
+def _run_in_pool(job_id):
+    try:
+        run_report(job_id)
+    finally:
+        connections.close_all()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=REPORT_JOB_WORKERS, thread_name_prefix='reports')
+        return _pool
+
+
+def dispatch_report(job_id):
+    if REPORT_JOB_BACKEND == 'celery':
+        from .tasks import run_report_job
+        run_report_job.delay(job_id)
+    else:
+        _get_pool().submit(_run_in_pool, job_id)
+
+
+def resume_stalled_reports():
+    """Relance les jobs sans signe de vie depuis REPORT_JOB_STALL_TIMEOUT (worker arrêté en cours de rendu).
+
+    Un job demandé depuis plus de REPORT_JOB_TIMEOUT est marqué en échec au
+    lieu d'être relancé : la demande suivante en crée un nouveau.
+    """
+    now = timezone.now()
+    stalled = ReportJob.objects.filter(
+        status__in=('PENDING', 'RUNNING'), heartbeat_at__lt=now - timedelta(seconds=REPORT_JOB_STALL_TIMEOUT)
+    )
+    expired = now - timedelta(seconds=REPORT_JOB_TIMEOUT)
+    failed = stalled.filter(created_at__lt=expired).update(
+        status='FAILED', message='Interrompu (aucune progression)', finished_at=now
+    )
+
+    resumed = []
+    for job_id, status, heartbeat_at in stalled.filter(created_at__gte=expired).values_list(
+        'id', 'status', 'heartbeat_at'
+    ):
+        # Mise à jour conditionnelle : un seul balayage relance le job, et pas s'il a repris entre-temps
+        if ReportJob.objects.filter(id=job_id, status=status, heartbeat_at=heartbeat_at).update(
+            status='PENDING', heartbeat_at=now, progress=0
+        ):
+            dispatch_report(job_id)
+            resumed.append(job_id)
+
+    if resumed or failed:
+        logger.warning(f"Rapports interrompus : {len(resumed)} relancé(s), {failed} marqué(s) en échec")
+    return {'resumed': len(resumed), 'failed': failed}
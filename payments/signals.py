@@ -0,0 +1,29 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from subscriptions.daily_statistics import refresh_day
+from subscriptions.models import Plan, Subscription
+from .models import Payment
+from .statistics import invalidate_statistics
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+@receiver(post_save, sender=Plan)
+@receiver(post_delete, sender=Plan)
+def invalidate_payment_statistics(sender, **kwargs):
+    """Les statistiques en cache sont recalculées après validation de l'écriture"""
+    transaction.on_commit(invalidate_statistics)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def refresh_daily_statistics(sender, instance, **kwargs):
+    """Un paiement d'un jour déjà matérialisé modifié après coup : ce jour est recalculé"""
+    day = timezone.localtime(instance.created_at).date()
+    if day < timezone.localdate():
+        transaction.on_commit(lambda: refresh_day(day))
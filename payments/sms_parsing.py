@@ -0,0 +1,159 @@
+"""Analyse des SMS de confirmation de paiement Mobile Money.
+
+Les modèles de messages de chaque opérateur sont décrits dans
+operator_templates.json (identifiants d'expéditeur, préfixes téléphoniques,
+expressions régulières à groupes nommés amount / phone / reference). Ils sont
+compilés une seule fois ; l'identifiant d'expéditeur du SMS permet de ne
+tester que les modèles de l'opérateur concerné. Ajouter un opérateur ne
+demande qu'une entrée dans le fichier de modèles.
+
+Module sans dépendance à Django : il est aussi utilisé par sms_reader.py.
+"""
+import json
+import os
+import re
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+DEFAULT_TEMPLATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'operator_templates.json')
+
+PATTERN_FLAGS = re.IGNORECASE | re.DOTALL
+COUNTRY_CODE = '261'
+
+NON_DIGITS = re.compile(r'\D')
+SENDER_SEPARATORS = re.compile(r'[\s_\-]')
+
+
+def normalize_amount(value):
+    """Montant en Decimal : '1 000', '1.000', '1,000.50', '2 500,00' ..."""
+    cleaned = ''.join(value.split()).rstrip('.,')
+    if ',' in cleaned and '.' in cleaned:
+        # Le dernier séparateur rencontré est le séparateur décimal
+        decimal_sep = ',' if cleaned.rfind(',') > cleaned.rfind('.') else '.'
+        thousands_sep = '.' if decimal_sep == ',' else ','
+        cleaned = cleaned.replace(thousands_sep, '').replace(decimal_sep, '.')
+    elif ',' in cleaned or '.' in cleaned:
+        sep = ',' if ',' in cleaned else '.'
+        integer, _, fraction = cleaned.rpartition(sep)
+        if cleaned.count(sep) == 1 and len(fraction) in (1, 2):
+            cleaned = f"{integer}.{fraction}"
+        else:
+            # Séparateur de milliers (1.000, 1,000,000)
+            cleaned = cleaned.replace(sep, '')
+    try:
+        return Decimal(cleaned)
+    except InvalidOperation:
+        raise ValueError(f"Montant invalide: {value}")
+
+
+def normalize_phone(value):
+    """Numéro au format national 03XXXXXXXX (+261 34 ..., 26134..., 34...)"""
+    digits = value if value.isdigit() else NON_DIGITS.sub('', value)
+    if digits.startswith(COUNTRY_CODE) and len(digits) == len(COUNTRY_CODE) + 9:
+        digits = digits[len(COUNTRY_CODE):]
+    if len(digits) == 9:
+        digits = '0' + digits
+    return digits
+
+
+def _sender_key(sender):
+    return SENDER_SEPARATORS.sub('', sender or '').upper()
+
+
+class OperatorTemplate:
+    def __init__(self, name, patterns, senders=(), prefixes=(), fragments=None):
+        self.name = name
+        self.senders = list(senders)
+        self.prefixes = list(prefixes)
+        self.patterns = [re.compile(self._expand(pattern, fragments or {}), PATTERN_FLAGS) for pattern in patterns]
+
+    @staticmethod
+    def _expand(pattern, fragments):
+        for key, fragment in fragments.items():
+            pattern = pattern.replace('{{%s}}' % key, fragment)
+        return pattern
+
+    def match(self, message):
+        """Champs bruts du premier modèle reconnu (None si aucun)"""
+        for pattern in self.patterns:
+            match = pattern.search(message)
+            if match:
+                return match.groupdict()
+        return None
+
+
+class SMSParserRegistry:
+    def __init__(self, templates=()):
+        self.templates = []
+        self._by_sender = {}
+        for template in templates:
+            self.register(template)
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_TEMPLATES_PATH):
+        """Charge et compile les modèles d'opérateurs d'un fichier JSON"""
+        with open(path, encoding='utf-8') as handle:
+            data = json.load(handle)
+        fragments = data.get('fragments', {})
+        return cls(
+            OperatorTemplate(
+                entry['name'], entry['patterns'],
+                senders=entry.get('senders', ()),
+                prefixes=entry.get('prefixes', ()),
+                fragments=fragments
+            )
+            for entry in data['operators']
+        )
+
+    def register(self, template):
+        self.templates.append(template)
+        for sender in template.senders:
+            self._by_sender[_sender_key(sender)] = template
+            self._by_sender[sender] = template
+
+    def template_for_sender(self, sender):
+        # Correspondance exacte d'abord, puis identifiant normalisé (« Orange Money », « ORANGE_MONEY »...)
+        return self._by_sender.get(sender) or self._by_sender.get(_sender_key(sender))
+
+    def is_operator_sender(self, sender):
+        return self.template_for_sender(sender) is not None
+
+    def operator_for_phone(self, phone):
+        """Opérateur d'un numéro d'après son préfixe (032/037 Orange, 033 Airtel, 034/038 Telma)"""
+        phone = normalize_phone(phone)
+        for template in self.templates:
+            if any(phone.startswith(prefix) for prefix in template.prefixes):
+                return template.name
+        return None
+
+    def parse(self, message, sender=None):
+        """Analyse un SMS de paiement ; seuls les modèles de l'expéditeur sont testés s'il est connu"""
+        template = self.template_for_sender(sender) if sender else None
+        candidates = [template] if template else self.templates
+
+        for candidate in candidates:
+            fields = candidate.match(message)
+            if not fields:
+                continue
+            try:
+                amount = normalize_amount(fields['amount'])
+            except ValueError:
+                continue
+            return {
+                'amount': amount,
+                'phone': normalize_phone(fields['phone']),
+                'reference': fields['reference'].strip('.-'),
+                'operator': candidate.name,
+                'message': message
+            }
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_registry(path=DEFAULT_TEMPLATES_PATH):
+    """Registre compilé, partagé par le processus"""
+    return SMSParserRegistry.from_file(path)
+
+
+def parse_payment_sms(message, sender=None):
+    return get_registry().parse(message, sender)
@@ -0,0 +1,184 @@
+"""Statistiques des paiements (admin, export PDF, graphiques).
+
+Le calcul tient en un nombre fixe de requêtes quel que soit le nombre de
+forfaits : forfaits avec leur dernier paiement réussi (sous-requête servie
+par l'index), abonnements actifs groupés par forfait. Les montants par forfait,
+la série des 7 derniers jours et la répartition par mode de paiement sont lus
+dans la table de faits journalière (subscriptions.daily_statistics), seule la
+journée en cours étant calculée à partir des paiements.
+
+Le résultat est mis en cache sous une clé versionnée : toute écriture d'un
+paiement, d'un abonnement ou d'un forfait incrémente la version (voir
+signals.py), les lecteurs suivants recalculent. La durée de vie du cache borne
+le retard pour les écritures qui échappent aux signaux (QuerySet.update) et
+fait glisser la fenêtre des 7 jours.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, OuterRef, Subquery
+from django.utils import timezone
+
+from subscriptions.daily_statistics import daily_rows, plan_revenue_totals
+
+logger = logging.getLogger(__name__)
+
+STATISTICS_CACHE_TIMEOUT = getattr(settings, 'STATISTICS_CACHE_TIMEOUT', 300)
+
+VERSION_KEY = 'payments:statistics:version'
+
+
+def _cache_key(version):
+    return f'payments:statistics:v{version}'
+
+
+def _current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def invalidate_statistics():
+    """Rend obsolètes les statistiques en cache"""
+    cache.add(VERSION_KEY, 1, None)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Clé évincée entre-temps : repartir d'une version neuve
+        cache.set(VERSION_KEY, 1, None)
+
+
+def _plan_statistics():
+    from subscriptions.models import Plan, Subscription
+    from .models import Payment
+
+    successful = Payment.objects.filter(status='SUCCESS')
+    # Dernier paiement réussi de chaque forfait : une recherche dans l'index (status, plan, created_at) par forfait
+    plans = Plan.objects.annotate(
+        last_payment_id=Subquery(
+            successful.filter(plan=OuterRef('pk')).order_by('-created_at').values('id')[:1]
+        )
+    ).order_by('id').values('id', 'name', 'price', 'last_payment_id')
+
+    active = dict(
+        Subscription.objects.filter(is_active=True).values('plan').annotate(
+            count=Count('id')
+        ).order_by().values_list('plan', 'count')
+    )
+    totals = plan_revenue_totals()
+
+    subscription_stats = []
+    for plan in plans:
+        subscription_stats.append({
+            'id': plan['id'],
+            'name': plan['name'],
+            'price': plan['price'],
+            'count': active.get(plan['id'], 0),
+            'total_amount': totals.get(plan['id'], 0),
+            'payment_id': plan['last_payment_id'],
+        })
+    return subscription_stats
+
+
+def _default_plan_statistics():
+    """Crée un forfait de test lorsqu'aucun forfait n'existe"""
+    from subscriptions.models import Plan
+
+    logger.info("Aucun forfait trouvé, création d'un forfait par défaut")
+    try:
+        default_plan = Plan.objects.create(
+            name="Forfait Test",
+            price=10000,
+            description="Forfait de test",
+            duration=30,
+            duration_unit='DAYS'
+        )
+    except Exception as e:
+        logger.error(f"Erreur lors de la création du forfait par défaut : {str(e)}")
+        return []
+    logger.info(f"Forfait par défaut créé : {default_plan.name}")
+    return [{
+        'id': default_plan.id,
+        'name': default_plan.name,
+        'price': default_plan.price,
+        'count': 0,
+        'total_amount': 0,
+        'payment_id': None
+    }]
+
+
+def _last_days():
+    today = timezone.localdate()
+    return [today - timedelta(days=offset) for offset in range(6, -1, -1)]
+
+
+def _daily_statistics(rows, days):
+    """Nombre et montant des paiements réussis de chaque jour, jours sans paiement compris"""
+    complete_daily_stats = []
+    for day in days:
+        total = [row for row in rows.get(day, []) if row.dimension == 'TOTAL']
+        complete_daily_stats.append({
+            'day': day,
+            'count': total[0].payments_count if total else 0,
+            'total_amount': float(total[0].revenue) if total else 0
+        })
+    return complete_daily_stats
+
+
+def _payment_mode_statistics(rows):
+    """Paiements réussis par mode de paiement sur la période"""
+    from .models import Payment
+
+    counts = defaultdict(int)
+    amounts = defaultdict(float)
+    for day_rows in rows.values():
+        for row in day_rows:
+            if row.dimension == 'METHOD':
+                counts[row.key] += row.payments_count
+                amounts[row.key] += float(row.revenue)
+    return [
+        {'method': method, 'name': name, 'count': counts[method], 'total_amount': amounts[method]}
+        for method, name in Payment.PAYMENT_METHOD_CHOICES
+    ]
+
+
+def compute_statistics():
+    try:
+        subscription_stats = _plan_statistics()
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération des forfaits : {str(e)}")
+        subscription_stats = []
+    if not subscription_stats:
+        subscription_stats = _default_plan_statistics()
+
+    days = _last_days()
+    try:
+        rows = daily_rows(days, ('TOTAL', 'METHOD'))
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération des statistiques journalières : {str(e)}")
+        rows = {}
+    daily_stats = _daily_statistics(rows, days)
+    return {
+        'subscription_stats': subscription_stats,
+        'daily_stats': daily_stats,
+        'payment_mode_stats': _payment_mode_statistics(rows),
+        'total_subscriptions': sum(stat['count'] for stat in subscription_stats),
+        'total_subscription_amount': sum(stat['total_amount'] or 0 for stat in subscription_stats),
+        'total_payments': sum(day['count'] for day in daily_stats),
+        'total_amount': sum(day['total_amount'] for day in daily_stats)
+    }
+
+
+def get_statistics():
+    """Statistiques des paiements, servies depuis le cache tant qu'aucune écriture ne les a rendues obsolètes"""
+    key = _cache_key(_current_version())
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_statistics()
+        cache.set(key, stats, STATISTICS_CACHE_TIMEOUT)
+    return stats
@@ -0,0 +1,32 @@
+from celery import shared_task
+
+from .fulfillment import resume_stalled_fulfillments, run_fulfillment, FULFILLMENT_RETRY_DELAY
+
+
+@shared_task(bind=True, max_retries=5)
+def fulfill_payment(self, payment_id):
+    """Identifiants WiFi, QR code et envoi au client pour un paiement confirmé (étapes idempotentes)"""
+    try:
+        run_fulfillment(payment_id, retries=0)
+    except Exception as e:
+        raise self.retry(exc=e, countdown=FULFILLMENT_RETRY_DELAY * 2 ** self.request.retries)
+
+
+@shared_task
+def resume_fulfillments():
+    """Relance les paiements confirmés dont le traitement n'a pas abouti"""
+    return resume_stalled_fulfillments()
+
+
+@shared_task
+def run_report_job(job_id):
+    """Produit le document d'un rapport mis en file (voir payments.reports)"""
+    from .reports import run_report
+    run_report(job_id)
+
+
+@shared_task
+def resume_report_jobs():
+    """Relance les rapports dont le rendu a été interrompu (voir payments.reports)"""
+    from .reports import resume_stalled_reports
+    return resume_stalled_reports()
@@ -14,11 +14,16 @@ urlpatterns = [
     path('<int:payment_id>/print/', views.print_receipt, name='print_receipt'),
     path('daily-receipts/<str:date>/', views.print_daily_receipts_pdf, name='daily_receipts_pdf'),
     path('daily-receipts-redirect/', views.daily_receipts_redirect_view, name='daily_receipts_redirect'),
+    path('reports/<int:job_id>/', views.report_job, name='report_job'),
+    path('reports/<int:job_id>/status/', views.report_job_status, name='report_job_status'),
+    path('reports/<int:job_id>/download/', views.report_job_download, name='report_job_download'),
     
     # Nouvelles API pour SMS
     path('api/initiate-sms-payment/', views.initiate_sms_payment, name='initiate_sms_payment'),
     path('api/check-payment-status/<int:transaction_id>/', views.check_payment_status, name='check_payment_status'),
+    path('api/wait-payment-status/<int:transaction_id>/', views.wait_payment_status, name='wait_payment_status'),
     path('api/process-sms-webhook/', views.process_sms_webhook, name='process_sms_webhook'),
+    path('api/fulfillment-metrics/', views.fulfillment_metrics, name='fulfillment_metrics'),
     
     path('api/', include(router.urls)),
 ]
\ No newline at end of file
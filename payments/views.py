@@ -1,19 +1,25 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from django.utils import timezone
 from datetime import timedelta
 import hashlib
 import uuid  # Ajout manquant
-from .models import Payment, SMSTransaction  # Ajout de SMSTransaction
+from .models import Payment, ReportJob, SMSTransaction  # Ajout de SMSTransaction
+from .fulfillment import get_metrics as get_fulfillment_metrics
+from .matching import confirm_payment
+from .notifications import PAYMENT_STATUS_LONG_POLL_TIMEOUT, status_payload, wait_for_status
+from .reports import request_report
+from .sms_parsing import normalize_phone
 from .serializers import PaymentSerializer
 from portal.models import WiFiCredentials
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.admin.views.decorators import staff_member_required
-from django.template.loader import render_to_string
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt  # Ajout manquant
+from django.views.decorators.http import require_GET
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
@@ -23,13 +29,10 @@ from reportlab.lib.units import inch
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from subscriptions.models import Plan
-from weasyprint import HTML
 import tempfile
 import os
 from django.db.models.functions import TruncDate
 from datetime import datetime
-from django.db import models
-from django.db.models import Count, Sum
 
 class PaymentViewSet(viewsets.ModelViewSet):
     queryset = Payment.objects.all()
@@ -146,58 +149,54 @@ def payment_detail(request, payment_id):
 @staff_member_required
 def daily_receipts_redirect_view(request):
     """Vue de redirection pour les reçus quotidiens"""
-    from django.shortcuts import redirect
-    from datetime import date
-    
     # Récupérer la date depuis les paramètres GET ou utiliser aujourd'hui
-    date_param = request.GET.get('date')
-    if date_param:
-        return redirect('payments:daily_receipts_pdf', date=date_param)
-    else:
-        today = date.today().strftime('%Y-%m-%d')
-        return redirect('payments:daily_receipts_pdf', date=today)
+    date_param = request.GET.get('date') or timezone.localdate().strftime('%Y-%m-%d')
+    return redirect('payments:daily_receipts_pdf', date=date_param)
 
 @staff_member_required
 def print_daily_receipts_pdf(request, date):
+    """Reçus du jour : document déjà produit pour ces paiements, sinon rapport mis en file et page de suivi"""
     try:
-        # Convertir la date string en objet date
+        # Valider la date
         target_date = datetime.strptime(date, '%Y-%m-%d').date()
     except ValueError:
         return HttpResponse("Date invalide", status=400)
 
-    # Filtrer les paiements pour la date cible
-    payments = Payment.objects.filter(
-        created_at__date=target_date,
-        status='SUCCESS' # Afficher uniquement les paiements réussis
-    ).order_by('created_at')
+    job, _ = request_report('DAILY_RECEIPTS', {'date': target_date.strftime('%Y-%m-%d')}, request.user)
+    if job.status == 'SUCCESS':
+        return _report_file_response(job)
+    return redirect('payments:report_job', job_id=job.id)
 
-    # Calculer le total pour cette date
-    total_amount = payments.aggregate(total=models.Sum('amount'))['total'] or 0
-    total_payments_count = payments.count()
-    
-    # Calculer l'effectif par mode de paiement
-    payment_method_counts = payments.values('payment_method').annotate(count=Count('id'))
+def _report_file_response(job):
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.filename,
+                        content_type='application/pdf')
 
-    # Contexte pour le template
-    context = {
-        'date': target_date,
-        'payments': payments,
-        'total_amount': total_amount,
-        'total_payments_count': total_payments_count,
-        'payment_method_counts': payment_method_counts, # Ajouter les statistiques par mode de paiement
-        'generation_datetime': timezone.now() # Ajouter la date et l'heure de génération
+def _report_job_payload(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress': job.progress,
+        'message': job.message,
+        'download_url': reverse('payments:report_job_download', args=[job.id]) if job.status == 'SUCCESS' else None,
     }
 
-    # Rendre le template HTML
-    html_string = render_to_string('payments/daily_receipts_pdf.html', context)
+@staff_member_required
+def report_job(request, job_id):
+    """Page de suivi d'un rapport : progression rafraîchie jusqu'au lien de téléchargement"""
+    job = get_object_or_404(ReportJob, id=job_id)
+    return render(request, 'payments/report_job.html', {'job': job, 'payload': _report_job_payload(job)})
 
-    # Générer le PDF avec WeasyPrint
-    html = HTML(string=html_string, base_url=request.build_absolute_uri())
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="reçus_paiement_{target_date.strftime('%Y-%m-%d')}.pdf"'
-    html.write_pdf(response)
+@staff_member_required
+def report_job_status(request, job_id):
+    job = get_object_or_404(ReportJob, id=job_id)
+    return JsonResponse(_report_job_payload(job))
 
-    return response
+@staff_member_required
+def report_job_download(request, job_id):
+    job = get_object_or_404(ReportJob, id=job_id, status='SUCCESS')
+    return _report_file_response(job)
 
 
 # Ajouter ces nouvelles vues API
@@ -212,9 +211,9 @@ def initiate_sms_payment(request):
         
         plan = get_object_or_404(Plan, id=plan_id, is_active=True)
         
-        # Créer une transaction SMS en attente
+        # Créer une transaction SMS en attente (numéro au format national pour le rapprochement)
         sms_transaction = SMSTransaction.objects.create(
-            phone_number=phone_number,
+            phone_number=normalize_phone(phone_number or '') or phone_number,
             amount=plan.price,
             plan=plan,
             reference=f"REF{uuid.uuid4().hex[:8].upper()}",
@@ -237,36 +236,40 @@ def initiate_sms_payment(request):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def check_payment_status(request, transaction_id):
-    """Vérifier le statut d'une transaction - polling depuis React"""
+    """Vérifier le statut d'une transaction - polling depuis React (intervalle conseillé : poll_interval)"""
     try:
-        transaction = get_object_or_404(SMSTransaction, id=transaction_id)
-        
-        if transaction.is_expired():
-            transaction.status = 'EXPIRED'
-            transaction.save()
-            
-        response_data = {
-            'status': transaction.status,
-            'reference': transaction.reference
-        }
-        
-        # Si confirmé, retourner les credentials WiFi
-        if transaction.status == 'CONFIRMED' and transaction.payment:
-            credentials = transaction.payment.wificredentials
-            response_data.update({
-                'wifi_credentials': {
-                    'username': credentials.username,
-                    'password': credentials.password,
-                    'qr_code': credentials.get_qr_code_base64(),
-                    'expires_at': credentials.expires_at.isoformat()
-                }
-            })
-            
-        return Response(response_data)
+        status, payload = status_payload(transaction_id)
+        if status is None:
+            return Response({'error': 'Transaction introuvable'}, status=404)
+        return Response(payload)
         
     except Exception as e:
         return Response({'error': str(e)}, status=400)
 
+@require_GET
+async def wait_payment_status(request, transaction_id):
+    """Long-poll : répond dès que le statut diffère de ?status= (PENDING par défaut) ou à l'expiration du délai.
+
+    Statuts : PENDING, PROCESSING (paiement reçu, identifiants en préparation), CONFIRMED, EXPIRED, FAILED.
+    Vue asynchrone : sous ASGI, l'attente n'occupe pas de worker.
+    """
+    known_status = request.GET.get('status', 'PENDING')
+    try:
+        timeout = min(float(request.GET.get('timeout', PAYMENT_STATUS_LONG_POLL_TIMEOUT)), PAYMENT_STATUS_LONG_POLL_TIMEOUT)
+    except ValueError:
+        timeout = PAYMENT_STATUS_LONG_POLL_TIMEOUT
+    
+    payload = await wait_for_status(transaction_id, known_status, max(timeout, 0))
+    if payload is None:
+        return JsonResponse({'error': 'Transaction introuvable'}, status=404)
+    return JsonResponse(payload)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def fulfillment_metrics(request):
+    """Durées et échecs des étapes de traitement des paiements confirmés"""
+    return Response(get_fulfillment_metrics())
+
 @api_view(['POST'])
 @csrf_exempt
 def process_sms_webhook(request):
@@ -274,44 +277,19 @@ def process_sms_webhook(request):
     try:
         # Données du SMS reçu par le modem
         sms_data = request.data
-        reference = sms_data.get('reference')
-        phone_number = sms_data.get('phone_number')
-        amount = sms_data.get('amount')
         
-        # Trouver la transaction correspondante
-        transaction = SMSTransaction.objects.get(
-            reference=reference,
-            phone_number=phone_number,
-            status='PENDING'
+        # Transaction en attente la plus ancienne correspondant au paiement, réclamée atomiquement
+        sms_transaction = confirm_payment(
+            sms_data.get('phone_number'),
+            sms_data.get('amount'),
+            reference=sms_data.get('reference'),
+            operator_message=sms_data.get('operator_message', '')
         )
         
-        if not transaction.is_expired() and float(amount) == float(transaction.amount):
-            # Créer le paiement
-            payment = Payment.objects.create(
-                user_id=1,  # Utilisateur anonyme ou système
-                plan=transaction.plan,
-                amount=transaction.amount,
-                payment_method='MOBILE_MONEY',
-                phone_number=transaction.phone_number,
-                status='SUCCESS'
-            )
-            
-            # Générer les credentials WiFi
-            credentials = WiFiCredentials.objects.create(
-                payment=payment,
-                expires_at=timezone.now() + timedelta(days=transaction.plan.get_duration_in_days())
-            )
-            
-            # Mettre à jour la transaction
-            transaction.status = 'CONFIRMED'
-            transaction.payment = payment
-            transaction.save()
-            
-            return Response({'success': True})
-        else:
-            transaction.status = 'FAILED'
-            transaction.save()
+        if sms_transaction is None:
             return Response({'error': 'Transaction invalide'}, status=400)
+        
+        return Response({'success': True, 'reference': sms_transaction.reference})
             
     except Exception as e:
         return Response({'error': str(e)}, status=400)
\ No newline at end of file
@@ -0,0 +1,29 @@
+"""Incréments groupés de compteurs (une requête UPDATE par lot de lignes).
+
+Même requête que F(champ) + Case(When(id=..., then=...)) mais écrite
+directement : au-delà de quelques centaines de lignes par relevé, la
+construction des expressions de l'ORM coûte bien plus que leur exécution.
+"""
+from django.db import connections, router
+
+
+def increment(model, totals, fields, batch_size=1000):
+    """Ajoute totals[pk][i] au champ fields[i] de chaque ligne : totals = {pk: (valeur, ...)}"""
+    if not totals:
+        return
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    table, pk = quote(model._meta.db_table), quote(model._meta.pk.column)
+    columns = [quote(model._meta.get_field(field).column) for field in fields]
+    ids = list(totals)
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            whens = ' '.join(['WHEN %s THEN %s'] * len(chunk))
+            assignments = ', '.join(f'{column} = {column} + CASE {pk} {whens} ELSE 0 END' for column in columns)
+            params = [value for position in range(len(columns))
+                      for row_id in chunk for value in (row_id, totals[row_id][position])]
+            cursor.execute(
+                f"UPDATE {table} SET {assignments} WHERE {pk} IN ({', '.join(['%s'] * len(chunk))})",
+                params + chunk
+            )
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wificredentials',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -2,10 +2,8 @@ from django.db import models
 from django.conf import settings
 from django.utils.crypto import get_random_string
 from django.utils import timezone
-import qrcode
-from io import BytesIO
-from django.core.files import File
-import base64
+
+from . import qr
 
 class WiFiCredentials(models.Model):
     class Meta:
@@ -18,8 +16,10 @@ class WiFiCredentials(models.Model):
     expires_at = models.DateTimeField()
     payment = models.OneToOneField('payments.Payment', on_delete=models.CASCADE, related_name='wificredentials', null=True, blank=True)
     qr_code = models.ImageField(upload_to='qr_codes/', null=True, blank=True)
+    # Envoi des identifiants au client (une seule fois)
+    delivered_at = models.DateTimeField(null=True, blank=True)
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, with_qr=True, **kwargs):
         if not self.username:
             self.username = f"user_{get_random_string(8)}"
         if not self.password:
@@ -27,37 +27,24 @@ class WiFiCredentials(models.Model):
         if not self.expires_at:
             self.expires_at = timezone.now() + timezone.timedelta(days=30)
         super().save(*args, **kwargs)
-        self.generate_qr_code()
+        # with_qr=False : le QR code est généré plus tard (pipeline de traitement des paiements)
+        if with_qr:
+            self.generate_qr_code()
+
+    def get_wifi_config(self):
+        """Contenu du QR code de connexion au réseau"""
+        return f"WIFI:T:WPA;S:BestConnect;P:{self.password};;"
 
     def generate_qr_code(self):
         if not self.qr_code:
-            # Créer le contenu du QR code
-            wifi_config = f"WIFI:T:WPA;S:BestConnect;P:{self.password};;"
-            
-            # Générer le QR code
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(wifi_config)
-            qr.make(fit=True)
-
-            # Créer l'image
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            # Sauvegarder l'image
-            buffer = BytesIO()
-            img.save(buffer, format='PNG')
-            filename = f'qr_code_{self.username}.png'
-            self.qr_code.save(filename, File(buffer), save=False)
-            self.save()
+            # Fichier partagé, nommé d'après l'empreinte de son contenu
+            self.qr_code.name = qr.save_file(self.get_wifi_config())
+            self.save(update_fields=['qr_code'], with_qr=False)
 
     def get_qr_code_base64(self):
         if self.qr_code:
-            with open(self.qr_code.path, 'rb') as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
+            # Servi depuis le cache mémoire du service QR, sans relire le fichier
+            return qr.get_base64(self.get_wifi_config())
         return None
 
     def __str__(self):
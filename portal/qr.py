@@ -0,0 +1,157 @@
+"""Service commun de génération des QR codes.
+
+Une image est identifiée par l'empreinte de son contenu et de ses paramètres
+de rendu : un même contenu n'est rendu et écrit qu'une fois, sous
+qr_codes/<empreinte>.png. Les PNG récemment utilisés sont gardés en mémoire
+(LRU) ; base64, tampons pour les PDF et fichiers sont servis sans relire le
+disque. Les fichiers sont partagés entre enregistrements et ne doivent donc
+jamais être supprimés avec l'un d'eux.
+"""
+import base64
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import partial
+from io import BytesIO
+
+import qrcode
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+QR_CACHE_SIZE = getattr(settings, 'QR_CACHE_SIZE', 512)
+QR_DIRECTORY = 'qr_codes'
+
+_KEY_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+
+
+class _LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_cache = _LRUCache(QR_CACHE_SIZE)
+
+
+def qr_key(data, box_size=10, border=4, fill_color='black', back_color='white'):
+    """Empreinte du contenu et des paramètres de rendu"""
+    payload = f'{box_size}|{border}|{fill_color}|{back_color}|{data}'
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def file_name(key):
+    return f'{QR_DIRECTORY}/{key}.png'
+
+
+def _render(data, box_size, border, fill_color, back_color):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color=fill_color, back_color=back_color)
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def get_png(data, box_size=10, border=4, fill_color='black', back_color='white'):
+    """PNG du QR code : mémoire, puis fichier déjà écrit, puis rendu"""
+    key = qr_key(data, box_size, border, fill_color, back_color)
+    png = _cache.get(key)
+    if png is None:
+        name = file_name(key)
+        if default_storage.exists(name):
+            with default_storage.open(name, 'rb') as handle:
+                png = handle.read()
+        else:
+            png = _render(data, box_size, border, fill_color, back_color)
+        _cache.put(key, png)
+    return png
+
+
+def get_base64(data, **style):
+    return base64.b64encode(get_png(data, **style)).decode('utf-8')
+
+
+def get_buffer(data, **style):
+    """Tampon PNG (ReportLab ImageReader, platypus Image...)"""
+    return BytesIO(get_png(data, **style))
+
+
+def save_file(data, **style):
+    """Écrit le PNG sous son empreinte s'il n'existe pas et retourne le nom à affecter à un ImageField"""
+    name = file_name(qr_key(data, **style))
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, ContentFile(get_png(data, **style)))
+        if saved != name:
+            # Écrit en parallèle par un autre processus : contenu identique, la copie est inutile
+            default_storage.delete(saved)
+    return name
+
+
+def _render_style(data, box_size=10, border=4, fill_color='black', back_color='white'):
+    return _render(data, box_size, border, fill_color, back_color)
+
+
+def save_files(contents, executor=None, **style):
+    """save_file pour un lot de contenus ; retourne les (nom, PNG) dans l'ordre des contenus.
+
+    Les PNG absents du disque sont rendus par executor (pool de processus) s'il est fourni. Ils ne
+    passent pas par le cache mémoire, qu'un lot de milliers d'images viderait.
+    """
+    names = [file_name(qr_key(data, **style)) for data in contents]
+    missing = [data for data, name in zip(contents, names) if not default_storage.exists(name)]
+    render = partial(_render_style, **style)
+    rendered = dict(zip(missing, executor.map(render, missing, chunksize=32) if executor else map(render, missing)))
+    files = []
+    for data, name in zip(contents, names):
+        png = rendered.get(data)
+        if png is None:
+            png = get_png(data, **style)
+        else:
+            saved = default_storage.save(name, ContentFile(png))
+            if saved != name:
+                default_storage.delete(saved)
+        files.append((name, png))
+    return files
+
+
+def read_file(name):
+    """Tampon PNG d'un fichier QR code enregistré (mis en cache s'il est adressé par son contenu)"""
+    key = os.path.splitext(os.path.basename(name))[0]
+    if not _KEY_PATTERN.match(key):
+        # Ancien fichier nommé d'après l'utilisateur : il peut être réécrit, pas de cache
+        with default_storage.open(name, 'rb') as handle:
+            return BytesIO(handle.read())
+    png = _cache.get(key)
+    if png is None:
+        with default_storage.open(name, 'rb') as handle:
+            png = handle.read()
+        _cache.put(key, png)
+    return BytesIO(png)
@@ -0,0 +1,208 @@
+"""Lecture événementielle des SMS sur un modem GSM (commandes AT, mode texte).
+
+Le flux série est découpé en lignes ; chaque commande AT attend sa réponse
+finale (OK / ERROR) au lieu d'une pause fixe, et les notifications non
+sollicitées (+CMTI, +CMT) sont traitées dès leur arrivée. Chaque SMS stocké
+est lu puis supprimé par son index une seule fois, après son traitement.
+
+Ce module ne dépend pas de Django : il peut être testé contre le simulateur
+de modem sur pseudo-terminal (modem_simulator.py).
+"""
+import csv
+import logging
+import time
+from collections import deque, namedtuple
+
+import serial
+
+logger = logging.getLogger(__name__)
+
+SMSMessage = namedtuple('SMSMessage', ['index', 'sender', 'timestamp', 'text'])
+
+FINAL_OK = 'OK'
+FINAL_ERRORS = ('ERROR', '+CMS ERROR', '+CME ERROR')
+
+
+class ModemError(Exception):
+    """Réponse d'erreur du modem ou absence de réponse dans le délai imparti"""
+
+
+def _parse_fields(line):
+    """Champs d'une ligne '+XXXX: a,"b,c",d' (les guillemets protègent les virgules)"""
+    _, _, values = line.partition(':')
+    return next(csv.reader([values.strip()]), [])
+
+
+class GSMModem:
+    def __init__(self, port='/dev/ttyUSB0', baudrate=9600, read_timeout=0.5, connection=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.read_timeout = read_timeout
+        self.ser = connection
+        self._buffer = b''
+        self._lines = deque()
+        # Notifications reçues pendant une commande, traitées ensuite par messages()
+        self._events = deque()
+        self._running = False
+
+    def open(self):
+        """Ouvre le port série et configure le modem (mode texte, notification +CMTI)"""
+        if self.ser is None:
+            self.ser = serial.Serial(self.port, self.baudrate, timeout=self.read_timeout)
+        self.ser.reset_input_buffer()
+        self.command('AT')
+        self.command('ATE0')  # Pas d'écho des commandes
+        self.command('AT+CMGF=1')  # Mode texte SMS
+        self.command('AT+CNMI=2,1,0,0,0')  # SMS stockés, notifiés par +CMTI avec leur index
+
+    def close(self):
+        self._running = False
+        if self.ser is not None:
+            self.ser.close()
+            self.ser = None
+
+    def stop(self):
+        """Demande l'arrêt de la boucle messages() à la prochaine ligne ou au prochain délai"""
+        self._running = False
+
+    # --- Découpage du flux en lignes ---
+
+    def _fill(self):
+        """Lit les octets disponibles (bloque au plus read_timeout) et découpe les lignes complètes"""
+        chunk = self.ser.read(self.ser.in_waiting or 1)
+        if not chunk:
+            return False
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split(b'\n')
+        for raw in lines:
+            line = raw.strip(b'\r').decode('utf-8', errors='replace').strip()
+            if line:
+                self._lines.append(line)
+        return True
+
+    def _read_line(self, timeout):
+        """Prochaine ligne non vide, ou None si rien n'arrive avant le délai (None = délai de lecture)"""
+        deadline = time.monotonic() + (self.read_timeout if timeout is None else timeout)
+        while not self._lines:
+            if not self._fill() and time.monotonic() >= deadline:
+                return None
+        return self._lines.popleft()
+
+    # --- Commandes AT ---
+
+    def command(self, command, timeout=5):
+        """Envoie une commande AT et retourne les lignes de réponse (sans le OK final)"""
+        self.ser.write((command + '\r').encode())
+        response = []
+        deadline = time.monotonic() + timeout
+        while True:
+            line = self._read_line(max(0, deadline - time.monotonic()))
+            if line is None:
+                raise ModemError(f"Pas de réponse du modem à {command}")
+            if line == command:
+                continue  # Écho résiduel avant ATE0
+            if line == FINAL_OK:
+                return response
+            if line.startswith(FINAL_ERRORS):
+                raise ModemError(f"{command}: {line}")
+            event = self._parse_notification(line)
+            if event is not None:
+                self._events.append(event)
+            else:
+                response.append(line)
+
+    def _parse_notification(self, line):
+        """Notification non sollicitée : ('stored', index) ou ('direct', SMSMessage)"""
+        if line.startswith('+CMTI:'):
+            fields = _parse_fields(line)
+            try:
+                return ('stored', int(fields[1]))
+            except (IndexError, ValueError):
+                logger.warning(f"Notification +CMTI illisible: {line}")
+                return ('ignored', None)
+        if line.startswith('+CMT:'):
+            fields = _parse_fields(line)
+            text = self._read_line(timeout=2) or ''
+            sender = fields[0] if fields else ''
+            timestamp = fields[2] if len(fields) > 2 else ''
+            return ('direct', SMSMessage(None, sender, timestamp, text))
+        return None
+
+    # --- SMS ---
+
+    @staticmethod
+    def _parse_listing(lines, prefix):
+        """Découpe une réponse +CMGR / +CMGL en SMS (en-tête suivi des lignes de texte)"""
+        messages = []
+        current = None
+        for line in lines:
+            if line.startswith(prefix):
+                fields = _parse_fields(line)
+                if prefix == '+CMGL:':
+                    # +CMGL: index,"statut","expéditeur",,"horodatage"
+                    index, fields = int(fields[0]), fields[1:]
+                else:
+                    index = None
+                current = {
+                    'index': index,
+                    'sender': fields[1] if len(fields) > 1 else '',
+                    'timestamp': fields[3] if len(fields) > 3 else '',
+                    'text': [],
+                }
+                messages.append(current)
+            elif current is not None:
+                current['text'].append(line)
+        return [
+            SMSMessage(message['index'], message['sender'], message['timestamp'], '\n'.join(message['text']))
+            for message in messages
+        ]
+
+    def read_message(self, index):
+        """Lit le SMS stocké à cet index (None si l'emplacement est vide)"""
+        messages = self._parse_listing(self.command(f'AT+CMGR={index}'), '+CMGR:')
+        if not messages:
+            return None
+        return messages[0]._replace(index=index)
+
+    def list_messages(self):
+        """Tous les SMS stockés dans le modem"""
+        return self._parse_listing(self.command('AT+CMGL="ALL"'), '+CMGL:')
+
+    def delete_message(self, index):
+        self.command(f'AT+CMGD={index}')
+
+    def messages(self):
+        """Génère les SMS au fil de leur arrivée, sans attente fixe.
+
+        Les SMS déjà stockés au démarrage sont d'abord traités. Un SMS stocké
+        n'est supprimé qu'une fois que l'appelant a repris la main après son
+        traitement : si la boucle est interrompue pendant le traitement, il
+        sera relu au prochain démarrage.
+        """
+        self._running = True
+        for message in self.list_messages():
+            yield message
+            self.delete_message(message.index)
+
+        while self._running:
+            if self._events:
+                kind, payload = self._events.popleft()
+            else:
+                line = self._read_line(timeout=None)
+                if line is None:
+                    continue
+                event = self._parse_notification(line)
+                if event is None:
+                    logger.debug(f"Ligne ignorée du modem: {line}")
+                    continue
+                kind, payload = event
+
+            if kind == 'direct':
+                yield payload
+            elif kind == 'stored':
+                message = self.read_message(payload)
+                if message is None:
+                    # Notification en double : le SMS a déjà été lu et supprimé
+                    continue
+                yield message
+                self.delete_message(payload)
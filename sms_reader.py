@@ -1,80 +1,68 @@
 #!/usr/bin/env python3
 import serial
 import time
-import re
 import requests
-import json
-from datetime import datetime
 import logging
 
+from payments.sms_parsing import get_registry, parse_payment_sms
+from sms_modem import GSMModem, ModemError
+
 # Configuration du modem GSM
 SERIAL_PORT = '/dev/ttyUSB0'  # Port série du modem
 BAUD_RATE = 9600
 API_ENDPOINT = 'http://localhost:8000/api/sms-transaction/'
 API_TOKEN = 'votre_token_api'
+API_TIMEOUT = 10       # Secondes avant d'abandonner un envoi à l'API
+API_RETRY_DELAY = 30   # Secondes avant de relire de la SIM un SMS non transmis
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+class APIUnavailable(Exception):
+    """Transaction non transmise à l'API (réseau, erreur serveur) : le SMS reste sur la SIM"""
+
+
 class SMSReader:
     def __init__(self):
-        self.ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
+        self.modem = GSMModem(SERIAL_PORT, BAUD_RATE)
         self.setup_modem()
     
     def setup_modem(self):
-        """Configuration initiale du modem"""
-        commands = [
-            'AT',  # Test de connexion
-            'AT+CMGF=1',  # Mode texte pour SMS
-            'AT+CNMI=1,2,0,0,0',  # Notification automatique des SMS
-            'AT+CPMS="SM"',  # Utiliser la mémoire SIM
-        ]
-        
-        for cmd in commands:
-            self.send_command(cmd)
-            time.sleep(1)
+        """Configuration initiale du modem (mode texte, notification +CMTI)"""
+        self.modem.open()
+        self.send_command('AT+CPMS="SM"')  # Utiliser la mémoire SIM
     
     def send_command(self, command):
-        """Envoyer une commande AT au modem"""
-        self.ser.write((command + '\r\n').encode())
-        response = self.ser.read(100).decode('utf-8', errors='ignore')
-        logger.info(f"Command: {command}, Response: {response.strip()}")
+        """Envoyer une commande AT au modem et attendre sa réponse finale"""
+        response = '\n'.join(self.modem.command(command))
+        logger.info(f"Command: {command}, Response: {response}")
         return response
     
-    def parse_operator_sms(self, message):
-        """Parser le SMS de l'opérateur (à adapter selon votre opérateur)"""
-        # Exemple pour Orange Money Madagascar
-        patterns = {
-            'amount': r'(\d+(?:\.\d{2})?)\s*Ar',
-            'reference': r'Ref[:\s]*(\w+)',
-            'phone': r'(?:de|from)[:\s]*(\+?\d{10,15})'
-        }
-        
-        result = {}
-        for key, pattern in patterns.items():
-            match = re.search(pattern, message, re.IGNORECASE)
-            if match:
-                result[key] = match.group(1)
-        
-        return result
+    def parse_operator_sms(self, message, sender=None):
+        """Parser le SMS de l'opérateur (modèles dans payments/operator_templates.json)"""
+        return parse_payment_sms(message, sender) or {}
     
     def process_sms(self, sender, message):
-        """Traiter un SMS reçu"""
+        """Traiter un SMS reçu (APIUnavailable si la transaction n'a pas pu être transmise)"""
         # Vérifier si c'est un SMS de l'opérateur
-        operator_numbers = ['1515', '1234', 'ORANGE']  # À adapter
-        
-        if sender not in operator_numbers:
+        if not get_registry().is_operator_sender(sender):
             return
         
         # Parser le message
-        parsed_data = self.parse_operator_sms(message)
+        parsed_data = self.parse_operator_sms(message, sender)
         
         if all(key in parsed_data for key in ['amount', 'reference', 'phone']):
             # Envoyer à l'API Django
             self.send_to_api(parsed_data, message)
     
     def send_to_api(self, data, raw_message):
-        """Envoyer les données à l'API Django"""
+        """Envoyer les données à l'API Django.
+
+        Lève APIUnavailable si l'API est injoignable ou en erreur (5xx) : le SMS
+        n'est pas supprimé. Une transaction refusée (4xx) est journalisée ; la
+        renvoyer n'y changerait rien.
+        """
         payload = {
             'reference': data['reference'],
             'phone_number': data['phone'],
@@ -88,15 +76,18 @@ class SMSReader:
         }
         
         try:
-            response = requests.post(API_ENDPOINT, 
-                                   json=payload, 
-                                   headers=headers)
-            if response.status_code == 201:
-                logger.info(f"Transaction envoyée avec succès: {data['reference']}")
-            else:
-                logger.error(f"Erreur API: {response.status_code} - {response.text}")
-        except Exception as e:
-            logger.error(f"Erreur lors de l'envoi à l'API: {e}")
+            response = requests.post(API_ENDPOINT,
+                                     json=payload,
+                                     headers=headers,
+                                     timeout=API_TIMEOUT)
+        except requests.RequestException as e:
+            raise APIUnavailable(f"Erreur lors de l'envoi à l'API: {e}") from e
+        if response.status_code == 201:
+            logger.info(f"Transaction envoyée avec succès: {data['reference']}")
+        elif response.status_code >= 500 or response.status_code == 429:
+            raise APIUnavailable(f"Erreur API: {response.status_code} - {response.text}")
+        else:
+            logger.error(f"Transaction refusée par l'API: {response.status_code} - {response.text}")
     
     def listen_for_sms(self):
         """Écouter en continu les SMS entrants"""
@@ -104,8 +95,21 @@ class SMSReader:
         
         while True:
             try:
-                if self.ser.in_waiting > 0:
-                    data = self.ser.read(self.ser.in_waiting).decode('utf-8', errors='ignore')
-                    
-                    # Détecter un nouveau SMS
-                    if '+
\ No newline at end of file
+                if self.modem.ser is None:
+                    self.setup_modem()
+                # Chaque SMS est traité dès sa notification puis supprimé du modem
+                for message in self.modem.messages():
+                    self.process_sms(message.sender, message.text)
+            except APIUnavailable as e:
+                # Boucle interrompue avant la suppression du SMS : relu de la SIM à la reprise
+                logger.error(f"{e} ; nouvel essai dans {API_RETRY_DELAY} s")
+                time.sleep(API_RETRY_DELAY)
+            except (serial.SerialException, ModemError) as e:
+                logger.error(f"Erreur modem: {e}")
+                self.modem.close()
+                time.sleep(10)
+
+
+if __name__ == '__main__':
+    reader = SMSReader()
+    reader.listen_for_sms()
@@ -0,0 +1,110 @@
+"""Vérification de la connectivité des abonnés auprès de la passerelle du portail captif.
+
+La passerelle est d'abord interrogée en un seul appel sur la liste des
+utilisateurs connectés (GET /connected_users). Si elle ne propose pas cet
+appel, chaque utilisateur est vérifié (GET /check_connection) par des requêtes
+asynchrones simultanées, bornées à CONNECTIVITY_CHECK_CONCURRENCY et partageant
+un pool de connexions. Les abonnements des utilisateurs déconnectés sont
+ensuite désactivés en une seule mise à jour.
+
+Un utilisateur dont le statut n'a pas pu être obtenu (délai dépassé, erreur de
+la passerelle) est laissé en l'état : une panne de la passerelle ne doit pas
+désactiver tous les abonnements.
+"""
+import asyncio
+import logging
+
+import httpx
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Subscription
+
+logger = logging.getLogger(__name__)
+
+CAPTIVE_PORTAL_API_URL = getattr(settings, 'CAPTIVE_PORTAL_API_URL', 'http://127.0.0.1:8080')
+CONNECTIVITY_CHECK_CONCURRENCY = getattr(settings, 'CONNECTIVITY_CHECK_CONCURRENCY', 20)
+CONNECTIVITY_CHECK_TIMEOUT = getattr(settings, 'CONNECTIVITY_CHECK_TIMEOUT', 5)
+
+
+class BulkEndpointUnavailable(Exception):
+    """La passerelle ne propose pas la liste des utilisateurs connectés"""
+
+
+async def _fetch_connected_users(client):
+    response = await client.get('/connected_users')
+    if response.status_code in (404, 405, 501):
+        raise BulkEndpointUnavailable()
+    response.raise_for_status()
+    return set(response.json()['usernames'])
+
+
+async def _check_user(client, semaphore, username):
+    """True / False selon la passerelle, None si le statut n'a pas pu être obtenu"""
+    async with semaphore:
+        try:
+            response = await client.get('/check_connection', params={'username': username})
+            if response.status_code != 200:
+                return None
+            return bool(response.json().get('is_connected'))
+        except (httpx.HTTPError, ValueError):
+            return None
+
+
+async def fetch_connection_status(usernames, base_url=None, concurrency=None, timeout=None):
+    """Statut de connexion de chaque utilisateur : {username: True/False}, sans les statuts inconnus"""
+    concurrency = concurrency or CONNECTIVITY_CHECK_CONCURRENCY
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url or CAPTIVE_PORTAL_API_URL,
+        timeout=timeout or CONNECTIVITY_CHECK_TIMEOUT,
+        limits=limits,
+    ) as client:
+        try:
+            connected = await _fetch_connected_users(client)
+            return {username: username in connected for username in usernames}
+        except BulkEndpointUnavailable:
+            logger.info("Liste des connectés indisponible sur la passerelle : vérification par utilisateur")
+        except (httpx.HTTPError, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Passerelle injoignable ou réponse invalide ({e}) : aucune vérification")
+            return {}
+
+        semaphore = asyncio.Semaphore(concurrency)
+        results = await asyncio.gather(*[_check_user(client, semaphore, username) for username in usernames])
+    return {username: result for username, result in zip(usernames, results) if result is not None}
+
+
+def check_connectivity(subscriptions=None, **options):
+    """Désactive les abonnements actifs des utilisateurs déconnectés ; retourne un résumé"""
+    from captive_portal.entitlements import invalidate_entitlement
+    from payments.statistics import invalidate_statistics
+
+    if subscriptions is None:
+        subscriptions = Subscription.objects.all()
+    active = list(subscriptions.filter(is_active=True).values_list('id', 'user_id', 'user__username'))
+    usernames = list({username for _, _, username in active})
+
+    status = asyncio.run(fetch_connection_status(usernames, **options)) if usernames else {}
+    disconnected = [(subscription_id, user_id) for subscription_id, user_id, username in active
+                    if status.get(username) is False]
+
+    deactivated = 0
+    if disconnected:
+        deactivated = Subscription.objects.filter(
+            id__in=[subscription_id for subscription_id, _ in disconnected], is_active=True
+        ).update(is_active=False, updated_at=timezone.now())
+        # Mise à jour groupée : les signaux ne sont pas émis
+        for user_id in {user_id for _, user_id in disconnected}:
+            invalidate_entitlement(user_id)
+        invalidate_statistics()
+
+    summary = {
+        'checked': len(status),
+        'unknown': len(usernames) - len(status),
+        'deactivated': deactivated,
+    }
+    logger.info(
+        f"Connectivité : {summary['checked']} utilisateur(s) vérifié(s), {summary['unknown']} inconnu(s), "
+        f"{deactivated} abonnement(s) désactivé(s)"
+    )
+    return summary
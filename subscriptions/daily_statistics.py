@@ -0,0 +1,235 @@
+"""Table de faits des statistiques journalières (modèle Statistics).
+
+Chaque jour est matérialisé en un bloc de lignes : le total du jour, puis une
+ligne par forfait, par mode de paiement et par opérateur Mobile Money. Un jour
+est toujours recalculé entièrement à partir des tables sources puis remplacé
+dans une transaction : la matérialisation est idempotente et peut être rejouée
+sur n'importe quelle période.
+
+La tâche nocturne reprend au dernier jour matérialisé (recalculé, pour les
+paiements arrivés tard) jusqu'à la veille. Les lecteurs utilisent la table pour
+la période couverte sans trou et calculent le reste (en général la journée en
+cours) à partir des paiements.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.utils import timezone
+
+from .models import Statistics, Subscription
+
+logger = logging.getLogger(__name__)
+
+# Opérateur inconnu (numéro hors des préfixes des modèles d'opérateurs)
+UNKNOWN_OPERATOR = 'AUTRE'
+
+
+def day_bounds(day):
+    """Début du jour et début du lendemain, dans le fuseau du projet"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def _row(day, dimension, key=''):
+    return Statistics(date=day, dimension=dimension, key=key, revenue=Decimal('0'))
+
+
+def compute_day(day, dimensions=None):
+    """Lignes (non enregistrées) d'un jour, calculées à partir des paiements, utilisateurs et abonnements.
+
+    dimensions restreint le calcul aux axes demandés (tous par défaut).
+    """
+    from payments.models import Payment
+    from payments.sms_parsing import get_registry
+
+    wanted = set(dimensions or dict(Statistics.DIMENSION_CHOICES))
+    start, end = day_bounds(day)
+    payments = Payment.objects.filter(created_at__gte=start, created_at__lt=end).order_by()
+    total = _row(day, 'TOTAL')
+    rows = {}
+
+    def row(dimension, key):
+        if (dimension, key) not in rows:
+            rows[(dimension, key)] = _row(day, dimension, key)
+        return rows[(dimension, key)]
+
+    def add(target, status, count, amount):
+        target.attempted_payments += count
+        if status == 'SUCCESS':
+            target.payments_count += count
+            target.revenue += amount or 0
+
+    # Agrégats groupés en base : quelques dizaines de groupes par jour, quel que soit le volume
+    groups = payments.values('plan', 'payment_method', 'status').annotate(
+        count=Count('id'), amount=Sum('amount')
+    ).values_list('plan', 'payment_method', 'status', 'count', 'amount')
+    for plan_id, method, status, count, amount in groups:
+        add(total, status, count, amount)
+        if 'PLAN' in wanted:
+            add(row('PLAN', str(plan_id)), status, count, amount)
+        if 'METHOD' in wanted:
+            add(row('METHOD', method), status, count, amount)
+
+    if 'OPERATOR' in wanted:
+        # Opérateur déduit du préfixe du numéro, une fois par numéro distinct
+        registry = get_registry()
+        by_phone = payments.filter(payment_method='MOBILE_MONEY').values('phone_number', 'status').annotate(
+            count=Count('id'), amount=Sum('amount')
+        ).values_list('phone_number', 'status', 'count', 'amount')
+        for phone, status, count, amount in by_phone:
+            add(row('OPERATOR', registry.operator_for_phone(phone or '') or UNKNOWN_OPERATOR), status, count, amount)
+
+    if wanted & {'TOTAL', 'PLAN'}:
+        total.new_users = get_user_model().objects.filter(created_at__gte=start, created_at__lt=end).count()
+
+        new_subscriptions = Subscription.objects.filter(
+            created_at__gte=start, created_at__lt=end
+        ).values('plan').annotate(count=Count('id')).order_by().values_list('plan', 'count')
+        for plan_id, count in new_subscriptions:
+            if 'PLAN' in wanted:
+                row('PLAN', str(plan_id)).new_subscriptions = count
+            total.new_subscriptions += count
+
+        active_subscriptions = Subscription.objects.filter(
+            start_date__lt=end, end_date__gte=end
+        ).values('plan').annotate(count=Count('id')).order_by().values_list('plan', 'count')
+        for plan_id, count in active_subscriptions:
+            if 'PLAN' in wanted:
+                row('PLAN', str(plan_id)).active_subscriptions = count
+            total.active_subscriptions += count
+
+    return [row for row in [total] + list(rows.values()) if row.dimension in wanted]
+
+
+def materialize_day(day):
+    """Recalcule et remplace les lignes d'un jour ; retourne le nombre de lignes écrites"""
+    rows = compute_day(day)
+    with transaction.atomic():
+        Statistics.objects.filter(date=day).delete()
+        Statistics.objects.bulk_create(rows)
+    return len(rows)
+
+
+def materialize_range(start, end):
+    """Matérialise chaque jour de start à end inclus ; retourne le nombre de jours traités"""
+    day = start
+    while day <= end:
+        materialize_day(day)
+        day += timedelta(days=1)
+    return max(0, (end - start).days + 1)
+
+
+def first_activity_day():
+    from payments.models import Payment
+
+    first = Payment.objects.aggregate(first=Min('created_at'))['first']
+    return timezone.localtime(first).date() if first else None
+
+
+def materialize_pending_days(until=None):
+    """Tâche nocturne : du dernier jour matérialisé (ou du premier paiement) jusqu'à la veille"""
+    from payments.statistics import invalidate_statistics
+
+    until = until or timezone.localdate() - timedelta(days=1)
+    last = Statistics.objects.filter(dimension='TOTAL').aggregate(last=Max('date'))['last']
+    start = last or first_activity_day() or until
+    days = materialize_range(start, until)
+    logger.info(f"Statistiques journalières matérialisées du {start} au {until} ({days} jours)")
+    invalidate_statistics()
+    return days
+
+
+def refresh_day(day):
+    """Recalcule un jour déjà matérialisé (paiement modifié après coup)"""
+    if Statistics.objects.filter(date=day, dimension='TOTAL').exists():
+        materialize_day(day)
+
+
+def covered_range():
+    """Première et dernière date de la période matérialisée sans trou, ou None"""
+    coverage = Statistics.objects.filter(dimension='TOTAL').aggregate(
+        first=Min('date'), last=Max('date'), days=Count('id')
+    )
+    if not coverage['days']:
+        return None
+    if coverage['days'] != (coverage['last'] - coverage['first']).days + 1:
+        # Période trouée (matérialisation partielle) : seule la partie finale contiguë serait sûre
+        logger.warning("Statistiques journalières incomplètes : calcul à partir des paiements")
+        return None
+    return coverage['first'], coverage['last']
+
+
+def _outside(coverage):
+    """Filtres des paiements hors de la période matérialisée (un intervalle de dates chacun, servi par l'index)"""
+    if coverage is None:
+        return [Q()]
+    start, _ = day_bounds(coverage[0])
+    _, end = day_bounds(coverage[1])
+    return [Q(created_at__lt=start), Q(created_at__gte=end)]
+
+
+def daily_rows(days, dimensions=('TOTAL',)):
+    """Lignes des axes demandés pour chaque jour : table de faits si matérialisé, sinon calcul"""
+    coverage = covered_range()
+    stored = defaultdict(list)
+    if coverage:
+        for row in Statistics.objects.filter(dimension__in=dimensions, date__in=days):
+            stored[row.date].append(row)
+    result = {}
+    for day in days:
+        if coverage and coverage[0] <= day <= coverage[1]:
+            result[day] = stored.get(day, [])
+        else:
+            result[day] = compute_day(day, dimensions)
+    return result
+
+
+def plan_revenue_totals():
+    """Chiffre d'affaires de chaque forfait depuis l'origine"""
+    from payments.models import Payment
+
+    coverage = covered_range()
+    if coverage is None:
+        # Rien de matérialisé : agrégat groupé sur tous les paiements
+        return dict(Payment.objects.filter(status='SUCCESS').values('plan').annotate(
+            total=Sum('amount')
+        ).order_by().values_list('plan', 'total'))
+
+    totals = defaultdict(Decimal)
+    stored = Statistics.objects.filter(
+        dimension='PLAN', date__range=coverage
+    ).values('key').annotate(total=Sum('revenue')).order_by().values_list('key', 'total')
+    for key, total in stored:
+        totals[int(key)] += total
+    for outside in _outside(coverage):
+        # Partie non matérialisée (la journée en cours) : peu de lignes, lues par l'index (status, created_at)
+        # et sommées ici ; un GROUP BY plan ferait préférer un index par forfait parcouru en entier
+        for plan_id, amount in Payment.objects.filter(outside, status='SUCCESS').values_list('plan', 'amount'):
+            totals[plan_id] += amount
+    return dict(totals)
+
+
+def lifetime_totals():
+    """Nombre de paiements (tous statuts) et montant des paiements réussis depuis l'origine"""
+    from payments.models import Payment
+
+    coverage = covered_range()
+    attempted, revenue = 0, Decimal('0')
+    if coverage:
+        stored = Statistics.objects.filter(dimension='TOTAL', date__range=coverage).aggregate(
+            attempted=Sum('attempted_payments'), revenue=Sum('revenue')
+        )
+        attempted += stored['attempted'] or 0
+        revenue += stored['revenue'] or 0
+    for outside in _outside(coverage):
+        live = Payment.objects.filter(outside).aggregate(
+            attempted=Count('id'), revenue=Sum('amount', filter=Q(status='SUCCESS'))
+        )
+        attempted += live['attempted']
+        revenue += live['revenue'] or 0
+    return attempted, revenue
@@ -0,0 +1,151 @@
+"""Expiration des abonnements arrivés à échéance.
+
+Un seul balayage ensembliste remplace les vérifications ligne par ligne faites
+à la lecture (admin, statut de session) : les abonnements actifs dont la date
+de fin est passée sont désactivés par lots (UPDATE ... WHERE is_active AND
+end_date < now, servi par l'index (is_active, end_date)). Les sessions du
+portail captif des utilisateurs qui n'ont plus aucun abonnement en cours sont
+terminées dans la même transaction, et chaque fin de session est tracée par
+une activité réseau LOGOUT.
+
+Le même balayage rend la coupure des forfaits au volume durable : les
+abonnements dont le quota est atteint sont désactivés s'ils ne l'ont pas été
+au relevé, et les sessions actives des utilisateurs sans abonnement ouvrant
+l'accès (Subscription.entitled) sont terminées, y compris celles ouvertes
+entre-temps par un processus dont le cache des droits n'était pas à jour.
+
+Le balayage tourne toutes les 30 secondes (Celery beat, tâche
+update_subscription_status) et peut être lancé à la demande (commande
+expire_subscriptions).
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Subscription
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_EXPIRY_BATCH_SIZE = getattr(settings, 'SUBSCRIPTION_EXPIRY_BATCH_SIZE', 1000)
+SUBSCRIPTION_EXPIRY_MAX_BATCHES = getattr(settings, 'SUBSCRIPTION_EXPIRY_MAX_BATCHES', 50)
+
+
+def end_user_sessions(user_ids, now, reason='subscription_expired'):
+    """Termine les sessions actives des utilisateurs et trace chaque fin de session (dans la transaction en cours)"""
+    from captive_portal import enforcement, registry, shaping
+    from captive_portal.models import NetworkActivity, UserSession
+
+    sessions = list(UserSession.objects.select_for_update().filter(
+        user_id__in=user_ids, is_active=True
+    ).values('id', 'user_id', 'ip_address', 'mac_address', 'user_agent'))
+    if not sessions:
+        return 0
+
+    session_ids = [session['id'] for session in sessions]
+    ended = UserSession.objects.filter(id__in=session_ids, is_active=True).update(is_active=False, end_time=now)
+    # UPDATE groupé sans signaux : registre des sessions actives, pare-feu et limitation de débit tenus à jour ici
+    transaction.on_commit(lambda: registry.unregister(session_ids))
+    for session in sessions:
+        transaction.on_commit(
+            lambda session=session: enforcement.revoke(session['mac_address'], session['ip_address'])
+        )
+        transaction.on_commit(lambda session=session: shaping.session_ended(session['ip_address']))
+
+    activities = NetworkActivity.objects.bulk_create([
+        NetworkActivity(
+            session_id=session['id'],
+            activity_type='LOGOUT',
+            ip_address=session['ip_address'],
+            mac_address=session['mac_address'],
+            user_agent=session['user_agent'] or '',
+            additional_data={'reason': reason},
+        )
+        for session in sessions
+    ])
+    UserSession.add_usage(NetworkActivity.usage_by_session(activities))
+    return ended
+
+
+def _expire_batch(now, batch_size):
+    """Désactive un lot d'abonnements échus ; retourne (abonnements, sessions, utilisateurs concernés)"""
+    with transaction.atomic():
+        expired = list(Subscription.objects.select_for_update(skip_locked=True).filter(
+            is_active=True, end_date__lt=now
+        ).order_by('end_date').values_list('id', 'user_id')[:batch_size])
+        if not expired:
+            return 0, 0, set()
+
+        subscription_ids = [subscription_id for subscription_id, _ in expired]
+        # Garde sur is_active : une expiration concurrente ne compte pas deux fois
+        count = Subscription.objects.filter(
+            id__in=subscription_ids, is_active=True
+        ).update(is_active=False, updated_at=now)
+
+        user_ids = {user_id for _, user_id in expired}
+        # Un utilisateur qui a encore un abonnement en cours garde ses sessions
+        entitled = set(Subscription.entitled(now).filter(
+            user_id__in=user_ids
+        ).values_list('user_id', flat=True))
+        sessions = end_user_sessions(user_ids - entitled, now)
+
+    logger.info(
+        f"{count} abonnement(s) expiré(s) ({', '.join(str(i) for i in subscription_ids)}), "
+        f"{sessions} session(s) terminée(s)"
+    )
+    return count, sessions, user_ids
+
+
+def _end_unentitled_batch(now, batch_size):
+    """Coupe les quotas atteints et termine un lot de sessions sans droit d'accès ; retourne (abonnements, sessions, utilisateurs)"""
+    from captive_portal.models import UserSession
+
+    with transaction.atomic():
+        exhausted = Subscription.objects.filter(
+            id__in=list(Subscription.exhausted().values_list('id', flat=True)[:batch_size])
+        ).update(is_active=False, updated_at=now)
+        user_ids = set(UserSession.objects.filter(is_active=True).exclude(
+            user_id__in=Subscription.entitled(now).values('user_id')
+        ).values_list('user_id', flat=True).distinct()[:batch_size])
+        sessions = end_user_sessions(user_ids, now, reason='not_entitled') if user_ids else 0
+
+    if exhausted or sessions:
+        logger.info(f"{exhausted} quota(s) atteint(s) désactivé(s), {sessions} session(s) sans droit terminée(s)")
+    return exhausted, sessions, user_ids
+
+
+def sweep_expired_subscriptions(now=None, batch_size=None, max_batches=None):
+    """Expire les abonnements échus par lots ; retourne le nombre d'abonnements et de sessions traités"""
+    from captive_portal.entitlements import invalidate_entitlement
+    from payments.statistics import invalidate_statistics
+
+    now = now or timezone.now()
+    batch_size = batch_size or SUBSCRIPTION_EXPIRY_BATCH_SIZE
+    max_batches = max_batches or SUBSCRIPTION_EXPIRY_MAX_BATCHES
+
+    totals = {'subscriptions': 0, 'sessions': 0}
+    for _ in range(max_batches):
+        count, sessions, user_ids = _expire_batch(now, batch_size)
+        if not count and not user_ids:
+            break
+        totals['subscriptions'] += count
+        totals['sessions'] += sessions
+        # Mises à jour groupées : les signaux ne sont pas émis, les caches sont invalidés ici
+        for user_id in user_ids:
+            invalidate_entitlement(user_id)
+    else:
+        logger.warning("Expiration des abonnements interrompue après le nombre maximum de lots")
+
+    for _ in range(max_batches):
+        count, sessions, user_ids = _end_unentitled_batch(now, batch_size)
+        if not count and not user_ids:
+            break
+        totals['subscriptions'] += count
+        totals['sessions'] += sessions
+        for user_id in user_ids:
+            invalidate_entitlement(user_id)
+
+    if totals['subscriptions']:
+        invalidate_statistics()
+    return totals
@@ -0,0 +1,42 @@
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from payments.statistics import invalidate_statistics
+from subscriptions.daily_statistics import first_activity_day, materialize_day
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Date invalide : {value} (format attendu AAAA-MM-JJ)")
+
+
+class Command(BaseCommand):
+    help = ('Calcule (ou recalcule) les statistiques journalières sur une période ; '
+            'sans argument, du premier paiement jusqu\'à la veille')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=_parse_date, help='Premier jour (AAAA-MM-JJ)')
+        parser.add_argument('--end', type=_parse_date, help='Dernier jour inclus (AAAA-MM-JJ)')
+
+    def handle(self, *args, **options):
+        end = options['end'] or timezone.localdate() - timedelta(days=1)
+        start = options['start'] or first_activity_day() or end
+        if start > end:
+            raise CommandError(f"Période vide : {start} > {end}")
+
+        started = time.perf_counter()
+        day, rows = start, 0
+        while day <= end:
+            rows += materialize_day(day)
+            day += timedelta(days=1)
+        invalidate_statistics()
+
+        days = (end - start).days + 1
+        self.stdout.write(self.style.SUCCESS(
+            f"{days} jours matérialisés du {start} au {end} ({rows} lignes) en {time.perf_counter() - started:.1f} s"
+        ))
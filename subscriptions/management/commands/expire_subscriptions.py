@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from subscriptions.expiry import sweep_expired_subscriptions
+
+
+class Command(BaseCommand):
+    help = 'Expire les abonnements échus et termine les sessions du portail captif associées'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Abonnements traités par transaction')
+        parser.add_argument('--max-batches', type=int, help='Nombre maximum de lots')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        totals = sweep_expired_subscriptions(batch_size=options['batch_size'], max_batches=options['max_batches'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['subscriptions']} abonnement(s) expiré(s), {totals['sessions']} session(s) terminée(s) "
+            f"en {time.perf_counter() - started:.2f} s"
+        ))
@@ -0,0 +1,125 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from gateway_simulator import GatewaySimulator
+from subscriptions.connectivity import check_connectivity
+from subscriptions.models import Plan, Subscription
+
+User = get_user_model()
+
+
+def legacy_check(subscriptions, base_url):
+    """Ancienne vérification : une requête bloquante par abonnement, l'une après l'autre"""
+    for subscription in subscriptions.filter(is_active=True):
+        try:
+            response = requests.get(
+                f"{base_url}/check_connection",
+                params={'username': subscription.user.username},
+                timeout=5
+            )
+            if not response.json().get('is_connected'):
+                subscription.is_active = False
+                subscription.save()
+        except requests.RequestException:
+            subscription.is_active = False
+            subscription.save()
+
+
+class Command(BaseCommand):
+    help = ('Vérifie la connectivité d\'abonnés de test auprès d\'une passerelle simulée : '
+            'appel groupé, vérification par utilisateur bornée, et ancienne vérification séquentielle')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=2000, help='Abonnements actifs de test')
+        parser.add_argument('--connected', type=float, default=0.8, help='Part des abonnés connectés')
+        parser.add_argument('--failing', type=int, default=10,
+                            help='Abonnés pour lesquels la passerelle répond en erreur')
+        parser.add_argument('--latency', type=float, default=0.05, help='Latence de la passerelle (secondes)')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requêtes simultanées au plus')
+        parser.add_argument('--legacy-sample', type=int, default=100,
+                            help='Abonnés vérifiés par l\'ancienne méthode (durée extrapolée), 0 pour l\'ignorer')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        count = options['subscribers']
+        if count < 1 or not 0 <= options['connected'] <= 1:
+            raise CommandError("--subscribers doit être positif et --connected compris entre 0 et 1")
+
+        rng = random.Random(options['seed'])
+        prefix = f"conn{uuid.uuid4().hex[:6]}"
+        usernames = [f"{prefix}_{i:06d}" for i in range(count)]
+        connected = {username for username in usernames if rng.random() < options['connected']}
+        failing = set(rng.sample(usernames, min(options['failing'], count)))
+
+        plan = Plan.objects.create(
+            name='Forfait charge connectivité', description='Test de charge',
+            duration=1, duration_unit='DAYS', price=1000
+        )
+        try:
+            subscriptions = self._populate(plan, usernames)
+            disconnected = set(usernames) - connected
+
+            gateway = GatewaySimulator(connected, latency=options['latency'], failing=failing).start()
+            try:
+                self._scenario('Appel groupé (/connected_users)', gateway, subscriptions, disconnected,
+                               options['concurrency'])
+                gateway.bulk = False
+                # Statut inconnu (erreur de la passerelle) : abonnement laissé actif
+                self._scenario('Vérification par utilisateur, bornée', gateway, subscriptions,
+                               disconnected - failing, options['concurrency'])
+                if options['legacy_sample']:
+                    self._legacy(gateway, subscriptions, options['legacy_sample'], count)
+            finally:
+                gateway.stop()
+        finally:
+            User.objects.filter(username__startswith=f"{prefix}_").delete()
+            plan.delete()
+
+    def _populate(self, plan, usernames):
+        User.objects.bulk_create([User(username=username, phone_number='0340000000') for username in usernames])
+        users = User.objects.filter(username__in=usernames)
+        now = timezone.now()
+        Subscription.objects.bulk_create([
+            Subscription(user=user, plan=plan, start_date=now, end_date=now + timedelta(days=1))
+            for user in users
+        ])
+        return Subscription.objects.filter(plan=plan)
+
+    def _scenario(self, label, gateway, subscriptions, expected, concurrency):
+        subscriptions.update(is_active=True)
+        gateway.requests = gateway.max_in_flight = 0
+        started = time.perf_counter()
+        summary = check_connectivity(subscriptions, base_url=gateway.url, concurrency=concurrency)
+        elapsed = time.perf_counter() - started
+
+        deactivated = set(subscriptions.filter(is_active=False).values_list('user__username', flat=True))
+        if deactivated != expected:
+            raise CommandError(
+                f"{label} : {len(deactivated)} abonnement(s) désactivé(s), {len(expected)} attendu(s)"
+            )
+        if gateway.max_in_flight > concurrency:
+            raise CommandError(f"{label} : {gateway.max_in_flight} requêtes simultanées pour {concurrency} permises")
+        self.stdout.write(
+            f"{label} : {elapsed:.2f} s, {gateway.requests} requête(s) à la passerelle "
+            f"({gateway.max_in_flight} simultanée(s) au plus), {summary['checked']} vérifié(s), "
+            f"{summary['unknown']} inconnu(s), {summary['deactivated']} désactivé(s)"
+        )
+        self.stdout.write(self.style.SUCCESS(f"{label} : abonnements désactivés conformes"))
+
+    def _legacy(self, gateway, subscriptions, sample, count):
+        subscriptions.update(is_active=True)
+        sample_ids = list(subscriptions.order_by('id').values_list('id', flat=True)[:sample])
+        started = time.perf_counter()
+        legacy_check(Subscription.objects.filter(id__in=sample_ids), gateway.url)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Ancienne vérification séquentielle : {elapsed:.2f} s pour {len(sample_ids)} abonné(s), "
+            f"soit environ {elapsed * count / len(sample_ids):.1f} s pour {count}"
+        )
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Statistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('dimension', models.CharField(choices=[('TOTAL', 'Total'), ('PLAN', 'Forfait'), ('METHOD', 'Mode de paiement'), ('OPERATOR', 'Opérateur')], max_length=10)),
+                ('key', models.CharField(blank=True, default='', max_length=50)),
+                ('payments_count', models.PositiveIntegerField(default=0, help_text='Paiements réussis')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('attempted_payments', models.PositiveIntegerField(default=0, help_text='Paiements créés, tous statuts')),
+                ('new_users', models.PositiveIntegerField(default=0)),
+                ('new_subscriptions', models.PositiveIntegerField(default=0)),
+                ('active_subscriptions', models.PositiveIntegerField(default=0, help_text='Abonnements en cours à la fin du jour')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Statistique journalière',
+                'verbose_name_plural': 'Statistiques journalières',
+                'ordering': ['-date', 'dimension', 'key'],
+                'indexes': [models.Index(fields=['dimension', 'date'], name='statistics_dimension_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='statistics',
+            constraint=models.UniqueConstraint(fields=('date', 'dimension', 'key'), name='statistics_day_dimension_key_uniq'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0002_statistics'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['is_active', 'end_date'], name='subscription_active_end_idx'),
+        ),
+    ]
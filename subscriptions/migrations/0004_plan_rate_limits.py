@@ -0,0 +1,23 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0003_subscription_expiry_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='burst_kbytes',
+            field=models.PositiveIntegerField(blank=True, help_text='Rafale autorisée en Ko (vide : calculée par tc)', null=True),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='rate_kbps',
+            field=models.PositiveIntegerField(blank=True, help_text='Débit maximal en kbit/s (vide : illimité)', null=True),
+        ),
+    ]
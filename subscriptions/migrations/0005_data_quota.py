@@ -0,0 +1,23 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0004_plan_rate_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='data_quota_mb',
+            field=models.PositiveIntegerField(blank=True, help_text='Volume de données inclus en Mo (vide : illimité)', null=True),
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='data_used',
+            field=models.BigIntegerField(default=0, help_text='Octets consommés (forfaits au volume)'),
+        ),
+    ]
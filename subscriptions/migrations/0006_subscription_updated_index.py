@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-18 18:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0005_data_quota'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['updated_at'], name='subscription_updated_idx'),
+        ),
+    ]
@@ -1,15 +1,15 @@
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
-import qrcode
-from io import BytesIO
-from django.core.files import File
 from PIL import Image
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
 from django.http import HttpResponse
 import os
 
+from portal import counters, qr
+
 class Plan(models.Model):
     DURATION_UNIT_CHOICES = [
         ('DAYS', 'Jours'),
@@ -22,6 +22,11 @@ class Plan(models.Model):
     duration = models.IntegerField(help_text="Durée de l'abonnement")
     duration_unit = models.CharField(max_length=10, choices=DURATION_UNIT_CHOICES)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Limitation de débit des sessions du forfait (captive_portal.shaping)
+    rate_kbps = models.PositiveIntegerField(null=True, blank=True, help_text="Débit maximal en kbit/s (vide : illimité)")
+    burst_kbytes = models.PositiveIntegerField(null=True, blank=True, help_text="Rafale autorisée en Ko (vide : calculée par tc)")
+    # Forfaits au volume : consommation relevée par captive_portal.accounting
+    data_quota_mb = models.PositiveIntegerField(null=True, blank=True, help_text="Volume de données inclus en Mo (vide : illimité)")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -49,76 +54,60 @@ class Subscription(models.Model):
     end_date = models.DateTimeField()
     is_active = models.BooleanField(default=True)
     qr_code = models.ImageField(upload_to='qr_codes/', null=True, blank=True)
+    data_used = models.BigIntegerField(default=0, help_text="Octets consommés (forfaits au volume)")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = 'Abonnement'
         verbose_name_plural = 'Abonnements'
+        indexes = [
+            # Balayage des abonnements échus (subscriptions.expiry)
+            models.Index(fields=['is_active', 'end_date'], name='subscription_active_end_idx'),
+            # Dernière modification (empreinte des statistiques, payments.reports)
+            models.Index(fields=['updated_at'], name='subscription_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.plan.name}"
 
+    @classmethod
+    def add_data_usage(cls, usage, batch_size=1000):
+        """Incrémente le volume consommé de plusieurs abonnements : usage = {subscription_id: octets}"""
+        counters.increment(cls, {subscription_id: (used,) for subscription_id, used in usage.items()},
+                           ['data_used'], batch_size)
+
+    @classmethod
+    def entitled(cls, now=None):
+        """Abonnements qui ouvrent l'accès : actifs, non échus et, pour un forfait au volume, avec du volume restant"""
+        return cls.objects.filter(is_active=True, end_date__gt=now or timezone.now()).filter(
+            models.Q(plan__data_quota_mb__isnull=True)
+            | models.Q(data_used__lt=models.F('plan__data_quota_mb') * 1024 * 1024)
+        )
+
+    @classmethod
+    def exhausted(cls):
+        """Abonnements actifs au volume dont le quota est atteint"""
+        return cls.objects.filter(
+            is_active=True, plan__data_quota_mb__isnull=False,
+            data_used__gte=models.F('plan__data_quota_mb') * 1024 * 1024
+        )
+
+    @property
+    def data_remaining(self):
+        """Octets restants du forfait au volume (None si le forfait n'a pas de quota)"""
+        if self.plan.data_quota_mb is None:
+            return None
+        return max(self.plan.data_quota_mb * 1024 * 1024 - self.data_used, 0)
+
     def generate_qr_code(self):
-        print(f"[DEBUG] generate_qr_code called for user: {self.user.username}, subscription ID: {self.id}")
-        
         # Vérifier si un QR code existe déjà DANS LA BASE ET SUR LE DISQUE
-        if self.qr_code:
-            qr_code_path = self.qr_code.path
-            if os.path.exists(qr_code_path):
-                print(f"[DEBUG] QR code file already exists at {qr_code_path} for subscription {self.id}.")
-                return # Le QR code existe et le fichier est présent, on ne fait rien
-            else:
-                print(f"[DEBUG] QR code entry exists in DB but file missing at {qr_code_path}. Clearing DB entry.")
-                # Si l'entrée existe en base mais pas le fichier, on l'efface pour régénérer
-                self.qr_code.delete(save=False) # Supprime le fichier s'il existait (ici il n'existe pas, mais bonne pratique) et efface le champ en base
-                self.qr_code = None # S'assurer que le champ est bien None
-
-        # Créer le contenu du QR code (uniquement le nom d'utilisateur)
-        qr_content = self.user.username
-        print(f"[DEBUG] QR content: {qr_content}")
-        
-        # S'assurer que le dossier media/qr_codes existe
-        qr_codes_dir = os.path.join(settings.MEDIA_ROOT, 'qr_codes')
-        print(f"[DEBUG] QR codes directory: {qr_codes_dir}")
-        os.makedirs(qr_codes_dir, exist_ok=True)
-        print(f"[DEBUG] QR codes directory checked/created.")
-        
-        # Générer le QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_content)
-        qr.make(fit=True)
-        print(f"[DEBUG] QR code generated.")
-        
-        # Créer l'image
-        img = qr.make_image(fill_color="black", back_color="white")
-        print(f"[DEBUG] QR code image created.")
-        
-        # Sauvegarder l'image dans un buffer
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        print(f"[DEBUG] QR code image saved to buffer.")
-        
-        # Générer un nom de fichier unique
-        # Utiliser user.pk au lieu de self.id car self.id pourrait être None si l'objet n'est pas encore sauvegardé
-        # Cependant, dans save(), self.id devrait être défini. Gardons self.id pour la cohérence.
-        filename = f'qr_code_{self.user.username}_{self.id}.png'
-        print(f"[DEBUG] Generated filename: {filename}")
-        
-        # Sauvegarder le fichier
-        try:
-            self.qr_code.save(filename, File(buffer), save=False) # save=False car le save() final se fait après
-            print(f"[DEBUG] qr_code.save called with filename: {filename}")
-            # self.save() # Ne pas sauvegarder ici, la méthode save() appelante s'en chargera
-            print(f"[DEBUG] QR code field updated in memory. File path should be: {self.qr_code.path}")
-        except Exception as e:
-            print(f"[DEBUG] Error during QR code file save: {e}")
+        if self.qr_code and self.qr_code.storage.exists(self.qr_code.name):
+            return # Le QR code existe et le fichier est présent, on ne fait rien
+
+        # Contenu du QR code (uniquement le nom d'utilisateur) ; fichier partagé nommé d'après son
+        # empreinte, à ne jamais supprimer avec l'abonnement. Le save() final se fait après.
+        self.qr_code.name = qr.save_file(self.user.username)
 
     def generate_pdf(self):
         response = HttpResponse(content_type='application/pdf')
@@ -145,7 +134,7 @@ class Subscription(models.Model):
         
         # QR Code
         if self.qr_code:
-            p.drawImage(self.qr_code.path, 50, height - 400, width=200, height=200)
+            p.drawImage(ImageReader(qr.read_file(self.qr_code.name)), 50, height - 400, width=200, height=200)
         
         p.showPage()
         p.save()
@@ -153,11 +142,8 @@ class Subscription(models.Model):
         return response
 
     def check_status(self):
-        """Vérifie et met à jour le statut de l'abonnement"""
-        if self.is_active and self.end_date < timezone.now():
-            self.is_active = False
-            self.save(update_fields=['is_active'])
-        return self.is_active
+        """Indique si l'abonnement est en cours (lecture seule : l'expiration est faite par subscriptions.expiry)"""
+        return self.is_active and self.end_date >= timezone.now()
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None
@@ -166,4 +152,47 @@ class Subscription(models.Model):
         # Commenter l'appel à generate_qr_code ici
         # if is_new:
         #     print(f"[DEBUG] Calling generate_qr_code from save method for new subscription {self.id}")
-        #     self.generate_qr_code() 
\ No newline at end of file
+        #     self.generate_qr_code() 
+
+class Statistics(models.Model):
+    """Statistiques journalières matérialisées (une ligne par jour et par axe d'analyse)"""
+    DIMENSION_CHOICES = [
+        ('TOTAL', 'Total'),
+        ('PLAN', 'Forfait'),
+        ('METHOD', 'Mode de paiement'),
+        ('OPERATOR', 'Opérateur'),
+    ]
+
+    date = models.DateField()
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    # Identifiant du forfait, mode de paiement ou opérateur ; vide pour le total
+    key = models.CharField(max_length=50, blank=True, default='')
+    payments_count = models.PositiveIntegerField(default=0, help_text="Paiements réussis")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    attempted_payments = models.PositiveIntegerField(default=0, help_text="Paiements créés, tous statuts")
+    new_users = models.PositiveIntegerField(default=0)
+    new_subscriptions = models.PositiveIntegerField(default=0)
+    active_subscriptions = models.PositiveIntegerField(default=0, help_text="Abonnements en cours à la fin du jour")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Statistique journalière'
+        verbose_name_plural = 'Statistiques journalières'
+        ordering = ['-date', 'dimension', 'key']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'dimension', 'key'], name='statistics_day_dimension_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['dimension', 'date'], name='statistics_dimension_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.dimension} {self.key} - {self.revenue} Ar"
+
+    @classmethod
+    def generate_daily_stats(cls, day=None):
+        """Matérialise un jour, ou par défaut les jours écoulés depuis le dernier calculé"""
+        from .daily_statistics import materialize_day, materialize_pending_days
+        if day is not None:
+            return materialize_day(day)
+        return materialize_pending_days()
@@ -25,7 +25,7 @@ from reportlab.graphics.shapes import Drawing
 from reportlab.graphics.barcode.qr import QrCodeWidget
 from reportlab.graphics import renderPDF
 from io import BytesIO
-import qrcode
+from portal import qr
 from PIL import Image as PILImage
 
 # Get an instance of a logger
@@ -195,20 +195,8 @@ def print_subscription_receipt(request, object_id):
         
         # Générer le QR code
         qr_data = f"Nom d'utilisateur: {subscription.user.username}\nMot de passe: {subscription.user.plain_password or 'Non renseigné'}"
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=3,
-            border=1,
-        )
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        
-        # Créer l'image QR en mémoire
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        qr_buffer = BytesIO()
-        qr_img.save(qr_buffer, format='PNG')
-        qr_buffer.seek(0)
+        # Image QR en mémoire (service QR partagé, rendue une seule fois par contenu)
+        qr_buffer = qr.get_buffer(qr_data, box_size=3, border=1)
         
         # Ajouter le QR code au PDF
         qr_image = Image(qr_buffer, width=30*mm, height=30*mm)
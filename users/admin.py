@@ -6,13 +6,11 @@ from .models import User
 from .forms import CustomUserCreationForm
 from subscriptions.models import Subscription
 from payments.models import Payment
+from payments import receipts
 from django.utils import timezone
 from datetime import timedelta
 from django.db.models import Q
-from django.http import HttpResponse, HttpResponseRedirect
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import mm
-from reportlab.lib.units import mm
+from django.http import HttpResponseRedirect
 from django.urls import path
 from django.template.response import TemplateResponse
 import string
@@ -22,7 +20,7 @@ import os
 from io import BytesIO
 from django.core.files import File
 from django.conf import settings
-import qrcode
+from portal import qr
 from PIL import Image
 
 def generate_password(length=12):
@@ -120,37 +118,15 @@ class CustomUserAdmin(UserAdmin):
         try:
             # Contenu du QR code (utilisateur et mot de passe)
             qr_content = f"{user.username}:{plain_password}"
-            print(f"[DEBUG print_receipt] QR content set to: {qr_content}")
             
-            # Générer le QR code dans un buffer en mémoire
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(qr_content)
-            qr.make(fit=True)
-            
-            img = qr.make_image(fill_color="green", back_color="white")
-            buffer = BytesIO()
-            img.save(buffer, format='PNG')
-            buffer.seek(0) # Rembobiner le buffer pour la lecture
-            qr_code_image_data = buffer
-
-            # Optionnel: Sauvegarder le QR code dans le modèle aussi, pour d'autres usages
-            # Cela recrée le fichier sur le disque si nécessaire.
-            # Utiliser un nom de fichier basé sur l'utilisateur et l'id de l'abonnement
-            filename = f'qr_code_{user.username}_{subscription.id}.png'
-            # Si on veut S'ASSURER que le champ QR code dans le modèle Subscription a le bon fichier:
-            if not subscription.qr_code or not os.path.exists(subscription.qr_code.path) or os.path.basename(subscription.qr_code.name) != filename:
-                 print(f"[DEBUG print_receipt] QR code file missing or name mismatch. Saving new file: {filename}")
-                 # Utiliser File pour envelopper le buffer et le nom de fichier
-                 file_to_save = File(BytesIO(buffer.getvalue()), name=filename)
-                 subscription.qr_code.save(filename, file_to_save, save=True) # save=True pour enregistrer l'objet après
-
-            # S'assurer que le buffer est positionné au début pour generate_receipt_pdf
-            qr_code_image_data.seek(0)
+            # Service QR partagé : rendu une seule fois par contenu, gardé en mémoire
+            qr_code_image_data = qr.get_buffer(qr_content, fill_color="green")
+
+            # Fichier partagé nommé d'après l'empreinte du contenu : écrit une seule fois, jamais dupliqué
+            filename = qr.save_file(qr_content, fill_color="green")
+            if subscription.qr_code.name != filename:
+                subscription.qr_code.name = filename
+                subscription.save(update_fields=['qr_code'])
             
         except Exception as e:
             print(f"[DEBUG print_receipt] Error generating or saving QR code for PDF: {e}")
@@ -172,219 +148,11 @@ class CustomUserAdmin(UserAdmin):
         return "Pas d'abonnement"
     get_subscription_status.short_description = "État de l'abonnement"
 
-    # Modifier la signature pour accepter les données de l'image QR code
+    # qr_code_image_data : tampon PNG du QR code (portal.qr.get_buffer)
     def generate_receipt_pdf(self, user, subscription, payment, plain_password, qr_code_image_data=None):
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="receipt_{user.username}.pdf"'
-        
-        # Définir les dimensions en millimètres (standard pour les tickets)
-        width = 80 * mm  # Largeur standard pour les tickets
-        height = 300 * mm  # Une grande hauteur pour permettre un contenu variable
-        
-        # Créer le canvas avec les dimensions personnalisées
-        # Utiliser portrait pour une imprimante ticket
-        p = canvas.Canvas(response, pagesize=(width, height))
-        
-        # Couleurs (utiliser des couleurs adaptées à l'impression thermique si possible, sinon gris)
-        # Pour l'impression thermique, les couleurs sont généralement converties en nuances de gris/noir.
-        # Utilisons du noir et un gris foncé pour le texte.
-        primary_color_rgb = (0, 0, 0)       # Noir (for general text)
-        title_color_rgb = (0, 0, 0.5)   # Dark Blue (for titles)
-        watermark_color_rgb = (0.9, 0.9, 0.9) # Gris très clair pour la filigrane
-        header_bg_color_rgb = (0.8, 0.9, 1.0) # Bleu très clair pour l'en-tête
-        header_text_color_rgb = (0, 0, 0.5) # Bleu foncé pour le texte de l'en-tête
-
-        # Marges et espacements (réduits pour un ticket)
-        margin_left = 2 * mm
-        margin_right = 2 * mm
-        margin_top = 5 * mm
-        margin_bottom = 5 * mm
-        content_width = width - (margin_left + margin_right)
-        
-        # Position de départ pour le contenu
-        y_position = height - margin_top
-        line_height = 4*mm  # Restauré à 4mm pour une meilleure lisibilité
-        small_line_height = 3*mm # Restauré à 3mm pour une meilleure lisibilité
-        
-        # --- Filigrane (positionné en premier pour être en arrière-plan) ---
-        # On place la filigrane en diagonal sur toute la page
-        p.setFillColorRGB(*watermark_color_rgb) # Couleur très claire
-        p.setFont("Helvetica", 16) # Taille réduite pour le filigrane
-        
-        # Sauvegarder l'état actuel du canvas
-        p.saveState()
-        
-        # Rotation de 45 degrés
-        p.translate(width/2, height/2)  # Déplacer au centre
-        p.rotate(45)  # Rotation de 45 degrés
-        
-        # Dessiner le filigrane plusieurs fois pour couvrir toute la page
-        watermark_text = "BestConnect by Franco Fanazava"
-        text_width = p.stringWidth(watermark_text, "Helvetica", 16)
-        
-        # Calculer les positions pour couvrir toute la page
-        # Ajuster les coordonnées pour mieux aligner avec le contenu
-        start_x = -width * 0.8
-        start_y = -height * 0.8
-        spacing = text_width * 2  # Augmenter l'espacement entre les répétitions
-        
-        # Dessiner le filigrane en diagonale avec une opacité réduite
-        p.setFillColorRGB(0.95, 0.95, 0.95)  # Presque blanc pour un effet plus subtil
-        
-        # Dessiner le filigrane en diagonale
-        for y in range(int(start_y), int(height*1.6), int(spacing)):
-            for x in range(int(start_x), int(width*1.6), int(spacing)):
-                p.drawString(x, y, watermark_text)
-        
-        # Restaurer l'état du canvas
-        p.restoreState()
-
-        # --- En-tête avec fond bleu ---
-        header_height = 15 * mm  # Réduit pour un en-tête plus compact
-        header_y_start = height - margin_top
-        header_y_end = header_y_start - header_height
-
-        # Dessiner le rectangle de fond bleu
-        p.setFillColorRGB(*header_bg_color_rgb)
-        p.rect(margin_left, header_y_end, width - (margin_left + margin_right), header_height, fill=1)
-
-        # Texte de l'en-tête
-        p.setFillColorRGB(*header_text_color_rgb)
-        p.setFont("Helvetica-Bold", 14)
-        p.drawCentredString(width/2, header_y_start - 5*mm, "BestConnect")
-        p.setFont("Helvetica-Bold", 12)
-        p.drawCentredString(width/2, header_y_start - 10*mm, "Reçu d'inscription")
-
-        # Mettre à jour la position Y après l'en-tête
-        y_position = header_y_end - 3*mm
-
-        # Ligne de séparation après l'en-tête
-        p.setStrokeColorRGB(*header_text_color_rgb)
-        p.line(margin_left, y_position, width - margin_right, y_position)
-        y_position -= line_height
-
-        # Fonction pour dessiner un titre de section
-        def draw_section_title(title):
-            nonlocal y_position
-            y_position -= small_line_height # Réduit l'espace avant le titre
-            p.setFillColorRGB(*title_color_rgb)
-            p.setFont("Helvetica-Bold", 8)
-            p.drawCentredString(width/2, y_position, title.upper())
-            y_position -= line_height # Réduit l'espace après le titre
-        
-        # Fonction pour dessiner une ligne d'information
-        def draw_info_line(label, value, is_bold_value=False):
-            nonlocal y_position
-            p.setFillColorRGB(*primary_color_rgb)
-            p.setFont("Helvetica", 7)
-            p.drawString(margin_left, y_position, f"{label}:")
-            
-            # Calculer la largeur du label pour aligner la valeur
-            label_width = p.stringWidth(label + ":", "Helvetica", 7)
-            value_x = margin_left + label_width + 1*mm # Réduit l'espace après le label
-            
-            if is_bold_value:
-                 p.setFont("Helvetica-Bold", 7)
-            else:
-                 p.setFont("Helvetica", 7)
-                 
-            # Utiliser un TextObject pour gérer le texte long automatiquement
-            text_object = p.beginText(value_x, y_position)
-            text_object.setFont("Helvetica" if not is_bold_value else "Helvetica-Bold", 7)
-            text_object.textLine(str(value))
-            p.drawText(text_object)
-
-            y_position -= small_line_height # Réduit l'espacement vertical entre les lignes
-
-        # Informations utilisateur
-        draw_section_title("Informations utilisateur")
-        draw_info_line("Nom d'utilisateur", user.username, is_bold_value=True)
-        draw_info_line("Mot de passe", plain_password, is_bold_value=True)
-        draw_info_line("Email", user.email or "Non renseigné")
-        draw_info_line("Téléphone", user.phone_number)
-        draw_info_line("Adresse", user.address or "Non renseignée")
-        y_position -= small_line_height # Réduit l'espace après la section (au lieu de small_line_height * 2)
-
-        # Informations abonnement
-        draw_section_title("Détails de l'abonnement")
-        draw_info_line("Forfait", subscription.plan.name, is_bold_value=True)
-        draw_info_line("Prix", f"{subscription.plan.price:,} Ar", is_bold_value=True)
-        
-        # Convertir les dates en heure locale de Madagascar
-        try:
-            MADAGASCAR_TZ = pytz.timezone('Indian/Antananarivo')
-        except pytz.UnknownTimeZoneError:
-            MADAGASCAR_TZ = timezone.get_default_timezone()
-            
-        start_date = subscription.start_date.astimezone(MADAGASCAR_TZ)
-        end_date = subscription.end_date.astimezone(MADAGASCAR_TZ)
-        payment_date = payment.created_at.astimezone(MADAGASCAR_TZ)
-        
-        draw_info_line("Date d'inscription", start_date.strftime('%d/%m/%Y'))
-        draw_info_line("Date d'expiration", end_date.strftime('%d/%m/%Y'))
-        y_position -= small_line_height # Réduit l'espace après la section (au lieu de small_line_height * 2)
-        
-        # Informations paiement
-        draw_section_title("Informations de paiement")
-        draw_info_line("Méthode de paiement", payment.get_payment_method_display())
-        draw_info_line("Numéro de téléphone", payment.phone_number)
-        draw_info_line("Date de paiement", payment_date.strftime('%d/%m/%Y %H:%M'))
-        
-        # Ajouter la date de génération du document
-        current_time = timezone.now().astimezone(MADAGASCAR_TZ)
-        draw_info_line("Document généré le", current_time.strftime('%d/%m/%Y à %H:%M'))
-        y_position -= line_height # Réduit l'espace avant le QR code (au lieu de line_height * 2)
-        
-        # QR Code centré
-        if qr_code_image_data:
-            print(f"[DEBUG generate_receipt_pdf] Attempting to draw QR code from buffer...")
-            qr_size = 50*mm
-            qr_x = (width - qr_size) / 2
-            footer_height = small_line_height * 2 + line_height  # Réduit la hauteur du footer
-            min_y_for_qr = margin_bottom + footer_height + 2*mm  # Réduit l'espace
-            qr_y = max(min_y_for_qr, y_position - qr_size)
-            
-            try:
-                from reportlab.lib.utils import ImageReader
-                img_reader = ImageReader(qr_code_image_data)
-                p.drawImage(img_reader, qr_x, qr_y, width=qr_size, height=qr_size)
-                y_position = qr_y - 2*mm  # Réduit l'espace après le QR code
-                print(f"[DEBUG generate_receipt_pdf] QR code drawn successfully from buffer.")
-            except Exception as e:
-                print(f"[DEBUG generate_receipt_pdf] Error drawing QR code from data buffer: {e}")
-                p.setFillColorRGB(1, 0, 0)
-                p.setFont("Helvetica-Bold", 7)
-                p.drawCentredString(width/2, y_position - 10*mm, "Erreur Affichage QR")
-                y_position -= 15*mm
-        else:
-            print(f"[DEBUG generate_receipt_pdf] No QR code data provided to draw.")
-            p.setFillColorRGB(1, 0, 0)
-            p.setFont("Helvetica-Bold", 7)
-            p.drawCentredString(width/2, y_position - 10*mm, "QR Code manquant")
-            y_position -= 15*mm
-
-        # Pied de page avec fond bleu clair
-        footer_height = small_line_height * 2 + line_height  # Réduit la hauteur du footer
-        footer_y_start = margin_bottom + 5*mm  # Réduit l'espace
-        final_footer_y = max(footer_y_start, y_position - footer_height)
-
-        # Rectangle de fond pour le pied de page
-        p.setFillColorRGB(*header_bg_color_rgb)
-        p.rect(margin_left, final_footer_y - 6*mm, width - (margin_left + margin_right), 6*mm, fill=1)  # Réduit la hauteur
-
-        # Texte du pied de page
-        p.setFillColorRGB(*header_text_color_rgb)
-        p.setFont("Helvetica-Bold", 8)
-        p.drawCentredString(width/2, final_footer_y + small_line_height, "Merci de votre confiance")
-        p.setFont("Helvetica", 7)
-        p.drawCentredString(width/2, final_footer_y + small_line_height*0.5, "BestConnect - Votre partenaire de confiance")
-        p.drawCentredString(width/2, final_footer_y, "Pour toute assistance: 034 72 497 15")
-
-        # Finaliser la page
-        p.showPage()
-        p.save()
-        
-        return response
+        qr_code = qr_code_image_data.getvalue() if qr_code_image_data else None
+        data = receipts.registration_receipt(user, subscription, payment, plain_password, qr_code)
+        return receipts.receipt_response(receipts.REGISTRATION_TICKET, [data], f"receipt_{user.username}.pdf")
 
     def save_model(self, request, obj, form, change):
         if not change:  # Si c'est une création
@@ -436,28 +204,15 @@ class CustomUserAdmin(UserAdmin):
             )
 
             # Pour une nouvelle création, générer et sauvegarder le QR code ici
-            # Utiliser la même logique que dans print_receipt pour la génération en mémoire et la sauvegarde
+            # Utiliser la même logique que dans print_receipt (service QR partagé)
             qr_code_image_data = None
             try:
                 qr_content = f"{obj.username}:{plain_password}"
-                qr = qrcode.QRCode(
-                    version=1,
-                    error_correction=qrcode.constants.ERROR_CORRECT_L,
-                    box_size=10,
-                    border=4,
-                )
-                qr.add_data(qr_content)
-                qr.make(fit=True)
-                img = qr.make_image(fill_color="green", back_color="white")
-                buffer = BytesIO()
-                img.save(buffer, format='PNG')
-                buffer.seek(0)
-                qr_code_image_data = buffer
+                qr_code_image_data = qr.get_buffer(qr_content, fill_color="green")
                 
-                # Sauvegarder le fichier QR code dans le modèle de l'abonnement
-                filename = f'qr_code_{obj.username}_{subscription.id}.png'
-                file_to_save = File(BytesIO(buffer.getvalue()), name=filename)
-                subscription.qr_code.save(filename, file_to_save, save=True) # save=True pour enregistrer l'abonnement avec le QR code
+                # Fichier QR code de l'abonnement, nommé d'après l'empreinte de son contenu
+                subscription.qr_code.name = qr.save_file(qr_content, fill_color="green")
+                subscription.save(update_fields=['qr_code'])
                 
             except Exception as e:
                  print(f"Error generating and saving QR code during user creation: {e}")
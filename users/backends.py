@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from .hashers import STAFF, make_password_for
+
+UserModel = get_user_model()
+
+
+class AccountClassModelBackend(ModelBackend):
+    """ModelBackend dont le hachage factice (utilisateur inconnu) suit la politique du personnel.
+
+    ModelBackend hache le mot de passe d'un User vierge, donc de classe ticket
+    (users.hashers) : un nom inconnu coûterait moins cher qu'un compte du
+    personnel et le temps de réponse révélerait les comptes du personnel.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Même coût que la vérification d'un compte du personnel
+            make_password_for(password, STAFF)
+        else:
+            if user.check_password(password) and self.user_can_authenticate(user):
+                return user
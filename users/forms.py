@@ -1,4 +1,5 @@
 from django import forms
+from django.core.validators import MaxValueValidator
 from django.contrib.auth.forms import UserCreationForm
 from .models import User
 from subscriptions.models import Plan
@@ -92,4 +93,23 @@ class CustomUserCreationForm(UserCreationForm):
         if commit:
             user.save()
         
-        return user 
\ No newline at end of file
+        return user 
+class VoucherForm(forms.Form):
+    """Génération en masse de tickets WiFi prépayés (users.vouchers)"""
+    count = forms.IntegerField(min_value=1, label="Nombre de tickets")
+    prefix = forms.SlugField(max_length=20, required=False, label="Préfixe des noms d'utilisateur")
+    payment_method = forms.ChoiceField(
+        choices=[
+            ('CASH', 'Espèces'),
+            ('MOBILE_MONEY', 'Mobile Money'),
+        ],
+        initial='CASH',
+        label="Méthode de paiement"
+    )
+
+    def __init__(self, *args, max_count=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if max_count:
+            self.fields['count'].validators.append(MaxValueValidator(max_count))
+            self.fields['count'].widget.attrs['max'] = max_count
+            self.fields['count'].help_text = f"{max_count} au plus ; au-delà, commande generate_vouchers"
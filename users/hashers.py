@@ -0,0 +1,46 @@
+"""Politique de hachage des mots de passe par classe de compte.
+
+Les comptes du personnel (staff, superutilisateurs) gardent le hacheur par
+défaut de Django. Les comptes tickets (clients WiFi, identifiants aléatoires
+valables quelques jours) utilisent un PBKDF2 à coût réduit : la vérification
+a lieu à chaque connexion au portail captif.
+
+La classe d'un compte est réévaluée à chaque vérification : un mot de passe
+haché selon une autre politique (ou un autre nombre d'itérations) est
+rehaché de façon transparente lors de la connexion suivante.
+
+Pour un nom d'utilisateur inconnu, le backend d'authentification
+(users.backends) hache au coût d'un compte du personnel : le temps de réponse
+ne distingue pas un compte du personnel d'un nom inexistant.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher, make_password
+
+PASSWORD_HASHER_POLICIES = getattr(settings, 'PASSWORD_HASHER_POLICIES', {})
+TICKET_PASSWORD_ITERATIONS = getattr(settings, 'TICKET_PASSWORD_ITERATIONS', 20000)
+
+STAFF = 'staff'
+TICKET = 'ticket'
+
+
+class TicketPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 à coût réduit pour les comptes tickets"""
+    algorithm = 'pbkdf2_ticket'
+    iterations = TICKET_PASSWORD_ITERATIONS
+
+
+def account_class(user):
+    return STAFF if user.is_staff or user.is_superuser else TICKET
+
+
+def policy_hasher(account_class):
+    """Hacheur de la classe de compte (hacheur par défaut si la classe n'a pas de politique)"""
+    return get_hasher(PASSWORD_HASHER_POLICIES.get(account_class, 'default'))
+
+
+def hasher_for(user):
+    return policy_hasher(account_class(user))
+
+
+def make_password_for(password, account_class):
+    return make_password(password, hasher=policy_hasher(account_class))
@@ -0,0 +1,86 @@
+import time
+import uuid
+
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+
+from users import hashers, workers
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Mesure le coût CPU d\'une connexion (authenticate) selon la politique de hachage de chaque '
+            'classe de compte, le rehachage transparent et le hachage en masse (série / pool de processus)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20)
+        parser.add_argument('--bulk', type=int, default=200, help="Mots de passe hachés en masse (0 : ignoré)")
+        parser.add_argument('--workers', type=int, default=None)
+
+    def handle(self, *args, **options):
+        prefix = f"hash{uuid.uuid4().hex[:6]}"
+        password = 'k7mq2xpa'
+        try:
+            for account_class in (hashers.STAFF, hashers.TICKET):
+                user = User(username=f"{prefix}_{account_class}", phone_number='0340000000',
+                            is_staff=account_class == hashers.STAFF)
+                user.set_password(password)
+                user.save()
+                self._measure_logins(account_class, user, password, options['logins'])
+
+            # Ancien compte ticket haché au coût par défaut : rehaché à la première connexion
+            user = User.objects.create(
+                username=f"{prefix}_legacy", phone_number='0340000000',
+                password=make_password(password, hasher='default')
+            )
+            started = time.process_time()
+            authenticate(username=user.username, password=password)
+            first = time.process_time() - started
+            user.refresh_from_db()
+            self.stdout.write(
+                f"Rehachage transparent : première connexion {first * 1000:.1f} ms CPU, "
+                f"hachage désormais {user.password.split('$', 1)[0]}"
+            )
+            self._measure_logins('ticket (rehaché)', user, password, options['logins'])
+
+            # Nom inconnu : même coût qu'un compte du personnel (users.backends)
+            started = time.process_time()
+            for _ in range(options['logins']):
+                assert authenticate(username=f"{prefix}_inconnu", password=password) is None
+            cpu = (time.process_time() - started) / options['logins']
+            self.stdout.write(f"Connexion nom inconnu : {cpu * 1000:.1f} ms CPU")
+
+            if options['bulk']:
+                self._measure_bulk(options['bulk'], options['workers'])
+        finally:
+            User.objects.filter(username__startswith=f"{prefix}_").delete()
+
+    def _measure_logins(self, label, user, password, logins):
+        started_cpu, started = time.process_time(), time.perf_counter()
+        for _ in range(logins):
+            assert authenticate(username=user.username, password=password) is not None
+        cpu = (time.process_time() - started_cpu) / logins
+        elapsed = (time.perf_counter() - started) / logins
+        self.stdout.write(
+            f"Connexion {label} ({hashers.hasher_for(user).algorithm}) : {cpu * 1000:.1f} ms CPU, "
+            f"{elapsed * 1000:.1f} ms, {1 / cpu:,.0f} connexions/s par cœur"
+        )
+
+    def _measure_bulk(self, count, pool_size):
+        passwords = [f"pw{i:06d}" for i in range(count)]
+        for account_class in (hashers.TICKET, hashers.STAFF):
+            started = time.perf_counter()
+            for password in passwords:
+                hashers.make_password_for(password, account_class)
+            serial = time.perf_counter() - started
+
+            started = time.perf_counter()
+            with workers.get_pool(pool_size) as pool:
+                list(pool.map(workers.hash_password, passwords, [account_class] * count, chunksize=16))
+            pooled = time.perf_counter() - started
+            self.stdout.write(
+                f"Hachage en masse {account_class} ({count}) : série {count / serial:,.0f}/s, "
+                f"pool de processus {count / pooled:,.0f}/s (démarrage du pool compris)"
+            )
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from subscriptions.models import Plan
+from users import vouchers
+
+
+class Command(BaseCommand):
+    help = ('Crée des tickets WiFi prépayés pour un forfait (utilisateurs, abonnements, paiements) '
+            'et écrit la planche PDF à imprimer ; affiche la durée et le débit de chaque étape')
+
+    def add_arguments(self, parser):
+        parser.add_argument('plan', type=int, help="Identifiant du forfait")
+        parser.add_argument('count', type=int)
+        parser.add_argument('--output', default=None, help="Fichier PDF (par défaut tickets_<forfait>_<nombre>.pdf)")
+        parser.add_argument('--prefix', default='')
+        parser.add_argument('--payment-method', choices=['CASH', 'MOBILE_MONEY'], default='CASH')
+        parser.add_argument('--workers', type=int, default=None)
+
+    def handle(self, *args, **options):
+        try:
+            plan = Plan.objects.get(pk=options['plan'])
+        except Plan.DoesNotExist:
+            raise CommandError(f"Forfait {options['plan']} introuvable")
+        count = options['count']
+        if count < 1:
+            raise CommandError("Le nombre de tickets doit être positif")
+        output = options['output'] or f"tickets_{plan.pk}_{count}.pdf"
+
+        timings = {}
+        cards = vouchers.generate_vouchers(
+            plan, count, prefix=options['prefix'], payment_method=options['payment_method'],
+            workers=options['workers'], timings=timings
+        )
+        with open(output, 'wb') as handle:
+            pages = vouchers.render_sheet(cards, handle, timings)
+
+        for stage, seconds in timings.items():
+            self.stdout.write(f"{stage}: {seconds:.2f} s ({count / seconds:,.0f} tickets/s)")
+        self.stdout.write(f"Total : {sum(timings.values()):.2f} s")
+        self.stdout.write(self.style.SUCCESS(f"{count} tickets créés, planche de {pages} pages : {output}"))
@@ -1,3 +1,4 @@
+from django.contrib.auth.hashers import check_password, make_password
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils import timezone
@@ -28,6 +29,23 @@ class User(AbstractUser):
     def __str__(self):
         return f"{self.display_name or self.username} ({self.phone_number})"
 
+    def set_password(self, raw_password):
+        # Hacheur de la politique de la classe du compte (users.hashers)
+        from .hashers import hasher_for
+        self.password = make_password(raw_password, hasher=hasher_for(self))
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        from .hashers import hasher_for
+
+        def setter(raw_password):
+            # Rehachage transparent : politique ou coût du hacheur modifié depuis le dernier hachage
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=['password'])
+
+        return check_password(raw_password, self.password, setter, preferred=hasher_for(self).algorithm)
+
     def clean(self):
         super().clean()
         if not self.phone_number:
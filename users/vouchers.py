@@ -0,0 +1,225 @@
+"""Génération en masse de tickets WiFi prépayés (cartes imprimées pour les revendeurs).
+
+Chaque ticket correspond à ce que crée l'ajout d'un utilisateur dans l'admin :
+un utilisateur (mot de passe haché et en clair pour l'impression), son
+abonnement au forfait avec son QR code et un paiement réussi. Le lot est
+produit par étapes, chacune chronométrée :
+
+- identifiants : noms d'utilisateur et mots de passe aléatoires, unicité
+  vérifiée en une requête par lot ;
+- hachage des mots de passe selon la politique des comptes tickets
+  (users.hashers), réparti sur un pool de processus ;
+- rendu des QR codes, sur le même pool ;
+- écriture en base par bulk_create, dans une transaction ;
+- planche PDF prête à imprimer, plusieurs cartes par page A4 (décor de la
+  page mis en cache, voir payments.receipts).
+"""
+import io
+import logging
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+
+from payments import receipts
+from payments.models import Payment
+from payments.statistics import invalidate_statistics
+from portal import qr
+from subscriptions.models import Subscription
+from . import workers as pool_workers
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+VOUCHER_PASSWORD_LENGTH = getattr(settings, 'VOUCHER_PASSWORD_LENGTH', 8)
+VOUCHER_BATCH_SIZE = getattr(settings, 'VOUCHER_BATCH_SIZE', 1000)
+
+# Caractères faciles à recopier depuis une carte (ni 0/O, ni 1/l/I)
+VOUCHER_ALPHABET = 'abcdefghjkmnpqrstuvwxyz23456789'
+
+
+@contextmanager
+def _timed(timings, stage):
+    started = time.perf_counter()
+    yield
+    timings[stage] = timings.get(stage, 0) + time.perf_counter() - started
+
+
+def _usernames(count, prefix):
+    """Noms d'utilisateur aléatoires absents de la base"""
+    usernames = set()
+    while len(usernames) < count:
+        candidates = {
+            f"{prefix}{get_random_string(6, VOUCHER_ALPHABET)}" for _ in range(count - len(usernames))
+        } - usernames
+        taken = set()
+        candidate_list = list(candidates)
+        for start in range(0, len(candidate_list), VOUCHER_BATCH_SIZE):
+            taken.update(User.objects.filter(
+                username__in=candidate_list[start:start + VOUCHER_BATCH_SIZE]
+            ).values_list('username', flat=True))
+        usernames |= candidates - taken
+    return list(usernames)[:count]
+
+
+def generate_vouchers(plan, count, prefix='', payment_method='CASH', workers=None, timings=None):
+    """Crée count tickets pour le forfait ; retourne les cartes à imprimer.
+
+    timings (dict) reçoit la durée en secondes de chaque étape.
+    """
+    timings = {} if timings is None else timings
+
+    with _timed(timings, 'identifiants'):
+        usernames = _usernames(count, prefix)
+        passwords = [get_random_string(VOUCHER_PASSWORD_LENGTH, VOUCHER_ALPHABET) for _ in usernames]
+
+    # Un seul processeur : le démarrage du pool coûterait plus qu'il ne rapporte
+    parallel = pool_workers.pool_size(workers) > 1
+    with pool_workers.get_pool(workers) if parallel else nullcontext() as pool:
+        with _timed(timings, 'hachage'):
+            hashes = list(
+                pool.map(pool_workers.hash_password, passwords, chunksize=16) if pool
+                else map(pool_workers.hash_password, passwords)
+            )
+        with _timed(timings, 'qr_codes'):
+            # Même contenu que le reçu d'inscription de l'admin : identifiants de connexion au portail
+            qr_codes = qr.save_files(
+                [f"{username}:{password}" for username, password in zip(usernames, passwords)],
+                executor=pool, fill_color="green"
+            )
+
+    with _timed(timings, 'base'):
+        start_date = timezone.now()
+        end_date = start_date + timedelta(days=plan.get_duration_in_days())
+        with transaction.atomic():
+            User.objects.bulk_create([
+                User(username=username, password=password_hash, plain_password=password)
+                for username, password, password_hash in zip(usernames, passwords, hashes)
+            ], batch_size=VOUCHER_BATCH_SIZE)
+            # Clés primaires relues : bulk_create ne les renvoie pas sous MySQL
+            users = {}
+            for start in range(0, count, VOUCHER_BATCH_SIZE):
+                users.update(User.objects.in_bulk(usernames[start:start + VOUCHER_BATCH_SIZE], field_name='username'))
+            Subscription.objects.bulk_create([
+                Subscription(
+                    user=users[username], plan=plan, start_date=start_date, end_date=end_date,
+                    is_active=True, qr_code=name
+                )
+                for username, (name, _) in zip(usernames, qr_codes)
+            ], batch_size=VOUCHER_BATCH_SIZE)
+            Payment.objects.bulk_create([
+                Payment(
+                    user=users[username], plan=plan, amount=plan.price, payment_method=payment_method,
+                    status='SUCCESS', receipt_number=f"RCP-{uuid.uuid4().hex[:8].upper()}"
+                )
+                for username in usernames
+            ], batch_size=VOUCHER_BATCH_SIZE)
+            # bulk_create n'émet pas les signaux : statistiques rendues obsolètes ici
+            transaction.on_commit(invalidate_statistics)
+
+    logger.info(f"{count} tickets créés pour le forfait {plan.name}")
+    validity = timezone.localtime(end_date).strftime('%d/%m/%Y')
+    return [
+        {'username': username, 'password': password, 'plan_name': plan.name,
+         'price': f"{plan.price:,} Ar", 'end_date': validity, 'qr_code': png}
+        for username, password, (_, png) in zip(usernames, passwords, qr_codes)
+    ]
+
+
+class VoucherSheet(receipts.ReceiptLayout):
+    """Planche A4 de cartes à découper, columns x rows cartes par page"""
+    name = 'voucher_sheet'
+    pagesize = A4
+    columns = 2
+    rows_per_page = 5
+    primary_color = (0.26, 0.46, 0.56)  # Bleu BestConnect
+    secondary_color = (0.2, 0.2, 0.2)   # Gris foncé
+    padding = 5 * mm
+    header_height = 10 * mm
+    qr_size = 38 * mm
+    # Libellé, clé, police de la valeur, décalage depuis le haut de la carte
+    card_fields = (
+        ("Utilisateur", 'username', ("Courier-Bold", 12), 15 * mm),
+        ("Mot de passe", 'password', ("Courier-Bold", 12), 25 * mm),
+        ("Forfait", 'plan_name', ("Helvetica-Bold", 9), 35 * mm),
+        ("Valable jusqu'au", 'end_date', ("Helvetica", 9), 45 * mm),
+    )
+
+    @property
+    def per_page(self):
+        return self.columns * self.rows_per_page
+
+    @property
+    def card_size(self):
+        return self.width / self.columns, self.height / self.rows_per_page
+
+    def cells(self):
+        card_width, card_height = self.card_size
+        for row in range(self.rows_per_page):
+            for column in range(self.columns):
+                yield column * card_width, self.height - (row + 1) * card_height
+
+    def draw_background(self, p):
+        card_width, card_height = self.card_size
+
+        # Traits de coupe
+        p.setStrokeColorRGB(0.7, 0.7, 0.7)
+        p.setDash(2, 2)
+        for column in range(1, self.columns):
+            p.line(column * card_width, 0, column * card_width, self.height)
+        for row in range(1, self.rows_per_page):
+            p.line(0, row * card_height, self.width, row * card_height)
+        p.setDash()
+
+        for x, y in self.cells():
+            top = y + card_height
+            p.setFillColorRGB(*self.primary_color)
+            p.rect(x + self.padding / 2, top - self.padding / 2 - self.header_height,
+                   card_width - self.padding, self.header_height, stroke=0, fill=1)
+            p.setFillColorRGB(1, 1, 1)
+            p.setFont("Helvetica-Bold", 12)
+            p.drawString(x + self.padding, top - self.padding / 2 - 6.5*mm, "BestConnect")
+            p.setFont("Helvetica", 9)
+            p.drawRightString(x + card_width - self.padding, top - self.padding / 2 - 6.5*mm, "Ticket WiFi")
+
+            p.setFillColorRGB(*self.secondary_color)
+            p.setFont("Helvetica", 7)
+            for label, _, _, offset in self.card_fields:
+                p.drawString(x + self.padding, top - offset, label)
+            p.setFont("Helvetica", 6)
+            p.drawString(x + self.padding, y + 3*mm, "Connectez-vous au réseau BestConnect - Assistance : 034 72 497 15")
+
+    def draw_fields(self, p, data):
+        card_width, card_height = self.card_size
+        for (x, y), card in zip(self.cells(), data['cards']):
+            top = y + card_height
+            p.setFillColorRGB(0, 0, 0)
+            for _, key, font, offset in self.card_fields:
+                p.setFont(*font)
+                p.drawString(x + self.padding, top - offset - 4.5*mm, str(card.get(key, '')))
+            if card.get('qr_code'):
+                p.drawImage(
+                    ImageReader(io.BytesIO(card['qr_code'])),
+                    x + card_width - self.padding - self.qr_size, y + 6*mm,
+                    width=self.qr_size, height=self.qr_size
+                )
+
+
+VOUCHER_SHEET = VoucherSheet()
+
+
+def render_sheet(vouchers, output, timings=None):
+    """Planche PDF des tickets ; retourne le nombre de pages"""
+    timings = {} if timings is None else timings
+    per_page = VOUCHER_SHEET.per_page
+    pages = ({'cards': vouchers[start:start + per_page]} for start in range(0, len(vouchers), per_page))
+    with _timed(timings, 'pdf'):
+        return receipts.render(VOUCHER_SHEET, pages, output)
@@ -0,0 +1,38 @@
+"""Pool de processus pour les traitements CPU en masse (hachage des mots de passe, QR codes).
+
+Les processus sont démarrés par spawn et configurent Django eux-mêmes : ce module
+ne doit donc importer aucun modèle, les fonctions exécutées dans le pool étant
+importées par les processus avant cette configuration.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.conf import settings
+
+VOUCHER_WORKERS = getattr(settings, 'VOUCHER_WORKERS', None)
+
+
+def _init_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def hash_password(password, account_class='ticket'):
+    from .hashers import make_password_for
+    return make_password_for(password, account_class)
+
+
+def pool_size(workers=None):
+    return workers or VOUCHER_WORKERS or os.cpu_count() or 1
+
+
+def get_pool(workers=None):
+    # spawn plutôt que fork : le processus appelant (serveur web) peut avoir des threads en cours
+    return ProcessPoolExecutor(
+        max_workers=pool_size(workers),
+        mp_context=get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(settings.SETTINGS_MODULE,),
+    )